@@ -0,0 +1,28 @@
+"""Add prediction_id to generated_audio
+
+Revision ID: 7c1e4b9a2d10
+Revises: 231f232efea4
+Create Date: 2026-10-19 09:12:04.118342
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c1e4b9a2d10'
+down_revision: Union[str, None] = '231f232efea4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('generated_audio', sa.Column('prediction_id', sa.String(length=64), nullable=True))
+    op.create_index(op.f('ix_generated_audio_prediction_id'), 'generated_audio', ['prediction_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_generated_audio_prediction_id'), table_name='generated_audio')
+    op.drop_column('generated_audio', 'prediction_id')
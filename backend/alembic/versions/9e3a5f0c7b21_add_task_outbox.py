@@ -0,0 +1,41 @@
+"""Add task_outbox
+
+Revision ID: 9e3a5f0c7b21
+Revises: 7c1e4b9a2d10
+Create Date: 2026-10-19 10:41:27.503116
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9e3a5f0c7b21'
+down_revision: Union[str, None] = '7c1e4b9a2d10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('task_outbox',
+    sa.Column('outbox_id', sa.Integer(), nullable=False),
+    sa.Column('task_name', sa.String(length=255), nullable=False),
+    sa.Column('args', sa.JSON(), nullable=False),
+    sa.Column('options', sa.JSON(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('sent_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('task_id', sa.String(length=255), nullable=True),
+    sa.Column('attempts', sa.Integer(), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.PrimaryKeyConstraint('outbox_id')
+    )
+    op.create_index(op.f('ix_task_outbox_outbox_id'), 'task_outbox', ['outbox_id'], unique=False)
+    op.create_index(op.f('ix_task_outbox_sent_at'), 'task_outbox', ['sent_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_task_outbox_sent_at'), table_name='task_outbox')
+    op.drop_index(op.f('ix_task_outbox_outbox_id'), table_name='task_outbox')
+    op.drop_table('task_outbox')
@@ -0,0 +1,35 @@
+"""Add cancelled generation and queue status
+
+Revision ID: a3e9c1f5b702
+Revises: f7c2d4e6a815
+Create Date: 2026-10-19 17:02:44.118305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3e9c1f5b702'
+down_revision: Union[str, None] = 'f7c2d4e6a815'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Other backends store the enums as plain strings
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    # ADD VALUE cannot run inside a transaction block before PostgreSQL 12
+    with op.get_context().autocommit_block():
+        op.execute("ALTER TYPE generationstatus ADD VALUE IF NOT EXISTS 'CANCELLED'")
+        op.execute("ALTER TYPE queuestatus ADD VALUE IF NOT EXISTS 'CANCELLED'")
+
+
+def downgrade() -> None:
+    # PostgreSQL cannot drop enum values; move cancelled rows to failed
+    # and leave the label unused
+    op.execute("UPDATE generated_audio SET status = 'FAILED' WHERE status = 'CANCELLED'")
+    op.execute("UPDATE generation_queue SET status = 'FAILED' WHERE status = 'CANCELLED'")
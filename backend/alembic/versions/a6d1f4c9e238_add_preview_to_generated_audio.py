@@ -0,0 +1,28 @@
+"""Add preview generations to generated_audio
+
+Revision ID: a6d1f4c9e238
+Revises: f3c8e2a7d517
+Create Date: 2026-10-19 22:37:15.918046
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a6d1f4c9e238'
+down_revision: Union[str, None] = 'f3c8e2a7d517'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('generated_audio', sa.Column('preview', sa.Boolean(), server_default=sa.false(), nullable=False))
+    op.add_column('generated_audio', sa.Column('source_script', sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('generated_audio', 'source_script')
+    op.drop_column('generated_audio', 'preview')
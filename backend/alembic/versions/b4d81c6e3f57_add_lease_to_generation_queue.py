@@ -0,0 +1,30 @@
+"""Add lease columns to generation_queue
+
+Revision ID: b4d81c6e3f57
+Revises: 9e3a5f0c7b21
+Create Date: 2026-10-19 11:58:50.271904
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b4d81c6e3f57'
+down_revision: Union[str, None] = '9e3a5f0c7b21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('generation_queue', sa.Column('leased_by', sa.String(length=255), nullable=True))
+    op.add_column('generation_queue', sa.Column('lease_expires_at', sa.DateTime(timezone=True), nullable=True))
+    op.create_index(op.f('ix_generation_queue_lease_expires_at'), 'generation_queue', ['lease_expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_generation_queue_lease_expires_at'), table_name='generation_queue')
+    op.drop_column('generation_queue', 'lease_expires_at')
+    op.drop_column('generation_queue', 'leased_by')
@@ -0,0 +1,26 @@
+"""Add next_attempt_at to task_outbox
+
+Revision ID: b8e2d6f1c347
+Revises: a6d1f4c9e238
+Create Date: 2026-10-20 09:12:44.271905
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b8e2d6f1c347'
+down_revision: Union[str, None] = 'a6d1f4c9e238'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('task_outbox', sa.Column('next_attempt_at', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('task_outbox', 'next_attempt_at')
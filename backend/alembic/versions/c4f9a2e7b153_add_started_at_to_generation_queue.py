@@ -0,0 +1,26 @@
+"""Add started_at to generation_queue
+
+Revision ID: c4f9a2e7b153
+Revises: b8e2d6f1c347
+Create Date: 2026-10-21 10:37:05.918342
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4f9a2e7b153'
+down_revision: Union[str, None] = 'b8e2d6f1c347'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('generation_queue', sa.Column('started_at', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('generation_queue', 'started_at')
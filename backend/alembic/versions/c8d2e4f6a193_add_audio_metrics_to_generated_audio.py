@@ -0,0 +1,30 @@
+"""Add checksum and loudness metrics to generated audio
+
+Revision ID: c8d2e4f6a193
+Revises: a3e9c1f5b702
+Create Date: 2026-10-19 18:11:27.402916
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c8d2e4f6a193'
+down_revision: Union[str, None] = 'a3e9c1f5b702'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('generated_audio', sa.Column('checksum', sa.String(length=64), nullable=True))
+    op.add_column('generated_audio', sa.Column('loudness_lufs', sa.Float(), nullable=True))
+    op.add_column('generated_audio', sa.Column('peak_dbfs', sa.Float(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('generated_audio', 'peak_dbfs')
+    op.drop_column('generated_audio', 'loudness_lufs')
+    op.drop_column('generated_audio', 'checksum')
@@ -0,0 +1,32 @@
+"""Add dead-letter fields to generation_queue
+
+Revision ID: d2f6a8b0c913
+Revises: b4d81c6e3f57
+Create Date: 2026-10-19 13:20:16.884530
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2f6a8b0c913'
+down_revision: Union[str, None] = 'b4d81c6e3f57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('generation_queue', sa.Column('last_error', sa.Text(), nullable=True))
+    op.add_column('generation_queue', sa.Column('error_kind', sa.String(length=20), nullable=True))
+    op.add_column('generation_queue', sa.Column('dead_lettered_at', sa.DateTime(timezone=True), nullable=True))
+    op.create_index(op.f('ix_generation_queue_dead_lettered_at'), 'generation_queue', ['dead_lettered_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_generation_queue_dead_lettered_at'), table_name='generation_queue')
+    op.drop_column('generation_queue', 'dead_lettered_at')
+    op.drop_column('generation_queue', 'error_kind')
+    op.drop_column('generation_queue', 'last_error')
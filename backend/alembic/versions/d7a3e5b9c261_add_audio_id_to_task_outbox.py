@@ -0,0 +1,49 @@
+"""Add audio_id to task_outbox
+
+Revision ID: d7a3e5b9c261
+Revises: c4f9a2e7b153
+Create Date: 2026-10-22 14:05:31.406127
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd7a3e5b9c261'
+down_revision: Union[str, None] = 'c4f9a2e7b153'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+GENERATION_TASK_NAMES = (
+    'app.tasks.generation_tasks.process_voice_generation',
+    'app.tasks.generation_tasks.finalize_generation',
+)
+
+
+def upgrade() -> None:
+    op.add_column('task_outbox', sa.Column('audio_id', sa.Integer(), nullable=True))
+    op.create_index(op.f('ix_task_outbox_audio_id'), 'task_outbox', ['audio_id'], unique=False)
+
+    # Records still within retention take their generation from the task arguments
+    outbox = sa.table(
+        'task_outbox',
+        sa.column('outbox_id', sa.Integer),
+        sa.column('task_name', sa.String),
+        sa.column('args', sa.JSON),
+        sa.column('audio_id', sa.Integer),
+    )
+    bind = op.get_bind()
+    rows = bind.execute(
+        sa.select(outbox.c.outbox_id, outbox.c.args).where(outbox.c.task_name.in_(GENERATION_TASK_NAMES))
+    ).fetchall()
+    for outbox_id, args in rows:
+        if args:
+            bind.execute(outbox.update().where(outbox.c.outbox_id == outbox_id).values(audio_id=args[0]))
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_task_outbox_audio_id'), table_name='task_outbox')
+    op.drop_column('task_outbox', 'audio_id')
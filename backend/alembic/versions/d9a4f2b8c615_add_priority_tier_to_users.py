@@ -0,0 +1,26 @@
+"""Add priority tier to users
+
+Revision ID: d9a4f2b8c615
+Revises: c8d2e4f6a193
+Create Date: 2026-10-19 19:03:51.227480
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd9a4f2b8c615'
+down_revision: Union[str, None] = 'c8d2e4f6a193'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('priority_tier', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'priority_tier')
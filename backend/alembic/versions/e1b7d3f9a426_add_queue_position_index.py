@@ -0,0 +1,31 @@
+"""Add index for queue position queries
+
+Revision ID: e1b7d3f9a426
+Revises: d9a4f2b8c615
+Create Date: 2026-10-19 19:41:06.583120
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e1b7d3f9a426'
+down_revision: Union[str, None] = 'd9a4f2b8c615'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'ix_generation_queue_status_queued_at',
+        'generation_queue',
+        ['status', 'queued_at', 'queue_id'],
+        unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_generation_queue_status_queued_at', table_name='generation_queue')
@@ -0,0 +1,26 @@
+"""Add streaming flag to generated_audio
+
+Revision ID: e5b7c9d1f024
+Revises: d2f6a8b0c913
+Create Date: 2026-10-19 15:02:41.307219
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5b7c9d1f024'
+down_revision: Union[str, None] = 'd2f6a8b0c913'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('generated_audio', sa.Column('streaming', sa.Boolean(), server_default=sa.false(), nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('generated_audio', 'streaming')
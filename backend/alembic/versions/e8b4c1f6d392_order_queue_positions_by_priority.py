@@ -0,0 +1,39 @@
+"""Order queue positions by priority
+
+Revision ID: e8b4c1f6d392
+Revises: d7a3e5b9c261
+Create Date: 2026-10-22 16:48:12.730554
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e8b4c1f6d392'
+down_revision: Union[str, None] = 'd7a3e5b9c261'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("UPDATE generation_queue SET priority = 0 WHERE priority IS NULL")
+    op.drop_index('ix_generation_queue_status_queued_at', table_name='generation_queue')
+    op.create_index(
+        'ix_generation_queue_status_priority_queued_at',
+        'generation_queue',
+        ['status', 'priority', 'queued_at', 'queue_id'],
+        unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_generation_queue_status_priority_queued_at', table_name='generation_queue')
+    op.create_index(
+        'ix_generation_queue_status_queued_at',
+        'generation_queue',
+        ['status', 'queued_at', 'queue_id'],
+        unique=False
+    )
@@ -0,0 +1,26 @@
+"""Add incremental flag to generated_audio
+
+Revision ID: f3c8e2a7d517
+Revises: e1b7d3f9a426
+Create Date: 2026-10-19 21:14:52.604318
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3c8e2a7d517'
+down_revision: Union[str, None] = 'e1b7d3f9a426'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('generated_audio', sa.Column('incremental', sa.Boolean(), server_default=sa.false(), nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('generated_audio', 'incremental')
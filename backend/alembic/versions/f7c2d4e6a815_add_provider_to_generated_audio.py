@@ -0,0 +1,26 @@
+"""Add provider to generated_audio
+
+Revision ID: f7c2d4e6a815
+Revises: e5b7c9d1f024
+Create Date: 2026-10-19 16:11:08.540932
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f7c2d4e6a815'
+down_revision: Union[str, None] = 'e5b7c9d1f024'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('generated_audio', sa.Column('provider', sa.String(length=50), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('generated_audio', 'provider')
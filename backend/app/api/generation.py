@@ -1,4 +1,5 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, Header, HTTPException, status, Query
+from fastapi.responses import FileResponse, StreamingResponse
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from app.database import get_db
@@ -10,7 +11,9 @@ from app.schemas.generation import (
     GenerationStatusResponse,
     GenerationList
 )
+from app.services.audio_postprocess import media_type_for
 from app.services.generation_service import GenerationService
+from app.services.streaming import iter_wav_stream
 from app.utils.dependencies import get_current_active_user
 
 router = APIRouter()
@@ -18,6 +21,7 @@ router = APIRouter()
 @router.post("/create", response_model=GenerationResponse, status_code=status.HTTP_201_CREATED)
 def create_generation(
     generation_data: GenerationCreate,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
@@ -29,8 +33,22 @@ def create_generation(
     2. Create a generation record
     3. Queue the generation task
     4. Return immediately with status 'pending'
+    
+    Send an Idempotency-Key header to make retries safe: repeating a request
+    with the same key returns the original generation instead of a new one.
+    An identical request made while a previous one is still in flight
+    returns that generation too, or 409 with a short Retry-After while the
+    previous one is still being created.
+    
+    When the queue is too long to drain in reasonable time, or the user
+    already has too many generations in progress, the request is refused
+    with 429 and a Retry-After header (priority tiers are exempt).
+    
+    With preview set, only the first sentence (at most PREVIEW_MAX_WORDS
+    words) is synthesized, on a lane of its own that full generations never
+    hold up; promote the preview to generate the whole script.
     """
-    generation = GenerationService.create_generation(db, current_user, generation_data)
+    generation = GenerationService.create_generation(db, current_user, generation_data, idempotency_key)
     return generation
 
 @router.get("/status/{audio_id}", response_model=GenerationStatusResponse)
@@ -44,8 +62,10 @@ def get_generation_status(
     
     Returns:
     - status: pending, processing, completed, or failed
+    - stage: fine-grained worker stage (queued, converting, uploading, inferring, ...)
     - progress: 0-100
-    - estimated_time_remaining: seconds (if processing)
+    - estimated_time_remaining: seconds (if pending or processing)
+    - poll_after: suggested seconds to wait before polling again
     - message: human-readable status message
     """
     status_info = GenerationService.get_generation_status(db, audio_id, current_user)
@@ -82,6 +102,51 @@ def get_generation(
     generation = GenerationService.get_generation_by_id(db, audio_id, current_user)
     return generation
 
+@router.get("/{audio_id}/stream")
+def stream_generation(
+    audio_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Listen to a streaming generation while it is being synthesized
+    
+    Returns one chunked WAV response: the header, then each sentence's audio
+    as soon as it is ready. Once the generation has completed, the stitched
+    file is returned instead.
+    """
+    output_path = GenerationService.get_stream_source(db, audio_id, current_user)
+    if output_path:
+        return FileResponse(path=output_path, media_type=media_type_for(output_path))
+    return StreamingResponse(iter_wav_stream(audio_id), media_type="audio/wav")
+
+@router.get("/{audio_id}/chunks/{index}")
+def get_generation_chunk(
+    audio_id: int,
+    index: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Download one finished chunk (a standalone WAV) of a streaming generation"""
+    path = GenerationService.get_stream_chunk(db, audio_id, index, current_user)
+    return FileResponse(path=path, media_type="audio/wav")
+
+@router.post("/{audio_id}/promote", response_model=GenerationResponse, status_code=status.HTTP_201_CREATED)
+def promote_preview(
+    audio_id: int,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Generate the full script of a preview
+    
+    Returns the new generation; the sentence the preview already spoke is
+    reused rather than synthesized again.
+    """
+    generation = GenerationService.promote_preview(db, audio_id, current_user, idempotency_key)
+    return generation
+
 @router.post("/{audio_id}/retry", response_model=GenerationResponse)
 def retry_generation(
     audio_id: int,
@@ -96,6 +161,21 @@ def retry_generation(
     generation = GenerationService.retry_failed_generation(db, audio_id, current_user)
     return generation
 
+@router.post("/{audio_id}/cancel", response_model=GenerationResponse)
+def cancel_generation(
+    audio_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Cancel a generation that is 'pending' or 'processing'
+    
+    Queued work is dropped and a running prediction is cancelled; the
+    generation ends as 'cancelled' and can be retried later
+    """
+    generation = GenerationService.cancel_generation(db, audio_id, current_user)
+    return generation
+
 @router.delete("/{audio_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_generation(
     audio_id: int,
@@ -105,7 +185,7 @@ def delete_generation(
     """
     Delete a generated audio
     
-    Cannot delete if status is 'processing'
+    Cannot delete if status is 'processing' (cancel it first)
     """
     GenerationService.delete_generation(db, audio_id, current_user)
     return None
@@ -92,7 +92,8 @@ def download_audio_file(
             raise HTTPException(status_code=404, detail="Generated audio not found")
         
         file_path = generated.output_file_path
-        filename = f"{generated.model_name}.wav"
+        extension = os.path.splitext(generated.output_file_path)[1] or ".wav"
+        filename = f"{generated.model_name}{extension}"
     
     if not file_path or not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="File not found")
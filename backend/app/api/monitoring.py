@@ -1,12 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 from app.database import get_db
 from app.models.generated_audio import GeneratedAudio, GenerationStatus
 from app.models.audio_sample import AudioSample
 from app.models.user import User
+from app.schemas.generation import DeadLetterRequeueRequest
 from app.utils.dependencies import get_current_active_user
 from datetime import datetime, timedelta
+from typing import Optional
 import os
 
 router = APIRouter()
@@ -95,40 +97,131 @@ def get_system_stats(
 
 @router.get("/queue")
 def get_queue_status(
+    limit: int = Query(50, ge=1, le=100),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    """Get current generation queue status"""
+    """
+    The user's queued and processing generations, each with its position in
+    the global queue and an ETA from the current drain rate
+    """
+    from app.services.queue_view import active_queue
+    
+    return active_queue(db, current_user, limit)
+
+@router.get("/eta")
+def get_eta_stats(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Learned generation timings and the current queue delay"""
     from app.models.generation_queue import GenerationQueue, QueueStatus
+    from app.services.ai_service import get_ai_service
+    from app.services.eta_estimator import eta_estimator
     
-    # Get user's items in queue
-    queue_items = db.query(GenerationQueue).join(GeneratedAudio).filter(
-        GeneratedAudio.user_id == current_user.user_id
-    ).order_by(GenerationQueue.queued_at).all()
-    
-    result = []
-    for item in queue_items:
-        result.append({
-            "queue_id": item.queue_id,
-            "audio_id": item.audio_id,
-            "status": item.status.value,
-            "priority": item.priority,
-            "queued_at": item.queued_at,
-            "processed_at": item.processed_at,
-            "retry_count": item.retry_count
-        })
+    ai_service = get_ai_service()
+    queued = db.query(GenerationQueue).filter(
+        GenerationQueue.status == QueueStatus.QUEUED
+    ).count()
+    
+    # Drain time of the current backlog at a typical script length
+    typical_processing = ai_service.estimate_processing_time_for_words(50)
+    
+    stats = eta_estimator.snapshot()
+    
+    return {
+        "provider": ai_service.provider_name,
+        "queued": queued,
+        "queue_delay_seconds": int(round(eta_estimator.queue_delay(queued, typical_processing))),
+        "observed_queue_wait": stats["queue_wait"],
+        "buckets": stats["buckets"]
+    }
+
+@router.get("/admission")
+def get_admission_state(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Admission limits, the backlog they are checked against and requests shed so far"""
+    from app.services.admission import snapshot
+    
+    return snapshot(db)
+
+@router.get("/dead-letter")
+def get_dead_letters(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=100),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Generations that failed permanently or ran out of automatic retries"""
+    from app.services.dead_letter import DeadLetterService
+    
+    return {
+        "total": DeadLetterService.count_dead_letters(db, current_user),
+        "items": DeadLetterService.list_dead_letters(db, current_user, skip, limit)
+    }
+
+@router.post("/dead-letter/requeue")
+def requeue_dead_letters(
+    request: Optional[DeadLetterRequeueRequest] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Re-queue dead-lettered generations (all of them, or the given audio_ids)"""
+    from app.services.dead_letter import DeadLetterService
+    
+    requeued = DeadLetterService.requeue_dead_letters(
+        db, current_user, request.audio_ids if request else None
+    )
+    return {
+        "requeued": len(requeued),
+        "audio_ids": requeued
+    }
+
+@router.get("/retries")
+def get_retry_metrics(
+    current_user: User = Depends(get_current_active_user)
+):
+    """Counters of automatic retries, dead-lettered and re-queued jobs"""
+    from app.services.retry_policy import retry_metrics
     
     return {
-        "total_in_queue": len(result),
-        "queue_items": result
+        "metrics": retry_metrics()
     }
 
+@router.get("/providers")
+def get_provider_limits(
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Routing signals (expected latency, error rate, load, cost) and the circuit
+    breaker, rate limit and adaptive concurrency state of each AI provider
+    """
+    from app.services.ai_service import get_ai_service
+    
+    ai_service = get_ai_service()
+    return {
+        "provider": ai_service.provider_name,
+        "routing": ai_service.router.snapshot(),
+        "providers": ai_service.provider_limits()
+    }
+
+@router.get("/workers")
+def get_worker_nodes(
+    current_user: User = Depends(get_current_active_user)
+):
+    """Affinity nodes, their assigned jobs and reference cache hit rates"""
+    from app.services.worker_affinity import snapshot
+    
+    return snapshot()
+
 @router.get("/ai-service")
 def get_ai_service_info():
     """Get AI service information"""
-    from app.services.ai_service import AIVoiceService
+    from app.services.ai_service import get_ai_service
     
-    ai_service = AIVoiceService()
+    ai_service = get_ai_service()
     service_info = ai_service.get_service_info()
     
     return {
@@ -0,0 +1,89 @@
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.database import get_db
+from app.models.generated_audio import GeneratedAudio
+from app.tasks.generation_tasks import finalize_generation
+from app.utils.webhooks import verify_webhook_signature
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+TERMINAL_PREDICTION_STATUSES = {"succeeded", "failed", "canceled"}
+
+async def raw_body(request: Request) -> bytes:
+    """The request body exactly as sent, which the signature covers"""
+    return await request.body()
+
+@router.post("/replicate", status_code=status.HTTP_202_ACCEPTED)
+def replicate_webhook(
+    request: Request,
+    body: bytes = Depends(raw_body),
+    db: Session = Depends(get_db)
+):
+    """
+    Receive prediction completion webhooks from Replicate
+
+    Verifies the delivery signature, finds the generation by prediction id
+    and enqueues a short finalize task to download the output. A plain def
+    like the other routes, so the database and broker calls run in the
+    threadpool instead of blocking the event loop.
+    """
+    if not settings.REPLICATE_WEBHOOK_SECRET:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Webhook secret not configured"
+        )
+
+    if not verify_webhook_signature(
+        settings.REPLICATE_WEBHOOK_SECRET,
+        request.headers.get("webhook-id"),
+        request.headers.get("webhook-timestamp"),
+        request.headers.get("webhook-signature"),
+        body
+    ):
+        logger.warning("Rejected Replicate webhook with invalid signature")
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid webhook signature"
+        )
+
+    try:
+        prediction = json.loads(body)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid webhook payload"
+        )
+
+    prediction_id = prediction.get("id")
+    prediction_status = prediction.get("status")
+
+    if prediction_status not in TERMINAL_PREDICTION_STATUSES:
+        # Only completion events are requested, ignore anything else
+        return {"received": True, "prediction_id": prediction_id}
+
+    generation = db.query(GeneratedAudio).filter(
+        GeneratedAudio.prediction_id == prediction_id
+    ).first()
+
+    if not generation:
+        # The submitting worker may not have committed yet; a non-2xx
+        # response makes Replicate redeliver the webhook.
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Generation not found for prediction"
+        )
+
+    finalize_generation.delay(
+        generation.audio_id,
+        prediction_status,
+        prediction.get("output"),
+        prediction.get("error")
+    )
+    logger.info(f"Queued finalize for audio_id={generation.audio_id} ({prediction_status})")
+
+    return {"received": True, "prediction_id": prediction_id, "audio_id": generation.audio_id}
@@ -4,12 +4,71 @@ from app.utils.dependencies import get_current_user
 from app.models.user import User
 from app.database import get_db
 from sqlalchemy.orm import Session
+from app.models.generated_audio import GeneratedAudio
+from app.services.progress_tracker import get_progress
+from app.services.streaming import iter_chunks
+from starlette.concurrency import run_in_threadpool
+import asyncio
+import json
 import logging
+import threading
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+def _status_message(audio_id, user_id: int) -> dict:
+    """Build a generation_status message for one of the user's generations"""
+    progress = get_progress(audio_id) if isinstance(audio_id, int) else None
+    
+    if not progress or progress["user_id"] != user_id:
+        return {
+            "type": "error",
+            "message": "No progress available for this generation",
+            "audio_id": audio_id
+        }
+    
+    return {
+        "type": "generation_status",
+        "audio_id": audio_id,
+        "stage": progress["stage"],
+        "progress": progress["progress"],
+        "message": progress["message"],
+        "updated_at": progress["updated_at"]
+    }
+
+async def _stream_chunks(websocket: WebSocket, audio_id: int, stop: threading.Event):
+    """Send each chunk of a streaming generation as a binary WAV frame"""
+    await manager.send_json(websocket, {"type": "stream_start", "audio_id": audio_id})
+    
+    chunks = iter_chunks(audio_id, stop=stop)
+    sent = 0
+    while True:
+        item = await run_in_threadpool(next, chunks, None)
+        if item is None:
+            break
+        index, path = item
+        
+        def read_chunk():
+            with open(path, "rb") as f:
+                return f.read()
+        
+        data = await run_in_threadpool(read_chunk)
+        # Metadata first, so clients know which chunk the next binary frame is;
+        # other streams and status events wait until both frames are out
+        async with manager.send_lock(websocket):
+            await websocket.send_json({
+                "type": "stream_chunk",
+                "audio_id": audio_id,
+                "index": index,
+                "bytes": len(data)
+            })
+            await websocket.send_bytes(data)
+        sent += 1
+    
+    if not stop.is_set():
+        await manager.send_json(websocket, {"type": "stream_end", "audio_id": audio_id, "chunks": sent})
+
 @router.websocket("/ws/{user_id}")
 async def websocket_endpoint(
     websocket: WebSocket,
@@ -45,10 +104,11 @@ async def websocket_endpoint(
     
     # Accept connection
     await manager.connect(websocket, user_id)
+    streams = {}  # audio_id -> (task, stop event)
     
     try:
         # Send initial connection message
-        await websocket.send_json({
+        await manager.send_json(websocket, {
             "type": "connection",
             "message": "Connected to generation updates",
             "user_id": user_id
@@ -57,8 +117,38 @@ async def websocket_endpoint(
         # Keep connection alive and listen for messages
         while True:
             data = await websocket.receive_text()
-            # Echo back for now
-            await websocket.send_json({
+            
+            try:
+                request = json.loads(data)
+            except ValueError:
+                request = None
+            
+            if isinstance(request, dict) and request.get("type") == "status":
+                # Current progress snapshot, straight from the progress store
+                await manager.send_json(websocket, _status_message(request.get("audio_id"), user_id))
+                continue
+            
+            if isinstance(request, dict) and request.get("type") == "stream":
+                # Audio of a streaming generation, chunk by chunk as binary frames
+                audio_id = request.get("audio_id")
+                generation = db.query(GeneratedAudio).filter(
+                    GeneratedAudio.audio_id == audio_id,
+                    GeneratedAudio.user_id == user_id
+                ).first() if isinstance(audio_id, int) else None
+                
+                if not generation or not generation.streaming:
+                    await manager.send_json(websocket, {
+                        "type": "error",
+                        "message": "No streaming generation found",
+                        "audio_id": audio_id
+                    })
+                elif audio_id not in streams or streams[audio_id][0].done():
+                    stop = threading.Event()
+                    streams[audio_id] = (asyncio.create_task(_stream_chunks(websocket, audio_id, stop)), stop)
+                continue
+            
+            # Echo back anything else
+            await manager.send_json(websocket, {
                 "type": "echo",
                 "message": data
             })
@@ -69,3 +159,7 @@ async def websocket_endpoint(
     except Exception as e:
         logger.error(f"WebSocket error: {e}")
         manager.disconnect(websocket, user_id)
+    finally:
+        for task, stop in streams.values():
+            stop.set()
+            task.cancel()
@@ -1,5 +1,11 @@
 from celery import Celery
+from celery.signals import celeryd_after_setup, worker_process_init, worker_ready, worker_shutdown, worker_shutting_down
 from app.config import settings
+from app.services.generation_pipeline import STAGE_QUEUES
+from app.services.worker_affinity import DEFAULT_TASK_PRIORITY
+import logging
+
+logger = logging.getLogger(__name__)
 
 celery_app = Celery(
     "voice_clone_worker",
@@ -16,7 +22,89 @@ celery_app.conf.update(
     task_track_started=True,
     task_time_limit=30 * 60,  # 30 minutes
     task_soft_time_limit=25 * 60,  # 25 minutes
+    # One queue per generation stage: run the CPU stages (prepare, postprocess)
+    # on prefork workers and the I/O stages (synthesize, fetch) on gevent ones
+    task_routes={name: {'queue': queue} for name, queue in STAGE_QUEUES.items()},
+    # Users on a priority tier are dispatched first within each queue (see
+    # worker_affinity.task_priority); Redis orders by these steps, 0 first
+    broker_transport_options={'queue_order_strategy': 'priority', 'priority_steps': list(range(10))},
+    task_default_priority=DEFAULT_TASK_PRIORITY,
+    beat_schedule={
+        'reap-stale-generations': {
+            'task': 'app.tasks.generation_tasks.reap_stale_generations',
+            'schedule': settings.REAPER_INTERVAL,
+        },
+    },
 )
 
 # Import tasks explicitly to register them
 from app.tasks import generation_tasks
+
+
+@worker_process_init.connect
+def init_worker_process(**kwargs):
+    """Build per-process services once, right after the prefork fork"""
+    from app.services.ai_service import get_ai_service
+    
+    get_ai_service().warm_up()
+
+
+_node_heartbeat = None
+
+
+@celeryd_after_setup.connect
+def join_affinity_node(sender, instance, **kwargs):
+    """Consume this node's twin of every affinity stage queue, and join the ring"""
+    global _node_heartbeat
+    from app.services.worker_affinity import AFFINITY_QUEUES, NodeHeartbeat, node_queue
+    
+    if not settings.WORKER_NODE:
+        return
+    queues = instance.app.amqp.queues
+    consumed = [name for name in AFFINITY_QUEUES if name in queues.consume_from]
+    for name in consumed:
+        queues.select_add(node_queue(name, settings.WORKER_NODE))
+    if consumed:
+        _node_heartbeat = NodeHeartbeat(settings.WORKER_NODE)
+        _node_heartbeat.start()
+        logger.info(f"Joined affinity node {settings.WORKER_NODE} for {', '.join(consumed)}")
+
+
+@worker_shutdown.connect
+def leave_affinity_node(**kwargs):
+    if _node_heartbeat:
+        _node_heartbeat.stop()
+
+
+@worker_ready.connect
+def reattach_orphaned_generations(**kwargs):
+    """Sweep for jobs a crashed predecessor left behind, instead of waiting for beat"""
+    from app.services.worker_drain import stop_draining
+    
+    stop_draining()
+    generation_tasks.reap_stale_generations.delay()
+
+
+@worker_ready.connect
+def seed_eta_estimator(**kwargs):
+    """Give the ETA estimator a starting point on a fresh Redis (once per worker, not per child)"""
+    from app.services.ai_service import get_ai_service
+    from app.services.eta_estimator import eta_estimator
+    from app.database import SessionLocal
+    
+    db = SessionLocal()
+    try:
+        eta_estimator.seed_from_history(db, get_ai_service().provider_name)
+    except Exception as e:
+        logger.warning(f"Could not seed ETA estimator: {e}")
+    finally:
+        db.close()
+
+
+@worker_shutting_down.connect
+def drain_generations(sig, how, exitcode, **kwargs):
+    """On a warm shutdown, hand jobs waiting on a provider back to the queue"""
+    from app.services.worker_drain import start_draining
+    
+    if how == "Warm":
+        start_draining()
@@ -46,10 +46,151 @@ class Settings(BaseSettings):
     # Replicate AI
     REPLICATE_API_TOKEN: Optional[str] = None
     REPLICATE_MODEL: str = "resemble-ai/chatterbox"
+    REPLICATE_WEBHOOK_URL: Optional[str] = None  # e.g. https://api.example.com/api/webhooks/replicate
+    REPLICATE_WEBHOOK_SECRET: Optional[str] = None  # whsec_... signing secret from Replicate
+    REPLICATE_POLL_INTERVAL: float = 1.0  # seconds between prediction status checks
+    
+    # Reference audio upload cache
+    REFERENCE_UPLOAD_CACHE: bool = True
+    REFERENCE_UPLOAD_TTL: int = 86400  # used when the provider gives no expiry
+    REFERENCE_UPLOAD_EXPIRY_MARGIN: int = 300  # re-upload this long before expiry
+    REFERENCE_DISK_CACHE_DIR: str = ""  # local conversions; default: UPLOAD_DIR/references
+    REFERENCE_DISK_CACHE_MAX_BYTES: int = 2 * 1024 ** 3
+    
+    # ETA estimation
+    ETA_EWMA_ALPHA: float = 0.2
+    ETA_MIN_SAMPLES: int = 3  # fall back to fixed formulas until then
+    WORKER_CONCURRENCY: int = 4  # generation tasks processed in parallel, all workers
+    
+    # Provider HTTP client
+    HTTP_POOL_SIZE: int = 10
+    DOWNLOAD_CHUNK_SIZE: int = 65536  # 64KB
+    DOWNLOAD_MAX_ATTEMPTS: int = 3
+    
+    # Generation request deduplication
+    IDEMPOTENCY_TTL: int = 86400  # how long an Idempotency-Key is remembered
+    SINGLE_FLIGHT_TTL: int = 3600  # identical requests attach to an in-flight job this long
+    SINGLE_FLIGHT_CLAIM_TTL: int = 30  # placeholder lifetime while the first request creates the job
+    SINGLE_FLIGHT_RETRY_AFTER: int = 1  # Retry-After sent to a duplicate of a request still being created
+    
+    # Generation leases and stale job reaper
+    GENERATION_LEASE_SECONDS: int = 120  # a job is presumed dead this long after its last heartbeat
+    GENERATION_HEARTBEAT_INTERVAL: int = 30
+    GENERATION_WEBHOOK_LEASE_SECONDS: int = 1800  # lease while a prediction awaits its webhook
+    GENERATION_STAGE_LEASE_SECONDS: int = 600  # lease while a job waits in the queue of its next stage
+    GENERATION_MAX_RETRIES: int = 3  # re-queues of a job before it is marked failed
+    REAPER_INTERVAL: int = 60  # seconds between stale job sweeps
+    
+    # Generation task retries
+    GENERATION_TASK_MAX_RETRIES: int = 5  # automatic retries of transient failures
+    GENERATION_RETRY_BASE_DELAY: float = 5.0  # seconds; doubles per attempt, with jitter
+    GENERATION_RETRY_MAX_DELAY: float = 300.0
+    
+    # Provider circuit breaker and bulkhead
+    CIRCUIT_WINDOW_SECONDS: int = 60  # rolling window the error rate is measured over
+    CIRCUIT_BUCKET_SECONDS: int = 10
+    CIRCUIT_MIN_CALLS: int = 5  # don't judge the provider on fewer calls than this
+    CIRCUIT_ERROR_THRESHOLD: float = 0.5  # failure rate that opens the circuit
+    CIRCUIT_SLOW_CALL_SECONDS: float = 180.0  # calls slower than this count as slow
+    CIRCUIT_SLOW_CALL_THRESHOLD: float = 0.8  # slow call rate that opens the circuit
+    CIRCUIT_OPEN_SECONDS: int = 30  # time before a half-open probe
+    CIRCUIT_PROBE_TIMEOUT: int = 300  # a probe that never reports back is retried after this
+    PROVIDER_MAX_CONCURRENCY: int = 8  # upper bound of the adaptive concurrency window, all workers
+    BULKHEAD_ACQUIRE_TIMEOUT: float = 5.0  # wait for a free slot before re-queuing the job
+    BULKHEAD_SLOT_TTL: int = 1800  # slots older than this belong to dead workers
+    
+    # Provider rate limit and adaptive concurrency
+    PROVIDER_RATE_LIMIT: float = 10.0  # requests per second, all workers
+    PROVIDER_RATE_BURST: float = 20.0
+    RATE_LIMIT_ACQUIRE_TIMEOUT: float = 5.0  # wait for a token before re-queuing the job
+    AIMD_INITIAL_CONCURRENCY: int = 4
+    AIMD_MIN_CONCURRENCY: int = 1
+    AIMD_DECREASE_FACTOR: float = 0.5  # multiplicative decrease on 429s or latency spikes
+    AIMD_DECREASE_COOLDOWN: float = 10.0  # at most one decrease per this many seconds
+    AIMD_LATENCY_SPIKE_FACTOR: float = 2.0  # latency above baseline * factor counts as overload
+    AIMD_LATENCY_ALPHA: float = 0.1  # EWMA weight of the latency baseline
+    AIMD_SPIKE_ALPHA: float = 0.03  # slower weight of spiking samples, so a lasting shift is re-learned
+    
+    # Sample-affinity routing to worker nodes
+    AFFINITY_ROUTING: bool = True  # takes effect once workers run with WORKER_NODE set
+    WORKER_NODE: str = ""  # this host's node name; its workers consume the node's own queues
+    AFFINITY_VIRTUAL_NODES: int = 64  # ring points per node
+    AFFINITY_NODE_CAPACITY: int = 16  # jobs assigned to a node before spilling over
+    AFFINITY_NODE_TTL: int = 30  # a node without a heartbeat this long leaves the ring
+    AFFINITY_LOAD_TTL: int = 1800  # assignments of jobs that never finished expire after this
+    
+    # Admission control on new generations
+    ADMISSION_CONTROL: bool = True
+    ADMISSION_MAX_QUEUE_DEPTH: int = 500  # queued jobs, all users
+    ADMISSION_MAX_DRAIN_SECONDS: int = 900  # estimated time to work off the queue
+    ADMISSION_MAX_USER_OUTSTANDING: int = 20  # queued or processing jobs per user
+    ADMISSION_EXEMPT_TIER: int = 1  # users on this priority tier or above are never shed
+    ADMISSION_MAX_RETRY_AFTER: int = 3600
+    ADMISSION_DEPTH_CACHE_SECONDS: float = 1.0
+    
+    # Queue view
+    QUEUE_DRAIN_WINDOW: int = 600  # seconds of completions the drain rate is measured over
+    QUEUE_DRAIN_MIN_SAMPLES: int = 5  # estimate from concurrency until this many completions
+    
+    # Task outbox relay
+    OUTBOX_BATCH_SIZE: int = 100
+    OUTBOX_POLL_INTERVAL: float = 0.2  # seconds between polls when the outbox is drained
+    OUTBOX_MAX_ATTEMPTS: int = 20  # publish attempts before the record's generation is dead-lettered
+    OUTBOX_RETRY_BASE: float = 1.0  # first wait before a failed record is published again; doubles per attempt
+    OUTBOX_RETRY_MAX: float = 300.0  # longest wait between attempts (20 attempts span about an hour)
+    OUTBOX_RETENTION: int = 86400  # keep sent records this long
+    
+    # Provider routing
+    PROVIDERS: str = ""  # fallback order, e.g. "replicate,replicate-turbo,synthetic"; default: replicate if configured, else synthetic
+    PROVIDER_MODELS: dict = {}  # extra Replicate-backed providers, e.g. {"replicate-turbo": "owner/model:version"}
+    PROVIDER_COSTS: dict = {}  # dollars per word, overriding each provider's default
+    PROVIDER_CONCURRENCY: dict = {}  # per-provider cap on concurrent calls
+    PROVIDER_RATE_LIMITS: dict = {}  # per-provider requests per second
+    PROVIDER_COST_WEIGHT: float = 600.0  # seconds of expected latency one dollar is worth when ranking
+    
+    # Audio postprocessing
+    AUDIO_POSTPROCESS: bool = True  # normalize, limit and trim outputs before delivery
+    AUDIO_NORMALIZE: bool = True
+    AUDIO_TARGET_LUFS: float = -16.0  # integrated loudness (EBU R128 gating)
+    AUDIO_PEAK_CEILING_DBFS: float = -1.0
+    AUDIO_TRIM_SILENCE: bool = True
+    AUDIO_SILENCE_THRESHOLD_DBFS: float = -50.0  # frames quieter than this count as silence
+    AUDIO_SILENCE_PAD_MS: int = 100  # silence kept around the speech
+    AUDIO_DELIVERY_FORMAT: str = "wav"  # wav or opus (Ogg Opus, much smaller downloads)
+    
+    # Synthetic local engine (used when no provider is configured)
+    SYNTHETIC_LATENCY_MODEL: str = "per_word"  # fixed, per_word or lognormal
+    SYNTHETIC_LATENCY_BASE: float = 0.5  # seconds per call
+    SYNTHETIC_LATENCY_PER_WORD: float = 0.05  # added per word (per_word and lognormal)
+    SYNTHETIC_LATENCY_SIGMA: float = 0.5  # lognormal spread around the per_word latency
+    SYNTHETIC_TRANSIENT_FAILURE_RATE: float = 0.0  # share of calls failing as if the provider was down
+    SYNTHETIC_PERMANENT_FAILURE_RATE: float = 0.0  # share of calls failing as if the input was bad
+    SYNTHETIC_SAMPLE_RATE: int = 24000
+    SYNTHETIC_WORDS_PER_MINUTE: int = 160
+    SYNTHETIC_DEFERRED_COMPLETION: bool = True  # complete via a delayed task instead of holding the worker
+    SYNTHETIC_SEED: Optional[int] = None
+    
+    # Streaming generations
+    STREAM_MAX_CHUNK_CHARS: int = 300  # longer sentences are split at clause boundaries
+    STREAM_POLL_INTERVAL: float = 0.25  # seconds between checks for new chunks
+    STREAM_TIMEOUT: int = 1800  # give up on a stream that stops producing chunks
+    STREAM_CHUNK_RETENTION: int = 3600  # keep chunk files this long after stitching
+    
+    # Sentence cache (streaming and incremental generations reuse unchanged sentences)
+    SEGMENT_CACHE: bool = True
+    SEGMENT_CACHE_DIR: str = ""  # shared storage; default: UPLOAD_DIR/segments
+    SEGMENT_CACHE_MAX_BYTES: int = 5 * 1024 ** 3
+    SEGMENT_CROSSFADE_MS: int = 30  # overlap at each sentence boundary of incremental generations
+    
+    # Preview generations (the first sentence only, on their own lane)
+    PREVIEW_MAX_WORDS: int = 25  # a longer first sentence is cut here
+    PREVIEW_CONCURRENCY: int = 4  # provider calls reserved for previews, per provider, across workers
+    PREVIEW_MAX_QUEUED: int = 50  # previews waiting at once before new ones are refused
     
     # Redis/Celery
     CELERY_BROKER_URL: str = "redis://localhost:6379/0"
     CELERY_RESULT_BACKEND: str = "redis://localhost:6379/0"
+    REDIS_URL: str = "redis://localhost:6379/1"  # coordination state; "memory://" for single-process
     
     class Config:
         env_file = ".env"
@@ -1,8 +1,10 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.config import settings
-from app.api import auth, samples, generation, library, websocket
+from app.api import auth, samples, generation, library, websocket, webhooks
 from app.logging_config import setup_logging
+from app.utils.websocket_manager import start_event_bridge, stop_event_bridge
+import asyncio
 
 # Setup logging
 setup_logging()
@@ -29,6 +31,16 @@ app.include_router(samples.router, prefix="/api/samples", tags=["Audio Samples"]
 app.include_router(generation.router, prefix="/api/generation", tags=["Generation"])
 app.include_router(library.router, prefix="/api/library", tags=["Library"])
 app.include_router(websocket.router, prefix="/api", tags=["WebSocket"])
+app.include_router(webhooks.router, prefix="/api/webhooks", tags=["Webhooks"])
+
+@app.on_event("startup")
+async def start_realtime_updates():
+    """Push worker status events to WebSocket clients of this process"""
+    start_event_bridge(asyncio.get_running_loop())
+
+@app.on_event("shutdown")
+async def stop_realtime_updates():
+    stop_event_bridge()
 
 @app.get("/")
 def root():
@@ -3,6 +3,7 @@ from app.models.audio_sample import AudioSample, UploadType
 from app.models.generated_audio import GeneratedAudio, GenerationStatus
 from app.models.user_session import UserSession
 from app.models.generation_queue import GenerationQueue, QueueStatus
+from app.models.task_outbox import TaskOutbox
 
 __all__ = [
     "User",
@@ -13,4 +14,5 @@ __all__ = [
     "UserSession",
     "GenerationQueue",
     "QueueStatus",
+    "TaskOutbox",
 ]
@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Enum, Float
-from sqlalchemy.sql import func
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Enum, Float, Boolean
+from sqlalchemy.sql import func, false
 from sqlalchemy.orm import relationship
 from app.database import Base
 import enum
@@ -9,6 +9,7 @@ class GenerationStatus(str, enum.Enum):
     PROCESSING = "processing"
     COMPLETED = "completed"
     FAILED = "failed"
+    CANCELLED = "cancelled"
 
 class GeneratedAudio(Base):
     __tablename__ = "generated_audio"
@@ -24,6 +25,15 @@ class GeneratedAudio(Base):
     status = Column(Enum(GenerationStatus), default=GenerationStatus.PENDING)
     generated_at = Column(DateTime(timezone=True), server_default=func.now())
     completed_at = Column(DateTime(timezone=True))
+    prediction_id = Column(String(64), index=True)  # Replicate prediction awaiting webhook
+    provider = Column(String(50))  # provider the job was routed to
+    streaming = Column(Boolean, nullable=False, default=False, server_default=false())  # synthesized and served chunk by chunk
+    incremental = Column(Boolean, nullable=False, default=False, server_default=false())  # stitched from cached sentences
+    preview = Column(Boolean, nullable=False, default=False, server_default=false())  # first sentence only, on the preview lane
+    source_script = Column(Text)  # full script a preview was cut from, for promotion
+    checksum = Column(String(64))  # SHA-256 of the delivered samples
+    loudness_lufs = Column(Float)
+    peak_dbfs = Column(Float)
     
     # Relationships
     user = relationship("User", back_populates="generated_audios")
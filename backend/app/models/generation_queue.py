@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, DateTime, ForeignKey, Enum
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Enum, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.database import Base
@@ -9,6 +9,7 @@ class QueueStatus(str, enum.Enum):
     PROCESSING = "processing"
     COMPLETED = "completed"
     FAILED = "failed"
+    CANCELLED = "cancelled"
 
 class GenerationQueue(Base):
     __tablename__ = "generation_queue"
@@ -16,11 +17,22 @@ class GenerationQueue(Base):
     queue_id = Column(Integer, primary_key=True, index=True)
     audio_id = Column(Integer, ForeignKey("generated_audio.audio_id", ondelete="CASCADE"), unique=True, nullable=False)
     user_id = Column(Integer, ForeignKey("users.user_id", ondelete="CASCADE"), nullable=False)
-    priority = Column(Integer, default=0)
+    priority = Column(Integer, default=0)  # the user's priority tier; higher is dispatched first
     status = Column(Enum(QueueStatus), default=QueueStatus.QUEUED)
     queued_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True))  # the current run was claimed by a worker
     processed_at = Column(DateTime(timezone=True))
     retry_count = Column(Integer, default=0)
+    leased_by = Column(String(255))  # worker currently running the job
+    lease_expires_at = Column(DateTime(timezone=True), index=True)  # renewed by the worker's heartbeat
+    last_error = Column(Text)
+    error_kind = Column(String(20))  # transient or permanent
+    dead_lettered_at = Column(DateTime(timezone=True), index=True)  # set once retries are given up
     
     # Relationships
     audio = relationship("GeneratedAudio", back_populates="queue")
+    
+    __table_args__ = (
+        # Queue positions are range counts on this index
+        Index("ix_generation_queue_status_priority_queued_at", "status", "priority", "queued_at", "queue_id"),
+    )
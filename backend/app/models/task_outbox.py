@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, JSON
+from sqlalchemy.sql import func
+from app.database import Base
+
+class TaskOutbox(Base):
+    """Celery task waiting to be published, written in the same transaction as its data"""
+    __tablename__ = "task_outbox"
+    
+    outbox_id = Column(Integer, primary_key=True, index=True)
+    task_name = Column(String(255), nullable=False)
+    args = Column(JSON, nullable=False, default=list)
+    options = Column(JSON)  # apply_async options, e.g. queue or countdown
+    audio_id = Column(Integer, index=True)  # generation the task works on, so cancelling finds it
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    sent_at = Column(DateTime(timezone=True), index=True)
+    task_id = Column(String(255))
+    attempts = Column(Integer, default=0)
+    last_error = Column(Text)
+    next_attempt_at = Column(DateTime(timezone=True))  # backoff after a failed publish
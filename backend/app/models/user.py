@@ -14,6 +14,7 @@ class User(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     is_active = Column(Boolean, default=True)
+    priority_tier = Column(Integer, nullable=False, default=0, server_default="0")  # above 0: queued first, never shed
     
     # Relationships
     audio_samples = relationship("AudioSample", back_populates="user", cascade="all, delete-orphan")
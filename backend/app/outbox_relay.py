@@ -0,0 +1,31 @@
+"""
+Outbox relay process: publishes committed task records to Celery.
+
+Run alongside the API and workers:
+    python -m app.outbox_relay
+"""
+import signal
+import logging
+from app.database import SessionLocal
+from app.services.outbox import OutboxRelay
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    stopping = []
+    
+    def request_stop(signum, frame):
+        logger.info("Stopping outbox relay...")
+        stopping.append(signum)
+    
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+    
+    logger.info("📮 Outbox relay started")
+    OutboxRelay().run(SessionLocal, stop=lambda: bool(stopping))
+
+
+if __name__ == "__main__":
+    main()
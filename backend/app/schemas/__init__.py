@@ -14,7 +14,8 @@ from app.schemas.generation import (
     GenerationCreate,
     GenerationResponse,
     GenerationStatusResponse,
-    GenerationList
+    GenerationList,
+    DeadLetterRequeueRequest
 )
 from app.schemas.library import (
     LibraryItem,
@@ -34,6 +35,7 @@ __all__ = [
     "GenerationResponse",
     "GenerationStatusResponse",
     "GenerationList",
+    "DeadLetterRequeueRequest",
     "LibraryItem",
     "LibraryResponse",
 ]
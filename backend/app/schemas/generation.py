@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 from app.models.generated_audio import GenerationStatus
 
 # Generation Request
@@ -10,6 +10,9 @@ class GenerationCreate(BaseModel):
     sample_id: int = Field(..., gt=0)
     model_name: str = Field(..., min_length=1, max_length=100)
     script_text: str = Field(..., min_length=1, max_length=5000)
+    stream: bool = False  # synthesize sentence by sentence; listen on /{audio_id}/stream
+    incremental: bool = False  # reuse sentences already synthesized for this voice (edited scripts)
+    preview: bool = False  # only the first sentence, fast; promote with /{audio_id}/promote
 
 # Generation Response
 class GenerationResponse(BaseModel):
@@ -26,15 +29,30 @@ class GenerationResponse(BaseModel):
     status: GenerationStatus
     generated_at: datetime
     completed_at: Optional[datetime]
+    streaming: bool = False
+    incremental: bool = False
+    preview: bool = False
+    provider: Optional[str] = None
+    checksum: Optional[str] = None  # SHA-256 of the delivered samples
+    loudness_lufs: Optional[float] = None
+    peak_dbfs: Optional[float] = None
 
 # Generation Status Check
 class GenerationStatusResponse(BaseModel):
     audio_id: int
     status: GenerationStatus
+    stage: Optional[str] = None  # queued, converting, uploading, inferring, ...
     progress: Optional[int] = None  # 0-100
     message: Optional[str] = None
+    estimated_time_remaining: Optional[int] = None  # seconds
+    poll_after: Optional[int] = None  # suggested seconds before polling again
+    updated_at: Optional[float] = None  # unix time of the last progress event
     
 # Generation List
 class GenerationList(BaseModel):
     generations: list[GenerationResponse]
     total: int
+
+# Dead-letter Requeue Request
+class DeadLetterRequeueRequest(BaseModel):
+    audio_ids: Optional[List[int]] = None  # default: every dead-lettered generation
@@ -0,0 +1,163 @@
+"""
+Admission control for new generations.
+
+A generation is only accepted while the shared backlog can still be worked
+off in reasonable time: beyond a queue depth, or a drain time estimated from
+learned processing times, new work is refused with 429 and a Retry-After
+computed from how long the backlog needs to shrink back under the limit.
+Each user is also capped on outstanding (queued or processing) jobs, so one
+client cannot fill the queue for everyone. Users on a priority tier are
+never shed.
+
+Previews run on their own lane, so the shared backlog does not hold them
+up; they are only refused when too many previews are already waiting.
+"""
+import math
+import time
+import logging
+from typing import NamedTuple
+from fastapi import HTTPException, status
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.models.generated_audio import GeneratedAudio
+from app.models.generation_queue import GenerationQueue, QueueStatus
+from app.models.user import User
+from app.services.eta_estimator import eta_estimator
+from app.utils.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+REJECTIONS_KEY = "admission:rejections"  # hash of reason -> count
+OUTSTANDING_STATUSES = (QueueStatus.QUEUED, QueueStatus.PROCESSING)
+
+# Queue depth read at most once per second per process; creates arrive in bursts
+_depth_cache = {"expires": 0.0, "value": 0}
+
+
+class Backlog(NamedTuple):
+    queued: int
+    per_job_seconds: float  # processing time of a job like the one being admitted
+    drain_seconds: float  # time for the workers to work off the queue
+
+
+def _queued(db: Session) -> int:
+    now = time.monotonic()
+    if _depth_cache["expires"] <= now:
+        _depth_cache["value"] = db.query(GenerationQueue).filter(
+            GenerationQueue.status == QueueStatus.QUEUED
+        ).count()
+        _depth_cache["expires"] = now + settings.ADMISSION_DEPTH_CACHE_SECONDS
+    return _depth_cache["value"]
+
+
+def backlog(db: Session, word_count: int = 50) -> Backlog:
+    """The current queue and how long it would take to drain"""
+    from app.services.ai_service import get_ai_service
+
+    queued = _queued(db)
+    per_job = get_ai_service().estimate_processing_time_for_words(word_count)
+    return Backlog(queued, per_job, eta_estimator.queue_delay(queued, per_job))
+
+
+def is_exempt(user: User) -> bool:
+    return (user.priority_tier or 0) >= settings.ADMISSION_EXEMPT_TIER
+
+
+def _reject(reason: str, detail: str, retry_after: float) -> HTTPException:
+    retry_after = int(min(max(math.ceil(retry_after), 1), settings.ADMISSION_MAX_RETRY_AFTER))
+    try:
+        get_redis().hincrby(REJECTIONS_KEY, reason, 1)
+    except Exception as e:
+        logger.debug(f"Could not count rejection: {e}")
+    logger.info(f"🚦 Shedding generation request ({reason}), retry after {retry_after}s")
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=f"{detail} Please retry in {retry_after} seconds.",
+        headers={"Retry-After": str(retry_after)}
+    )
+
+
+def queued_previews(db: Session) -> int:
+    return db.query(GenerationQueue).join(
+        GeneratedAudio, GeneratedAudio.audio_id == GenerationQueue.audio_id
+    ).filter(
+        GenerationQueue.status == QueueStatus.QUEUED,
+        GeneratedAudio.preview.is_(True)
+    ).count()
+
+
+def admit(db: Session, user: User, script_text: str, preview: bool = False) -> None:
+    """
+    Accept a new generation or refuse it
+
+    Raises:
+        HTTPException: 429 with Retry-After when the user or the queue is over its limit
+    """
+    if not settings.ADMISSION_CONTROL or is_exempt(user):
+        return
+
+    word_count = len(script_text.split())
+    concurrency = max(settings.WORKER_CONCURRENCY, 1)
+
+    outstanding = db.query(GenerationQueue).filter(
+        GenerationQueue.user_id == user.user_id,
+        GenerationQueue.status.in_(OUTSTANDING_STATUSES)
+    ).count()
+    current = backlog(db, word_count)
+
+    if outstanding >= settings.ADMISSION_MAX_USER_OUTSTANDING:
+        # A slot frees up once one of the user's jobs has been worked off
+        raise _reject(
+            "user_outstanding",
+            f"You already have {outstanding} generations in progress.",
+            current.per_job_seconds * (outstanding - settings.ADMISSION_MAX_USER_OUTSTANDING + 1)
+        )
+
+    if preview:
+        excess_previews = queued_previews(db) - settings.PREVIEW_MAX_QUEUED + 1
+        if excess_previews > 0:
+            raise _reject(
+                "preview_depth",
+                "Too many previews are waiting.",
+                excess_previews * current.per_job_seconds / max(settings.PREVIEW_CONCURRENCY, 1)
+            )
+        return
+
+    # Time for the workers to bring each measure back under its limit
+    excess_jobs = current.queued - settings.ADMISSION_MAX_QUEUE_DEPTH + 1
+    excess_seconds = current.drain_seconds - settings.ADMISSION_MAX_DRAIN_SECONDS
+    if excess_jobs > 0:
+        raise _reject(
+            "queue_depth",
+            "The generation queue is full.",
+            excess_jobs * current.per_job_seconds / concurrency
+        )
+    if excess_seconds > 0:
+        raise _reject(
+            "drain_time",
+            f"The generation queue needs about {int(current.drain_seconds)} seconds to clear.",
+            excess_seconds
+        )
+
+
+def snapshot(db: Session) -> dict:
+    """Limits, the current backlog and rejection counts, for monitoring"""
+    current = backlog(db)
+    try:
+        rejections = {reason: int(count) for reason, count in get_redis().hgetall(REJECTIONS_KEY).items()}
+    except Exception:
+        rejections = {}
+    return {
+        "enabled": settings.ADMISSION_CONTROL,
+        "queued": current.queued,
+        "drain_seconds": int(round(current.drain_seconds)),
+        "queued_previews": queued_previews(db),
+        "limits": {
+            "max_queue_depth": settings.ADMISSION_MAX_QUEUE_DEPTH,
+            "max_drain_seconds": settings.ADMISSION_MAX_DRAIN_SECONDS,
+            "max_user_outstanding": settings.ADMISSION_MAX_USER_OUTSTANDING,
+            "exempt_tier": settings.ADMISSION_EXEMPT_TIER,
+            "max_queued_previews": settings.PREVIEW_MAX_QUEUED,
+        },
+        "rejections": rejections,
+    }
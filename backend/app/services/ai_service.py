@@ -1,11 +1,10 @@
 import os
-import uuid
-import time
-import shutil
-from typing import Tuple
+from typing import Callable, List, Optional, Tuple
 from app.config import settings
+from app.services.eta_estimator import eta_estimator
+from app.services.voice_providers import ProviderRegistry, ProviderRouter, VoiceProvider
 import logging
-import asyncio
+import threading
 
 logger = logging.getLogger(__name__)
 
@@ -13,42 +12,46 @@ class AIVoiceService:
     """
     AI Voice Cloning Service
     
-    Automatically uses Replicate if configured, otherwise falls back to mock
+    Routes each generation to one of the configured providers (PROVIDERS);
+    by default Replicate if configured, otherwise the local synthetic engine
     """
     
     def __init__(self):
         self.output_dir = os.path.join(settings.UPLOAD_DIR, "generated")
         os.makedirs(self.output_dir, exist_ok=True)
         
-        # Determine which service to use
-        self.use_real_ai = self._check_replicate_available()
+        self.registry = ProviderRegistry.from_settings(self.output_dir)
+        self.router = ProviderRouter(self.registry)
+        self.use_real_ai = any(provider.real for provider in self.registry.all())
         
+        names = ", ".join(provider.name for provider in self.registry.all())
         if self.use_real_ai:
-            from app.services.replicate_integration import ReplicateVoiceService
-            self.replicate_service = ReplicateVoiceService()
-            logger.info("✅ Using Replicate + Chatterbox for AI generation")
+            logger.info(f"✅ Using AI providers: {names}")
         else:
-            logger.info("⚠️  Using MOCK AI (set REPLICATE_API_TOKEN for real AI)")
+            logger.info("⚠️  Using MOCK AI: local synthetic audio (set REPLICATE_API_TOKEN for real AI)")
             logger.info("   Get your token at: https://replicate.com/account/api-tokens")
     
-    def _check_replicate_available(self) -> bool:
-        """Check if Replicate is configured"""
-        if not settings.REPLICATE_API_TOKEN:
-            return False
-        
-        try:
-            from app.services.replicate_integration import ReplicateVoiceService
-            service = ReplicateVoiceService()
-            return service.check_health()
-        except Exception as e:
-            logger.error(f"Replicate not available: {e}")
-            return False
+    def provider(self, name: Optional[str] = None) -> VoiceProvider:
+        """A configured provider by name (default: the first one)"""
+        return self.registry.get(name) if name else self.registry.primary
+    
+    def rank_providers(self, text: str) -> List[VoiceProvider]:
+        """Providers to try for this script, best first"""
+        return self.router.rank(len(text.split()))
+    
+    def warm_up(self):
+        """Build providers eagerly (called once per worker process)"""
+        for provider in self.registry.all():
+            provider.warm_up()
     
     def generate_speech(
         self,
         sample_path: str,
         text: str,
-        model_name: str
+        model_name: str,
+        on_progress: Optional[Callable] = None,
+        on_submitted: Optional[Callable[[str], None]] = None,
+        provider: Optional[str] = None
     ) -> Tuple[str, float, int]:
         """
         Generate speech from text using voice sample
@@ -57,77 +60,25 @@ class AIVoiceService:
             sample_path: Path to the audio sample file
             text: Text to synthesize
             model_name: Name for the model
+            on_progress: Optional callback(stage, fraction) for progress events
+            on_submitted: Optional callback(prediction_id) once a provider job exists
+            provider: Use this provider instead of routing
             
         Returns:
             Tuple of (output_path, duration_seconds, file_size_bytes)
         """
-        if self.use_real_ai:
-            try:
-                return self._generate_with_replicate(sample_path, text, model_name)
-            except Exception as e:
-                logger.error(f"Replicate failed, falling back to mock: {e}")
-                return self._generate_mock_audio(sample_path, text, model_name)
-        else:
-            return self._generate_mock_audio(sample_path, text, model_name)
+        # Provider failures propagate so the task can retry or fail the job;
+        # only unavailable providers (never called) fall through to the next
+        _, result = self.router.run(
+            len(text.split()),
+            lambda chosen: chosen.generate_speech(sample_path, text, model_name, on_progress, on_submitted),
+            pinned=provider
+        )
+        return result
     
-    def _generate_with_replicate(
-        self,
-        sample_path: str,
-        text: str,
-        model_name: str
-    ) -> Tuple[str, float, int]:
-        """Generate with Replicate"""
-        logger.info(f"🤖 Generating REAL AI audio with Replicate")
-        
-        # Run async function in sync context (for Celery compatibility)
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        try:
-            result = loop.run_until_complete(
-                self.replicate_service.generate_speech(sample_path, text, model_name)
-            )
-            return result
-        finally:
-            loop.close()
-    
-    def _generate_mock_audio(
-        self,
-        sample_path: str,
-        text: str,
-        model_name: str
-    ) -> Tuple[str, float, int]:
-        """
-        Generate mock audio for testing
-        """
-        logger.info(f"🎭 Generating MOCK audio for: {model_name}")
-        
-        # Simulate processing time (2 seconds per 10 words)
-        word_count = len(text.split())
-        processing_time = (word_count / 10) * 2
-        logger.info(f"⏱️  Simulating {processing_time:.1f}s processing for {word_count} words")
-        time.sleep(min(processing_time, 10))  # Cap at 10 seconds
-        
-        # Generate output filename
-        output_filename = f"{uuid.uuid4()}.wav"
-        output_path = os.path.join(self.output_dir, output_filename)
-        
-        # Copy the sample file as output (mock)
-        if os.path.exists(sample_path):
-            shutil.copy2(sample_path, output_path)
-            file_size = os.path.getsize(output_path)
-        else:
-            # Create a dummy file
-            with open(output_path, 'wb') as f:
-                f.write(b'RIFF' + b'\x00' * 1000)
-            file_size = os.path.getsize(output_path)
-        
-        # Estimate duration
-        duration = len(text.split()) * 0.1
-        
-        logger.info(f"✅ Mock audio generated: {output_path}")
-        
-        return output_path, duration, file_size
+    def provider_limits(self) -> dict:
+        """State of each provider's breaker and limiters, for monitoring and autoscaling"""
+        return {provider.name: provider.limits() for provider in self.registry.all()}
     
     def validate_sample(self, sample_path: str) -> bool:
         """Validate that audio sample is suitable for cloning"""
@@ -147,38 +98,107 @@ class AIVoiceService:
         
         return True
     
+    @property
+    def provider_name(self) -> str:
+        """The primary provider, for callers that report a single one"""
+        return self.registry.primary.name
+    
     def estimate_processing_time(self, text: str) -> int:
         """Estimate processing time in seconds"""
-        word_count = len(text.split())
-        
-        if self.use_real_ai:
-            # Replicate: ~10-30 seconds depending on text length
-            return max(15, int((word_count / 10) * 3))
-        else:
-            # Mock: ~2 seconds per 10 words
-            return max(5, int((word_count / 10) * 2))
+        return self.estimate_processing_time_for_words(len(text.split()))
+    
+    def estimate_processing_time_for_words(self, word_count: int) -> int:
+        """Estimate processing time in seconds for a script of word_count words"""
+        # On the provider the router would pick; learned timings when there are some
+        best = self.router.rank(word_count)[0]
+        return max(int(round(self.router.expected_latency(best, word_count))), 1)
+    
+    def estimate(self, text: str, queued_ahead: Optional[int] = None) -> dict:
+        """Processing time plus current queue delay, in seconds"""
+        processing = self.estimate_processing_time(text)
+        queue_delay = eta_estimator.queue_delay(queued_ahead, processing)
+        return {
+            "processing_seconds": processing,
+            "queue_delay_seconds": int(round(queue_delay)),
+            "total_seconds": int(round(processing + queue_delay)),
+        }
     
     def get_service_info(self) -> dict:
         """Get information about the AI service"""
+        primary = self.registry.primary
         info = {
             "mode": "replicate" if self.use_real_ai else "mock",
             "provider": "Replicate.com" if self.use_real_ai else "Mock",
-            "model": settings.REPLICATE_MODEL if self.use_real_ai else "N/A",
+            "model": getattr(primary, "model", "N/A"),
+            "providers": [
+                {
+                    "name": provider.name,
+                    "model": getattr(provider, "model", None),
+                    "available": provider.check_health(),
+                    "cost_per_word": provider.cost_per_word,
+                }
+                for provider in self.registry.all()
+            ],
         }
         
         if self.use_real_ai:
-            info["replicate_available"] = self.replicate_service.check_health()
+            info["replicate_available"] = any(p["available"] for p in info["providers"])
+            info["limits"] = self.provider_limits()
         
         return info
     
     def estimate_cost(self, text: str) -> dict:
-        """Estimate cost for generation"""
-        if self.use_real_ai:
-            return self.replicate_service.estimate_cost(text)
-        else:
-            return {
-                "estimated_duration_seconds": len(text.split()) * 0.1,
-                "estimated_cost_usd": 0.0,
-                "word_count": len(text.split()),
-                "note": "Mock mode - no cost"
-            }
+        """Estimate cost for generation, on the provider the router would pick"""
+        return self.rank_providers(text)[0].estimate_cost(text)
+
+
+# Process-wide service registry
+_service: Optional[AIVoiceService] = None
+_service_key: Optional[tuple] = None
+_service_lock = threading.Lock()
+
+
+def _service_config_key() -> tuple:
+    """Settings (and process) the cached service was built for"""
+    return (
+        os.getpid(),
+        settings.REPLICATE_API_TOKEN,
+        settings.REPLICATE_MODEL,
+        settings.REPLICATE_WEBHOOK_URL,
+        settings.UPLOAD_DIR,
+        settings.PROVIDERS,
+        repr(settings.PROVIDER_MODELS),
+    )
+
+
+def get_ai_service() -> AIVoiceService:
+    """
+    Get the shared AIVoiceService for this process
+    
+    The service is built once and reused; it is rebuilt when the relevant
+    settings change or when called from a forked child process.
+    """
+    global _service, _service_key
+    
+    key = _service_config_key()
+    service = _service
+    if service is not None and _service_key == key:
+        return service
+    
+    with _service_lock:
+        if _service is None or _service_key != key:
+            _service = AIVoiceService()
+            _service_key = key
+        return _service
+
+
+def reset_ai_service() -> None:
+    """Drop the shared service so the next call rebuilds it"""
+    global _service, _service_key, _service_lock
+    _service = None
+    _service_key = None
+    _service_lock = threading.Lock()
+
+
+# A fork can happen while another thread holds the lock; start children clean
+os.register_at_fork(after_in_child=reset_ai_service)
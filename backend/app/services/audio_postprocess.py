@@ -0,0 +1,350 @@
+"""
+Postprocessing of generated audio.
+
+Outputs are read through a memory map and processed block by block with
+NumPy, so memory stays flat however long the audio is:
+
+1. Analysis pass: per 10 ms frame, the K-weighted energy (computed in the
+   frequency domain from the BS.1770 filter response), the sample peak and
+   the RMS level. Integrated loudness is gated over 400 ms blocks as in
+   EBU R128; the frame levels locate leading and trailing silence.
+2. Render pass: trim, apply the normalization gain under a look-ahead peak
+   limiter, write the delivery file (WAV, or Opus when configured) and
+   measure its duration, peak and SHA-256 checksum as the samples go out.
+"""
+import os
+import uuid
+import struct
+import hashlib
+import logging
+import contextlib
+import wave
+from typing import Iterator, NamedTuple, Optional, Tuple
+import numpy as np
+from app.config import settings
+from app.utils.wav import WavFormat
+
+logger = logging.getLogger(__name__)
+
+FRAME_SECONDS = 0.01  # analysis resolution
+GATE_BLOCK_FRAMES = 40  # 400 ms gating blocks...
+GATE_HOP_FRAMES = 10  # ...overlapping by 75%
+ABSOLUTE_GATE_LUFS = -70.0
+RELATIVE_GATE_LU = -10.0
+MAX_GAIN_DB = 20.0  # never lift near-silent output further than this
+LIMITER_RADIUS_FRAMES = 5  # look-ahead and release, in frames either side
+CHUNK_FRAMES = 1000  # frames per processing step (10 s)
+OPUS_SAMPLE_RATES = (8000, 12000, 16000, 24000, 48000)
+# BS.1770 K-weighting filters (b, a), as specified for 48 kHz
+K_WEIGHTING_RATE = 48000
+SHELF_FILTER = ((1.53512485958697, -2.69169618940638, 1.19839281085285), (1.0, -1.69065929318241, 0.73248077421585))
+HIGHPASS_FILTER = ((1.0, -2.0, 1.0), (1.0, -1.99004745483398, 0.99007225036621))
+
+_WAVE_FORMAT_PCM = 1
+_WAVE_FORMAT_FLOAT = 3
+_WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+class PostprocessResult(NamedTuple):
+    path: str
+    duration: float  # seconds
+    file_size: int  # bytes
+    peak_dbfs: Optional[float]  # None for silent output
+    loudness_lufs: Optional[float]  # integrated loudness after normalization
+    checksum: str  # SHA-256 of the delivered PCM samples
+
+
+class Analysis(NamedTuple):
+    frame_energy: np.ndarray  # K-weighted mean square per frame
+    frame_peaks: np.ndarray
+    frame_levels: np.ndarray  # RMS per frame, dBFS
+
+
+def map_pcm(path: str) -> Tuple[WavFormat, np.ndarray]:
+    """
+    Memory-map the samples of a PCM or float WAV file
+
+    Returns:
+        The format and a read-only (frames, channels) array
+
+    Raises:
+        ValueError: not a WAV file this module can read
+    """
+    with open(path, "rb") as f:
+        header = f.read(12)
+        if len(header) < 12 or header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+            raise ValueError(f"{path} is not a WAV file")
+
+        fmt_chunk = None
+        while True:
+            chunk_header = f.read(8)
+            if len(chunk_header) < 8:
+                raise ValueError(f"{path} has no data chunk")
+            chunk_id, size = chunk_header[:4], struct.unpack("<I", chunk_header[4:])[0]
+            if chunk_id == b"fmt ":
+                fmt_chunk = f.read(size)
+            elif chunk_id == b"data":
+                data_offset = f.tell()
+                break
+            else:
+                f.seek(size, os.SEEK_CUR)
+            if size % 2:
+                f.seek(1, os.SEEK_CUR)  # chunks are word aligned
+
+    if fmt_chunk is None:
+        raise ValueError(f"{path} has no fmt chunk")
+    tag, channels, rate, _, _, bits = struct.unpack("<HHIIHH", fmt_chunk[:16])
+    if tag == _WAVE_FORMAT_EXTENSIBLE and len(fmt_chunk) >= 26:
+        tag = struct.unpack("<H", fmt_chunk[24:26])[0]
+
+    dtypes = {
+        (_WAVE_FORMAT_PCM, 16): np.dtype("<i2"),
+        (_WAVE_FORMAT_PCM, 32): np.dtype("<i4"),
+        (_WAVE_FORMAT_FLOAT, 32): np.dtype("<f4"),
+    }
+    dtype = dtypes.get((tag, bits))
+    if dtype is None:
+        raise ValueError(f"Unsupported WAV encoding in {path}: format {tag}, {bits} bits")
+
+    # The data size field is unreliable in streamed files; trust the file length
+    frames = (os.path.getsize(path) - data_offset) // (dtype.itemsize * channels)
+    samples = np.memmap(path, dtype=dtype, mode="r", offset=data_offset, shape=(frames, channels))
+    return WavFormat(channels, dtype.itemsize, rate), samples
+
+
+def _as_float(block: np.ndarray) -> np.ndarray:
+    if block.dtype.kind == "f":
+        return block.astype(np.float32)
+    return block.astype(np.float32) / float(np.iinfo(block.dtype).max + 1)
+
+
+def _biquad_power(b, a, w: np.ndarray) -> np.ndarray:
+    z = np.exp(-1j * w)
+    numerator = b[0] + b[1] * z + b[2] * z * z
+    denominator = a[0] + a[1] * z + a[2] * z * z
+    return np.abs(numerator / denominator) ** 2
+
+
+def k_weighting(frame_length: int, rate: int) -> np.ndarray:
+    """
+    Weights turning a frame's rfft power spectrum into its K-weighted mean square
+
+    The BS.1770 pre-filter (high shelf) and RLB high-pass, folded together
+    with the Parseval factors of the rfft. The filters are the standard's
+    48 kHz coefficients evaluated at each bin's frequency, so other sample
+    rates get the reference response rather than a re-designed approximation.
+    """
+    frequencies = np.arange(frame_length // 2 + 1) * rate / frame_length
+    w = np.minimum(2 * np.pi * frequencies / K_WEIGHTING_RATE, np.pi)
+    response = _biquad_power(*SHELF_FILTER, w) * _biquad_power(*HIGHPASS_FILTER, w)
+
+    # Every bin but DC (and Nyquist, for even lengths) stands for two
+    parseval = np.full(frequencies.shape, 2.0)
+    parseval[0] = 1.0
+    if frame_length % 2 == 0:
+        parseval[-1] = 1.0
+    return response * parseval / frame_length ** 2
+
+
+def _chunks(samples: np.ndarray, frame_length: int, start: int = 0, stop: Optional[int] = None) -> Iterator[Tuple[int, np.ndarray]]:
+    """(first sample, float block) over samples[start:stop], in whole-frame steps"""
+    stop = len(samples) if stop is None else stop
+    step = frame_length * CHUNK_FRAMES
+    for offset in range(start, stop, step):
+        yield offset, _as_float(samples[offset:min(offset + step, stop)])
+
+
+def analyze(samples: np.ndarray, rate: int) -> Analysis:
+    """Frame energies, peaks and levels, in one pass"""
+    frame_length = max(int(rate * FRAME_SECONDS), 1)
+    weights = k_weighting(frame_length, rate)
+
+    energies, peaks, levels = [], [], []
+    for _, block in _chunks(samples, frame_length):
+        count = -(-len(block) // frame_length)
+        padded = np.zeros((count * frame_length, block.shape[1]), dtype=np.float32)
+        padded[:len(block)] = block
+        frames = padded.reshape(count, frame_length, block.shape[1])
+
+        spectrum = np.abs(np.fft.rfft(frames, axis=1)) ** 2
+        # Channel energies add up (BS.1770 weights 1.0 for front channels)
+        energies.append(np.einsum("fkc,k->f", spectrum, weights))
+        peaks.append(np.abs(frames).max(axis=(1, 2)))
+        levels.append(np.sqrt((frames ** 2).mean(axis=(1, 2))))
+
+    if not energies:
+        empty = np.zeros(0, dtype=np.float32)
+        return Analysis(empty, empty, empty)
+
+    with np.errstate(divide="ignore"):
+        frame_levels = 20 * np.log10(np.concatenate(levels))
+    return Analysis(np.concatenate(energies), np.concatenate(peaks), frame_levels)
+
+
+def gated_loudness(frame_energy: np.ndarray) -> Optional[float]:
+    """Integrated loudness (LUFS) of K-weighted frame energies, gated as in EBU R128"""
+    if len(frame_energy) >= GATE_BLOCK_FRAMES:
+        cumulative = np.concatenate(([0.0], np.cumsum(frame_energy, dtype=np.float64)))
+        starts = np.arange(0, len(frame_energy) - GATE_BLOCK_FRAMES + 1, GATE_HOP_FRAMES)
+        blocks = (cumulative[starts + GATE_BLOCK_FRAMES] - cumulative[starts]) / GATE_BLOCK_FRAMES
+    else:
+        blocks = np.array([frame_energy.mean()]) if len(frame_energy) else np.zeros(0)
+
+    with np.errstate(divide="ignore"):
+        block_loudness = -0.691 + 10 * np.log10(blocks)
+    blocks = blocks[block_loudness > ABSOLUTE_GATE_LUFS]
+    if not len(blocks):
+        return None
+    relative_gate = -0.691 + 10 * np.log10(blocks.mean()) + RELATIVE_GATE_LU
+    with np.errstate(divide="ignore"):
+        blocks = blocks[-0.691 + 10 * np.log10(blocks) > relative_gate]
+    return float(-0.691 + 10 * np.log10(blocks.mean()))
+
+
+def limiter_gains(frame_peaks: np.ndarray, gain: float, ceiling: float) -> np.ndarray:
+    """
+    Per-frame gain keeping gain * samples under the ceiling
+
+    The reduction each frame needs is spread over its neighbours (a minimum
+    then a moving average over the same radius), which gives the limiter its
+    look-ahead and release without any frame ending above the ceiling.
+    """
+    needed = np.minimum(1.0, ceiling / np.maximum(frame_peaks * gain, 1e-12))
+    radius = LIMITER_RADIUS_FRAMES
+    padded = np.pad(needed, radius, mode="edge")
+    window = 2 * radius + 1
+    held = np.lib.stride_tricks.sliding_window_view(padded, window).min(axis=1)
+    held = np.pad(held, radius, mode="edge")
+    return np.convolve(held, np.ones(window) / window, mode="valid")
+
+
+def trim_bounds(frame_levels: np.ndarray, threshold_dbfs: float, pad_frames: int) -> Tuple[int, int]:
+    """First and last+1 frame to keep once leading and trailing silence is cut"""
+    voiced = np.flatnonzero(frame_levels > threshold_dbfs)
+    if not len(voiced):
+        return 0, len(frame_levels)
+    return max(voiced[0] - pad_frames, 0), min(voiced[-1] + 1 + pad_frames, len(frame_levels))
+
+
+class _WavSink:
+    def __init__(self, path: str, fmt: WavFormat):
+        self.file = wave.open(path, "wb")
+        self.file.setnchannels(fmt.channels)
+        self.file.setsampwidth(2)
+        self.file.setframerate(fmt.frame_rate)
+
+    def write(self, pcm: np.ndarray) -> None:
+        self.file.writeframes(pcm.tobytes())
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class _OpusSink:
+    def __init__(self, path: str, fmt: WavFormat):
+        import soundfile
+        self.file = soundfile.SoundFile(
+            path, "w", samplerate=fmt.frame_rate, channels=fmt.channels, format="OGG", subtype="OPUS"
+        )
+
+    def write(self, pcm: np.ndarray) -> None:
+        self.file.write(pcm)
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def _delivery_format(fmt: WavFormat) -> str:
+    delivery = settings.AUDIO_DELIVERY_FORMAT
+    if delivery == "opus":
+        try:
+            import soundfile
+            supported = "OPUS" in soundfile.available_subtypes("OGG")
+        except (ImportError, OSError):
+            supported = False
+        if not supported or fmt.frame_rate not in OPUS_SAMPLE_RATES:
+            logger.warning(f"Cannot encode Opus at {fmt.frame_rate} Hz here, delivering WAV")
+            return "wav"
+    return delivery
+
+
+def postprocess_audio(path: str, output_dir: Optional[str] = None) -> PostprocessResult:
+    """
+    Normalize, limit and trim a generated WAV file into its delivery file
+
+    A WAV delivered next to its source replaces it once complete. Any other
+    delivery file is named after the source and the source is left in
+    place, for the caller to delete once the new path has been recorded; a
+    retry then finds the source again and rewrites the same delivery file.
+
+    Raises:
+        ValueError: the file is not a WAV file we can map
+    """
+    fmt, samples = map_pcm(path)
+    rate = fmt.frame_rate
+    frame_length = max(int(rate * FRAME_SECONDS), 1)
+
+    analysis = analyze(samples, rate)
+    first, last = 0, len(analysis.frame_levels)
+    if settings.AUDIO_TRIM_SILENCE:
+        pad = int(settings.AUDIO_SILENCE_PAD_MS / 1000 / FRAME_SECONDS)
+        first, last = trim_bounds(analysis.frame_levels, settings.AUDIO_SILENCE_THRESHOLD_DBFS, pad)
+
+    # Measure what will be delivered: gating blocks straddling cut silence
+    # would otherwise pull the measurement down
+    loudness = gated_loudness(analysis.frame_energy[first:last])
+    ceiling = 10 ** (settings.AUDIO_PEAK_CEILING_DBFS / 20)
+    gain = 1.0
+    if settings.AUDIO_NORMALIZE and loudness is not None:
+        gain_db = min(settings.AUDIO_TARGET_LUFS - loudness, MAX_GAIN_DB)
+        gain = 10 ** (gain_db / 20)
+    frame_gains = limiter_gains(analysis.frame_peaks, gain, ceiling) * gain
+
+    delivery = _delivery_format(fmt)
+    extension = "ogg" if delivery == "opus" else "wav"
+    output_dir = output_dir or os.path.dirname(path)
+    final_path = os.path.join(output_dir, f"{os.path.splitext(os.path.basename(path))[0]}.{extension}")
+    # Written under a temporary name so nothing ever reads half a file
+    output_path = os.path.join(output_dir, f".{uuid.uuid4()}.{extension}")
+    sink = _OpusSink(output_path, fmt) if delivery == "opus" else _WavSink(output_path, fmt)
+
+    digest = hashlib.sha256()
+    peak = 0.0
+    written = 0
+    frame_centers = (np.arange(len(frame_gains)) + 0.5) * frame_length
+    try:
+        stop = min(last * frame_length, len(samples))
+        for offset, block in _chunks(samples, frame_length, first * frame_length, stop):
+            positions = np.arange(offset, offset + len(block))
+            block *= np.interp(positions, frame_centers, frame_gains).astype(np.float32)[:, None]
+            np.clip(block, -ceiling, ceiling, out=block)
+            pcm = np.round(block * 32767).astype("<i2")
+            sink.write(pcm)
+            digest.update(pcm.tobytes())
+            peak = max(peak, float(np.abs(block).max(initial=0.0)))
+            written += len(pcm)
+    except BaseException:
+        sink.close()
+        with contextlib.suppress(OSError):
+            os.remove(output_path)
+        raise
+    sink.close()
+    del samples
+    os.replace(output_path, final_path)
+    output_path = final_path
+
+    if loudness is not None:
+        loudness = round(loudness + 20 * float(np.log10(gain)), 1)
+    return PostprocessResult(
+        output_path,
+        round(written / rate, 2),
+        os.path.getsize(output_path),
+        round(20 * float(np.log10(peak)), 1) if peak > 0 else None,
+        loudness,
+        digest.hexdigest(),
+    )
+
+
+def media_type_for(path: str) -> str:
+    """Content type to serve a delivered file with"""
+    return "audio/ogg" if path.endswith(".ogg") else "audio/wav"
@@ -0,0 +1,113 @@
+"""
+Cancellation of queued and in-flight generations.
+
+Cancelling sets a flag in Redis, drops or revokes the generation's Celery
+tasks and cancels its provider prediction. Workers check the flag between
+stages (one EXISTS per check) and stop without spending more provider time;
+a task that is already running cannot be interrupted mid-call, so the flag
+is what actually stops it.
+"""
+import logging
+from typing import Callable, List, Optional
+from sqlalchemy.orm import Session
+from app.models.generation_queue import GenerationQueue
+from app.models.task_outbox import TaskOutbox
+from app.utils.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+CANCEL_KEY_PREFIX = "generation:cancel:"
+CANCEL_TTL = 24 * 60 * 60  # longer than any job stays queued or running
+
+# Tasks that act on a generation, with the audio id as their first argument
+GENERATION_TASK_NAMES = (
+    "app.tasks.generation_tasks.process_voice_generation",
+    "app.tasks.generation_tasks.finalize_generation",
+)
+
+
+class GenerationCancelled(Exception):
+    """The user cancelled the generation; stop working on it"""
+
+    def __init__(self, audio_id: int):
+        super().__init__(f"Generation {audio_id} was cancelled")
+        self.audio_id = audio_id
+
+
+def _cancel_key(audio_id: int) -> str:
+    return f"{CANCEL_KEY_PREFIX}{audio_id}"
+
+
+def request_cancel(audio_id: int) -> None:
+    """Raise the cancellation flag for workers to see"""
+    get_redis().set(_cancel_key(audio_id), 1, ex=CANCEL_TTL)
+
+
+def clear_cancel(audio_id: int) -> None:
+    """Lower the flag, e.g. when a cancelled generation is retried"""
+    get_redis().delete(_cancel_key(audio_id))
+
+
+def is_cancelled(audio_id: int) -> bool:
+    """Whether the generation has been cancelled (False if Redis is unreachable)"""
+    try:
+        return bool(get_redis().exists(_cancel_key(audio_id)))
+    except Exception as e:
+        logger.warning(f"Could not check cancellation of audio_id={audio_id}: {e}")
+        return False
+
+
+def check_cancelled(audio_id: int) -> None:
+    """
+    Stop here if the generation has been cancelled
+
+    Raises:
+        GenerationCancelled: the flag is set
+    """
+    if is_cancelled(audio_id):
+        raise GenerationCancelled(audio_id)
+
+
+def cancellable(audio_id: int, on_progress: Callable) -> Callable:
+    """Wrap a progress callback so every stage change is also a cancellation check"""
+    def report(stage, fraction: Optional[float] = None):
+        check_cancelled(audio_id)
+        on_progress(stage, fraction)
+    return report
+
+
+def revoke_generation_tasks(db: Session, audio_id: int, queue_item: Optional[GenerationQueue] = None) -> List[str]:
+    """
+    Keep the generation's tasks from running (the caller commits)
+
+    Outbox records not yet published are dropped; published ones, and the
+    task holding the lease, are revoked so queued copies and scheduled
+    retries are discarded by the workers.
+
+    Returns:
+        Celery task ids that were revoked
+    """
+    task_ids = []
+    records = db.query(TaskOutbox).filter(
+        TaskOutbox.audio_id == audio_id,
+        TaskOutbox.task_name.in_(GENERATION_TASK_NAMES)
+    ).all()
+    for record in records:
+        if record.sent_at is None:
+            db.delete(record)
+        elif record.task_id:
+            task_ids.append(record.task_id)
+
+    if queue_item is not None and queue_item.leased_by and queue_item.leased_by.count(":") >= 2:
+        # Lease owners are host:pid:task_id
+        task_ids.append(queue_item.leased_by.rsplit(":", 1)[-1])
+
+    task_ids = list(dict.fromkeys(task_ids))
+    if task_ids:
+        from app.celery_app import celery_app
+        try:
+            celery_app.control.revoke(task_ids)
+        except Exception as e:
+            # The flag still stops them when they start
+            logger.warning(f"Could not revoke tasks of audio_id={audio_id}: {e}")
+    return task_ids
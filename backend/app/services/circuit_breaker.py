@@ -0,0 +1,239 @@
+"""
+Circuit breaker and bulkhead around AI provider calls, shared through Redis.
+
+The breaker counts calls, failures and slow calls per provider in short time
+buckets. When the error or slow-call rate over the window crosses its
+threshold it opens: calls fail fast with ProviderUnavailableError and the
+task puts the job back in the queue. After CIRCUIT_OPEN_SECONDS one probe
+call is let through (half-open); its outcome closes or re-opens the circuit.
+
+The bulkhead caps concurrent provider calls across all workers with a
+sorted set of slot tokens; slots of crashed workers expire on their own.
+"""
+import enum
+import time
+import uuid
+import logging
+from contextlib import contextmanager
+from typing import Callable, Optional, Union
+from app.config import settings
+from app.services.retry_policy import TransientGenerationError
+from app.utils.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderUnavailableError(TransientGenerationError):
+    """The provider is not being called right now; hold the job and try later"""
+
+
+class CircuitOpenError(ProviderUnavailableError):
+    pass
+
+
+class BulkheadFullError(ProviderUnavailableError):
+    pass
+
+
+class CircuitState(str, enum.Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Error-rate and latency circuit breaker for one provider"""
+
+    def __init__(self, name: str, clock=time.time):
+        self.name = name
+        self.clock = clock
+        self.state_key = f"circuit:{name}"
+        self.probe_key = f"circuit:{name}:probe"
+
+    def _bucket_key(self, bucket: int) -> str:
+        return f"circuit:{self.name}:bucket:{bucket}"
+
+    def _current_bucket(self) -> int:
+        return int(self.clock() // settings.CIRCUIT_BUCKET_SECONDS)
+
+    def state(self) -> CircuitState:
+        data = get_redis().hgetall(self.state_key)
+        if data.get("state") != CircuitState.OPEN.value:
+            return CircuitState.CLOSED
+        if self.clock() >= float(data["opened_at"]) + settings.CIRCUIT_OPEN_SECONDS:
+            return CircuitState.HALF_OPEN
+        return CircuitState.OPEN
+
+    def before_call(self) -> bool:
+        """
+        Check whether a call may go ahead
+
+        Returns:
+            True if this call is the half-open probe
+
+        Raises:
+            CircuitOpenError: the circuit is open (or another call is probing)
+        """
+        state = self.state()
+        if state == CircuitState.CLOSED:
+            return False
+
+        if state == CircuitState.HALF_OPEN:
+            client = get_redis()
+            if client.set(self.probe_key, self.clock(), nx=True, ex=settings.CIRCUIT_PROBE_TIMEOUT):
+                logger.info(f"🔌 Circuit {self.name} half-open, probing provider")
+                return True
+            raise CircuitOpenError(f"{self.name} circuit is half-open", retry_after=settings.CIRCUIT_OPEN_SECONDS)
+
+        opened_at = float(get_redis().hget(self.state_key, "opened_at") or self.clock())
+        remaining = max(opened_at + settings.CIRCUIT_OPEN_SECONDS - self.clock(), 1.0)
+        raise CircuitOpenError(f"{self.name} circuit is open", retry_after=remaining)
+
+    def release_probe(self) -> None:
+        """Give up the probe without an outcome, e.g. when the call was turned away before reaching the provider"""
+        try:
+            get_redis().delete(self.probe_key)
+        except Exception as e:
+            logger.warning(f"Could not release probe of circuit {self.name}: {e}")
+
+    def record(self, latency: float, failed: bool, probe: bool = False) -> None:
+        """Record the outcome of a provider call"""
+        try:
+            client = get_redis()
+            if probe:
+                client.delete(self.probe_key)
+                if failed:
+                    self._open("probe failed")
+                else:
+                    self._close()
+                return
+
+            key = self._bucket_key(self._current_bucket())
+            client.hincrby(key, "calls", 1)
+            if failed:
+                client.hincrby(key, "errors", 1)
+            if latency >= settings.CIRCUIT_SLOW_CALL_SECONDS:
+                client.hincrby(key, "slow", 1)
+            client.expire(key, settings.CIRCUIT_WINDOW_SECONDS + settings.CIRCUIT_BUCKET_SECONDS)
+
+            if self.state() == CircuitState.CLOSED:
+                reason = self._trip_reason()
+                if reason:
+                    self._open(reason)
+        except Exception as e:
+            # A Redis problem must not take provider calls down with it
+            logger.warning(f"Could not record call outcome for circuit {self.name}: {e}")
+
+    def window_stats(self) -> dict:
+        """Call, error and slow-call counts over the window since the circuit last closed"""
+        client = get_redis()
+        closed_at = float(client.hget(self.state_key, "closed_at") or 0)
+        first_bucket = max(
+            self._current_bucket() - settings.CIRCUIT_WINDOW_SECONDS // settings.CIRCUIT_BUCKET_SECONDS + 1,
+            int(closed_at // settings.CIRCUIT_BUCKET_SECONDS)
+        )
+
+        totals = {"calls": 0, "errors": 0, "slow": 0}
+        for bucket in range(first_bucket, self._current_bucket() + 1):
+            for name, value in client.hgetall(self._bucket_key(bucket)).items():
+                totals[name] = totals.get(name, 0) + int(value)
+        return totals
+
+    def _trip_reason(self) -> Optional[str]:
+        stats = self.window_stats()
+        if stats["calls"] < settings.CIRCUIT_MIN_CALLS:
+            return None
+        error_rate = stats["errors"] / stats["calls"]
+        if error_rate >= settings.CIRCUIT_ERROR_THRESHOLD:
+            return f"error rate {error_rate:.0%}"
+        slow_rate = stats["slow"] / stats["calls"]
+        if slow_rate >= settings.CIRCUIT_SLOW_CALL_THRESHOLD:
+            return f"slow call rate {slow_rate:.0%}"
+        return None
+
+    def _open(self, reason: str) -> None:
+        get_redis().hset(self.state_key, mapping={"state": CircuitState.OPEN.value, "opened_at": self.clock(), "reason": reason})
+        logger.error(f"🔴 Circuit {self.name} opened: {reason}")
+
+    def _close(self) -> None:
+        get_redis().hset(self.state_key, mapping={"state": CircuitState.CLOSED.value, "closed_at": self.clock(), "reason": ""})
+        logger.info(f"🟢 Circuit {self.name} closed")
+
+    def snapshot(self) -> dict:
+        data = get_redis().hgetall(self.state_key)
+        return {
+            "state": self.state().value,
+            "reason": data.get("reason") or None,
+            "opened_at": float(data["opened_at"]) if data.get("opened_at") else None,
+            "window": self.window_stats(),
+        }
+
+
+class Bulkhead:
+    """Caps concurrent calls to a provider across all processes"""
+
+    def __init__(self, name: str, limit: Optional[Union[int, Callable[[], int]]] = None, clock=time.time):
+        """
+        Args:
+            name: Provider name
+            limit: Slot count, or a callable returning the current one
+                (e.g. an adaptive concurrency window)
+        """
+        self.name = name
+        self.key = f"bulkhead:{name}"
+        self._limit = limit
+        self.clock = clock
+
+    @property
+    def limit(self) -> int:
+        if callable(self._limit):
+            return self._limit()
+        return self._limit or settings.PROVIDER_MAX_CONCURRENCY
+
+    def try_acquire(self) -> Optional[str]:
+        """Take a slot if one is free; returns its token"""
+        client = get_redis()
+        now = self.clock()
+        # Slots held longer than any task may run belong to dead workers
+        client.zremrangebyscore(self.key, "-inf", now - settings.BULKHEAD_SLOT_TTL)
+
+        token = uuid.uuid4().hex
+        client.zadd(self.key, {token: now})
+        rank = client.zrank(self.key, token)
+        if rank is not None and rank < self.limit:
+            return token
+        client.zrem(self.key, token)
+        return None
+
+    def release(self, token: str) -> None:
+        get_redis().zrem(self.key, token)
+
+    @contextmanager
+    def slot(self, timeout: Optional[float] = None):
+        """
+        Hold a slot for the duration of the block
+
+        Raises:
+            BulkheadFullError: no slot became free within the timeout
+        """
+        timeout = settings.BULKHEAD_ACQUIRE_TIMEOUT if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        token = self.try_acquire()
+        while token is None and time.monotonic() < deadline:
+            time.sleep(0.1)
+            token = self.try_acquire()
+        if token is None:
+            raise BulkheadFullError(
+                f"{self.name} is at its limit of {self.limit} concurrent calls",
+                retry_after=settings.BULKHEAD_ACQUIRE_TIMEOUT
+            )
+        try:
+            yield
+        finally:
+            self.release(token)
+
+    def in_use(self) -> int:
+        return get_redis().zcard(self.key)
+
+    def snapshot(self) -> dict:
+        return {"limit": self.limit, "in_use": self.in_use()}
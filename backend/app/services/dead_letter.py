@@ -0,0 +1,120 @@
+"""
+Dead-letter queue for generations that failed permanently or ran out of retries.
+
+Dead-lettered jobs are ordinary FAILED queue rows with ``dead_lettered_at``
+set, the last error and its classification, so they can be inspected and
+re-queued in bulk once the cause is fixed.
+"""
+import logging
+from datetime import datetime, timezone
+from typing import List, Optional
+from sqlalchemy.orm import Session
+from app.models.generated_audio import GeneratedAudio, GenerationStatus
+from app.models.generation_queue import GenerationQueue, QueueStatus
+from app.models.user import User
+from app.services.outbox import enqueue_task
+from app.services.progress_tracker import GenerationStage, ProgressTracker
+from app.services.retry_policy import ErrorKind, record_retry_event
+from app.services.worker_affinity import dispatch_options, release
+
+logger = logging.getLogger(__name__)
+
+PROCESS_TASK_NAME = "app.tasks.generation_tasks.process_voice_generation"
+
+
+class DeadLetterService:
+    @staticmethod
+    def dead_letter(queue_item: GenerationQueue, error: BaseException, kind: ErrorKind) -> None:
+        """Move a job to the dead-letter queue (the caller commits)"""
+        queue_item.status = QueueStatus.FAILED
+        queue_item.last_error = f"{type(error).__name__}: {error}"[:2000]
+        queue_item.error_kind = kind.value
+        queue_item.dead_lettered_at = datetime.now(timezone.utc)
+        record_retry_event("dead_lettered", kind, error)
+        release(queue_item.audio_id)
+
+    @staticmethod
+    def requeue(db: Session, generation: GeneratedAudio, queue_item: Optional[GenerationQueue]) -> None:
+        """
+        Put a failed generation back in the queue (the caller commits)
+
+        The prediction id is kept: the synthesize stage reattaches to a
+        prediction the provider may still finish and starts over otherwise.
+        """
+        generation.status = GenerationStatus.PENDING
+
+        if queue_item is None:
+            queue_item = GenerationQueue(audio_id=generation.audio_id, user_id=generation.user_id, retry_count=0)
+            db.add(queue_item)
+        queue_item.status = QueueStatus.QUEUED
+        queue_item.retry_count = (queue_item.retry_count or 0) + 1
+        queue_item.dead_lettered_at = None
+
+        enqueue_task(db, PROCESS_TASK_NAME, [generation.audio_id], options=dispatch_options(
+            generation.sample_id, generation.audio_id, preview=bool(generation.preview),
+            priority=queue_item.priority
+        ), audio_id=generation.audio_id)
+
+    @staticmethod
+    def _dead_lettered(db: Session, user: User):
+        """Queue rows and generations of a user's dead-lettered jobs"""
+        return db.query(GenerationQueue, GeneratedAudio).join(
+            GeneratedAudio, GeneratedAudio.audio_id == GenerationQueue.audio_id
+        ).filter(
+            GeneratedAudio.user_id == user.user_id,
+            GenerationQueue.dead_lettered_at.isnot(None)
+        )
+
+    @staticmethod
+    def count_dead_letters(db: Session, user: User) -> int:
+        """Number of dead-lettered generations of a user"""
+        return DeadLetterService._dead_lettered(db, user).count()
+
+    @staticmethod
+    def list_dead_letters(db: Session, user: User, skip: int = 0, limit: int = 100) -> List[dict]:
+        """Dead-lettered generations of a user, newest first"""
+        rows = DeadLetterService._dead_lettered(db, user).order_by(
+            GenerationQueue.dead_lettered_at.desc()
+        ).offset(skip).limit(limit).all()
+
+        return [
+            {
+                "audio_id": generation.audio_id,
+                "sample_id": generation.sample_id,
+                "script_text": generation.script_text,
+                "error_kind": queue_item.error_kind,
+                "last_error": queue_item.last_error,
+                "retry_count": queue_item.retry_count,
+                "queued_at": queue_item.queued_at,
+                "dead_lettered_at": queue_item.dead_lettered_at,
+            }
+            for queue_item, generation in rows
+        ]
+
+    @staticmethod
+    def requeue_dead_letters(db: Session, user: User, audio_ids: Optional[List[int]] = None) -> List[int]:
+        """
+        Re-queue dead-lettered generations of a user
+
+        Args:
+            audio_ids: Only these generations (default: all dead-lettered ones)
+
+        Returns:
+            The re-queued audio ids
+        """
+        query = DeadLetterService._dead_lettered(db, user)
+        if audio_ids:
+            query = query.filter(GenerationQueue.audio_id.in_(audio_ids))
+
+        requeued = []
+        for queue_item, generation in query.all():
+            DeadLetterService.requeue(db, generation, queue_item)
+            requeued.append(generation.audio_id)
+        db.commit()
+
+        for audio_id in requeued:
+            ProgressTracker(audio_id, user.user_id).update(GenerationStage.QUEUED)
+            record_retry_event("requeued")
+        if requeued:
+            logger.info(f"Re-queued {len(requeued)} dead-lettered generation(s) for user {user.user_id}")
+        return requeued
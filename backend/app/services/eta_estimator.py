@@ -0,0 +1,192 @@
+"""
+Online ETA estimator learned from completed generations.
+
+Per (provider, script-length bucket) we keep an exponentially weighted mean
+and variance of processing time, plus one for queue wait, in Redis hashes
+shared by all processes. Estimates are reported at a high quantile
+(mean + z * stddev) so clients and autoscaling err on the late side.
+"""
+import math
+import time
+import logging
+from typing import Optional
+from app.config import settings
+from app.utils.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+ETA_KEY_PREFIX = "eta:"
+ETA_KEYS_SET = "eta:keys"
+QUEUE_WAIT_KEY = "eta:queue_wait"
+SEED_LOCK_KEY = "eta:seeding"  # held by the one worker seeding from history
+
+# Upper word-count bound of each length bucket
+LENGTH_BUCKETS = (25, 50, 100, 200, 400, 800)
+
+# z-score for the reported quantile (1.28 ~ p90 of a normal distribution)
+QUANTILE_Z = 1.28
+
+
+def length_bucket(word_count: int) -> str:
+    """Name of the length bucket a script falls in"""
+    for upper in LENGTH_BUCKETS:
+        if word_count <= upper:
+            return f"le{upper}"
+    return f"gt{LENGTH_BUCKETS[-1]}"
+
+
+class EtaEstimator:
+    """EWMA processing and queue-wait statistics"""
+
+    def __init__(self, alpha: Optional[float] = None):
+        self.alpha = alpha if alpha is not None else settings.ETA_EWMA_ALPHA
+
+    @staticmethod
+    def _key(provider: str, bucket: str) -> str:
+        return f"{ETA_KEY_PREFIX}{provider}:{bucket}"
+
+    def _update(self, key: str, value: float) -> None:
+        """
+        Fold one observation into the EWMA stored at key
+        (read-modify-write; concurrent writers may occasionally drop a sample)
+        """
+        client = get_redis()
+        stats = client.hgetall(key)
+
+        if not stats:
+            mean, var, count = value, 0.0, 1
+        else:
+            previous = float(stats["mean"])
+            diff = value - previous
+            mean = previous + self.alpha * diff
+            var = (1 - self.alpha) * (float(stats["var"]) + self.alpha * diff * diff)
+            count = int(stats["count"]) + 1
+
+        client.hset(key, mapping={"mean": mean, "var": var, "count": count, "updated_at": time.time()})
+
+    @staticmethod
+    def _read(key: str) -> Optional[dict]:
+        stats = get_redis().hgetall(key)
+        if not stats:
+            return None
+        return {
+            "mean": float(stats["mean"]),
+            "stddev": math.sqrt(max(float(stats["var"]), 0.0)),
+            "count": int(stats["count"]),
+        }
+
+    def record(
+        self,
+        provider: str,
+        word_count: int,
+        processing_seconds: float,
+        queue_wait_seconds: Optional[float] = None
+    ) -> None:
+        """Record the timings of a completed generation"""
+        try:
+            key = self._key(provider, length_bucket(word_count))
+            self._update(key, max(processing_seconds, 0.0))
+            get_redis().sadd(ETA_KEYS_SET, key)
+
+            if queue_wait_seconds is not None:
+                self._update(QUEUE_WAIT_KEY, max(queue_wait_seconds, 0.0))
+        except Exception as e:
+            logger.warning(f"Could not record ETA sample: {e}")
+
+    def estimate_processing(self, provider: str, word_count: int) -> Optional[float]:
+        """Calibrated processing time, or None until enough samples exist"""
+        try:
+            stats = self._read(self._key(provider, length_bucket(word_count)))
+        except Exception as e:
+            logger.warning(f"Could not read ETA stats: {e}")
+            return None
+
+        if not stats or stats["count"] < settings.ETA_MIN_SAMPLES:
+            return None
+        return stats["mean"] + QUANTILE_Z * stats["stddev"]
+
+    def queue_delay(self, queued_ahead: Optional[int] = None, processing_seconds: Optional[float] = None) -> float:
+        """
+        Current expected wait before a new job starts
+
+        With a count of jobs ahead, this is the time for the workers to drain
+        them; otherwise it falls back to the recently observed queue wait.
+        """
+        if queued_ahead is not None and processing_seconds:
+            return queued_ahead * processing_seconds / max(settings.WORKER_CONCURRENCY, 1)
+
+        try:
+            stats = self._read(QUEUE_WAIT_KEY)
+        except Exception as e:
+            logger.warning(f"Could not read queue wait stats: {e}")
+            return 0.0
+        return stats["mean"] if stats else 0.0
+
+    def snapshot(self) -> dict:
+        """All learned statistics, for monitoring and autoscaling"""
+        client = get_redis()
+        buckets = {}
+        for key in sorted(client.smembers(ETA_KEYS_SET)):
+            stats = self._read(key)
+            if stats:
+                buckets[key[len(ETA_KEY_PREFIX):]] = stats
+        return {
+            "buckets": buckets,
+            "queue_wait": self._read(QUEUE_WAIT_KEY),
+        }
+
+    def seed_from_history(self, db, provider: str, limit: int = 200) -> int:
+        """
+        Bootstrap empty statistics from recently completed generations
+        (completed_at - the queue row's started_at, so queue wait is kept apart)
+
+        Args:
+            provider: Provider to credit rows from before providers were recorded
+
+        Returns:
+            Number of samples recorded
+        """
+        from app.models.generated_audio import GeneratedAudio, GenerationStatus
+        from app.models.generation_queue import GenerationQueue
+
+        client = get_redis()
+        if client.smembers(ETA_KEYS_SET):
+            return 0
+        # Workers starting together would each replay the same history
+        if not client.set(SEED_LOCK_KEY, 1, nx=True, ex=60):
+            return 0
+
+        rows = db.query(GeneratedAudio, GenerationQueue).join(
+            GenerationQueue, GenerationQueue.audio_id == GeneratedAudio.audio_id
+        ).filter(
+            GeneratedAudio.status == GenerationStatus.COMPLETED,
+            GeneratedAudio.completed_at.isnot(None),
+            GenerationQueue.started_at.isnot(None)
+        ).order_by(GeneratedAudio.completed_at.desc()).limit(limit).all()
+
+        # Oldest first so the EWMA ends on the most recent behaviour
+        for generation, queue_item in reversed(rows):
+            seconds = (generation.completed_at - queue_item.started_at).total_seconds()
+            queue_wait = (queue_item.started_at - queue_item.queued_at).total_seconds() if queue_item.queued_at else None
+            # Each row teaches the provider that actually served it
+            self.record(generation.provider or provider, len(generation.script_text.split()), seconds, queue_wait)
+
+        return len(rows)
+
+
+def record_generation_timings(provider: str, text: str, progress_info: Optional[dict]) -> None:
+    """Record a finished generation using the stage timestamps from its progress"""
+    if not progress_info:
+        return
+
+    stamps = progress_info["stage_timestamps"]
+    queued_at = stamps.get("queued")
+    started_at = stamps.get("started")
+    if not started_at:
+        return
+
+    queue_wait = started_at - queued_at if queued_at and queued_at <= started_at else None
+    eta_estimator.record(provider, len(text.split()), time.time() - started_at, queue_wait)
+
+
+eta_estimator = EtaEstimator()
@@ -0,0 +1,247 @@
+"""
+Leases on running generations, and the reaper for expired ones.
+
+A worker takes a lease on the queue row when it starts a generation and a
+heartbeat thread keeps extending it. If the worker is OOM-killed or hits the
+task time limit the lease runs out; the periodic reaper then re-queues the
+job (it resumes its Replicate prediction if one was submitted) or, once the
+retry cap is reached, marks it failed. Queued jobs sent to a node that has
+since left the affinity ring are dispatched again, since nothing else reads
+that node's queue.
+"""
+import os
+import socket
+import threading
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.models.generated_audio import GeneratedAudio, GenerationStatus
+from app.models.generation_queue import GenerationQueue, QueueStatus
+from app.services.outbox import enqueue_task
+from app.services.progress_tracker import GenerationStage, ProgressTracker
+from app.services.worker_affinity import assigned_node, dispatch_options, live_nodes
+
+logger = logging.getLogger(__name__)
+
+# Queue status matching each final generation status
+FINAL_QUEUE_STATUS = {
+    GenerationStatus.COMPLETED: QueueStatus.COMPLETED,
+    GenerationStatus.FAILED: QueueStatus.FAILED,
+    GenerationStatus.CANCELLED: QueueStatus.CANCELLED,
+}
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def worker_identity(task_id: Optional[str] = None) -> str:
+    """Identify this worker process (and task) as a lease holder"""
+    identity = f"{socket.gethostname()}:{os.getpid()}"
+    return f"{identity}:{task_id}" if task_id else identity
+
+
+class GenerationLease:
+    """Lease on one generation, renewed by a background heartbeat"""
+
+    def __init__(
+        self,
+        audio_id: int,
+        owner: str,
+        session_factory=None,
+        duration: Optional[int] = None,
+        interval: Optional[float] = None
+    ):
+        if session_factory is None:
+            from app.database import SessionLocal
+            session_factory = SessionLocal
+        self.audio_id = audio_id
+        self.owner = owner
+        self.session_factory = session_factory
+        self.duration = duration or settings.GENERATION_LEASE_SECONDS
+        self.interval = interval or settings.GENERATION_HEARTBEAT_INTERVAL
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def acquire(self, queue_item: GenerationQueue, duration: Optional[int] = None) -> None:
+        """Take (or extend) the lease on the queue row; the caller commits"""
+        queue_item.leased_by = self.owner
+        queue_item.lease_expires_at = _utcnow() + timedelta(seconds=duration or self.duration)
+
+    @staticmethod
+    def release(queue_item: GenerationQueue) -> None:
+        """Drop the lease once the job has finished; the caller commits"""
+        queue_item.leased_by = None
+        queue_item.lease_expires_at = None
+
+    def renew(self) -> bool:
+        """
+        Extend the lease from a separate session
+
+        Returns:
+            False if another worker (or the reaper) has taken the job over
+        """
+        db = self.session_factory()
+        try:
+            updated = db.query(GenerationQueue).filter(
+                GenerationQueue.audio_id == self.audio_id,
+                GenerationQueue.leased_by == self.owner
+            ).update(
+                {GenerationQueue.lease_expires_at: _utcnow() + timedelta(seconds=self.duration)},
+                synchronize_session=False
+            )
+            db.commit()
+            return updated > 0
+        finally:
+            db.close()
+
+    def start(self) -> None:
+        """Start heartbeating in the background"""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"lease-heartbeat:{self.audio_id}", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                if not self.renew():
+                    logger.warning(f"Lost lease on audio_id={self.audio_id}; another worker owns it now")
+                    return
+            except Exception as e:
+                logger.warning(f"Lease heartbeat failed for audio_id={self.audio_id}: {e}")
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def lease_is_held(queue_item: GenerationQueue, db: Session) -> bool:
+    """Whether a live lease is held on the queue row"""
+    return db.query(GenerationQueue).filter(
+        GenerationQueue.queue_id == queue_item.queue_id,
+        GenerationQueue.leased_by.isnot(None),
+        GenerationQueue.lease_expires_at > _utcnow()
+    ).count() > 0
+
+
+def reap_expired_leases(db: Session, now: Optional[datetime] = None) -> dict:
+    """
+    Re-queue or fail generations whose worker stopped heartbeating
+
+    Rows left PROCESSING without any lease (from before leases existed) are
+    treated as expired once they are older than the webhook lease.
+
+    Returns:
+        Counts of requeued and failed generations
+    """
+    now = now or _utcnow()
+    legacy_cutoff = now - timedelta(seconds=settings.GENERATION_WEBHOOK_LEASE_SECONDS)
+
+    query = db.query(GenerationQueue).filter(
+        GenerationQueue.status == QueueStatus.PROCESSING,
+        or_(
+            GenerationQueue.lease_expires_at < now,
+            (GenerationQueue.lease_expires_at.is_(None)) & (GenerationQueue.queued_at < legacy_cutoff)
+        )
+    )
+    # Several beat schedulers must not reap the same row twice
+    if db.bind.dialect.name == "postgresql":
+        query = query.with_for_update(skip_locked=True)
+
+    requeued, failed = [], []
+    for queue_item in query.all():
+        generation = db.query(GeneratedAudio).filter(GeneratedAudio.audio_id == queue_item.audio_id).first()
+        GenerationLease.release(queue_item)
+
+        if generation is None or generation.status in FINAL_QUEUE_STATUS:
+            # Finished, but the worker died before updating the queue row
+            queue_item.status = FINAL_QUEUE_STATUS[generation.status] if generation else QueueStatus.FAILED
+            continue
+
+        if (queue_item.retry_count or 0) < settings.GENERATION_MAX_RETRIES:
+            queue_item.retry_count = (queue_item.retry_count or 0) + 1
+            queue_item.status = QueueStatus.QUEUED
+            generation.status = GenerationStatus.PENDING
+            enqueue_task(
+                db,
+                "app.tasks.generation_tasks.process_voice_generation",
+                [generation.audio_id],
+                options=dispatch_options(
+                    generation.sample_id, generation.audio_id, preview=bool(generation.preview),
+                    priority=queue_item.priority
+                ),
+                audio_id=generation.audio_id
+            )
+            requeued.append(generation)
+        else:
+            queue_item.status = QueueStatus.FAILED
+            generation.status = GenerationStatus.FAILED
+            failed.append(generation)
+
+    db.commit()
+
+    for generation in requeued:
+        logger.warning(f"♻️ Re-queued stale generation audio_id={generation.audio_id}")
+        ProgressTracker(generation.audio_id, generation.user_id).update(
+            GenerationStage.QUEUED, message="Your request was interrupted and has been re-queued"
+        )
+    for generation in failed:
+        logger.error(f"💀 Stale generation audio_id={generation.audio_id} exceeded retries, marked failed")
+        ProgressTracker(generation.audio_id, generation.user_id).update(GenerationStage.FAILED)
+
+    return {"requeued": len(requeued), "failed": len(failed)}
+
+
+def redispatch_stranded(db: Session) -> int:
+    """
+    Dispatch again the queued generations waiting in the queue of a dead node
+
+    A node that stops heartbeating leaves the ring, but the jobs already sent
+    to its own prepare queue stay there with no lease for the reaper to see.
+    They are sent to a live node (or the shared queue) without counting a
+    retry; should the node come back, the copy it still holds is skipped as
+    a duplicate delivery.
+
+    Returns:
+        Number of generations dispatched again
+    """
+    if not settings.AFFINITY_ROUTING:
+        return 0
+    live = set(live_nodes())
+
+    stranded = []
+    for queue_item in db.query(GenerationQueue).filter(GenerationQueue.status == QueueStatus.QUEUED).all():
+        node = assigned_node(queue_item.audio_id)
+        if node is None or node in live:
+            continue
+        generation = db.query(GeneratedAudio).filter(GeneratedAudio.audio_id == queue_item.audio_id).first()
+        if generation is None or generation.status != GenerationStatus.PENDING:
+            continue
+        enqueue_task(
+            db,
+            "app.tasks.generation_tasks.process_voice_generation",
+            [generation.audio_id],
+            options=dispatch_options(
+                generation.sample_id, generation.audio_id, preview=bool(generation.preview),
+                priority=queue_item.priority
+            ),
+            audio_id=generation.audio_id
+        )
+        stranded.append((generation.audio_id, node))
+    db.commit()
+
+    for audio_id, node in stranded:
+        logger.warning(f"♻️ Node {node} left the ring, re-dispatched queued generation audio_id={audio_id}")
+    return len(stranded)
@@ -0,0 +1,522 @@
+"""
+Stages of a voice generation.
+
+A generation runs as a Celery chain of four stage tasks, each routed to its
+own queue so every worker pool can be sized and pooled for its bottleneck:
+
+- prepare (CPU, prefork): claim the job, route it to a provider and convert
+  or upload its reference audio;
+- synthesize (I/O, gevent): run inference at the provider;
+- fetch (network, gevent): bring the output onto local storage;
+- postprocess (CPU, prefork): normalize, limit, trim and encode the audio,
+  then record the result.
+
+Stages hand each other a small JSON job dict and re-read the rows they need,
+so any worker can run any stage. Each stage holds the job's lease while it
+runs and extends it while the job waits for the next one. Once a stage has
+an outcome (cancelled, or handed to a webhook provider) it returns a result
+dict with a status, which the remaining stages pass along untouched;
+finalize_generation runs fetch and postprocess once the provider reports back.
+"""
+import os
+import logging
+from contextlib import nullcontext
+from typing import Callable, Optional, Tuple
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.sql import func
+from app.config import settings
+from app.models.audio_sample import AudioSample
+from app.models.generated_audio import GeneratedAudio, GenerationStatus
+from app.models.generation_queue import GenerationQueue, QueueStatus
+from app.services.ai_service import get_ai_service
+from app.services.audio_postprocess import PostprocessResult, postprocess_audio
+from app.services.cancellation import GenerationCancelled, cancellable, check_cancelled, is_cancelled
+from app.services.circuit_breaker import ProviderUnavailableError
+from app.services.eta_estimator import record_generation_timings
+from app.services.generation_lease import GenerationLease, lease_is_held
+from app.services.outbox import enqueue_task
+from app.services.progress_tracker import GenerationStage, ProgressTracker, get_progress
+from app.services.queue_view import record_drained
+from app.services.retry_policy import ErrorKind, classify_error
+from app.services.segment_cache import SegmentCache, synthesize_incremental
+from app.services.streaming import synthesize_streaming
+from app.services.voice_providers import VoiceProvider
+from app.services.worker_affinity import assigned_node, dispatch_options
+from app.services.worker_drain import WorkerDraining
+from app.utils.redis_client import get_redis
+from app.utils.wav import duration_of, read_wav
+
+logger = logging.getLogger(__name__)
+
+# Marks a generation already re-run after its uploaded reference expired
+REFERENCE_RETRY_KEY_PREFIX = "reference:retried:"
+
+# Generations no stage should touch again
+FINISHED_STATUSES = (GenerationStatus.COMPLETED, GenerationStatus.FAILED, GenerationStatus.CANCELLED)
+
+# Queue of each stage task; CPU stages go to prefork workers, I/O stages to gevent ones
+STAGE_QUEUES = {
+    "app.tasks.generation_tasks.process_voice_generation": "generation.prepare",
+    "app.tasks.generation_tasks.synthesize_generation": "generation.synthesize",
+    "app.tasks.generation_tasks.fetch_generation_output": "generation.fetch",
+    "app.tasks.generation_tasks.postprocess_generation": "generation.postprocess",
+    "app.tasks.generation_tasks.finalize_generation": "generation.postprocess",
+}
+
+
+def _rows(db: Session, audio_id: int) -> Tuple[Optional[GeneratedAudio], Optional[GenerationQueue]]:
+    generation = db.query(GeneratedAudio).filter(GeneratedAudio.audio_id == audio_id).first()
+    queue_item = db.query(GenerationQueue).filter(GenerationQueue.audio_id == audio_id).first()
+    return generation, queue_item
+
+
+def new_job(generation: GeneratedAudio, queue_item: Optional[GenerationQueue], **fields) -> dict:
+    """Job dict for a generation; attempt ties the stages to one run of it"""
+    job = {
+        "audio_id": generation.audio_id,
+        "provider": generation.provider,
+        "streaming": bool(generation.streaming),
+        "preview": bool(generation.preview),
+        "attempt": (queue_item.retry_count or 0) if queue_item else 0,
+        "priority": (queue_item.priority or 0) if queue_item else 0,
+        # Released once synthesis is over, wherever the stage ends up running
+        "node": assigned_node(generation.audio_id),
+    }
+    job.update(fields)
+    return job
+
+
+def claim(db: Session, audio_id: int, lease: GenerationLease) -> Optional[Tuple[GeneratedAudio, Optional[GenerationQueue]]]:
+    """
+    Mark a generation processing and take its lease (the caller starts the heartbeat)
+
+    Returns:
+        The generation and its queue row, or None when there is nothing to do
+
+    Raises:
+        GenerationCancelled: the user cancelled it before it started
+    """
+    generation, queue_item = _rows(db, audio_id)
+    if not generation:
+        logger.error(f"❌ Generation not found: audio_id={audio_id}")
+        return None
+
+    if generation.status in FINISHED_STATUSES:
+        logger.info(f"Generation {audio_id} already {generation.status.value}, skipping")
+        return None
+    check_cancelled(audio_id)
+
+    if queue_item and queue_item.status == QueueStatus.PROCESSING and lease_is_held(queue_item, db):
+        # Duplicate delivery while another worker (or a later stage) holds the job
+        logger.info(f"Generation {audio_id} is leased by {queue_item.leased_by}, skipping")
+        return None
+
+    ProgressTracker(audio_id, generation.user_id).mark_started()
+    _mark_processing(generation, queue_item, lease)
+    if queue_item:
+        queue_item.started_at = func.now()
+    db.commit()
+    return generation, queue_item
+
+
+def enter_stage(db: Session, job: dict, lease: GenerationLease) -> Optional[Tuple[GeneratedAudio, Optional[GenerationQueue]]]:
+    """
+    Rows for a later stage, with the job's lease taken over
+
+    Returns:
+        None if the job has finished or been re-run since this stage was queued
+    """
+    audio_id = job["audio_id"]
+    generation, queue_item = _rows(db, audio_id)
+    if generation is None or generation.status in FINISHED_STATUSES:
+        logger.info(f"Generation {audio_id} is finished, dropping its pending stage")
+        return None
+    check_cancelled(audio_id)
+
+    if queue_item and (queue_item.retry_count or 0) != job["attempt"]:
+        # The reaper or a retry restarted the job; that run owns it now
+        logger.info(f"Generation {audio_id} was re-queued, dropping a stage of attempt {job['attempt']}")
+        return None
+
+    _mark_processing(generation, queue_item, lease)
+    db.commit()
+    return generation, queue_item
+
+
+def _mark_processing(generation: GeneratedAudio, queue_item: Optional[GenerationQueue], lease: GenerationLease) -> None:
+    # A stage retried after a transient failure finds the job back in the queue
+    generation.status = GenerationStatus.PROCESSING
+    if queue_item:
+        queue_item.status = QueueStatus.PROCESSING
+        lease.acquire(queue_item)
+
+
+def hand_off(db: Session, audio_id: int, lease: GenerationLease) -> None:
+    """Hold the job's lease while it waits in the next stage's queue"""
+    lease.stop()
+    _, queue_item = _rows(db, audio_id)
+    if queue_item:
+        lease.acquire(queue_item, duration=settings.GENERATION_STAGE_LEASE_SECONDS)
+        db.commit()
+
+
+def hand_back(db: Session, audio_id: int) -> None:
+    """
+    Return a job to the queue, e.g. one this worker is giving up on as it shuts down
+
+    The job keeps its attempt and prediction id, so the next worker picks up
+    where this one stopped instead of counting a retry or paying twice.
+    """
+    db.rollback()
+    generation, queue_item = _rows(db, audio_id)
+    if generation is None or generation.status in FINISHED_STATUSES:
+        return
+    generation.status = GenerationStatus.PENDING
+    if queue_item:
+        queue_item.status = QueueStatus.QUEUED
+        GenerationLease.release(queue_item)
+    enqueue_task(
+        db,
+        "app.tasks.generation_tasks.process_voice_generation",
+        [audio_id],
+        options=dispatch_options(
+            generation.sample_id, audio_id, preview=bool(generation.preview),
+            priority=queue_item.priority if queue_item else 0
+        ),
+        audio_id=audio_id
+    )
+    db.commit()
+    logger.info(f"↩️ Handed generation {audio_id} back to the queue")
+    ProgressTracker(audio_id, generation.user_id).update(GenerationStage.QUEUED)
+
+
+def retry_expired_reference(db: Session, generation: GeneratedAudio, error: Optional[str]) -> bool:
+    """
+    Re-run a job whose prediction failed because its uploaded reference expired
+
+    The provider fetched the reference only after the webhook submission
+    succeeded, so the failure arrives with the prediction. The upload is
+    forgotten and the job queued again, once, so it uploads a fresh copy.
+
+    Returns:
+        Whether the job was queued again
+    """
+    ai_service = get_ai_service()
+    if generation.provider not in ai_service.registry:
+        return False
+    provider = ai_service.provider(generation.provider)
+    if not provider.reference_expired(error):
+        return False
+    if not get_redis().set(
+        f"{REFERENCE_RETRY_KEY_PREFIX}{generation.audio_id}", 1, nx=True, ex=settings.GENERATION_WEBHOOK_LEASE_SECONDS
+    ):
+        return False
+
+    sample = db.query(AudioSample).filter(AudioSample.sample_id == generation.sample_id).first()
+    if sample:
+        provider.invalidate_reference(sample.file_path)
+    logger.warning(f"⚠️ Reference of generation {generation.audio_id} expired at {provider.name}, re-running: {error}")
+    generation.prediction_id = None
+    db.commit()
+    hand_back(db, generation.audio_id)
+    return True
+
+
+def by_sentence(generation: GeneratedAudio) -> bool:
+    """Whether the job is synthesized sentence by sentence, from the sample itself"""
+    if generation.streaming:
+        return True
+    return settings.SEGMENT_CACHE and bool(generation.incremental or generation.preview)
+
+
+def route(generation: GeneratedAudio) -> Tuple[VoiceProvider, bool]:
+    """The provider to prepare the job for, and whether the job must stay on it"""
+    ai_service = get_ai_service()
+    if generation.provider in ai_service.registry and (generation.prediction_id or generation.streaming):
+        # Resume on the provider holding the prediction; a stream keeps one voice
+        return ai_service.provider(generation.provider), True
+    if generation.provider in ai_service.registry and generation.incremental:
+        # Cached sentences (e.g. of a promoted preview) are only reused on the provider that spoke them
+        return ai_service.provider(generation.provider), False
+    best = ai_service.router.rank(len(generation.script_text.split()))[0]
+    return best, bool(generation.streaming)
+
+
+def prepare_reference(db: Session, generation: GeneratedAudio, queue_item: Optional[GenerationQueue], tracker: ProgressTracker) -> dict:
+    """Route the job and get its voice sample ready for the provider"""
+    sample = db.query(AudioSample).filter(AudioSample.sample_id == generation.sample_id).first()
+    if not sample:
+        raise Exception(f"Sample not found: sample_id={generation.sample_id}")
+
+    logger.info(f"📂 Using sample: {sample.file_path}")
+    provider, pinned = route(generation)
+    if generation.provider != provider.name:
+        generation.provider = provider.name
+        db.commit()
+
+    reference = sample.file_path
+    resuming = generation.prediction_id and provider.supports_resume
+    if not by_sentence(generation) and not resuming:
+        reference = provider.prepare_reference(sample.file_path, cancellable(generation.audio_id, tracker))
+
+    return new_job(generation, queue_item, pinned=pinned, sample_path=sample.file_path, reference=reference)
+
+
+def reference_available(reference: str) -> bool:
+    """Whether a prepared reference can be used on this worker"""
+    return reference.startswith(("http://", "https://")) or os.path.exists(reference)
+
+
+def store_prediction_id(db: Session, audio_id: int, prediction_id: str) -> None:
+    """Persist the prediction id as soon as it exists so a re-queued job can resume it"""
+    session = sessionmaker(bind=db.get_bind())()
+    try:
+        session.query(GeneratedAudio).filter(GeneratedAudio.audio_id == audio_id).update(
+            {GeneratedAudio.prediction_id: prediction_id}, synchronize_session=False
+        )
+        session.commit()
+    except Exception as e:
+        logger.warning(f"Could not store prediction id for audio_id={audio_id}: {e}")
+    finally:
+        session.close()
+
+
+def synthesize(
+    db: Session,
+    job: dict,
+    generation: GeneratedAudio,
+    queue_item: Optional[GenerationQueue],
+    lease: GenerationLease,
+    tracker: ProgressTracker
+) -> Optional[dict]:
+    """
+    Run inference, on the prepared provider unless it is unavailable
+
+    Returns:
+        The job with the provider's output, or a "submitted" result when the
+        provider completes it asynchronously (webhook or deferred completion)
+    """
+    ai_service = get_ai_service()
+    on_progress = cancellable(job["audio_id"], tracker)
+    logger.info(f"📝 Generating text: {generation.script_text[:100]}...")
+
+    def attempt(provider: VoiceProvider):
+        reference = job["reference"]
+        if provider.name != job["provider"] or not reference_available(reference):
+            # Fallback, or a retry that left the preparing node: prepare here
+            # rather than go back through the CPU queue
+            reference = provider.prepare_reference(job["sample_path"], on_progress)
+        with provider.preview_lane() if generation.preview else nullcontext():
+            return _synthesize_on(provider, db, generation, queue_item, lease, job["sample_path"], reference, on_progress)
+
+    provider, (output, prediction_id) = ai_service.router.run(
+        len(generation.script_text.split()),
+        attempt,
+        pinned=job["provider"] if job["pinned"] else None,
+        preferred=job["provider"]
+    )
+
+    if output is None:
+        logger.info(f"📨 Submitted prediction {prediction_id} to {provider.name}, awaiting completion")
+        return {
+            'audio_id': job["audio_id"],
+            'status': 'submitted',
+            'prediction_id': prediction_id,
+            'provider': provider.name
+        }
+    return dict(job, provider=provider.name, output=output)
+
+
+def _synthesize_on(
+    provider: VoiceProvider,
+    db: Session,
+    generation: GeneratedAudio,
+    queue_item: Optional[GenerationQueue],
+    lease: GenerationLease,
+    sample_path: str,
+    reference: str,
+    on_progress: Callable
+):
+    """
+    Synthesize on one provider
+
+    Returns:
+        Tuple of (output, None), or (None, prediction_id) when the provider
+        completes the job asynchronously
+
+    Raises:
+        ProviderUnavailableError: the provider was not called; try another
+    """
+    audio_id = generation.audio_id
+    if generation.provider != provider.name:
+        generation.provider = provider.name
+        db.commit()
+
+    def speak(sentence: str):
+        return provider.generate_speech(sample_path=sample_path, text=sentence, model_name=generation.model_name)
+
+    segments = None
+    if settings.SEGMENT_CACHE and by_sentence(generation):
+        segments = SegmentCache.for_voice(sample_path, provider)
+    if generation.streaming:
+        # Sentence by sentence; each chunk is published as soon as it exists
+        output_path, _, _ = synthesize_streaming(
+            speak,
+            audio_id,
+            generation.user_id,
+            generation.script_text,
+            provider.output_dir,
+            on_progress=on_progress,
+            cache=segments
+        )
+        return output_path, None
+
+    if segments and (generation.incremental or generation.preview):
+        # Only sentences this voice has not spoken before go to the provider;
+        # a preview's sentence is then reused when it is promoted
+        output_path, _, _ = synthesize_incremental(
+            speak, segments, generation.script_text, provider.output_dir, on_progress=on_progress
+        )
+        return output_path, None
+
+    if generation.prediction_id and provider.supports_resume:
+        # Re-queued after a crash: pick up the prediction we already paid for
+        try:
+            return provider.await_prediction(generation.prediction_id, on_progress=on_progress), None
+        except (ProviderUnavailableError, GenerationCancelled, WorkerDraining):
+            raise
+        except Exception as e:
+            if classify_error(e)[0] == ErrorKind.TRANSIENT:
+                # For all we know it is still running; retry the reattach
+                # rather than pay for a second prediction
+                raise
+            logger.warning(f"Could not resume prediction {generation.prediction_id}, starting over: {e}")
+            generation.prediction_id = None
+            db.commit()
+
+    if provider.supports_webhooks:
+        # Hand off to the provider; its completion enqueues finalize_generation
+        try:
+            prediction_id = provider.submit_generation(sample_path, generation.script_text, reference=reference)
+        except ProviderUnavailableError:
+            raise
+        except Exception as e:
+            logger.error(f"Webhook submission failed, generating inline: {e}")
+        else:
+            # The webhook finishes the job; hold the lease until then
+            lease.stop()
+            generation.prediction_id = prediction_id
+            if queue_item:
+                lease.acquire(queue_item, duration=settings.GENERATION_WEBHOOK_LEASE_SECONDS)
+            db.commit()
+            on_progress(GenerationStage.INFERRING)
+            return None, prediction_id
+
+    output = provider.synthesize(
+        sample_path,
+        reference,
+        generation.script_text,
+        generation.model_name,
+        on_progress=on_progress,
+        on_submitted=lambda prediction_id: store_prediction_id(db, audio_id, prediction_id)
+    )
+    return output, None
+
+
+def fetch_output(job: dict, tracker: ProgressTracker) -> dict:
+    """Bring the provider's output onto local storage"""
+    provider = get_ai_service().provider(job["provider"])
+    output_path = provider.fetch_output(job["output"], cancellable(job["audio_id"], tracker))
+    return dict(job, output_path=output_path)
+
+
+def measure_output(path: str) -> Tuple[float, int]:
+    """(duration_seconds, file_size_bytes) of generated audio"""
+    try:
+        fmt, frames = read_wav(path)
+        duration = round(duration_of(fmt, frames), 2)
+    except Exception as e:
+        logger.warning(f"Could not determine duration of {path}: {e}")
+        duration = 0.0
+    return duration, os.path.getsize(path)
+
+
+def process_output(path: str) -> PostprocessResult:
+    """Postprocess generated audio, or just measure it if it can't be processed"""
+    if settings.AUDIO_POSTPROCESS:
+        try:
+            return postprocess_audio(path)
+        except ValueError as e:
+            logger.warning(f"Delivering {path} unprocessed: {e}")
+    duration, file_size = measure_output(path)
+    return PostprocessResult(path, duration, file_size, None, None, None)
+
+
+def postprocess(
+    db: Session,
+    job: dict,
+    generation: GeneratedAudio,
+    queue_item: Optional[GenerationQueue],
+    tracker: ProgressTracker
+) -> dict:
+    """
+    Process the audio and record the finished generation
+
+    Raises:
+        GenerationCancelled: cancelled while in flight; the audio is discarded
+    """
+    audio_id = job["audio_id"]
+    output_path = job["output_path"]
+    if is_cancelled(audio_id):
+        discard_output(output_path)
+        raise GenerationCancelled(audio_id)
+
+    tracker(GenerationStage.FINALIZING)
+    source_path = output_path
+    audio = process_output(source_path)
+    output_path, duration, file_size = audio.path, audio.duration, audio.file_size
+
+    logger.info(f"✅ Generation successful!")
+    logger.info(f"   Output: {output_path}")
+    logger.info(f"   Duration: {duration}s")
+    logger.info(f"   Size: {file_size} bytes")
+    if audio.loudness_lufs is not None:
+        logger.info(f"   Loudness: {audio.loudness_lufs} LUFS, peak {audio.peak_dbfs} dBFS")
+
+    generation.output_file_path = output_path
+    generation.duration_seconds = duration
+    generation.file_size = file_size
+    generation.checksum = audio.checksum
+    generation.loudness_lufs = audio.loudness_lufs
+    generation.peak_dbfs = audio.peak_dbfs
+    generation.status = GenerationStatus.COMPLETED
+    generation.completed_at = func.now()
+
+    if queue_item:
+        queue_item.status = QueueStatus.COMPLETED
+        queue_item.processed_at = func.now()
+        GenerationLease.release(queue_item)
+
+    db.commit()
+    if output_path != source_path:
+        # Only now: a retry before the commit has to find the source again
+        discard_output(source_path)
+    tracker(GenerationStage.COMPLETED)
+    record_drained(audio_id)
+    record_generation_timings(job["provider"], generation.script_text, get_progress(audio_id))
+
+    return {
+        'audio_id': audio_id,
+        'status': 'completed',
+        'provider': job["provider"],
+        'output_path': output_path,
+        'duration': duration,
+        'file_size': file_size
+    }
+
+
+def discard_output(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError as e:
+        logger.warning(f"Could not delete discarded output {path}: {e}")
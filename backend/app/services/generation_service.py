@@ -1,4 +1,5 @@
 from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
 from fastapi import HTTPException, status
 from typing import List, Optional
 from datetime import datetime
@@ -6,9 +7,24 @@ from app.models.generated_audio import GeneratedAudio, GenerationStatus
 from app.models.generation_queue import GenerationQueue, QueueStatus
 from app.models.audio_sample import AudioSample
 from app.models.user import User
+from app.config import settings
 from app.schemas.generation import GenerationCreate
 from app.tasks.generation_tasks import process_voice_generation
+from app.services.progress_tracker import GenerationStage, ProgressTracker, STAGE_PROGRESS, get_progress
+from app.services.admission import admit
+from app.services.outbox import enqueue_task
+from app.services.worker_affinity import dispatch_options, release
+from app.services.dead_letter import DeadLetterService
+from app.services.streaming import StreamChunks
+from app.services.generation_lease import GenerationLease
+from app.services.cancellation import clear_cancel, request_cancel, revoke_generation_tasks
+from app.services.idempotency import (
+    IdempotencyConflict, SingleFlightPending, idempotency_store, request_fingerprint, single_flight
+)
+from app.utils.text_chunks import leading_text
 import logging
+import time
+import os
 
 logger = logging.getLogger(__name__)
 
@@ -17,9 +33,143 @@ class GenerationService:
     def create_generation(
         db: Session,
         user: User,
-        generation_data: GenerationCreate
+        generation_data: GenerationCreate,
+        idempotency_key: Optional[str] = None,
+        provider: Optional[str] = None
     ) -> GeneratedAudio:
-        """Create a new generation request and queue it"""
+        """
+        Create a new generation request and queue it
+        
+        Retries carrying the same Idempotency-Key get the original generation
+        back, and an identical request (same sample, model and text) made while
+        a previous one is still pending or processing attaches to that one.
+        
+        Args:
+            provider: Provider to prefer, e.g. the one that spoke a promoted preview
+        """
+        if generation_data.preview and generation_data.stream:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="A preview cannot be streamed"
+            )
+        
+        fingerprint = request_fingerprint(
+            generation_data.sample_id,
+            generation_data.model_name,
+            generation_data.script_text,
+            stream=generation_data.stream,
+            incremental=generation_data.incremental,
+            preview=generation_data.preview
+        )
+        
+        if idempotency_key:
+            replayed = GenerationService._begin_idempotent(db, user, idempotency_key, fingerprint)
+            if replayed is not None:
+                return replayed
+        
+        try:
+            generation = GenerationService._create_coalesced(db, user, generation_data, fingerprint, provider)
+        except Exception:
+            if idempotency_key:
+                idempotency_store.release(user.user_id, idempotency_key)
+            raise
+        
+        if idempotency_key:
+            idempotency_store.complete(user.user_id, idempotency_key, fingerprint, generation.audio_id)
+        
+        return generation
+    
+    @staticmethod
+    def _begin_idempotent(
+        db: Session,
+        user: User,
+        idempotency_key: str,
+        fingerprint: str
+    ) -> Optional[GeneratedAudio]:
+        """Reserve an Idempotency-Key; returns the original generation of a replay"""
+        for _ in range(2):
+            try:
+                replayed_id = idempotency_store.begin(user.user_id, idempotency_key, fingerprint)
+            except IdempotencyConflict as e:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT if e.in_progress else status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    detail=str(e)
+                )
+            if replayed_id is None:
+                return None
+            replayed = db.query(GeneratedAudio).filter(
+                GeneratedAudio.audio_id == replayed_id,
+                GeneratedAudio.user_id == user.user_id
+            ).first()
+            if replayed:
+                logger.info(f"Replaying generation {replayed_id} for Idempotency-Key {idempotency_key}")
+                return replayed
+            # The original generation was deleted; start over under this key,
+            # unless a concurrent retry got there first
+            idempotency_store.release(user.user_id, idempotency_key)
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A request with this Idempotency-Key is still in progress"
+        )
+    
+    @staticmethod
+    def _create_coalesced(
+        db: Session,
+        user: User,
+        generation_data: GenerationCreate,
+        fingerprint: str,
+        provider: Optional[str] = None
+    ) -> GeneratedAudio:
+        """Attach to an identical in-flight generation, or create one"""
+        try:
+            existing_id = single_flight.claim(user.user_id, fingerprint)
+            if existing_id is not None:
+                existing = db.query(GeneratedAudio).filter(
+                    GeneratedAudio.audio_id == existing_id,
+                    GeneratedAudio.user_id == user.user_id
+                ).first()
+                if existing and existing.status in (GenerationStatus.PENDING, GenerationStatus.PROCESSING):
+                    logger.info(f"Coalesced duplicate request onto in-flight generation {existing_id}")
+                    return existing
+                if not single_flight.take_over(user.user_id, fingerprint, existing_id):
+                    # An identical request is replacing the finished generation right now
+                    raise SingleFlightPending("An identical request is still being created")
+        except SingleFlightPending as e:
+            # Its id is moments away; the client retries instead of a worker thread waiting
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"{e}. Please retry in {settings.SINGLE_FLIGHT_RETRY_AFTER} seconds.",
+                headers={"Retry-After": str(settings.SINGLE_FLIGHT_RETRY_AFTER)}
+            )
+        
+        try:
+            # Replays and coalesced duplicates add no work; only new jobs are shed
+            admit(db, user, GenerationService._synthesized_text(generation_data), preview=generation_data.preview)
+            generation = GenerationService._create_and_queue(db, user, generation_data, provider)
+        except Exception:
+            single_flight.release(user.user_id, fingerprint)
+            raise
+        
+        single_flight.publish(user.user_id, fingerprint, generation.audio_id)
+        return generation
+    
+    @staticmethod
+    def _synthesized_text(generation_data: GenerationCreate) -> str:
+        """The part of the script the generation speaks: all of it, or a preview's first sentence"""
+        if not generation_data.preview:
+            return generation_data.script_text
+        # Cut the way incremental synthesis splits, so promotion finds the sentence cached
+        preview = leading_text(generation_data.script_text, settings.PREVIEW_MAX_WORDS, settings.STREAM_MAX_CHUNK_CHARS)
+        return preview or generation_data.script_text
+    
+    @staticmethod
+    def _create_and_queue(
+        db: Session,
+        user: User,
+        generation_data: GenerationCreate,
+        provider: Optional[str] = None
+    ) -> GeneratedAudio:
+        """Create the generation, its queue entry and its outbox task"""
         # Verify sample exists and belongs to user
         sample = db.query(AudioSample).filter(
             AudioSample.sample_id == generation_data.sample_id,
@@ -40,48 +190,94 @@ class GenerationService:
                 detail="Audio sample file not found on server"
             )
         
-        # Create generation record
+        # Generation, queue entry and task are written in one transaction;
+        # the outbox relay publishes the task once it has committed
         new_generation = GeneratedAudio(
             user_id=user.user_id,
             sample_id=generation_data.sample_id,
             model_name=generation_data.model_name,
-            script_text=generation_data.script_text,
+            script_text=GenerationService._synthesized_text(generation_data),
+            streaming=generation_data.stream,
+            incremental=generation_data.incremental,
+            preview=generation_data.preview,
+            source_script=generation_data.script_text if generation_data.preview else None,
+            provider=provider,
             status=GenerationStatus.PENDING
         )
-        
         db.add(new_generation)
-        db.commit()
-        db.refresh(new_generation)
+        db.flush()
         
-        # Add to queue
         queue_item = GenerationQueue(
             audio_id=new_generation.audio_id,
             user_id=user.user_id,
             status=QueueStatus.QUEUED,
-            priority=0
+            priority=user.priority_tier or 0
         )
-        
         db.add(queue_item)
-        db.commit()
+        enqueue_task(
+            db,
+            process_voice_generation.name,
+            [new_generation.audio_id],
+            options=dispatch_options(
+                new_generation.sample_id, new_generation.audio_id, preview=generation_data.preview,
+                priority=queue_item.priority
+            ),
+            audio_id=new_generation.audio_id
+        )
+        audio_id = new_generation.audio_id
         
-        # Trigger background task
-        logger.info(f"Queuing generation task for audio_id: {new_generation.audio_id}")
         try:
-            task = process_voice_generation.delay(new_generation.audio_id)
-            logger.info(f"Task queued successfully: {task.id}")
-        except Exception as e:
-            logger.error(f"Failed to queue task: {str(e)}")
-            # Update status to failed
-            new_generation.status = GenerationStatus.FAILED
-            queue_item.status = QueueStatus.FAILED
             db.commit()
+        except Exception as e:
+            db.rollback()
+            # The task was never queued, so it will never free its node
+            release(audio_id)
+            logger.error(f"Failed to create generation: {str(e)}")
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Failed to queue generation task: {str(e)}"
+                detail="Failed to queue generation task"
             )
+        db.refresh(new_generation)
+        
+        logger.info(f"Queued generation task for audio_id: {new_generation.audio_id}")
+        ProgressTracker(new_generation.audio_id, user.user_id).update(GenerationStage.QUEUED)
         
         return new_generation
     
+    @staticmethod
+    def promote_preview(
+        db: Session,
+        audio_id: int,
+        user: User,
+        idempotency_key: Optional[str] = None
+    ) -> GeneratedAudio:
+        """
+        Queue the full generation of a preview's script
+        
+        The full generation is incremental and prefers the preview's
+        provider, so the sentence the preview spoke comes from the segment
+        cache instead of being synthesized again.
+        """
+        preview = GenerationService.get_generation_by_id(db, audio_id, user)
+        if not preview.preview:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Only previews can be promoted"
+            )
+        if preview.sample_id is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="The voice sample of this preview was deleted"
+            )
+        
+        generation_data = GenerationCreate(
+            sample_id=preview.sample_id,
+            model_name=preview.model_name,
+            script_text=preview.source_script or preview.script_text,
+            incremental=True
+        )
+        return GenerationService.create_generation(db, user, generation_data, idempotency_key, provider=preview.provider)
+    
     @staticmethod
     def get_generation_by_id(
         db: Session,
@@ -102,6 +298,62 @@ class GenerationService:
         
         return generation
     
+    @staticmethod
+    def get_stream_source(
+        db: Session,
+        audio_id: int,
+        user: User
+    ) -> Optional[str]:
+        """
+        Check a streaming generation can be listened to
+        
+        Returns:
+            Path of the stitched file once the generation has completed,
+            or None while its chunks are still being produced
+        """
+        generation = GenerationService.get_generation_by_id(db, audio_id, user)
+        
+        if not generation.streaming:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Generation was not created in streaming mode"
+            )
+        
+        if generation.status in (GenerationStatus.FAILED, GenerationStatus.CANCELLED):
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Generation {generation.status.value}"
+            )
+        
+        if generation.status == GenerationStatus.COMPLETED:
+            if not generation.output_file_path or not os.path.exists(generation.output_file_path):
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="File not found"
+                )
+            return generation.output_file_path
+        
+        return None
+    
+    @staticmethod
+    def get_stream_chunk(
+        db: Session,
+        audio_id: int,
+        index: int,
+        user: User
+    ) -> str:
+        """Path of one finished chunk of a streaming generation"""
+        generation = GenerationService.get_generation_by_id(db, audio_id, user)
+        
+        path = StreamChunks(audio_id).chunk_path(index) if generation.streaming else None
+        if not path or not os.path.exists(path):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Chunk not available"
+            )
+        
+        return path
+    
     @staticmethod
     def get_user_generations(
         db: Session,
@@ -138,7 +390,7 @@ class GenerationService:
             if generation.status == GenerationStatus.PROCESSING:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Cannot delete audio that is currently processing"
+                    detail="Cannot delete audio that is currently processing; cancel it first"
                 )
             
             # Delete file if exists (don't fail if file delete fails)
@@ -151,6 +403,9 @@ class GenerationService:
                     logger.warning(f"Failed to delete file {generation.output_file_path}: {file_error}")
                     # Continue with database deletion even if file deletion fails
             
+            if generation.streaming:
+                StreamChunks(audio_id).clear()
+            
             # Explicitly delete queue item first (work around cascade issue)
             from app.models.generation_queue import GenerationQueue
             queue_item = db.query(GenerationQueue).filter(
@@ -163,6 +418,7 @@ class GenerationService:
             # Now delete the generation record
             db.delete(generation)
             db.commit()
+            release(audio_id)
             logger.info(f"Successfully deleted generation {audio_id}")
             
             return True
@@ -178,6 +434,59 @@ class GenerationService:
                 detail=f"Failed to delete generation: {str(e)}"
             )
     
+    @staticmethod
+    def cancel_generation(
+        db: Session,
+        audio_id: int,
+        user: User
+    ) -> GeneratedAudio:
+        """
+        Cancel a pending or processing generation
+        
+        Queued tasks are dropped or revoked and a submitted prediction is
+        cancelled at the provider; a worker already running the job stops at
+        its next stage boundary.
+        """
+        generation = GenerationService.get_generation_by_id(db, audio_id, user)
+        
+        if generation.status not in (GenerationStatus.PENDING, GenerationStatus.PROCESSING):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Cannot cancel a generation that is {generation.status.value}"
+            )
+        
+        # Flag first so a worker picking the job up right now sees it
+        request_cancel(audio_id)
+        
+        queue_item = db.query(GenerationQueue).filter(
+            GenerationQueue.audio_id == audio_id
+        ).first()
+        revoked = revoke_generation_tasks(db, audio_id, queue_item)
+        
+        if generation.prediction_id and generation.provider:
+            from app.services.ai_service import get_ai_service
+            ai_service = get_ai_service()
+            try:
+                if generation.provider in ai_service.registry:
+                    ai_service.provider(generation.provider).cancel_generation(generation.prediction_id)
+            except Exception as e:
+                # It may have just finished; finalize ignores cancelled generations
+                logger.warning(f"Could not cancel prediction {generation.prediction_id}: {e}")
+        
+        generation.status = GenerationStatus.CANCELLED
+        generation.completed_at = func.now()
+        if queue_item:
+            queue_item.status = QueueStatus.CANCELLED
+            queue_item.processed_at = func.now()
+            GenerationLease.release(queue_item)
+        db.commit()
+        db.refresh(generation)
+        release(audio_id)
+        
+        logger.info(f"Cancelled generation {audio_id} ({len(revoked)} task(s) revoked)")
+        ProgressTracker(audio_id, user.user_id).update(GenerationStage.CANCELLED)
+        return generation
+    
     @staticmethod
     def get_generation_status(
         db: Session,
@@ -197,27 +506,77 @@ class GenerationService:
             GenerationStatus.PENDING: 10,
             GenerationStatus.PROCESSING: 50,
             GenerationStatus.COMPLETED: 100,
-            GenerationStatus.FAILED: 0
+            GenerationStatus.FAILED: 0,
+            GenerationStatus.CANCELLED: 0
         }
         
-        # Estimate time remaining (very rough)
+        progress = progress_map.get(generation.status, 0)
+        message = GenerationService._get_status_message(generation.status)
+        stage = None
+        updated_at = None
         estimated_time = None
-        if generation.status == GenerationStatus.PROCESSING:
-            from app.services.ai_service import AIVoiceService
-            ai_service = AIVoiceService()
-            estimated_time = ai_service.estimate_processing_time(generation.script_text)
+        poll_after = None
+        
+        in_flight = generation.status in (GenerationStatus.PENDING, GenerationStatus.PROCESSING)
+        if in_flight:
+            # Workers publish staged progress to Redis; prefer it over the map
+            progress_info = get_progress(audio_id)
+            if progress_info:
+                progress = progress_info["progress"]
+                message = progress_info["message"] or message
+                stage = progress_info["stage"]
+                updated_at = progress_info["updated_at"]
+            
+            estimated_time = GenerationService._estimate_time_remaining(generation, progress_info)
+            # Suggest polling a few times over the remaining time, within 1-10s
+            poll_after = min(max(estimated_time // 4, 1), 10)
+        else:
+            stage = generation.status.value
         
         return {
             "audio_id": generation.audio_id,
             "status": generation.status,
-            "progress": progress_map.get(generation.status, 0),
-            "message": GenerationService._get_status_message(generation.status),
+            "stage": stage,
+            "progress": progress,
+            "message": message,
             "estimated_time_remaining": estimated_time,
+            "poll_after": poll_after,
+            "updated_at": updated_at,
             "retry_count": queue_item.retry_count if queue_item else 0,
             "created_at": generation.generated_at,
             "completed_at": generation.completed_at
         }
     
+    @staticmethod
+    def _estimate_time_remaining(generation: GeneratedAudio, progress_info: Optional[dict]) -> int:
+        """Estimate seconds remaining from the staged progress, if any"""
+        from app.services.ai_service import get_ai_service
+        expected = get_ai_service().estimate_processing_time(generation.script_text)
+        
+        if not progress_info:
+            return expected
+        
+        now = time.time()
+        timestamps = progress_info["stage_timestamps"]
+        
+        # Extrapolate from the reported inference percentage when we have one
+        inferring_at = timestamps.get(GenerationStage.INFERRING.value)
+        start, end = STAGE_PROGRESS[GenerationStage.INFERRING]
+        fraction = (progress_info["progress"] - start) / (end - start)
+        if progress_info["stage"] == GenerationStage.INFERRING.value and inferring_at and 0.05 <= fraction < 1:
+            elapsed = now - inferring_at
+            return max(int(elapsed * (1 - fraction) / fraction), 1)
+        
+        # Otherwise subtract the time spent since the worker picked it up
+        started = [
+            value for name, value in timestamps.items()
+            if name != GenerationStage.QUEUED.value
+        ]
+        if started:
+            return max(int(expected - (now - min(started))), 1)
+        
+        return expected
+    
     @staticmethod
     def _get_status_message(status: GenerationStatus) -> str:
         """Get human-readable status message"""
@@ -225,7 +584,8 @@ class GenerationService:
             GenerationStatus.PENDING: "Your request is in the queue",
             GenerationStatus.PROCESSING: "Generating your audio with AI...",
             GenerationStatus.COMPLETED: "Audio generation complete! Ready to download.",
-            GenerationStatus.FAILED: "Generation failed. Please try again or contact support."
+            GenerationStatus.FAILED: "Generation failed. Please try again or contact support.",
+            GenerationStatus.CANCELLED: "Generation cancelled."
         }
         return messages.get(status, "Unknown status")
     
@@ -235,30 +595,26 @@ class GenerationService:
         audio_id: int,
         user: User
     ) -> GeneratedAudio:
-        """Retry a failed generation"""
+        """Retry a failed or cancelled generation"""
         generation = GenerationService.get_generation_by_id(db, audio_id, user)
         
-        if generation.status != GenerationStatus.FAILED:
+        if generation.status not in (GenerationStatus.FAILED, GenerationStatus.CANCELLED):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Can only retry failed generations"
+                detail="Can only retry failed or cancelled generations"
             )
-        
-        # Reset status
-        generation.status = GenerationStatus.PENDING
+        clear_cancel(audio_id)
         
         queue_item = db.query(GenerationQueue).filter(
             GenerationQueue.audio_id == audio_id
         ).first()
         
-        if queue_item:
-            queue_item.status = QueueStatus.QUEUED
-            queue_item.retry_count += 1
-        
+        # Reset status and re-queue the task in the same transaction
+        DeadLetterService.requeue(db, generation, queue_item)
         db.commit()
+        db.refresh(generation)
         
-        # Re-queue the task
         logger.info(f"Retrying generation for audio_id: {audio_id}")
-        generate_voice_audio_task.delay(audio_id)
+        ProgressTracker(audio_id, user.user_id).update(GenerationStage.QUEUED)
         
         return generation
@@ -0,0 +1,187 @@
+"""
+Idempotency keys and single-flight coalescing for generation requests.
+
+- An ``Idempotency-Key`` is reserved in Redis with a fingerprint of the
+  request body; retries with the same key get the original generation back.
+- Identical concurrent requests (same user, sample, model and text) are
+  coalesced onto one in-flight generation instead of enqueuing duplicates.
+"""
+import hashlib
+import json
+import logging
+import threading
+from typing import Optional
+from app.config import settings
+from app.utils.redis_client import InMemoryRedis, get_redis
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_KEY_PREFIX = "idempotency:"
+INFLIGHT_KEY_PREFIX = "inflight:generation:"
+
+# Placeholder value while the first request is still creating its generation
+PENDING = "pending"
+
+# Replace the claim only if it still points at the finished generation (or expired)
+TAKE_OVER_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if current and current ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+return 1
+"""
+
+
+def request_fingerprint(
+    sample_id: int,
+    model_name: str,
+    script_text: str,
+    stream: bool = False,
+    incremental: bool = False,
+    preview: bool = False
+) -> str:
+    """Stable hash of the fields that define a generation request"""
+    fields = {
+        "sample_id": sample_id,
+        "model_name": model_name,
+        # Whitespace-only differences are the same request
+        "script_text": " ".join(script_text.split()),
+    }
+    if stream:
+        fields["stream"] = True
+    if incremental:
+        fields["incremental"] = True
+    if preview:
+        fields["preview"] = True
+    payload = json.dumps(fields, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class IdempotencyConflict(Exception):
+    """The key was used before with a different request, or is still in use"""
+
+    def __init__(self, message: str, in_progress: bool = False):
+        super().__init__(message)
+        self.in_progress = in_progress
+
+
+class IdempotencyStore:
+    """Idempotency-Key records, scoped per user"""
+
+    @staticmethod
+    def _key(user_id: int, idempotency_key: str) -> str:
+        return f"{IDEMPOTENCY_KEY_PREFIX}{user_id}:{idempotency_key}"
+
+    def begin(self, user_id: int, idempotency_key: str, fingerprint: str) -> Optional[int]:
+        """
+        Reserve an idempotency key
+
+        Returns:
+            The audio_id of the original generation if this is a replay,
+            or None if the caller should create a new generation.
+
+        Raises:
+            IdempotencyConflict: the key belongs to a different request,
+                or the original request has not finished yet
+        """
+        client = get_redis()
+        key = self._key(user_id, idempotency_key)
+        record = {"fingerprint": fingerprint, "audio_id": None}
+
+        if client.set(key, json.dumps(record), nx=True, ex=settings.IDEMPOTENCY_TTL):
+            return None
+
+        existing = json.loads(client.get(key) or "null")
+        if existing is None:
+            # Expired between SET and GET; treat as a fresh request
+            client.set(key, json.dumps(record), ex=settings.IDEMPOTENCY_TTL)
+            return None
+
+        if existing["fingerprint"] != fingerprint:
+            raise IdempotencyConflict("Idempotency-Key was already used with a different request")
+
+        if existing["audio_id"] is None:
+            raise IdempotencyConflict("A request with this Idempotency-Key is still in progress", in_progress=True)
+
+        return existing["audio_id"]
+
+    def complete(self, user_id: int, idempotency_key: str, fingerprint: str, audio_id: int) -> None:
+        """Store the generation created for this key"""
+        record = {"fingerprint": fingerprint, "audio_id": audio_id}
+        get_redis().set(self._key(user_id, idempotency_key), json.dumps(record), ex=settings.IDEMPOTENCY_TTL)
+
+    def release(self, user_id: int, idempotency_key: str) -> None:
+        """Free the key after a failed request so the client can retry"""
+        get_redis().delete(self._key(user_id, idempotency_key))
+
+
+class SingleFlightPending(Exception):
+    """An identical request has claimed the generation but not created it yet"""
+
+
+class SingleFlight:
+    """Coalesces identical in-flight generation requests"""
+
+    _local_lock = threading.Lock()
+
+    @staticmethod
+    def _key(user_id: int, fingerprint: str) -> str:
+        return f"{INFLIGHT_KEY_PREFIX}{user_id}:{fingerprint}"
+
+    def claim(self, user_id: int, fingerprint: str) -> Optional[int]:
+        """
+        Try to become the request that creates the generation
+
+        Returns:
+            None if claimed (caller creates the generation and must call
+            publish or release), else the audio_id of the existing
+            generation to attach to.
+
+        Raises:
+            SingleFlightPending: an identical request is still creating its
+                generation; the placeholder expires if that request died
+        """
+        client = get_redis()
+        key = self._key(user_id, fingerprint)
+
+        if client.set(key, PENDING, nx=True, ex=settings.SINGLE_FLIGHT_CLAIM_TTL):
+            return None
+
+        value = client.get(key)
+        if value is None:
+            # Expired between SET and GET; claim it
+            return self.claim(user_id, fingerprint)
+        if value == PENDING:
+            raise SingleFlightPending("An identical request is still being created")
+        return int(value)
+
+    def take_over(self, user_id: int, fingerprint: str, finished_id: int) -> bool:
+        """
+        Claim a key whose generation is no longer in flight
+
+        Returns:
+            False if an identical request took it over first
+        """
+        client = get_redis()
+        key = self._key(user_id, fingerprint)
+        if not isinstance(client, InMemoryRedis):
+            return bool(client.eval(TAKE_OVER_SCRIPT, 1, key, str(finished_id), PENDING, settings.SINGLE_FLIGHT_CLAIM_TTL))
+
+        with self._local_lock:
+            current = client.get(key)
+            if current is not None and current != str(finished_id):
+                return False
+            client.set(key, PENDING, ex=settings.SINGLE_FLIGHT_CLAIM_TTL)
+            return True
+
+    def publish(self, user_id: int, fingerprint: str, audio_id: int) -> None:
+        """Point later identical requests at this generation"""
+        get_redis().set(self._key(user_id, fingerprint), audio_id, ex=settings.SINGLE_FLIGHT_TTL)
+
+    def release(self, user_id: int, fingerprint: str) -> None:
+        get_redis().delete(self._key(user_id, fingerprint))
+
+
+idempotency_store = IdempotencyStore()
+single_flight = SingleFlight()
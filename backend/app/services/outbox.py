@@ -0,0 +1,170 @@
+"""
+Transactional outbox for Celery task dispatch.
+
+Request handlers call ``enqueue_task`` inside their own transaction, so the
+task exists if and only if the data it refers to was committed. The relay
+(``python -m app.outbox_relay``) publishes unsent records to the broker in
+batches over one producer connection and marks them sent.
+
+A record the broker refuses is retried with exponential backoff, so a
+broker outage costs it a handful of attempts rather than one per poll. A
+record that runs out of attempts dead-letters the generation it was going
+to start instead of leaving it pending forever.
+"""
+import time
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Sequence
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+from app.config import settings
+from app.models.task_outbox import TaskOutbox
+
+logger = logging.getLogger(__name__)
+
+PURGE_INTERVAL = 3600  # seconds between clean-ups of sent records
+
+
+def enqueue_task(
+    db: Session,
+    task_name: str,
+    args: Sequence = (),
+    options: Optional[dict] = None,
+    audio_id: Optional[int] = None
+) -> TaskOutbox:
+    """
+    Add a task to the outbox (the caller commits)
+
+    Args:
+        db: Session whose transaction the task belongs to
+        task_name: Registered Celery task name
+        args: Positional task arguments (JSON serializable)
+        options: Extra apply_async options
+        audio_id: Generation the task works on, if any
+    """
+    record = TaskOutbox(task_name=task_name, args=list(args), options=options, audio_id=audio_id, attempts=0)
+    db.add(record)
+    return record
+
+
+class OutboxRelay:
+    """Publishes committed outbox records to Celery"""
+
+    def __init__(self, celery_app=None, batch_size: Optional[int] = None):
+        if celery_app is None:
+            from app.celery_app import celery_app
+        self.celery_app = celery_app
+        self.batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+
+    def _pending(self, db: Session):
+        query = db.query(TaskOutbox).filter(
+            TaskOutbox.sent_at.is_(None),
+            TaskOutbox.attempts < settings.OUTBOX_MAX_ATTEMPTS,
+            or_(TaskOutbox.next_attempt_at.is_(None), TaskOutbox.next_attempt_at <= datetime.now(timezone.utc))
+        ).order_by(TaskOutbox.outbox_id).limit(self.batch_size)
+
+        # Lets several relays run side by side without double-publishing
+        if db.bind.dialect.name == "postgresql":
+            query = query.with_for_update(skip_locked=True)
+        return query.all()
+
+    def relay_batch(self, db: Session) -> int:
+        """
+        Publish one batch of pending records
+
+        Returns:
+            Number of records published
+        """
+        records = self._pending(db)
+        if not records:
+            db.rollback()
+            return 0
+
+        sent = 0
+        try:
+            with self.celery_app.producer_or_acquire() as producer:
+                for record in records:
+                    result = self.celery_app.send_task(
+                        record.task_name,
+                        args=record.args,
+                        producer=producer,
+                        **(record.options or {})
+                    )
+                    record.task_id = result.id
+                    record.sent_at = func.now()
+                    sent += 1
+        except Exception as e:
+            # Broker trouble; keep the rest for the next round
+            logger.error(f"Outbox relay failed after {sent}/{len(records)} records: {e}")
+            # Whatever was published stays published, even if the backoff below fails
+            db.commit()
+            if sent < len(records):
+                failed = records[sent]
+                failed.attempts = (failed.attempts or 0) + 1
+                failed.last_error = str(e)
+                delay = min(settings.OUTBOX_RETRY_BASE * 2 ** (failed.attempts - 1), settings.OUTBOX_RETRY_MAX)
+                failed.next_attempt_at = datetime.now(timezone.utc) + timedelta(seconds=delay)
+                if failed.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+                    give_up(db, failed, e)
+
+        db.commit()
+        if sent:
+            logger.info(f"📤 Relayed {sent} task(s) from outbox")
+        return sent
+
+    def run(self, session_factory, poll_interval: Optional[float] = None, stop=None) -> None:
+        """Relay until stop() returns True, draining full batches back to back"""
+        poll_interval = poll_interval if poll_interval is not None else settings.OUTBOX_POLL_INTERVAL
+        last_purge = 0.0
+
+        while not (stop and stop()):
+            db = session_factory()
+            try:
+                sent = self.relay_batch(db)
+                if time.time() - last_purge > PURGE_INTERVAL:
+                    purge_sent(db, settings.OUTBOX_RETENTION)
+                    last_purge = time.time()
+            except Exception as e:
+                logger.error(f"Outbox relay error: {e}")
+                sent = 0
+            finally:
+                db.close()
+
+            if sent < self.batch_size:
+                time.sleep(poll_interval)
+
+
+def give_up(db: Session, record: TaskOutbox, error: Exception) -> None:
+    """Dead-letter the generation an unpublishable record was going to start (the caller commits)"""
+    from app.models.generated_audio import GeneratedAudio, GenerationStatus
+    from app.models.generation_queue import GenerationQueue, QueueStatus
+    from app.services.cancellation import GENERATION_TASK_NAMES
+    from app.services.dead_letter import DeadLetterService
+    from app.services.progress_tracker import GenerationStage, ProgressTracker
+    from app.services.retry_policy import ErrorKind
+
+    logger.error(f"Giving up on outbox record {record.outbox_id} ({record.task_name}) after {record.attempts} attempts")
+    if record.task_name not in GENERATION_TASK_NAMES or record.audio_id is None:
+        return
+
+    audio_id = record.audio_id
+    generation = db.query(GeneratedAudio).filter(GeneratedAudio.audio_id == audio_id).first()
+    if generation is None or generation.status not in (GenerationStatus.PENDING, GenerationStatus.PROCESSING):
+        return
+    generation.status = GenerationStatus.FAILED
+    queue_item = db.query(GenerationQueue).filter(GenerationQueue.audio_id == audio_id).first()
+    if queue_item and queue_item.status != QueueStatus.FAILED:
+        DeadLetterService.dead_letter(queue_item, error, ErrorKind.TRANSIENT)
+    ProgressTracker(audio_id, generation.user_id).update(GenerationStage.FAILED)
+
+
+def purge_sent(db: Session, older_than_seconds: int) -> int:
+    """Delete sent records older than the given age"""
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=older_than_seconds)
+    deleted = db.query(TaskOutbox).filter(
+        TaskOutbox.sent_at.isnot(None),
+        TaskOutbox.sent_at < cutoff
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted
@@ -0,0 +1,174 @@
+"""
+Fine-grained generation progress, kept in Redis.
+
+Workers publish stage changes (and inference percentage) to a Redis hash per
+generation; the status endpoint and WebSocket read from it, so progress never
+costs a Postgres commit. Each change is also published on the event bus so
+API processes can push it to the user's WebSocket connections.
+"""
+import enum
+import time
+import logging
+from typing import Optional
+from app.utils.event_bus import publish_event
+from app.utils.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_KEY_PREFIX = "generation:progress:"
+PROGRESS_TTL = 24 * 60 * 60  # keep finished progress for a day
+
+
+class GenerationStage(str, enum.Enum):
+    QUEUED = "queued"
+    CONVERTING = "converting"
+    UPLOADING = "uploading"
+    INFERRING = "inferring"
+    DOWNLOADING = "downloading"
+    FINALIZING = "finalizing"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+# Overall progress range (start, end) covered by each stage
+STAGE_PROGRESS = {
+    GenerationStage.QUEUED: (0, 5),
+    GenerationStage.CONVERTING: (5, 10),
+    GenerationStage.UPLOADING: (10, 20),
+    GenerationStage.INFERRING: (20, 85),
+    GenerationStage.DOWNLOADING: (85, 95),
+    GenerationStage.FINALIZING: (95, 99),
+    GenerationStage.COMPLETED: (100, 100),
+    GenerationStage.FAILED: (0, 0),
+    GenerationStage.CANCELLED: (0, 0),
+}
+
+# Coarse generation status matching GenerationStatus values
+STAGE_STATUS = {
+    GenerationStage.QUEUED: "pending",
+    GenerationStage.COMPLETED: "completed",
+    GenerationStage.FAILED: "failed",
+    GenerationStage.CANCELLED: "cancelled",
+}
+
+STAGE_MESSAGES = {
+    GenerationStage.QUEUED: "Your request is in the queue",
+    GenerationStage.CONVERTING: "Preparing your voice sample...",
+    GenerationStage.UPLOADING: "Uploading your voice sample...",
+    GenerationStage.INFERRING: "Generating your audio with AI...",
+    GenerationStage.DOWNLOADING: "Downloading generated audio...",
+    GenerationStage.FINALIZING: "Finishing up...",
+    GenerationStage.COMPLETED: "Audio generation complete! Ready to download.",
+    GenerationStage.FAILED: "Generation failed. Please try again or contact support.",
+    GenerationStage.CANCELLED: "Generation cancelled.",
+}
+
+
+def _progress_key(audio_id: int) -> str:
+    return f"{PROGRESS_KEY_PREFIX}{audio_id}"
+
+
+class ProgressTracker:
+    """Publishes stage events for one generation"""
+
+    def __init__(self, audio_id: int, user_id: Optional[int] = None):
+        self.audio_id = audio_id
+        self.user_id = user_id
+
+    def update(
+        self,
+        stage: GenerationStage,
+        fraction: Optional[float] = None,
+        message: Optional[str] = None
+    ) -> Optional[dict]:
+        """
+        Record the current stage
+
+        Args:
+            stage: Stage the generation is in
+            fraction: Completion of the stage (0-1), e.g. inference percentage
+            message: Human-readable message (defaults to the stage message)
+        """
+        start, end = STAGE_PROGRESS[stage]
+        progress = start
+        if fraction is not None:
+            progress = start + (end - start) * min(max(fraction, 0.0), 1.0)
+
+        now = time.time()
+        fields = {
+            "audio_id": self.audio_id,
+            "stage": stage.value,
+            "progress": int(progress),
+            "message": message or STAGE_MESSAGES[stage],
+            "updated_at": now,
+        }
+
+        try:
+            client = get_redis()
+            if self.user_id is None:
+                # Failure paths may not know the owner; reuse the stored one
+                stored_user_id = client.hget(_progress_key(self.audio_id), "user_id")
+                self.user_id = int(stored_user_id) if stored_user_id else None
+            if self.user_id is not None:
+                fields["user_id"] = self.user_id
+
+            # Only stamp a stage the first time we enter it
+            if fraction is None or not client.hget(_progress_key(self.audio_id), f"{stage.value}_at"):
+                fields[f"{stage.value}_at"] = now
+            client.hset(_progress_key(self.audio_id), mapping=fields)
+            client.expire(_progress_key(self.audio_id), PROGRESS_TTL)
+        except Exception as e:
+            # Progress is best effort and must never fail a generation
+            logger.warning(f"Could not publish progress for audio_id={self.audio_id}: {e}")
+            return None
+
+        if self.user_id is not None:
+            publish_event({
+                "type": "generation_status",
+                "audio_id": self.audio_id,
+                "user_id": self.user_id,
+                "status": STAGE_STATUS.get(stage, "processing"),
+                "stage": stage.value,
+                "progress": fields["progress"],
+                "message": fields["message"],
+                "updated_at": now,
+            })
+
+        return fields
+
+    def mark_started(self) -> None:
+        """Stamp the moment a worker picked the generation up"""
+        try:
+            get_redis().hset(_progress_key(self.audio_id), "started_at", time.time())
+        except Exception as e:
+            logger.warning(f"Could not mark audio_id={self.audio_id} started: {e}")
+
+    def __call__(self, stage: GenerationStage, fraction: Optional[float] = None):
+        """Allow the tracker to be passed around as an on_progress callback"""
+        self.update(stage, fraction)
+
+
+def get_progress(audio_id: int) -> Optional[dict]:
+    """Get the latest progress snapshot for a generation, if any"""
+    try:
+        raw = get_redis().hgetall(_progress_key(audio_id))
+    except Exception as e:
+        logger.warning(f"Could not read progress for audio_id={audio_id}: {e}")
+        return None
+
+    if not raw:
+        return None
+
+    snapshot = {
+        "audio_id": int(raw.get("audio_id", audio_id)),
+        "stage": raw.get("stage"),
+        "progress": int(raw.get("progress", 0)),
+        "message": raw.get("message"),
+        "updated_at": float(raw["updated_at"]) if raw.get("updated_at") else None,
+        "user_id": int(raw["user_id"]) if raw.get("user_id") else None,
+        "stage_timestamps": {
+            name[:-3]: float(value) for name, value in raw.items() if name.endswith("_at") and name != "updated_at"
+        },
+    }
+    return snapshot
@@ -0,0 +1,128 @@
+"""
+Active queue view: where each job stands and when it should be done.
+
+Positions are rank queries on the (status, priority, queued_at, queue_id)
+index, ordered like dispatch: higher priority tiers first, then by arrival.
+One index range count per active job, so they cost the same however long
+the history grows. ETAs divide the jobs ahead by the drain rate: completions
+over the last few minutes, recorded in a Redis sorted set, or while there
+are too few of those, worker concurrency over the learned processing time.
+Previews are ranked among the previews on their own lane, which works
+through PREVIEW_CONCURRENCY of them at a time.
+"""
+import time
+import logging
+from typing import List, Optional
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.models.generated_audio import GeneratedAudio
+from app.models.generation_queue import GenerationQueue, QueueStatus
+from app.models.user import User
+from app.services.progress_tracker import get_progress
+from app.utils.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+DRAINED_KEY = "queue:drained"  # zset of audio_id -> completed at
+ACTIVE_STATUSES = (QueueStatus.QUEUED, QueueStatus.PROCESSING)
+
+
+def record_drained(audio_id: int) -> None:
+    """Count a job that has left the queue towards the drain rate"""
+    now = time.time()
+    try:
+        redis = get_redis()
+        redis.zadd(DRAINED_KEY, {str(audio_id): now})
+        redis.zremrangebyscore(DRAINED_KEY, "-inf", now - settings.QUEUE_DRAIN_WINDOW)
+    except Exception as e:
+        logger.debug(f"Could not record drained job: {e}")
+
+
+def drain_rate(per_job_seconds: float) -> float:
+    """Jobs finishing per second, measured when there is enough recent data"""
+    try:
+        redis = get_redis()
+        redis.zremrangebyscore(DRAINED_KEY, "-inf", time.time() - settings.QUEUE_DRAIN_WINDOW)
+        drained = redis.zcard(DRAINED_KEY)
+    except Exception as e:
+        logger.debug(f"Could not read drain rate: {e}")
+        drained = 0
+    if drained >= settings.QUEUE_DRAIN_MIN_SAMPLES:
+        return drained / settings.QUEUE_DRAIN_WINDOW
+    return max(settings.WORKER_CONCURRENCY, 1) / max(per_job_seconds, 1)
+
+
+def queue_position(db: Session, queue_item: GenerationQueue, preview: bool = False) -> int:
+    """Queued jobs ahead of this one, all users, by priority then arrival (0 for processing jobs); previews only count previews"""
+    if queue_item.status != QueueStatus.QUEUED:
+        return 0
+    # Higher priority tiers are dispatched first, then first come first served
+    priority = queue_item.priority or 0
+    query = db.query(GenerationQueue).filter(
+        GenerationQueue.status == QueueStatus.QUEUED,
+        or_(
+            GenerationQueue.priority > priority,
+            and_(
+                GenerationQueue.priority == priority,
+                or_(
+                    GenerationQueue.queued_at < queue_item.queued_at,
+                    and_(GenerationQueue.queued_at == queue_item.queued_at, GenerationQueue.queue_id < queue_item.queue_id)
+                )
+            )
+        )
+    )
+    if preview:
+        query = query.join(GeneratedAudio, GeneratedAudio.audio_id == GenerationQueue.audio_id).filter(
+            GeneratedAudio.preview.is_(True)
+        )
+    return query.count()
+
+
+def active_queue(db: Session, user: User, limit: int = 50) -> dict:
+    """The user's queued and processing jobs with their global position and ETA"""
+    from app.services.ai_service import get_ai_service
+    from app.services.generation_service import GenerationService
+
+    ai_service = get_ai_service()
+    rows = db.query(GenerationQueue, GeneratedAudio).join(
+        GeneratedAudio, GeneratedAudio.audio_id == GenerationQueue.audio_id
+    ).filter(
+        GenerationQueue.user_id == user.user_id,
+        GenerationQueue.status.in_(ACTIVE_STATUSES)
+    ).order_by(GenerationQueue.queued_at, GenerationQueue.queue_id).limit(limit).all()
+
+    rate = drain_rate(ai_service.estimate_processing_time_for_words(50))
+    preview_rate = max(settings.PREVIEW_CONCURRENCY, 1) / max(
+        ai_service.estimate_processing_time_for_words(settings.PREVIEW_MAX_WORDS), 1
+    )
+    items: List[dict] = []
+    for queue_item, generation in rows:
+        position: Optional[int] = None
+        if queue_item.status == QueueStatus.PROCESSING:
+            eta = GenerationService._estimate_time_remaining(generation, get_progress(generation.audio_id))
+            starts_in = 0
+        else:
+            position = queue_position(db, queue_item, preview=bool(generation.preview))
+            starts_in = int(round(position / (preview_rate if generation.preview else rate)))
+            eta = starts_in + ai_service.estimate_processing_time(generation.script_text)
+        items.append({
+            "queue_id": queue_item.queue_id,
+            "audio_id": queue_item.audio_id,
+            "status": queue_item.status.value,
+            "priority": queue_item.priority,
+            "preview": bool(generation.preview),
+            "queued_at": queue_item.queued_at,
+            "retry_count": queue_item.retry_count,
+            "position": position,
+            "starts_in_seconds": starts_in,
+            "eta_seconds": eta,
+        })
+
+    total_queued = db.query(GenerationQueue).filter(GenerationQueue.status == QueueStatus.QUEUED).count()
+    return {
+        "total_queued": total_queued,
+        "drain_rate_per_minute": round(rate * 60, 2),
+        "active": len(items),
+        "queue_items": items,
+    }
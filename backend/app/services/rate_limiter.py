@@ -0,0 +1,253 @@
+"""
+Distributed rate and concurrency limits for provider calls.
+
+- TokenBucket: request rate shared by every worker (PROVIDER_RATE_LIMIT per
+  second, bursts up to PROVIDER_RATE_BURST).
+- AdaptiveConcurrency: an AIMD concurrency window. Healthy calls grow it by
+  about one slot per window's worth of calls; a 429 or a latency spike
+  (relative to a learned per-unit baseline) halves it, at most once per
+  cooldown so one burst of errors is not punished repeatedly. Spiking
+  samples still move the baseline, only more slowly, so after a lasting
+  latency shift (e.g. a new model version) the baseline catches up and the
+  window can grow again. The window is used as the provider bulkhead
+  limit, so total in-flight calls settle at what the provider actually
+  sustains.
+
+State lives in Redis and is updated atomically with Lua scripts; with
+REDIS_URL=memory:// an equivalent in-process implementation is used.
+"""
+import math
+import time
+import threading
+import logging
+from typing import Optional, Tuple
+from app.config import settings
+from app.services.circuit_breaker import ProviderUnavailableError
+from app.utils.redis_client import InMemoryRedis, get_redis
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitedError(ProviderUnavailableError):
+    pass
+
+
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local requested = tonumber(ARGV[4])
+local data = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(data[1]) or burst
+local updated = tonumber(data[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= requested then
+    tokens = tokens - requested
+else
+    wait = (requested - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 60)
+return tostring(wait)
+"""
+
+AIMD_SCRIPT = """
+local now = tonumber(ARGV[1])
+local overloaded = tonumber(ARGV[2])
+local latency = tonumber(ARGV[3])
+local min_window = tonumber(ARGV[4])
+local max_window = tonumber(ARGV[5])
+local initial = tonumber(ARGV[6])
+local factor = tonumber(ARGV[7])
+local spike = tonumber(ARGV[8])
+local cooldown = tonumber(ARGV[9])
+local alpha = tonumber(ARGV[10])
+local spike_alpha = tonumber(ARGV[11])
+local data = redis.call('HMGET', KEYS[1], 'window', 'baseline', 'decreased_at')
+local window = tonumber(data[1]) or initial
+local baseline = tonumber(data[2])
+local decreased_at = tonumber(data[3]) or 0
+local spiked = latency >= 0 and baseline and latency > baseline * spike
+if spiked then
+    overloaded = 1
+    baseline = baseline + spike_alpha * (latency - baseline)
+end
+if overloaded == 1 then
+    if now - decreased_at >= cooldown then
+        window = math.max(min_window, window * factor)
+        decreased_at = now
+    end
+else
+    window = math.min(max_window, window + 1 / window)
+    if latency >= 0 then
+        if baseline then
+            baseline = baseline + alpha * (latency - baseline)
+        else
+            baseline = latency
+        end
+    end
+end
+redis.call('HSET', KEYS[1], 'window', tostring(window), 'decreased_at', tostring(decreased_at))
+if baseline then
+    redis.call('HSET', KEYS[1], 'baseline', tostring(baseline))
+end
+return tostring(window)
+"""
+
+
+def _uses_memory(client) -> bool:
+    return isinstance(client, InMemoryRedis)
+
+
+class TokenBucket:
+    """Request rate limit shared across processes"""
+
+    _local_lock = threading.Lock()
+
+    def __init__(self, name: str, rate: Optional[float] = None, burst: Optional[float] = None, clock=time.time):
+        self.name = name
+        self.key = f"ratelimit:{name}"
+        self.rate = rate or settings.PROVIDER_RATE_LIMIT
+        self.burst = burst or settings.PROVIDER_RATE_BURST
+        self.clock = clock
+
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        """
+        Take tokens if available
+
+        Returns:
+            0 if acquired, else seconds until enough tokens will be available
+        """
+        client = get_redis()
+        now = self.clock()
+        if not _uses_memory(client):
+            return float(client.eval(TOKEN_BUCKET_SCRIPT, 1, self.key, self.rate, self.burst, now, tokens))
+
+        with self._local_lock:
+            state = client.hgetall(self.key)
+            available = float(state.get("tokens", self.burst))
+            updated = float(state.get("updated_at", now))
+            available = min(self.burst, available + max(0.0, now - updated) * self.rate)
+            wait = 0.0
+            if available >= tokens:
+                available -= tokens
+            else:
+                wait = (tokens - available) / self.rate
+            client.hset(self.key, mapping={"tokens": available, "updated_at": now})
+            return wait
+
+    def acquire(self, tokens: float = 1.0, timeout: Optional[float] = None) -> None:
+        """
+        Wait for tokens
+
+        Raises:
+            RateLimitedError: they would not be available within the timeout
+        """
+        timeout = settings.RATE_LIMIT_ACQUIRE_TIMEOUT if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        wait = self.try_acquire(tokens)
+        while wait > 0:
+            if time.monotonic() + wait > deadline:
+                raise RateLimitedError(f"{self.name} rate limit reached", retry_after=wait)
+            time.sleep(wait)
+            wait = self.try_acquire(tokens)
+
+    def snapshot(self) -> dict:
+        state = get_redis().hgetall(self.key)
+        now = self.clock()
+        available = float(state.get("tokens", self.burst))
+        updated = float(state.get("updated_at", now))
+        return {
+            "rate_per_second": self.rate,
+            "burst": self.burst,
+            "tokens": round(min(self.burst, available + max(0.0, now - updated) * self.rate), 3),
+        }
+
+
+class AdaptiveConcurrency:
+    """AIMD concurrency window shared across processes"""
+
+    _local_lock = threading.Lock()
+
+    def __init__(self, name: str, clock=time.time):
+        self.name = name
+        self.key = f"concurrency:{name}"
+        self.clock = clock
+
+    def _params(self) -> Tuple:
+        return (
+            settings.AIMD_MIN_CONCURRENCY,
+            settings.PROVIDER_MAX_CONCURRENCY,
+            settings.AIMD_INITIAL_CONCURRENCY,
+            settings.AIMD_DECREASE_FACTOR,
+            settings.AIMD_LATENCY_SPIKE_FACTOR,
+            settings.AIMD_DECREASE_COOLDOWN,
+            settings.AIMD_LATENCY_ALPHA,
+            settings.AIMD_SPIKE_ALPHA,
+        )
+
+    def window(self) -> float:
+        value = get_redis().hget(self.key, "window")
+        return float(value) if value else float(settings.AIMD_INITIAL_CONCURRENCY)
+
+    def limit(self) -> int:
+        """Current number of concurrent calls allowed"""
+        return max(settings.AIMD_MIN_CONCURRENCY, int(math.floor(self.window())))
+
+    def record(self, latency_per_unit: Optional[float] = None, overloaded: bool = False) -> float:
+        """
+        Feed back the outcome of a call
+
+        Args:
+            latency_per_unit: Call latency divided by its size (e.g. seconds per word),
+                or None when the latency says nothing about provider load
+            overloaded: The provider signalled overload (429)
+
+        Returns:
+            The new window
+        """
+        latency = -1.0 if latency_per_unit is None else latency_per_unit
+        client = get_redis()
+        now = self.clock()
+        try:
+            if not _uses_memory(client):
+                return float(client.eval(AIMD_SCRIPT, 1, self.key, now, int(overloaded), latency, *self._params()))
+
+            min_window, max_window, initial, factor, spike, cooldown, alpha, spike_alpha = self._params()
+            with self._local_lock:
+                state = client.hgetall(self.key)
+                window = float(state.get("window", initial))
+                baseline = float(state["baseline"]) if state.get("baseline") else None
+                decreased_at = float(state.get("decreased_at", 0))
+
+                if latency >= 0 and baseline and latency > baseline * spike:
+                    overloaded = True
+                    baseline += spike_alpha * (latency - baseline)
+
+                if overloaded:
+                    if now - decreased_at >= cooldown:
+                        window = max(min_window, window * factor)
+                        decreased_at = now
+                else:
+                    window = min(max_window, window + 1 / window)
+                    if latency >= 0:
+                        baseline = latency if baseline is None else baseline + alpha * (latency - baseline)
+
+                mapping = {"window": window, "decreased_at": decreased_at}
+                if baseline is not None:
+                    mapping["baseline"] = baseline
+                client.hset(self.key, mapping=mapping)
+                return window
+        except Exception as e:
+            logger.warning(f"Could not update concurrency window for {self.name}: {e}")
+            return self.window()
+
+    def snapshot(self) -> dict:
+        state = get_redis().hgetall(self.key)
+        return {
+            "window": round(self.window(), 3),
+            "limit": self.limit(),
+            "latency_baseline": float(state["baseline"]) if state.get("baseline") else None,
+            "last_decrease_at": float(state["decreased_at"]) if float(state.get("decreased_at", 0)) else None,
+        }
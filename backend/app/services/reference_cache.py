@@ -0,0 +1,179 @@
+"""
+Caches of prepared reference audio.
+
+ReferenceUploadCache holds the URLs of references uploaded to the provider's
+file API. Entries are keyed by the content hash of the voice sample, so every
+sample is uploaded once and later predictions pass the remote URL instead of
+the full audio. Entries expire shortly before the provider deletes the file.
+
+ReferenceDiskCache holds references converted for the provider on the
+worker's local disk, bounded in size and evicted least recently used first.
+Affinity routing (see worker_affinity) sends a voice's jobs to the same node,
+so its conversion is found there.
+"""
+import os
+import json
+import shutil
+import time
+import logging
+from datetime import datetime
+from typing import Optional
+from app.config import settings
+from app.utils.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+
+class ReferenceUploadCache:
+    """Remote upload URLs of prepared reference audio, by content hash"""
+    
+    KEY_PREFIX = "refcache:"
+    
+    def __init__(self, namespace: str = "replicate"):
+        self.namespace = namespace
+    
+    def _key(self, content_hash: str) -> str:
+        return f"{self.KEY_PREFIX}{self.namespace}:{content_hash}"
+    
+    def get(self, content_hash: str) -> Optional[dict]:
+        """Get a still-valid upload for this content, if any"""
+        try:
+            raw = get_redis().get(self._key(content_hash))
+        except Exception as e:
+            logger.warning(f"Reference cache unavailable: {e}")
+            return None
+        
+        if not raw:
+            return None
+        
+        entry = json.loads(raw)
+        if entry.get("expires_at") and entry["expires_at"] - settings.REFERENCE_UPLOAD_EXPIRY_MARGIN <= time.time():
+            return None
+        return entry
+    
+    def put(
+        self,
+        content_hash: str,
+        url: str,
+        file_id: Optional[str] = None,
+        expires_at: Optional[str] = None
+    ) -> None:
+        """Remember an upload until shortly before it expires remotely"""
+        expiry = self._parse_expiry(expires_at) or time.time() + settings.REFERENCE_UPLOAD_TTL
+        ttl = int(expiry - time.time() - settings.REFERENCE_UPLOAD_EXPIRY_MARGIN)
+        if ttl <= 0:
+            return
+        
+        entry = {"url": url, "file_id": file_id, "expires_at": expiry}
+        try:
+            get_redis().set(self._key(content_hash), json.dumps(entry), ex=ttl)
+        except Exception as e:
+            logger.warning(f"Could not cache reference upload: {e}")
+    
+    def invalidate(self, content_hash: str) -> None:
+        """Forget an upload (e.g. the provider no longer has the file)"""
+        try:
+            get_redis().delete(self._key(content_hash))
+        except Exception as e:
+            logger.warning(f"Could not invalidate reference upload: {e}")
+    
+    @staticmethod
+    def _parse_expiry(expires_at: Optional[str]) -> Optional[float]:
+        """Parse an ISO-8601 expiry timestamp into epoch seconds"""
+        if not expires_at:
+            return None
+        try:
+            return datetime.fromisoformat(expires_at.replace("Z", "+00:00")).timestamp()
+        except ValueError:
+            logger.warning(f"Unrecognized upload expiry: {expires_at}")
+            return None
+
+
+class ReferenceDiskCache:
+    """Converted reference audio on local disk, by content hash, LRU-bounded"""
+    
+    STATS_KEY_PREFIX = "refcache:disk:"
+    
+    def __init__(self, directory: str, max_bytes: int, node: str = ""):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.node = node or "shared"
+    
+    def path_for(self, content_hash: str) -> str:
+        return os.path.join(self.directory, f"{content_hash}.wav")
+    
+    def get(self, content_hash: str) -> Optional[str]:
+        """Path of the cached conversion, marked as just used, if any"""
+        path = self.path_for(content_hash)
+        try:
+            os.utime(path)
+        except OSError:
+            self._count("misses")
+            return None
+        self._count("hits")
+        return path
+    
+    def put(self, content_hash: str, converted_path: str) -> str:
+        """Move a fresh conversion into the cache and make room for it"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path_for(content_hash)
+        shutil.move(converted_path, path)  # conversions may come from another filesystem
+        self.evict(keep=path)
+        return path
+    
+    def evict(self, keep: Optional[str] = None) -> int:
+        """
+        Delete least recently used entries until the cache fits its budget
+        
+        Returns:
+            Number of entries deleted
+        """
+        entries = []
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                if entry.is_file() and entry.name.endswith(".wav"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            evicted += 1
+        if evicted:
+            logger.info(f"Evicted {evicted} cached references from {self.directory}")
+        return evicted
+    
+    def stats(self) -> dict:
+        """Hit and miss counts of this node's cache"""
+        try:
+            raw = get_redis().hgetall(f"{self.STATS_KEY_PREFIX}{self.node}")
+        except Exception:
+            raw = {}
+        hits, misses = int(raw.get("hits", 0)), int(raw.get("misses", 0))
+        return {
+            "node": self.node,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 3) if hits + misses else None,
+        }
+    
+    def _count(self, outcome: str) -> None:
+        try:
+            get_redis().hincrby(f"{self.STATS_KEY_PREFIX}{self.node}", outcome, 1)
+        except Exception as e:
+            logger.debug(f"Could not count reference cache {outcome}: {e}")
+
+
+def reference_disk_cache() -> ReferenceDiskCache:
+    """The disk cache of this worker, as configured"""
+    directory = settings.REFERENCE_DISK_CACHE_DIR or os.path.join(settings.UPLOAD_DIR, "references")
+    return ReferenceDiskCache(directory, settings.REFERENCE_DISK_CACHE_MAX_BYTES, settings.WORKER_NODE)
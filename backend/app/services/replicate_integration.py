@@ -2,14 +2,36 @@ import replicate
 import os
 import uuid
 import asyncio
-from typing import Tuple
+import contextlib
+import time
+from typing import Callable, Optional, Tuple
 from app.config import settings
 import logging
 import tempfile
-import requests
+from app.services.progress_tracker import GenerationStage
+from app.services.reference_cache import ReferenceUploadCache, reference_disk_cache
+from app.services.retry_policy import PermanentGenerationError
+from app.services.worker_drain import check_draining
+from app.utils.file_handler import compute_file_hash
+from app.utils.http_client import download_to_file, get_http_session, write_chunks_to_file
 
 logger = logging.getLogger(__name__)
 
+REPLICATE_API_BASE = "https://api.replicate.com"
+TERMINAL_PREDICTION_STATUSES = ("succeeded", "failed", "canceled")
+
+
+# What a prediction fails with when its input file URL cannot be fetched; a
+# bare 404 or "not found" also covers unknown models and versions, which a
+# fresh upload would not fix
+MISSING_INPUT_FILE_ERRORS = ("failed to download file", "could not download file")
+
+
+def _is_missing_file_error(error) -> bool:
+    """Whether a Replicate error (or prediction error text) means an input file URL could not be found"""
+    message = str(error).lower()
+    return any(text in message for text in MISSING_INPUT_FILE_ERRORS)
+
 class ReplicateVoiceService:
     """
     Production AI Voice Cloning using Replicate + Chatterbox
@@ -18,7 +40,7 @@ class ReplicateVoiceService:
     Capabilities: High-quality voice cloning with emotion control
     """
     
-    def __init__(self):
+    def __init__(self, model: Optional[str] = None):
         self.api_token = settings.REPLICATE_API_TOKEN
         
         if not self.api_token:
@@ -27,10 +49,12 @@ class ReplicateVoiceService:
         # Set environment variable for replicate client
         os.environ["REPLICATE_API_TOKEN"] = self.api_token
         
-        self.model = settings.REPLICATE_MODEL
+        self.model = model or settings.REPLICATE_MODEL
         self.output_dir = os.path.join(settings.UPLOAD_DIR, "generated")
         os.makedirs(self.output_dir, exist_ok=True)
         
+        self.reference_cache = ReferenceUploadCache()
+        
         logger.info(f"✅ Replicate initialized with model: {self.model}")
     
     def _convert_to_wav(self, audio_path: str) -> str:
@@ -79,11 +103,392 @@ class ReplicateVoiceService:
             logger.error(f"❌ Failed to convert audio: {e}")
             raise Exception(f"Failed to convert audio to WAV: {str(e)}")
     
+    @contextlib.contextmanager
+    def _reference_audio(self, sample_path: str, on_progress: Optional[Callable] = None):
+        """
+        Yield an open handle to the reference audio in WAV format.
+        Any temporary converted file is removed on exit.
+        """
+        if on_progress:
+            on_progress(GenerationStage.CONVERTING)
+        
+        # Convert to WAV if needed
+        converted_path = None
+        try:
+            converted_path = self._convert_to_wav(sample_path)
+            audio_file_to_use = converted_path
+        except Exception as e:
+            logger.warning(f"⚠️ Could not convert audio, trying original: {e}")
+            audio_file_to_use = sample_path
+        
+        try:
+            with open(audio_file_to_use, "rb") as audio_file_handle:
+                yield audio_file_handle
+        finally:
+            # Clean up converted file if it was created
+            if converted_path and converted_path != sample_path and os.path.exists(converted_path):
+                try:
+                    os.unlink(converted_path)
+                    logger.debug(f"🧹 Cleaned up temporary file: {converted_path}")
+                except Exception as e:
+                    logger.warning(f"⚠️ Could not delete temp file {converted_path}: {e}")
+    
+    def upload_file(self, file_handle) -> Tuple[str, Optional[str], Optional[str]]:
+        """
+        Upload a file through Replicate's file API
+        
+        Returns:
+            Tuple of (url, file_id, expires_at)
+        """
+        response = get_http_session().post(
+            f"{REPLICATE_API_BASE}/v1/files",
+            headers={"Authorization": f"Bearer {self.api_token}"},
+            files={"content": (os.path.basename(file_handle.name), file_handle, "audio/wav")},
+            timeout=(10, 120)
+        )
+        response.raise_for_status()
+        data = response.json()
+        return data["urls"]["get"], data.get("id"), data.get("expires_at")
+    
+    def _uploaded_reference_url(
+        self,
+        sample_path: str,
+        refresh: bool = False,
+        on_progress: Optional[Callable] = None
+    ) -> Optional[str]:
+        """
+        URL of the prepared reference audio on Replicate, uploading it once
+        per content hash. Returns None if the upload is not possible.
+        """
+        content_hash = compute_file_hash(sample_path)
+        
+        if refresh:
+            self.reference_cache.invalidate(content_hash)
+        else:
+            entry = self.reference_cache.get(content_hash)
+            if entry:
+                logger.info(f"♻️  Reusing uploaded reference audio: {entry['url']}")
+                return entry["url"]
+        
+        try:
+            with self._reference_audio(sample_path, on_progress) as audio_file_handle:
+                if on_progress:
+                    on_progress(GenerationStage.UPLOADING)
+                url, file_id, expires_at = self.upload_file(audio_file_handle)
+        except Exception as e:
+            logger.warning(f"⚠️ Reference upload failed, sending audio inline: {e}")
+            return None
+        
+        self.reference_cache.put(content_hash, url, file_id, expires_at)
+        logger.info(f"📤 Uploaded reference audio: {url}")
+        return url
+    
+    @contextlib.contextmanager
+    def _audio_prompt(
+        self,
+        sample_path: str,
+        refresh: bool = False,
+        on_progress: Optional[Callable] = None
+    ):
+        """Yield the audio_prompt input: a cached upload URL, else an open file"""
+        url = None
+        if settings.REFERENCE_UPLOAD_CACHE:
+            url = self._uploaded_reference_url(sample_path, refresh=refresh, on_progress=on_progress)
+        
+        if url:
+            yield url
+        else:
+            with self._reference_audio(sample_path, on_progress) as audio_file_handle:
+                yield audio_file_handle  # Replicate handles file upload
+    
+    def _with_audio_prompt(self, sample_path: str, call, on_progress: Optional[Callable] = None):
+        """
+        Call `call(audio_prompt)`; if a cached upload turns out to be gone
+        on Replicate's side, re-upload it and try once more.
+        """
+        with self._audio_prompt(sample_path, on_progress=on_progress) as audio_prompt:
+            try:
+                return call(audio_prompt)
+            except Exception as e:
+                if not (isinstance(audio_prompt, str) and _is_missing_file_error(e)):
+                    raise
+                logger.warning(f"⚠️ Uploaded reference no longer available, re-uploading: {e}")
+        
+        with self._audio_prompt(sample_path, refresh=True, on_progress=on_progress) as audio_prompt:
+            return call(audio_prompt)
+    
+    def prepare_reference(
+        self,
+        sample_path: str,
+        on_progress: Optional[Callable] = None,
+        refresh: bool = False
+    ) -> str:
+        """
+        Reference audio ready to send: the uploaded URL when the upload cache
+        is on, otherwise a WAV conversion stored next to the samples
+        """
+        if settings.REFERENCE_UPLOAD_CACHE:
+            url = self._uploaded_reference_url(sample_path, refresh=refresh, on_progress=on_progress)
+            if url:
+                return url
+        
+        if on_progress:
+            on_progress(GenerationStage.CONVERTING)
+        if sample_path.lower().endswith('.wav'):
+            return sample_path
+        
+        # Converted once per content into this node's cache; affinity
+        # routing brings the voice's later jobs back here
+        cache = reference_disk_cache()
+        content_hash = compute_file_hash(sample_path)
+        prepared_path = cache.get(content_hash)
+        if prepared_path is None:
+            try:
+                prepared_path = cache.put(content_hash, self._convert_to_wav(sample_path))
+            except Exception as e:
+                logger.warning(f"⚠️ Could not convert audio, trying original: {e}")
+                return sample_path
+        return prepared_path
+    
+    @contextlib.contextmanager
+    def _open_reference(self, reference: str):
+        """Yield the audio_prompt input for a prepared reference"""
+        if reference.startswith(("http://", "https://")):
+            yield reference
+        else:
+            with open(reference, "rb") as audio_file_handle:
+                yield audio_file_handle
+    
+    def submit_prepared(self, sample_path: str, reference: str, text: str, **params):
+        """
+        Create a prediction from a prepared reference; an uploaded reference
+        that has expired on Replicate's side is uploaded again once
+        
+        Returns:
+            The created replicate Prediction
+        """
+        try:
+            with self._open_reference(reference) as audio_prompt:
+                return self._submit(text, audio_prompt, **params)
+        except Exception as e:
+            if not (reference.startswith(("http://", "https://")) and _is_missing_file_error(e)):
+                raise
+            logger.warning(f"⚠️ Uploaded reference no longer available, re-uploading: {e}")
+        
+        reference = self.prepare_reference(sample_path, refresh=True)
+        with self._open_reference(reference) as audio_prompt:
+            return self._submit(text, audio_prompt, **params)
+    
+    def predict(
+        self,
+        sample_path: str,
+        reference: str,
+        text: str,
+        on_progress: Optional[Callable] = None,
+        on_submitted: Optional[Callable[[str], None]] = None
+    ):
+        """
+        Run a prediction from a prepared reference and wait for it
+        
+        Replicate fetches input URLs only once the prediction runs, so an
+        uploaded reference that has expired fails the prediction rather than
+        its creation; it is uploaded again and the prediction re-run once.
+        
+        Returns:
+            The prediction output (audio URL), for save_output
+        """
+        def run(reference):
+            logger.info("📤 Sending request to Replicate...")
+            with self._open_reference(reference) as audio_prompt:
+                prediction = self._submit(text, audio_prompt)
+            if on_submitted:
+                on_submitted(prediction.id)
+            return self.wait_for_prediction(prediction, on_progress)
+        
+        try:
+            return run(reference)
+        except Exception as e:
+            if not (reference.startswith(("http://", "https://")) and _is_missing_file_error(e)):
+                raise
+            logger.warning(f"⚠️ Uploaded reference no longer available, re-uploading: {e}")
+        
+        return run(self.prepare_reference(sample_path, refresh=True))
+    
+    def invalidate_reference(self, sample_path: str) -> None:
+        """Forget the uploaded reference of a sample, so the next job uploads it again"""
+        self.reference_cache.invalidate(compute_file_hash(sample_path))
+    
+    def _submit(self, text: str, audio_prompt, **params):
+        """Create a prediction for the configured model"""
+        # Chatterbox expects 'audio_prompt' and 'prompt' (text)
+        input_data = {
+            "prompt": text,
+            "audio_prompt": audio_prompt
+        }
+        
+        # "owner/name:version" pins a version, "owner/name" uses the latest
+        if ":" in self.model:
+            version_id = self.model.split(":", 1)[1]
+            return replicate.predictions.create(
+                version=version_id, input=input_data, **params
+            )
+        return replicate.models.predictions.create(
+            model=self.model, input=input_data, **params
+        )
+    
+    def wait_for_prediction(self, prediction, on_progress: Optional[Callable] = None):
+        """
+        Poll a prediction until it finishes, reporting inference progress
+        
+        Returns:
+            The prediction output
+        """
+        if on_progress:
+            on_progress(GenerationStage.INFERRING)
+        
+        last_percentage = None
+        while prediction.status not in TERMINAL_PREDICTION_STATUSES:
+            # A worker shutting down leaves the prediction to its successor
+            check_draining()
+            time.sleep(settings.REPLICATE_POLL_INTERVAL)
+            prediction.reload()
+            
+            progress = prediction.progress
+            if on_progress and progress and progress.percentage != last_percentage:
+                last_percentage = progress.percentage
+                on_progress(GenerationStage.INFERRING, progress.percentage)
+        
+        if prediction.status != "succeeded":
+            raise PermanentGenerationError(f"Prediction {prediction.id} {prediction.status}: {prediction.error}")
+        
+        return prediction.output
+    
+    def create_prediction(
+        self,
+        sample_path: str,
+        text: str,
+        webhook: Optional[str] = None,
+        reference: Optional[str] = None
+    ):
+        """
+        Submit a prediction to Replicate without waiting for it to finish
+        
+        Args:
+            sample_path: Path to the reference audio sample
+            text: Text to synthesize
+            webhook: URL Replicate should POST to once the prediction completes
+            reference: The sample as prepared by prepare_reference, if it was
+            
+        Returns:
+            The created replicate Prediction
+        """
+        params = {}
+        if webhook:
+            params["webhook"] = webhook
+            params["webhook_events_filter"] = ["completed"]
+        
+        def submit(audio_prompt):
+            logger.info("📤 Submitting prediction to Replicate...")
+            return self._submit(text, audio_prompt, **params)
+        
+        if reference:
+            prediction = self.submit_prepared(sample_path, reference, text, **params)
+        else:
+            prediction = self._with_audio_prompt(sample_path, submit)
+        
+        logger.info(f"✅ Prediction submitted: {prediction.id}")
+        return prediction
+    
+    def await_prediction(self, prediction_id: str, on_progress: Optional[Callable] = None):
+        """Wait for an existing prediction; returns its output"""
+        logger.info(f"🔁 Resuming prediction {prediction_id}")
+        prediction = replicate.predictions.get(prediction_id)
+        return self.wait_for_prediction(prediction, on_progress)
+    
+    def cancel_prediction(self, prediction_id: str) -> None:
+        """Cancel a running prediction so it stops being billed"""
+        replicate.predictions.cancel(prediction_id)
+        logger.info(f"🛑 Cancelled prediction {prediction_id}")
+    
+    def save_output(self, output, on_progress: Optional[Callable] = None) -> Tuple[str, float, int]:
+        """
+        Download a prediction output and measure it
+        
+        Returns:
+            Tuple of (output_file_path, duration_seconds, file_size_bytes)
+        """
+        output_path = self.download_output(output, on_progress)
+        
+        # Get file info
+        file_size = os.path.getsize(output_path)
+        
+        # Calculate duration
+        duration = self._get_audio_duration(output_path)
+        
+        logger.info(f"✅ Generation complete!")
+        logger.info(f"   Output: {output_path}")
+        logger.info(f"   Duration: {duration:.2f}s")
+        logger.info(f"   Size: {file_size / 1024:.2f}KB")
+        
+        return output_path, duration, file_size
+    
+    def download_output(self, output, on_progress: Optional[Callable] = None) -> str:
+        """
+        Download a prediction output into the generated audio directory
+        
+        Args:
+            output: Prediction output (URL string or file-like object)
+            on_progress: Optional stage callback
+            
+        Returns:
+            Path of the downloaded file
+        """
+        # Replicate may return a list of outputs; the audio is the first one
+        if isinstance(output, (list, tuple)):
+            if not output:
+                raise Exception("Replicate returned an empty output")
+            output = output[0]
+        
+        # Generate unique filename
+        output_filename = f"{uuid.uuid4()}.wav"
+        output_path = os.path.join(self.output_dir, output_filename)
+        
+        # Download the generated audio
+        # Replicate can return either a URL string or a FileOutput object
+        logger.info("💾 Downloading generated audio...")
+        if on_progress:
+            on_progress(GenerationStage.DOWNLOADING)
+        
+        # Check if output is a string (URL) or a file-like object
+        output_url = output if isinstance(output, str) else getattr(output, 'url', None)
+        if isinstance(output_url, str) and output_url.startswith(('http://', 'https://')):
+            # Stream over the pooled connection straight to disk
+            logger.info(f"   Downloading from URL: {output_url}")
+            download_to_file(output_url, output_path)
+        elif hasattr(output, 'read'):
+            # It's a file-like object, copy it in chunks
+            write_chunks_to_file(
+                iter(lambda: output.read(settings.DOWNLOAD_CHUNK_SIZE), b""),
+                output_path
+            )
+        elif hasattr(output, '__iter__') and not isinstance(output, str):
+            # Iterable of byte chunks
+            write_chunks_to_file(output, output_path)
+        else:
+            # Try to convert to string and download
+            output_url = str(output)
+            logger.info(f"   Downloading from URL: {output_url}")
+            download_to_file(output_url, output_path)
+        
+        return output_path
+    
     async def generate_speech(
         self,
         sample_path: str,
         text: str,
-        model_name: str
+        model_name: str,
+        on_progress: Optional[Callable] = None,
+        on_submitted: Optional[Callable[[str], None]] = None
     ) -> Tuple[str, float, int]:
         """
         Generate speech using Replicate Chatterbox model
@@ -92,6 +497,9 @@ class ReplicateVoiceService:
             sample_path: Path to the reference audio sample
             text: Text to synthesize
             model_name: Name for this voice model (metadata)
+            on_progress: Optional callback(stage, fraction) for progress events
+            on_submitted: Optional callback(prediction_id) once the prediction exists,
+                so a crashed job can resume it instead of paying for a new one
             
         Returns:
             Tuple of (output_file_path, duration_seconds, file_size_bytes)
@@ -99,102 +507,25 @@ class ReplicateVoiceService:
         logger.info(f"🤖 Starting Replicate generation for: {text[:50]}...")
         logger.info(f"   Using voice sample: {sample_path}")
         
-        # Convert to WAV if needed
-        converted_path = None
-        try:
-            converted_path = self._convert_to_wav(sample_path)
-            audio_file_to_use = converted_path
-        except Exception as e:
-            logger.warning(f"⚠️ Could not convert audio, trying original: {e}")
-            audio_file_to_use = sample_path
-        
-        audio_file_handle = None
         try:
-            # Prepare input for Chatterbox model
-            # Chatterbox expects 'audio_prompt' and 'prompt' (text)
-            audio_file_handle = open(audio_file_to_use, "rb")
-            input_data = {
-                "prompt": text,
-                "audio_prompt": audio_file_handle  # Replicate handles file upload
-            }
+            def run(audio_prompt):
+                logger.info("📤 Sending request to Replicate...")
+                prediction = self._submit(text, audio_prompt)
+                if on_submitted:
+                    on_submitted(prediction.id)
+                return self.wait_for_prediction(prediction, on_progress)
             
-            logger.info("📤 Sending request to Replicate...")
-            
-            # Run the model using async
-            output = await asyncio.to_thread(
-                replicate.run,
-                self.model,
-                input=input_data
-            )
-            
-            # Close file handle after request
-            if audio_file_handle:
-                audio_file_handle.close()
-                audio_file_handle = None
+            # Submit and poll in a thread
+            output = await asyncio.to_thread(self._with_audio_prompt, sample_path, run, on_progress)
             
             logger.info("📥 Received response from Replicate")
             
-            # Generate unique filename
-            output_filename = f"{uuid.uuid4()}.wav"
-            output_path = os.path.join(self.output_dir, output_filename)
-            
-            # Download the generated audio
-            # Replicate can return either a URL string or a FileOutput object
-            logger.info("💾 Downloading generated audio...")
-            
-            # Check if output is a string (URL) or a file-like object
-            if isinstance(output, str):
-                # It's a URL, download it
-                logger.info(f"   Downloading from URL: {output}")
-                response = requests.get(output, timeout=60)
-                response.raise_for_status()
-                with open(output_path, "wb") as file:
-                    file.write(response.content)
-            elif hasattr(output, 'read'):
-                # It's a file-like object
-                with open(output_path, "wb") as file:
-                    file.write(output.read())
-            else:
-                # Try to convert to string and download
-                output_url = str(output)
-                logger.info(f"   Downloading from URL: {output_url}")
-                response = requests.get(output_url, timeout=60)
-                response.raise_for_status()
-                with open(output_path, "wb") as file:
-                    file.write(response.content)
-            
-            # Get file info
-            file_size = os.path.getsize(output_path)
-            
-            # Calculate duration
-            duration = self._get_audio_duration(output_path)
-            
-            logger.info(f"✅ Generation complete!")
-            logger.info(f"   Output: {output_path}")
-            logger.info(f"   Duration: {duration:.2f}s")
-            logger.info(f"   Size: {file_size / 1024:.2f}KB")
-            
-            return output_path, duration, file_size
+            return self.save_output(output, on_progress)
             
         except Exception as e:
             logger.error(f"❌ Replicate generation failed: {str(e)}")
             logger.error(f"   Error type: {type(e).__name__}")
-            raise Exception(f"Replicate AI generation failed: {str(e)}")
-        finally:
-            # Close file handle if still open
-            if audio_file_handle:
-                try:
-                    audio_file_handle.close()
-                except:
-                    pass
-            
-            # Clean up converted file if it was created
-            if converted_path and converted_path != sample_path and os.path.exists(converted_path):
-                try:
-                    os.unlink(converted_path)
-                    logger.debug(f"🧹 Cleaned up temporary file: {converted_path}")
-                except Exception as e:
-                    logger.warning(f"⚠️ Could not delete temp file {converted_path}: {e}")
+            raise Exception(f"Replicate AI generation failed: {str(e)}") from e
     
     def _get_audio_duration(self, file_path: str) -> float:
         """Get audio duration using wave library"""
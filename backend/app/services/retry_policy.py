@@ -0,0 +1,146 @@
+"""
+Error classification, retry backoff and retry metrics for generation tasks.
+
+Transient errors (network trouble, timeouts, rate limits, provider 5xx) are
+retried with jittered exponential backoff; permanent ones (bad input, failed
+predictions, other 4xx) go straight to the dead-letter queue.
+"""
+import enum
+import random
+import logging
+from typing import Optional, Tuple
+from app.config import settings
+from app.utils.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+RETRY_METRICS_KEY = "metrics:generation_retries"
+
+# HTTP statuses worth retrying
+TRANSIENT_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class ErrorKind(str, enum.Enum):
+    TRANSIENT = "transient"
+    PERMANENT = "permanent"
+
+
+class TransientGenerationError(Exception):
+    """A failure that is expected to go away if the job is retried later"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class PermanentGenerationError(Exception):
+    """A failure that retrying will not fix"""
+
+
+def _causes(error: BaseException):
+    """The error followed by the exceptions it was raised from"""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        yield error
+        error = error.__cause__ or error.__context__
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    status = getattr(error, "status", None)
+    if isinstance(status, int):
+        return status
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    retry_after = getattr(error, "retry_after", None)
+    if retry_after is None:
+        headers = getattr(getattr(error, "response", None), "headers", None) or {}
+        retry_after = headers.get("Retry-After")
+    try:
+        return float(retry_after) if retry_after is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """Whether the provider rejected a call for exceeding its rate limit"""
+    return any(_status_code(exc) == 429 for exc in _causes(error))
+
+
+def classify_error(error: BaseException) -> Tuple[ErrorKind, Optional[float]]:
+    """
+    Decide whether an error is worth retrying
+
+    Returns:
+        Tuple of (kind, retry_after_seconds or None)
+    """
+    import requests
+
+    for exc in _causes(error):
+        if isinstance(exc, TransientGenerationError):
+            return ErrorKind.TRANSIENT, exc.retry_after
+        if isinstance(exc, PermanentGenerationError):
+            return ErrorKind.PERMANENT, None
+
+        status = _status_code(exc)
+        if status in TRANSIENT_STATUSES:
+            return ErrorKind.TRANSIENT, _retry_after(exc)
+        if status is not None and 400 <= status < 500:
+            return ErrorKind.PERMANENT, None
+
+        # Connection and timeout errors; DownloadError is an IOError we raise
+        # after exhausting resumes, which is also worth another go later
+        if isinstance(exc, (ConnectionError, TimeoutError, requests.ConnectionError, requests.Timeout)):
+            return ErrorKind.TRANSIENT, None
+        from app.utils.http_client import DownloadError
+        if isinstance(exc, DownloadError):
+            return ErrorKind.TRANSIENT, None
+
+        try:
+            import httpx
+            if isinstance(exc, httpx.TransportError):
+                return ErrorKind.TRANSIENT, None
+        except ImportError:
+            pass
+
+    # Anything we cannot recognise is treated as a bug or bad input
+    return ErrorKind.PERMANENT, None
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """
+    Seconds to wait before retry number `attempt` (0-based)
+
+    "Full jitter": uniform in [0, min(cap, base * 2^attempt)], so workers
+    that failed together do not retry together. A provider Retry-After is
+    respected as a lower bound.
+    """
+    ceiling = min(settings.GENERATION_RETRY_MAX_DELAY, settings.GENERATION_RETRY_BASE_DELAY * (2 ** attempt))
+    delay = random.uniform(0, ceiling)
+    if retry_after:
+        delay = max(delay, retry_after)
+    return delay
+
+
+def record_retry_event(event: str, kind: Optional[ErrorKind] = None, error: Optional[BaseException] = None) -> None:
+    """
+    Count a retry event (retried, dead_lettered, requeued, recovered)
+    """
+    try:
+        client = get_redis()
+        client.hincrby(RETRY_METRICS_KEY, event, 1)
+        if kind is not None:
+            client.hincrby(RETRY_METRICS_KEY, f"{event}:{kind.value}", 1)
+        if error is not None:
+            client.hincrby(RETRY_METRICS_KEY, f"{event}:{type(error).__name__}", 1)
+    except Exception as e:
+        logger.warning(f"Could not record retry metric {event}: {e}")
+
+
+def retry_metrics() -> dict:
+    """All retry counters"""
+    return {name: int(value) for name, value in get_redis().hgetall(RETRY_METRICS_KEY).items()}
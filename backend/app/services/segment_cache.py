@@ -0,0 +1,116 @@
+"""
+Sentence-level synthesis cache.
+
+Streaming and incremental generations are synthesized one sentence at a
+time, and every sentence is kept on shared storage under a key made of the
+voice sample's content hash, the normalized sentence and the provider
+settings that shape the audio. When a script is edited and generated again,
+only the sentences that changed go to the provider; the rest are read back
+from the cache and everything is re-stitched with short crossfades.
+
+Entries are plain WAV files named by their key, bounded by size and evicted
+least recently used first, like the local reference cache.
+"""
+import os
+import json
+import uuid
+import shutil
+import hashlib
+import logging
+import unicodedata
+from typing import Callable, Optional, Tuple
+from app.config import settings
+from app.services.progress_tracker import GenerationStage
+from app.services.reference_cache import ReferenceDiskCache
+from app.utils.file_handler import compute_file_hash
+from app.utils.text_chunks import split_sentences
+from app.utils.wav import crossfade_wavs
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_sentence(sentence: str) -> str:
+    """Unicode and whitespace variants of a sentence sound the same; case and punctuation do not"""
+    return " ".join(unicodedata.normalize("NFKC", sentence).split())
+
+
+class SegmentCache(ReferenceDiskCache):
+    """Synthesized sentences of one voice on one provider"""
+
+    STATS_KEY_PREFIX = "segcache:"
+
+    def __init__(self, directory: str, max_bytes: int, reference_hash: str, params: dict):
+        super().__init__(directory, max_bytes)
+        self.reference_hash = reference_hash
+        self.params = params
+
+    @classmethod
+    def for_voice(cls, sample_path: str, provider) -> "SegmentCache":
+        """The cache of a voice sample on a provider, as configured"""
+        directory = settings.SEGMENT_CACHE_DIR or os.path.join(settings.UPLOAD_DIR, "segments")
+        return cls(directory, settings.SEGMENT_CACHE_MAX_BYTES, compute_file_hash(sample_path), provider.voice_params)
+
+    def key(self, sentence: str) -> str:
+        payload = json.dumps({
+            "reference": self.reference_hash,
+            "sentence": normalize_sentence(sentence),
+            "params": self.params,
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def lookup(self, sentence: str) -> Optional[str]:
+        """Path of the cached audio of a sentence, if any"""
+        return self.get(self.key(sentence))
+
+    def store(self, sentence: str, path: str) -> str:
+        """Move freshly synthesized audio of a sentence into the cache; returns its new path"""
+        os.makedirs(self.directory, exist_ok=True)
+        # Stage next to the entry so it appears whole to workers reading the cache
+        staging = os.path.join(self.directory, f".{uuid.uuid4()}.tmp")
+        shutil.move(path, staging)
+        return self.put(self.key(sentence), staging)
+
+
+def synthesize_incremental(
+    synthesize: Callable[[str], Tuple[str, float, int]],
+    cache: SegmentCache,
+    text: str,
+    output_dir: str,
+    on_progress: Optional[Callable] = None
+) -> Tuple[str, float, int]:
+    """
+    Synthesize the sentences of text that are not cached yet and stitch all of them
+
+    Args:
+        synthesize: Function turning one sentence into (path, duration, size)
+        cache: Segment cache of the voice and provider
+        text: Full script
+        output_dir: Where the stitched file is written
+        on_progress: Optional callback(stage, fraction) for progress events
+
+    Returns:
+        Tuple of (output_path, duration_seconds, file_size_bytes) of the stitched file
+    """
+    sentences = split_sentences(text, max_chars=settings.STREAM_MAX_CHUNK_CHARS)
+    if not sentences:
+        raise ValueError("Script has no text to synthesize")
+
+    paths = []
+    reused = 0
+    for index, sentence in enumerate(sentences):
+        path = cache.lookup(sentence)
+        if path:
+            reused += 1
+        else:
+            if on_progress:
+                on_progress(GenerationStage.INFERRING, index / len(sentences))
+            chunk_path, _, _ = synthesize(sentence)
+            path = cache.store(sentence, chunk_path)
+        paths.append(path)
+    logger.info(f"♻️ Reused {reused}/{len(sentences)} cached sentences")
+
+    if on_progress:
+        on_progress(GenerationStage.FINALIZING)
+    output_path = os.path.join(output_dir, f"{uuid.uuid4()}.wav")
+    duration, file_size = crossfade_wavs(paths, output_path, settings.SEGMENT_CROSSFADE_MS / 1000)
+    return output_path, duration, file_size
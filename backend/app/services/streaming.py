@@ -0,0 +1,213 @@
+"""
+Streaming generations: synthesize a script sentence by sentence and make
+each chunk available as soon as it is ready.
+
+The worker writes every finished chunk to ``generated/chunks/{audio_id}/``,
+records it in a Redis hash and publishes a ``generation_chunk`` event. The
+HTTP stream endpoint and the WebSocket read chunks back from the registry,
+so listeners can attach at any point (or to another API process) and still
+get the audio from the start. Once every chunk exists they are stitched into
+the generation's regular output file.
+
+A job that is re-queued after a crash keeps the chunks it already has and
+only synthesizes the rest. Sentences found in the segment cache are not
+synthesized at all.
+"""
+import os
+import time
+import uuid
+import shutil
+import logging
+import threading
+from typing import Callable, Dict, Iterator, Optional, Tuple
+from app.config import settings
+from app.services.progress_tracker import GenerationStage, get_progress
+from app.utils.event_bus import publish_event
+from app.utils.redis_client import get_redis
+from app.utils.text_chunks import split_sentences
+from app.utils.wav import WavFormat, concatenate_wavs, duration_of, read_wav, streaming_header
+
+logger = logging.getLogger(__name__)
+
+STREAM_KEY_PREFIX = "generation:stream:"
+
+
+def chunk_dir(audio_id: int) -> str:
+    return os.path.join(settings.UPLOAD_DIR, "generated", "chunks", str(audio_id))
+
+
+class StreamChunks:
+    """Registry of the finished chunks of one streaming generation"""
+
+    def __init__(self, audio_id: int, user_id: Optional[int] = None):
+        self.audio_id = audio_id
+        self.user_id = user_id
+        self.key = f"{STREAM_KEY_PREFIX}{audio_id}"
+
+    def start(self, total: int) -> None:
+        client = get_redis()
+        client.hset(self.key, mapping={"total": total})
+        client.expire(self.key, settings.STREAM_TIMEOUT + settings.STREAM_CHUNK_RETENTION)
+
+    def add(self, index: int, path: str, duration: float) -> None:
+        """Record a finished chunk and tell listeners about it"""
+        client = get_redis()
+        client.hset(self.key, mapping={f"chunk:{index}": path, f"duration:{index}": duration})
+        total = client.hget(self.key, "total")
+        publish_event({
+            "type": "generation_chunk",
+            "audio_id": self.audio_id,
+            "user_id": self.user_id,
+            "index": index,
+            "total": int(total) if total else None,
+            "duration": duration,
+            "url": f"/api/generation/{self.audio_id}/chunks/{index}",
+        })
+
+    def finish(self, output_path: str) -> None:
+        get_redis().hset(self.key, mapping={"output": output_path})
+
+    def state(self) -> dict:
+        """Total chunk count (None until known), finished chunk paths and the stitched output"""
+        data = get_redis().hgetall(self.key)
+        chunks: Dict[int, str] = {}
+        durations: Dict[int, float] = {}
+        for field, value in data.items():
+            name, _, index = field.partition(":")
+            if name == "chunk":
+                chunks[int(index)] = value
+            elif name == "duration":
+                durations[int(index)] = float(value)
+        return {
+            "total": int(data["total"]) if data.get("total") else None,
+            "chunks": chunks,
+            "durations": durations,
+            "output": data.get("output"),
+        }
+
+    def chunk_path(self, index: int) -> Optional[str]:
+        return get_redis().hget(self.key, f"chunk:{index}")
+
+    def clear(self) -> None:
+        get_redis().delete(self.key)
+        shutil.rmtree(chunk_dir(self.audio_id), ignore_errors=True)
+
+
+def synthesize_streaming(
+    synthesize: Callable[[str], Tuple[str, float, int]],
+    audio_id: int,
+    user_id: int,
+    text: str,
+    output_dir: str,
+    on_progress: Optional[Callable] = None,
+    cache=None
+) -> Tuple[str, float, int]:
+    """
+    Synthesize text one sentence at a time, publishing each chunk
+
+    Args:
+        synthesize: Function turning one sentence into (path, duration, size)
+        audio_id: Generation being streamed
+        user_id: Owner, for chunk events
+        text: Full script
+        output_dir: Where the stitched file is written
+        on_progress: Optional callback(stage, fraction) for progress events
+        cache: Optional SegmentCache to read sentences from and add them to
+
+    Returns:
+        Tuple of (output_path, duration_seconds, file_size_bytes) of the stitched file
+    """
+    sentences = split_sentences(text, max_chars=settings.STREAM_MAX_CHUNK_CHARS)
+    chunks = StreamChunks(audio_id, user_id)
+    existing = chunks.state()["chunks"]
+    chunks.start(len(sentences))
+    directory = chunk_dir(audio_id)
+    os.makedirs(directory, exist_ok=True)
+
+    paths = []
+    for index, sentence in enumerate(sentences):
+        path = os.path.join(directory, f"{index:04d}.wav")
+        if existing.get(index) == path and os.path.exists(path):
+            # Synthesized before this job was re-queued
+            paths.append(path)
+            continue
+
+        cached = cache.lookup(sentence) if cache else None
+        if cached:
+            shutil.copyfile(cached, path)
+            duration = round(duration_of(*read_wav(path)), 2)
+        else:
+            if on_progress:
+                on_progress(GenerationStage.INFERRING, index / len(sentences))
+            chunk_path, duration, _ = synthesize(sentence)
+            if cache:
+                shutil.copyfile(cache.store(sentence, chunk_path), path)
+            else:
+                shutil.move(chunk_path, path)
+        chunks.add(index, path, duration)
+        paths.append(path)
+        logger.info(f"🔊 Chunk {index + 1}/{len(sentences)} ready for audio_id={audio_id}")
+
+    if on_progress:
+        on_progress(GenerationStage.FINALIZING)
+    output_path = os.path.join(output_dir, f"{uuid.uuid4()}.wav")
+    duration, file_size = concatenate_wavs(paths, output_path)
+    chunks.finish(output_path)
+    return output_path, duration, file_size
+
+
+def _stream_finished(audio_id: int, state: dict, next_index: int) -> bool:
+    if state["total"] is not None and next_index >= state["total"]:
+        return True
+    progress = get_progress(audio_id)
+    return bool(progress and progress["stage"] in (GenerationStage.FAILED.value, GenerationStage.CANCELLED.value))
+
+
+def iter_chunks(
+    audio_id: int,
+    poll_interval: Optional[float] = None,
+    timeout: Optional[float] = None,
+    stop: Optional[threading.Event] = None
+) -> Iterator[Tuple[int, str]]:
+    """
+    Yield (index, path) of each chunk in order, waiting for ones still being synthesized
+
+    Stops after the last chunk, when the generation fails or is cancelled,
+    when no new chunk has appeared within the timeout, or when stop is set.
+    """
+    poll_interval = settings.STREAM_POLL_INTERVAL if poll_interval is None else poll_interval
+    timeout = settings.STREAM_TIMEOUT if timeout is None else timeout
+    stop = stop or threading.Event()
+    chunks = StreamChunks(audio_id)
+    next_index = 0
+    deadline = time.monotonic() + timeout
+
+    while not stop.is_set():
+        state = chunks.state()
+        while next_index in state["chunks"]:
+            yield next_index, state["chunks"][next_index]
+            next_index += 1
+            deadline = time.monotonic() + timeout
+        if _stream_finished(audio_id, state, next_index):
+            return
+        if time.monotonic() >= deadline:
+            logger.warning(f"Stream for audio_id={audio_id} timed out at chunk {next_index}")
+            return
+        stop.wait(poll_interval)
+
+
+def iter_wav_stream(audio_id: int, **kwargs) -> Iterator[bytes]:
+    """
+    One continuous WAV stream: a header of unknown length, then the PCM
+    frames of each chunk as it becomes available
+    """
+    fmt: Optional[WavFormat] = None
+    for index, path in iter_chunks(audio_id, **kwargs):
+        chunk_fmt, frames = read_wav(path)
+        if fmt is None:
+            fmt = chunk_fmt
+            yield streaming_header(fmt)
+        elif chunk_fmt != fmt:
+            logger.error(f"Chunk {index} of audio_id={audio_id} has a different format, ending stream")
+            return
+        yield frames
@@ -0,0 +1,216 @@
+"""
+Local synthetic TTS engine for development, load tests and benchmarks.
+
+Renders speech-like PCM audio with NumPy: one harmonic "syllable" per word
+at a realistic speaking rate, with pauses after sentences, so durations,
+file sizes and post-processing costs match what a real model produces.
+
+Provider behaviour is simulated separately from rendering:
+- latency, from a fixed, per-word or log-normal model;
+- failures, injected at configurable transient and permanent rates.
+
+With deferred completion the engine works like a webhook provider: submit()
+returns a prediction id at once and a delayed Celery task completes the job
+after the sampled latency, so no worker slot is held while "inferring".
+"""
+import os
+import uuid
+import zlib
+import asyncio
+import logging
+from typing import Callable, Optional, Tuple
+import numpy as np
+from app.config import settings
+from app.services.progress_tracker import GenerationStage
+from app.services.retry_policy import PermanentGenerationError, TransientGenerationError
+from app.utils.wav import WavFormat, read_wav, wav_bytes, duration_of
+
+logger = logging.getLogger(__name__)
+
+LATENCY_MODELS = ("fixed", "per_word", "lognormal")
+
+# Pause after sentence-ending words, seconds
+SENTENCE_PAUSE = 0.35
+# Share of each word's slot that is voiced; the rest is the gap between words
+VOICED_SHARE = 0.8
+
+
+class LatencyModel:
+    """How long the simulated provider takes for a call"""
+
+    def __init__(
+        self,
+        kind: str = "per_word",
+        base: float = 0.5,
+        per_word: float = 0.05,
+        sigma: float = 0.5
+    ):
+        if kind not in LATENCY_MODELS:
+            raise ValueError(f"Unknown latency model {kind!r}, expected one of {', '.join(LATENCY_MODELS)}")
+        self.kind = kind
+        self.base = base
+        self.per_word = per_word
+        self.sigma = sigma
+
+    @classmethod
+    def from_settings(cls) -> "LatencyModel":
+        return cls(
+            settings.SYNTHETIC_LATENCY_MODEL,
+            settings.SYNTHETIC_LATENCY_BASE,
+            settings.SYNTHETIC_LATENCY_PER_WORD,
+            settings.SYNTHETIC_LATENCY_SIGMA,
+        )
+
+    def expected(self, word_count: int) -> float:
+        """Mean latency in seconds"""
+        if self.kind == "fixed":
+            return self.base
+        median = self.base + self.per_word * word_count
+        if self.kind == "lognormal":
+            return median * float(np.exp(self.sigma ** 2 / 2))
+        return median
+
+    def sample(self, word_count: int, rng: np.random.Generator) -> float:
+        """One latency draw in seconds"""
+        if self.kind == "fixed":
+            return self.base
+        median = self.base + self.per_word * word_count
+        if self.kind == "lognormal":
+            # Heavy right tail, like real inference queues
+            return float(median * rng.lognormal(0.0, self.sigma))
+        return median
+
+
+class SyntheticVoiceEngine:
+    """Renders speech-shaped audio locally, with simulated provider latency and failures"""
+
+    def __init__(
+        self,
+        output_dir: str,
+        latency: Optional[LatencyModel] = None,
+        transient_failure_rate: Optional[float] = None,
+        permanent_failure_rate: Optional[float] = None,
+        sample_rate: Optional[int] = None,
+        words_per_minute: Optional[int] = None,
+        seed: Optional[int] = None
+    ):
+        self.output_dir = output_dir
+        self.latency = latency or LatencyModel.from_settings()
+        self.transient_failure_rate = (
+            settings.SYNTHETIC_TRANSIENT_FAILURE_RATE if transient_failure_rate is None else transient_failure_rate
+        )
+        self.permanent_failure_rate = (
+            settings.SYNTHETIC_PERMANENT_FAILURE_RATE if permanent_failure_rate is None else permanent_failure_rate
+        )
+        self.format = WavFormat(1, 2, sample_rate or settings.SYNTHETIC_SAMPLE_RATE)
+        self.words_per_minute = words_per_minute or settings.SYNTHETIC_WORDS_PER_MINUTE
+        self.rng = np.random.default_rng(settings.SYNTHETIC_SEED if seed is None else seed)
+
+    def expected_duration(self, text: str) -> float:
+        """Seconds of audio render() produces for text"""
+        words = text.split()
+        pauses = sum(1 for word in words if word[-1] in ".!?")
+        return len(words) * 60.0 / self.words_per_minute + pauses * SENTENCE_PAUSE
+
+    def render(self, text: str) -> np.ndarray:
+        """
+        Speech-like int16 PCM for text
+
+        Each word is a voiced segment (a few harmonics of a per-word pitch
+        under a smooth envelope) whose length follows the word's length;
+        sentence ends add a pause. Deterministic for a given text.
+        """
+        words = text.split() or [""]
+        rate = self.format.frame_rate
+        lengths = np.array([len(word) + 2 for word in words], dtype=np.float64)
+        slots = lengths / lengths.mean() * (60.0 / self.words_per_minute)
+        pauses = np.array([SENTENCE_PAUSE if word and word[-1] in ".!?" else 0.0 for word in words])
+
+        slot_samples = np.round((slots + pauses) * rate).astype(np.int64)
+        voiced_samples = np.round(slots * VOICED_SHARE * rate).astype(np.int64)
+        starts = np.concatenate(([0], np.cumsum(slot_samples)[:-1]))
+        # Pitch per word between 100 and 220 Hz, stable across runs
+        pitches = [100.0 + zlib.crc32(word.encode()) % 120 for word in words]
+
+        out = np.zeros(int(slot_samples.sum()), dtype=np.int16)
+        for start, length, pitch in zip(starts, voiced_samples, pitches):
+            if length <= 0:
+                continue
+            n = np.arange(length, dtype=np.float32)
+            phase = (2 * np.pi * pitch / rate) * n
+            segment = sum(np.sin(k * phase) / k for k in range(1, 5))
+            # Smooth onset and release; the harmonics above peak near 2.1
+            segment *= np.sin(np.pi * n / length) / 2.1
+            out[start:start + length] = np.round(segment * 0.5 * 32767)
+        return out
+
+    def write(self, samples: np.ndarray) -> Tuple[str, float, int]:
+        """Save samples as a WAV file in the output directory"""
+        output_path = os.path.join(self.output_dir, f"{uuid.uuid4()}.wav")
+        frames = samples.tobytes()
+        with open(output_path, "wb") as f:
+            f.write(wav_bytes(self.format, frames))
+        return output_path, round(duration_of(self.format, frames), 2), os.path.getsize(output_path)
+
+    @staticmethod
+    def describe(path: str) -> Tuple[str, float, int]:
+        """(path, duration, size) of an audio file the engine wrote"""
+        fmt, frames = read_wav(path)
+        return path, round(duration_of(fmt, frames), 2), os.path.getsize(path)
+
+    def sample_latency(self, text: str) -> float:
+        return self.latency.sample(len(text.split()), self.rng)
+
+    def inject_failure(self) -> None:
+        """
+        Fail the call at the configured rates
+
+        Raises:
+            TransientGenerationError: as if the provider was unavailable
+            PermanentGenerationError: as if the input was rejected
+        """
+        draw = self.rng.random()
+        if draw < self.transient_failure_rate:
+            raise TransientGenerationError("Injected transient failure")
+        if draw < self.transient_failure_rate + self.permanent_failure_rate:
+            raise PermanentGenerationError("Injected permanent failure")
+
+    async def synthesize_async(self, text: str, on_progress: Optional[Callable] = None) -> Tuple[str, float, int]:
+        """Wait out the simulated latency without blocking the event loop, then render"""
+        if on_progress:
+            on_progress(GenerationStage.INFERRING)
+        latency = self.sample_latency(text)
+        await asyncio.sleep(latency)
+        self.inject_failure()
+        loop = asyncio.get_running_loop()
+        samples = await loop.run_in_executor(None, self.render, text)
+        return self.write(samples)
+
+    def synthesize(self, text: str, on_progress: Optional[Callable] = None) -> Tuple[str, float, int]:
+        """Synchronous synthesize_async, for callers that must have the audio now"""
+        return asyncio.run(self.synthesize_async(text, on_progress))
+
+    def submit(self, text: str) -> str:
+        """
+        Start a deferred job; it completes after the sampled latency
+
+        Returns:
+            A prediction id, resolved later by complete_synthetic_prediction
+        """
+        error = None
+        try:
+            self.inject_failure()
+        except PermanentGenerationError as e:
+            # Accepted, then failed; transient failures surface at submission
+            error = str(e)
+
+        from app.celery_app import celery_app
+        prediction_id = f"synthetic-{uuid.uuid4().hex}"
+        latency = self.sample_latency(text)
+        celery_app.send_task(
+            "app.tasks.generation_tasks.complete_synthetic_prediction",
+            args=[prediction_id, error],
+            countdown=latency
+        )
+        logger.info(f"🎭 Synthetic prediction {prediction_id} completes in {latency:.2f}s")
+        return prediction_id
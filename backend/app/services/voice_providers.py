@@ -0,0 +1,542 @@
+"""
+TTS provider registry and load-aware routing.
+
+Every backend implements VoiceProvider and gets its own circuit breaker,
+rate limit, adaptive concurrency window and bulkhead, keyed by provider
+name, so one slow or failing backend never throttles the others.
+
+ProviderRouter ranks the configured providers for each job from live
+signals: learned latency for the script length, error rate over the breaker
+window, how full the provider's concurrency window is, and the job's cost.
+Providers with an open circuit are skipped; the configured order
+(PROVIDERS) breaks ties and is the fallback order.
+"""
+import time
+import asyncio
+import threading
+import logging
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+from app.config import settings
+from app.services.circuit_breaker import Bulkhead, CircuitBreaker, CircuitState, ProviderUnavailableError
+from app.services.eta_estimator import eta_estimator
+from app.services.rate_limiter import AdaptiveConcurrency, TokenBucket
+from app.services.retry_policy import ErrorKind, classify_error, is_rate_limit_error
+from app.services.synthetic_engine import SyntheticVoiceEngine
+
+logger = logging.getLogger(__name__)
+
+GenerationResult = Tuple[str, float, int]  # (output_path, duration_seconds, file_size_bytes)
+
+
+class VoiceProvider:
+    """Common interface of TTS backends"""
+
+    # Produces cloned speech (as opposed to the synthetic test engine)
+    real = True
+    # Default cost of one word, in dollars
+    default_cost_per_word = 0.0
+
+    def __init__(self, name: str, output_dir: str):
+        self.name = name
+        self.output_dir = output_dir
+        self.cost_per_word = settings.PROVIDER_COSTS.get(name, self.default_cost_per_word)
+        max_concurrency = settings.PROVIDER_CONCURRENCY.get(name)
+        self.circuit_breaker = CircuitBreaker(name)
+        self.rate_limiter = TokenBucket(name, rate=settings.PROVIDER_RATE_LIMITS.get(name))
+        self.concurrency = AdaptiveConcurrency(name)
+        self.bulkhead = Bulkhead(
+            name,
+            limit=(lambda: min(self.concurrency.limit(), max_concurrency)) if max_concurrency else self.concurrency.limit
+        )
+        # Previews get slots of their own, so a backlog of full jobs never holds them up
+        self.preview_bulkhead = Bulkhead(f"{name}:preview", limit=settings.PREVIEW_CONCURRENCY)
+        self._lane = threading.local()  # greenlet-local under gevent
+
+    @contextmanager
+    def preview_lane(self):
+        """Calls made in the block use the preview slots instead of the regular ones"""
+        self._lane.preview = True
+        try:
+            yield
+        finally:
+            self._lane.preview = False
+
+    def warm_up(self) -> None:
+        """Build clients eagerly (called once per worker process)"""
+
+    def generate_speech(
+        self,
+        sample_path: str,
+        text: str,
+        model_name: str,
+        on_progress: Optional[Callable] = None,
+        on_submitted: Optional[Callable[[str], None]] = None
+    ) -> GenerationResult:
+        """Generate speech and wait for the audio"""
+        raise NotImplementedError
+
+    # Pipeline stages (see generation_pipeline); by default synthesize does
+    # all the work through generate_speech and its output is a local file
+
+    def prepare_reference(self, sample_path: str, on_progress: Optional[Callable] = None) -> str:
+        """Get the voice sample ready to send (CPU stage)"""
+        return sample_path
+
+    def synthesize(
+        self,
+        sample_path: str,
+        reference: str,
+        text: str,
+        model_name: str,
+        on_progress: Optional[Callable] = None,
+        on_submitted: Optional[Callable[[str], None]] = None
+    ):
+        """Run inference from a prepared reference (I/O stage); returns the output for fetch_output"""
+        output_path, _, _ = self.generate_speech(reference, text, model_name, on_progress, on_submitted)
+        return output_path
+
+    def fetch_output(self, output, on_progress: Optional[Callable] = None) -> str:
+        """Bring an output onto local storage (network stage); returns its path"""
+        return output
+
+    @property
+    def supports_webhooks(self) -> bool:
+        """Whether submit_generation completes jobs asynchronously"""
+        return False
+
+    def submit_generation(self, sample_path: str, text: str, reference: Optional[str] = None) -> str:
+        """Start a job that completes asynchronously; returns its prediction id"""
+        raise NotImplementedError(f"{self.name} cannot complete generations asynchronously")
+
+    def await_prediction(self, prediction_id: str, on_progress: Optional[Callable] = None):
+        """Wait for an already-submitted job; returns its output for fetch_output"""
+        raise NotImplementedError(f"{self.name} cannot resume predictions")
+
+    @property
+    def supports_resume(self) -> bool:
+        return False
+
+    def reference_expired(self, error: Optional[str]) -> bool:
+        """Whether a failed prediction's error means the uploaded reference it was sent is gone"""
+        return False
+
+    def invalidate_reference(self, sample_path: str) -> None:
+        """Forget a sample's uploaded reference so the next job uploads it again"""
+
+    def cancel_generation(self, prediction_id: str) -> bool:
+        """Stop a submitted job so it is no longer billed; False if the provider cannot"""
+        return False
+
+    def expected_latency(self, word_count: int) -> float:
+        """Processing time in seconds before any timings have been learned"""
+        raise NotImplementedError
+
+    def estimate_cost(self, text: str) -> dict:
+        word_count = len(text.split())
+        return {
+            "estimated_cost_usd": round(word_count * self.cost_per_word, 4),
+            "word_count": word_count,
+        }
+
+    def check_health(self) -> bool:
+        return True
+
+    @property
+    def voice_params(self) -> dict:
+        """Everything besides the reference and the text that shapes the audio (segment cache keys)"""
+        return {"provider": self.name}
+
+    def _call_provider(self, call, units: Optional[float] = None):
+        """
+        Run a provider call behind the circuit breaker, rate limit and
+        adaptive concurrency window
+
+        Args:
+            call: Function making the provider call
+            units: Size of the work (e.g. words) to normalise latency by,
+                or None if its latency says nothing about provider load
+
+        Raises:
+            ProviderUnavailableError: the circuit is open, the rate limit is
+                exhausted or every concurrency slot is busy
+        """
+        probe = self.circuit_breaker.before_call()
+        bulkhead = self.preview_bulkhead if getattr(self._lane, "preview", False) else self.bulkhead
+        called = False
+        try:
+            self.rate_limiter.acquire()
+            with bulkhead.slot():
+                called = True
+                started = time.monotonic()
+                try:
+                    result = call()
+                except Exception as e:
+                    elapsed = time.monotonic() - started
+                    # Only provider trouble counts against it, not bad input
+                    failed = classify_error(e)[0] == ErrorKind.TRANSIENT
+                    self.circuit_breaker.record(elapsed, failed=failed, probe=probe)
+                    if is_rate_limit_error(e):
+                        self.concurrency.record(overloaded=True)
+                    raise
+                elapsed = time.monotonic() - started
+                self.circuit_breaker.record(elapsed, failed=False, probe=probe)
+                self.concurrency.record(elapsed / units if units else None)
+                return result
+        finally:
+            if probe and not called:
+                # Turned away by our own limits: the provider was not probed
+                self.circuit_breaker.release_probe()
+
+    def limits(self) -> dict:
+        """State of the breaker and limiters, for monitoring and autoscaling"""
+        return {
+            "circuit_breaker": self.circuit_breaker.snapshot(),
+            "rate_limit": self.rate_limiter.snapshot(),
+            "concurrency": self.concurrency.snapshot(),
+            "in_flight": self.bulkhead.in_use(),
+            "previews_in_flight": self.preview_bulkhead.in_use(),
+        }
+
+
+class ReplicateProvider(VoiceProvider):
+    """Chatterbox (or another voice model) on Replicate"""
+
+    default_cost_per_word = 0.0004  # ~$0.001 per second of audio at 2.5 words/second
+
+    def __init__(self, name: str, output_dir: str, model: Optional[str] = None):
+        super().__init__(name, output_dir)
+        self.model = model or settings.REPLICATE_MODEL
+        self._service = None
+        self._service_lock = threading.Lock()
+
+    @property
+    def service(self):
+        """Replicate client, built on first use"""
+        if self._service is None:
+            with self._service_lock:
+                if self._service is None:
+                    from app.services.replicate_integration import ReplicateVoiceService
+                    self._service = ReplicateVoiceService(model=self.model)
+        return self._service
+
+    def warm_up(self) -> None:
+        self.service
+
+    def generate_speech(
+        self,
+        sample_path: str,
+        text: str,
+        model_name: str,
+        on_progress: Optional[Callable] = None,
+        on_submitted: Optional[Callable[[str], None]] = None
+    ) -> GenerationResult:
+        logger.info(f"🤖 Generating REAL AI audio with {self.name} ({self.model})")
+
+        def run():
+            # Run async function in sync context (for Celery compatibility)
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            try:
+                return loop.run_until_complete(
+                    self.service.generate_speech(sample_path, text, model_name, on_progress, on_submitted)
+                )
+            finally:
+                loop.close()
+
+        return self._call_provider(run, units=max(len(text.split()), 1))
+
+    @property
+    def supports_webhooks(self) -> bool:
+        return bool(settings.REPLICATE_WEBHOOK_URL)
+
+    def prepare_reference(self, sample_path: str, on_progress: Optional[Callable] = None) -> str:
+        return self.service.prepare_reference(sample_path, on_progress)
+
+    def synthesize(
+        self,
+        sample_path: str,
+        reference: str,
+        text: str,
+        model_name: str,
+        on_progress: Optional[Callable] = None,
+        on_submitted: Optional[Callable[[str], None]] = None
+    ):
+        logger.info(f"🤖 Generating REAL AI audio with {self.name} ({self.model})")
+        return self._call_provider(
+            lambda: self.service.predict(sample_path, reference, text, on_progress, on_submitted),
+            units=max(len(text.split()), 1)
+        )
+
+    def fetch_output(self, output, on_progress: Optional[Callable] = None) -> str:
+        return self.service.download_output(output, on_progress)
+
+    def submit_generation(self, sample_path: str, text: str, reference: Optional[str] = None) -> str:
+        prediction = self._call_provider(
+            lambda: self.service.create_prediction(
+                sample_path, text, webhook=settings.REPLICATE_WEBHOOK_URL, reference=reference
+            )
+        )
+        return prediction.id
+
+    def await_prediction(self, prediction_id: str, on_progress: Optional[Callable] = None):
+        return self._call_provider(lambda: self.service.await_prediction(prediction_id, on_progress))
+
+    @property
+    def supports_resume(self) -> bool:
+        return True
+
+    def reference_expired(self, error: Optional[str]) -> bool:
+        from app.services.replicate_integration import _is_missing_file_error
+        return bool(error) and _is_missing_file_error(error)
+
+    def invalidate_reference(self, sample_path: str) -> None:
+        self.service.invalidate_reference(sample_path)
+
+    def cancel_generation(self, prediction_id: str) -> bool:
+        self.service.cancel_prediction(prediction_id)
+        return True
+
+    def expected_latency(self, word_count: int) -> float:
+        # Replicate: ~10-30 seconds depending on text length
+        return max(15, int((word_count / 10) * 3))
+
+    def estimate_cost(self, text: str) -> dict:
+        estimate = self.service.estimate_cost(text)
+        if self.name in settings.PROVIDER_COSTS:
+            estimate["estimated_cost_usd"] = round(estimate["word_count"] * self.cost_per_word, 4)
+        return estimate
+
+    def check_health(self) -> bool:
+        return self.service.check_health()
+
+    @property
+    def voice_params(self) -> dict:
+        return {"provider": self.name, "model": self.model}
+
+
+class SyntheticProvider(VoiceProvider):
+    """The local NumPy engine (no voice cloning; for development and load tests)"""
+
+    real = False
+
+    def __init__(self, name: str, output_dir: str):
+        super().__init__(name, output_dir)
+        self.engine = SyntheticVoiceEngine(output_dir)
+
+    def generate_speech(
+        self,
+        sample_path: str,
+        text: str,
+        model_name: str,
+        on_progress: Optional[Callable] = None,
+        on_submitted: Optional[Callable[[str], None]] = None
+    ) -> GenerationResult:
+        logger.info(f"🎭 Generating synthetic audio for: {model_name}")
+        return self._call_provider(
+            lambda: self.engine.synthesize(text, on_progress),
+            units=max(len(text.split()), 1)
+        )
+
+    @property
+    def supports_webhooks(self) -> bool:
+        return settings.SYNTHETIC_DEFERRED_COMPLETION
+
+    def submit_generation(self, sample_path: str, text: str, reference: Optional[str] = None) -> str:
+        # Deferred jobs hold no slot, so only the breaker and rate limit apply
+        probe = self.circuit_breaker.before_call()
+        try:
+            self.rate_limiter.acquire()
+        except ProviderUnavailableError:
+            if probe:
+                self.circuit_breaker.release_probe()
+            raise
+        return self.engine.submit(text)
+
+    def expected_latency(self, word_count: int) -> float:
+        return self.engine.latency.expected(word_count)
+
+    def estimate_cost(self, text: str) -> dict:
+        estimate = super().estimate_cost(text)
+        estimate["estimated_duration_seconds"] = round(self.engine.expected_duration(text), 2)
+        estimate["note"] = "Mock mode - no cost"
+        return estimate
+
+    @property
+    def voice_params(self) -> dict:
+        return {
+            "provider": self.name,
+            "frame_rate": self.engine.format.frame_rate,
+            "words_per_minute": self.engine.words_per_minute,
+        }
+
+
+def _replicate_available() -> bool:
+    """Check if Replicate is configured, without building a client"""
+    if not settings.REPLICATE_API_TOKEN:
+        return False
+
+    try:
+        import replicate  # noqa: F401
+        return True
+    except Exception as e:
+        logger.error(f"Replicate not available: {e}")
+        return False
+
+
+def configured_provider_names() -> List[str]:
+    """Provider names in fallback order"""
+    names = [name.strip() for name in settings.PROVIDERS.split(",") if name.strip()]
+    if names:
+        return names
+    return ["replicate"] if _replicate_available() else ["synthetic"]
+
+
+def build_provider(name: str, output_dir: str) -> Optional[VoiceProvider]:
+    """
+    Provider for a configured name
+
+    "synthetic" is the local engine; "replicate" and any name listed in
+    PROVIDER_MODELS run on Replicate (with that model).
+    """
+    if name == "synthetic":
+        return SyntheticProvider(name, output_dir)
+    if name == "replicate" or name in settings.PROVIDER_MODELS:
+        if not _replicate_available():
+            logger.error(f"Provider {name} needs REPLICATE_API_TOKEN, skipping it")
+            return None
+        return ReplicateProvider(name, output_dir, model=settings.PROVIDER_MODELS.get(name))
+    logger.error(f"Unknown provider {name!r}, skipping it")
+    return None
+
+
+class ProviderRegistry:
+    """Configured providers, in fallback order"""
+
+    def __init__(self, providers: Optional[List[VoiceProvider]] = None):
+        self._providers: Dict[str, VoiceProvider] = {}
+        for provider in providers or []:
+            self.register(provider)
+
+    @classmethod
+    def from_settings(cls, output_dir: str) -> "ProviderRegistry":
+        providers = [build_provider(name, output_dir) for name in configured_provider_names()]
+        providers = [provider for provider in providers if provider is not None]
+        if not providers:
+            logger.error("No usable providers configured, falling back to the synthetic engine")
+            providers = [SyntheticProvider("synthetic", output_dir)]
+        return cls(providers)
+
+    def register(self, provider: VoiceProvider) -> None:
+        self._providers[provider.name] = provider
+
+    def get(self, name: str) -> VoiceProvider:
+        try:
+            return self._providers[name]
+        except KeyError:
+            raise KeyError(f"Provider {name!r} is not configured")
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._providers
+
+    def all(self) -> List[VoiceProvider]:
+        return list(self._providers.values())
+
+    @property
+    def primary(self) -> VoiceProvider:
+        return self.all()[0]
+
+
+class ProviderRouter:
+    """Ranks providers for a job by expected latency, load, errors and cost"""
+
+    def __init__(self, registry: ProviderRegistry):
+        self.registry = registry
+
+    def expected_latency(self, provider: VoiceProvider, word_count: int) -> float:
+        learned = eta_estimator.estimate_processing(provider.name, word_count)
+        return learned if learned is not None else provider.expected_latency(word_count)
+
+    def stats(self, provider: VoiceProvider, word_count: int) -> dict:
+        """Routing signals for one provider"""
+        window = provider.circuit_breaker.window_stats()
+        error_rate = window["errors"] / window["calls"] if window["calls"] else 0.0
+        limit = max(provider.bulkhead.limit, 1)
+        in_flight = provider.bulkhead.in_use()
+        latency = self.expected_latency(provider, word_count)
+        cost = word_count * provider.cost_per_word
+
+        # Expected seconds until the job is done, inflated by how busy and
+        # how unreliable the provider is, plus what it costs
+        utilization = min(in_flight / limit, 1.0)
+        score = latency * (1 + utilization) / (1 - min(error_rate, 0.9))
+        score += cost * settings.PROVIDER_COST_WEIGHT
+
+        return {
+            "provider": provider.name,
+            "state": provider.circuit_breaker.state().value,
+            "expected_latency": round(latency, 2),
+            "error_rate": round(error_rate, 3),
+            "in_flight": in_flight,
+            "limit": limit,
+            "saturated": in_flight >= limit,
+            "cost_usd": round(cost, 4),
+            "score": round(score, 3),
+        }
+
+    def rank(self, word_count: int) -> List[VoiceProvider]:
+        """
+        Providers to try for a job, best first
+
+        Open circuits go last (they fail fast, so the job is held rather than
+        lost if every provider is down), then saturated providers; within each
+        group the lowest score wins and configuration order breaks ties.
+        """
+        providers = self.registry.all()
+        stats = {provider.name: self.stats(provider, word_count) for provider in providers}
+
+        def key(item):
+            position, provider = item
+            s = stats[provider.name]
+            return (s["state"] == CircuitState.OPEN.value, s["saturated"], s["score"], position)
+
+        return [provider for _, provider in sorted(enumerate(providers), key=key)]
+
+    def snapshot(self, word_count: int = 50) -> List[dict]:
+        """Routing signals of every provider at a typical script length, in rank order"""
+        return [self.stats(provider, word_count) for provider in self.rank(word_count)]
+
+    def run(
+        self,
+        word_count: int,
+        call: Callable[[VoiceProvider], object],
+        pinned: Optional[str] = None,
+        preferred: Optional[str] = None
+    ):
+        """
+        Run call(provider) on the best provider, falling back down the
+        ranking while providers are unavailable
+
+        Args:
+            word_count: Size of the job
+            call: Work to do with the chosen provider
+            pinned: Provider the job must stay on (e.g. one holding its prediction)
+            preferred: Provider to try first (e.g. one the job is prepared for)
+
+        Returns:
+            Tuple of (provider, call's result)
+
+        Raises:
+            ProviderUnavailableError: every candidate was unavailable
+        """
+        candidates = [self.registry.get(pinned)] if pinned else self.rank(word_count)
+        if preferred and not pinned:
+            candidates.sort(key=lambda provider: provider.name != preferred)
+        last_error: Optional[ProviderUnavailableError] = None
+        for provider in candidates:
+            try:
+                return provider, call(provider)
+            except ProviderUnavailableError as e:
+                logger.warning(f"↪️ Provider {provider.name} unavailable ({e}), trying the next one")
+                last_error = e
+        raise last_error
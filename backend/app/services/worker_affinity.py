@@ -0,0 +1,246 @@
+"""
+Sample-affinity routing of generations to worker nodes.
+
+A node is one host's pair of stage workers (prefork and gevent) started
+with the same WORKER_NODE. Besides the shared stage queues, each node
+consumes its own prepare and synthesize queues, and every job for a voice
+is sent to the node that owns the sample on a consistent-hash ring, so the
+reference is converted once into that node's local cache and found there
+by every later job for the voice. Nodes joining or leaving only move the
+voices that hash next to them.
+
+A node with AFFINITY_NODE_CAPACITY jobs assigned is saturated; its jobs
+spill over to the next nodes on the ring, and to the shared queues once
+every node is busy.
+
+Previews skip the ring: every stage of a preview runs on the preview lane,
+a queue of its own served by a small dedicated worker, so a preview never
+waits behind full generations.
+"""
+import time
+import bisect
+import hashlib
+import logging
+import threading
+from functools import lru_cache
+from typing import Iterator, List, Optional, Tuple
+from app.config import settings
+from app.utils.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+NODES_KEY = "affinity:nodes"  # zset of node -> last heartbeat
+LOAD_KEY_PREFIX = "affinity:load:"  # zset per node of audio_id -> assigned at
+JOB_KEY_PREFIX = "affinity:job:"  # audio_id -> node its load is counted against
+
+# Broker priority of jobs of users without a priority tier; each tier above
+# 0 is served one step earlier (see celery_app's priority_steps)
+DEFAULT_TASK_PRIORITY = 5
+
+# Stage queues with a per-node twin; the synthesize stage has to run where
+# the prepare stage left the reference
+AFFINITY_QUEUES = ("generation.prepare", "generation.synthesize")
+PREVIEW_QUEUE = "generation.preview"
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent-hash ring with virtual nodes"""
+
+    def __init__(self, nodes, replicas: int = 64):
+        points = sorted((_hash(f"{node}#{i}"), node) for node in set(nodes) for i in range(replicas))
+        self._hashes = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def __len__(self) -> int:
+        return len(set(self._nodes))
+
+    def nodes_for(self, key: str) -> Iterator[str]:
+        """Distinct nodes in ring order, starting with the key's owner"""
+        if not self._nodes:
+            return
+        start = bisect.bisect(self._hashes, _hash(key))
+        seen = set()
+        for i in range(len(self._nodes)):
+            node = self._nodes[(start + i) % len(self._nodes)]
+            if node not in seen:
+                seen.add(node)
+                yield node
+
+
+@lru_cache(maxsize=8)
+def _ring(nodes: Tuple[str, ...]) -> HashRing:
+    return HashRing(nodes, settings.AFFINITY_VIRTUAL_NODES)
+
+
+def node_queue(queue: str, node: str) -> str:
+    return f"{queue}.{node}"
+
+
+def live_nodes() -> List[str]:
+    """Nodes that have sent a heartbeat recently"""
+    redis = get_redis()
+    redis.zremrangebyscore(NODES_KEY, "-inf", time.time() - settings.AFFINITY_NODE_TTL)
+    return redis.zrange(NODES_KEY, 0, -1)
+
+
+def node_load(node: str) -> int:
+    """Jobs assigned to the node that have not finished synthesis"""
+    redis = get_redis()
+    key = f"{LOAD_KEY_PREFIX}{node}"
+    # Entries of jobs that died on the node age out
+    redis.zremrangebyscore(key, "-inf", time.time() - settings.AFFINITY_LOAD_TTL)
+    return redis.zcard(key)
+
+
+def assign(sample_id: int, audio_id: int) -> Optional[str]:
+    """
+    Pick the node for a job and count it against that node's load
+
+    Returns:
+        The node, or None when affinity is off, no node is up or all are saturated
+    """
+    if not settings.AFFINITY_ROUTING:
+        return None
+    try:
+        nodes = live_nodes()
+        if not nodes:
+            return None
+        # A re-dispatched job gives up the node it was sent to before
+        release(audio_id)
+        for node in _ring(tuple(sorted(nodes))).nodes_for(f"sample:{sample_id}"):
+            if node_load(node) < settings.AFFINITY_NODE_CAPACITY:
+                redis = get_redis()
+                redis.zadd(f"{LOAD_KEY_PREFIX}{node}", {str(audio_id): time.time()})
+                redis.set(f"{JOB_KEY_PREFIX}{audio_id}", node, ex=settings.AFFINITY_LOAD_TTL)
+                return node
+            logger.info(f"Node {node} is saturated, spilling audio_id={audio_id} over")
+    except Exception as e:
+        logger.warning(f"Affinity routing unavailable, using the shared queue: {e}")
+    return None
+
+
+def assigned_node(audio_id: int) -> Optional[str]:
+    """The node a job's load is counted against, if any"""
+    try:
+        return get_redis().get(f"{JOB_KEY_PREFIX}{audio_id}")
+    except Exception as e:
+        logger.warning(f"Could not look up the node of audio_id={audio_id}: {e}")
+        return None
+
+
+def release(audio_id: int, node: Optional[str] = None) -> None:
+    """
+    The job no longer needs its node (its synthesis is over or it will never run)
+
+    Args:
+        audio_id: The job
+        node: The node the job was assigned when it was dispatched; defaults
+            to its current assignment
+    """
+    try:
+        redis = get_redis()
+        key = f"{JOB_KEY_PREFIX}{audio_id}"
+        current = redis.get(key)
+        node = node or current
+        if not node:
+            return
+        redis.zrem(f"{LOAD_KEY_PREFIX}{node}", str(audio_id))
+        # A stale run must not forget the assignment of a newer dispatch
+        if current == node:
+            redis.delete(key)
+    except Exception as e:
+        logger.warning(f"Could not release audio_id={audio_id} from node {node}: {e}")
+
+
+def task_priority(tier: Optional[int]) -> int:
+    """Broker priority of a job on the given user priority tier (Redis serves 0 first)"""
+    return max(DEFAULT_TASK_PRIORITY - (tier or 0), 0)
+
+
+def dispatch_options(
+    sample_id: Optional[int],
+    audio_id: int,
+    preview: bool = False,
+    priority: Optional[int] = 0
+) -> Optional[dict]:
+    """Outbox options sending a generation's first stage to the preview lane or its node, if any, at its tier's priority"""
+    options = {}
+    if preview:
+        options["queue"] = PREVIEW_QUEUE
+    else:
+        node = assign(sample_id, audio_id) if sample_id is not None else None
+        if node is not None:
+            options["queue"] = node_queue("generation.prepare", node)
+    if priority:
+        options["priority"] = task_priority(priority)
+    return options or None
+
+
+def stage_options(queue: str, preview: bool = False, priority: Optional[int] = 0) -> dict:
+    """Signature options keeping a stage on the preview lane or this worker's node, at the job's priority"""
+    options = {}
+    if preview:
+        options["queue"] = PREVIEW_QUEUE
+    elif settings.WORKER_NODE and queue in AFFINITY_QUEUES:
+        options["queue"] = node_queue(queue, settings.WORKER_NODE)
+    if priority:
+        options["priority"] = task_priority(priority)
+    return options
+
+
+def snapshot() -> dict:
+    """Live nodes with their load and reference cache hit rates"""
+    from app.services.reference_cache import ReferenceDiskCache
+
+    nodes = live_nodes()
+    return {
+        "enabled": settings.AFFINITY_ROUTING,
+        "capacity": settings.AFFINITY_NODE_CAPACITY,
+        "nodes": [
+            {
+                "node": node,
+                "load": node_load(node),
+                "reference_cache": ReferenceDiskCache("", 0, node).stats(),
+            }
+            for node in nodes
+        ],
+    }
+
+
+class NodeHeartbeat:
+    """Keeps this worker's node on the ring while the worker runs"""
+
+    def __init__(self, node: str):
+        self.node = node
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def beat(self) -> None:
+        try:
+            get_redis().zadd(NODES_KEY, {self.node: time.time()})
+        except Exception as e:
+            logger.warning(f"Node heartbeat failed for {self.node}: {e}")
+
+    def _run(self) -> None:
+        while not self._stop.wait(settings.AFFINITY_NODE_TTL / 3):
+            self.beat()
+
+    def start(self) -> None:
+        self.beat()
+        self._thread = threading.Thread(target=self._run, name=f"node-heartbeat:{self.node}", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Leave the ring so new jobs for this node's voices go elsewhere"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+        try:
+            get_redis().zrem(NODES_KEY, self.node)
+        except Exception as e:
+            logger.warning(f"Could not remove node {self.node} from the ring: {e}")
@@ -0,0 +1,72 @@
+"""
+Graceful shutdown of generation workers.
+
+On a warm shutdown (SIGTERM, e.g. during a deploy) Celery stops taking new
+tasks and waits for the running ones, which may be polling a prediction for
+minutes. Instead the worker raises a drain flag; jobs waiting on a provider
+see it at their next poll, hand themselves back to the queue and exit, and
+the next worker to pick them up reattaches to the same prediction.
+
+The flag is process-local for pools running tasks in the main process
+(gevent, solo) and mirrored in Redis for prefork children, which never see
+the signal themselves.
+"""
+import os
+import socket
+import logging
+import threading
+from app.utils.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+DRAIN_KEY_PREFIX = "worker:draining:"
+DRAIN_TTL = 3600  # longer than any warm shutdown
+
+_draining = threading.Event()
+
+
+class WorkerDraining(Exception):
+    """The worker is shutting down; give the job back rather than finish it here"""
+
+
+def _drain_key(pid: int) -> str:
+    return f"{DRAIN_KEY_PREFIX}{socket.gethostname()}:{pid}"
+
+
+def start_draining() -> None:
+    """Ask this worker's running jobs to hand themselves back"""
+    _draining.set()
+    try:
+        get_redis().set(_drain_key(os.getpid()), 1, ex=DRAIN_TTL)
+    except Exception as e:
+        logger.warning(f"Could not publish drain flag: {e}")
+    logger.info("Worker draining: in-flight generations will be handed back to the queue")
+
+
+def stop_draining() -> None:
+    _draining.clear()
+    try:
+        get_redis().delete(_drain_key(os.getpid()))
+    except Exception as e:
+        logger.warning(f"Could not clear drain flag: {e}")
+
+
+def is_draining() -> bool:
+    """Whether this process, or the worker that forked it, is shutting down"""
+    if _draining.is_set():
+        return True
+    try:
+        return bool(get_redis().exists(_drain_key(os.getppid())))
+    except Exception:
+        return False
+
+
+def check_draining() -> None:
+    """
+    Stop here if the worker is shutting down
+
+    Raises:
+        WorkerDraining: the drain flag is up
+    """
+    if is_draining():
+        raise WorkerDraining("Worker is shutting down")
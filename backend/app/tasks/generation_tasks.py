@@ -3,109 +3,400 @@ Celery tasks for voice generation
 """
 
 import logging
+from typing import Optional
+from celery.exceptions import Ignore
 from app.celery_app import celery_app
+from app.config import settings
 from app.database import SessionLocal
 from app.models.generated_audio import GeneratedAudio, GenerationStatus
 from app.models.generation_queue import GenerationQueue, QueueStatus
-from app.models.audio_sample import AudioSample
-from app.services.ai_service import AIVoiceService
+from app.services import generation_pipeline, worker_affinity
+from app.services.ai_service import get_ai_service
+from app.services.progress_tracker import GenerationStage, ProgressTracker
+from app.services.circuit_breaker import ProviderUnavailableError
+from app.services.dead_letter import DeadLetterService
+from app.services.retry_policy import (
+    ErrorKind,
+    PermanentGenerationError,
+    backoff_delay,
+    classify_error,
+    record_retry_event,
+)
+from app.services.streaming import StreamChunks
+from app.services.cancellation import GenerationCancelled, is_cancelled
+from app.services.generation_lease import GenerationLease, reap_expired_leases, redispatch_stranded, worker_identity
+from app.services.generation_pipeline import FINISHED_STATUSES
+from app.services.worker_drain import WorkerDraining
+from sqlalchemy.sql import func
 
 logger = logging.getLogger(__name__)
 
 @celery_app.task(bind=True, name='app.tasks.generation_tasks.process_voice_generation')
 def process_voice_generation(self, audio_id: int):
     """
-    Process voice generation task
+    Start a voice generation: claim it, route it and prepare its reference
+    audio, then hand it to the synthesize, fetch and postprocess stages
     
     Args:
         audio_id: ID of the GeneratedAudio record to process
     """
     db = SessionLocal()
+    lease = GenerationLease(audio_id, worker_identity(self.request.id))
     
     try:
         logger.info(f"🎬 Starting voice generation task for audio_id={audio_id}")
         
-        # Get generation record
-        generation = db.query(GeneratedAudio).filter(GeneratedAudio.audio_id == audio_id).first()
-        if not generation:
-            logger.error(f"❌ Generation not found: audio_id={audio_id}")
+        claimed = generation_pipeline.claim(db, audio_id, lease)
+        if claimed is None:
             return
-        
-        # Update status to PROCESSING
-        generation.status = GenerationStatus.PROCESSING
-        
-        # Update queue status
-        queue_item = db.query(GenerationQueue).filter(GenerationQueue.audio_id == audio_id).first()
+        generation, queue_item = claimed
         if queue_item:
-            queue_item.status = QueueStatus.PROCESSING
-        
-        db.commit()
+            lease.start()
         logger.info(f"✅ Status updated to PROCESSING")
         
-        # Get sample
-        sample = db.query(AudioSample).filter(AudioSample.sample_id == generation.sample_id).first()
-        if not sample:
-            raise Exception(f"Sample not found: sample_id={generation.sample_id}")
+        job = generation_pipeline.prepare_reference(db, generation, queue_item, ProgressTracker(audio_id, generation.user_id))
+        job["retried"] = bool(self.request.retries)
+        generation_pipeline.hand_off(db, audio_id, lease)
         
-        logger.info(f"📂 Using sample: {sample.file_path}")
-        logger.info(f"📝 Generating text: {generation.script_text[:100]}...")
+    except Exception as e:
+        return _stage_failed(self, db, audio_id, e, lease)
         
-        # Generate audio using AI service
-        ai_service = AIVoiceService()
-        output_path, duration, file_size = ai_service.generate_speech(
-            sample_path=sample.file_path,
-            text=generation.script_text,
-            model_name=generation.model_name
-        )
+    finally:
+        lease.stop()
+        db.close()
+    
+    # Synthesize where the reference was just prepared (see worker_affinity);
+    # previews run every stage on their own lane
+    preview = job.get("preview", False)
+    priority = job.get("priority", 0)
+    return _run_stages(
+        self,
+        audio_id,
+        synthesize_generation.s(job).set(**worker_affinity.stage_options("generation.synthesize", preview, priority))
+        | fetch_generation_output.s().set(**worker_affinity.stage_options("generation.fetch", preview, priority))
+        | postprocess_generation.s().set(**worker_affinity.stage_options("generation.postprocess", preview, priority))
+    )
+
+
+@celery_app.task(bind=True, name='app.tasks.generation_tasks.synthesize_generation')
+def synthesize_generation(self, job: dict):
+    """Run inference for a prepared job (I/O stage)"""
+    def stage(db, generation, queue_item, lease, tracker):
+        return generation_pipeline.synthesize(db, job, generation, queue_item, lease, tracker)
+    try:
+        return _run_stage(self, job, stage)
+    finally:
+        if job:
+            # The node's cached reference is no longer needed
+            worker_affinity.release(job["audio_id"], job.get("node"))
+
+
+@celery_app.task(bind=True, name='app.tasks.generation_tasks.fetch_generation_output')
+def fetch_generation_output(self, job: dict):
+    """Download a job's output onto local storage (network stage)"""
+    def stage(db, generation, queue_item, lease, tracker):
+        return generation_pipeline.fetch_output(job, tracker)
+    return _run_stage(self, job, stage)
+
+
+@celery_app.task(bind=True, name='app.tasks.generation_tasks.postprocess_generation')
+def postprocess_generation(self, job: dict):
+    """Measure a job's audio and mark the generation completed (CPU stage)"""
+    def stage(db, generation, queue_item, lease, tracker):
+        result = generation_pipeline.postprocess(db, job, generation, queue_item, tracker)
+        if job["streaming"]:
+            purge_stream_chunks.apply_async(args=[job["audio_id"]], countdown=settings.STREAM_CHUNK_RETENTION)
+        if job.get("retried"):
+            record_retry_event("recovered")
+        logger.info(f"🎉 Voice generation completed for audio_id={job['audio_id']}")
+        return result
+    return _run_stage(self, job, stage, last=True)
+
+
+def _run_stage(task, job: Optional[dict], stage, last: bool = False):
+    """
+    Run one pipeline stage under the job's lease
+    
+    A job that already has an outcome (a result dict with a status, or None
+    when it was dropped) passes straight through to the end of the chain.
+    """
+    if job is None or "status" in job:
+        return job
+    
+    audio_id = job["audio_id"]
+    db = SessionLocal()
+    lease = GenerationLease(audio_id, worker_identity(task.request.id))
+    
+    try:
+        rows = generation_pipeline.enter_stage(db, job, lease)
+        if rows is None:
+            return None
+        generation, queue_item = rows
+        if queue_item:
+            lease.start()
         
-        logger.info(f"✅ Generation successful!")
-        logger.info(f"   Output: {output_path}")
-        logger.info(f"   Duration: {duration}s")
-        logger.info(f"   Size: {file_size} bytes")
+        if task.request.retries:
+            job["retried"] = True
+        result = stage(db, generation, queue_item, lease, ProgressTracker(audio_id, generation.user_id))
+        if not last and "status" not in result:
+            generation_pipeline.hand_off(db, audio_id, lease)
+        return result
         
-        # Update generation record
-        generation.output_file_path = output_path
-        generation.duration_seconds = duration
-        generation.file_size = file_size
-        generation.status = GenerationStatus.COMPLETED
+    except Exception as e:
+        return _stage_failed(task, db, audio_id, e, lease)
         
-        # Update queue
+    finally:
+        lease.stop()
+        db.close()
+
+
+def _run_stages(task, audio_id: int, stages):
+    """
+    Send the remaining stages on to their queues
+    
+    A task run eagerly (tests, scripts) runs them inline and returns the
+    final result instead.
+    """
+    if task.request.is_eager:
+        return stages.apply().get()
+    stages.apply_async()
+    return {'audio_id': audio_id, 'status': 'dispatched'}
+
+
+def _stage_failed(task, db, audio_id: int, error: Exception, lease: GenerationLease):
+    """
+    Stop quietly for a cancelled job, hand a job back when the worker is
+    shutting down; retry or dead-letter anything else
+    """
+    lease.stop()
+    if isinstance(error, GenerationCancelled) or is_cancelled(audio_id):
+        # A cancelled prediction also surfaces as a provider failure
+        _mark_cancelled(db, audio_id)
+        return {'audio_id': audio_id, 'status': 'cancelled'}
+    if isinstance(error, WorkerDraining):
+        generation_pipeline.hand_back(db, audio_id)
+        return {'audio_id': audio_id, 'status': 'requeued'}
+    logger.error(f"❌ Voice generation failed for audio_id={audio_id}: {str(error)}")
+    logger.exception(error)
+    _handle_failure(task, db, audio_id, error)
+    raise error
+
+
+def _mark_cancelled(db, audio_id: int) -> None:
+    """Make sure a job the worker stopped for cancellation is recorded as cancelled"""
+    logger.info(f"🛑 Generation {audio_id} was cancelled, stopping")
+    try:
+        db.rollback()
+        generation = db.query(GeneratedAudio).filter(GeneratedAudio.audio_id == audio_id).first()
+        queue_item = db.query(GenerationQueue).filter(GenerationQueue.audio_id == audio_id).first()
+        if generation and generation.status != GenerationStatus.CANCELLED:
+            generation.status = GenerationStatus.CANCELLED
+            generation.completed_at = func.now()
         if queue_item:
-            queue_item.status = QueueStatus.COMPLETED
-            from sqlalchemy.sql import func
-            queue_item.processed_at = func.now()
+            queue_item.status = QueueStatus.CANCELLED
+            GenerationLease.release(queue_item)
+        db.commit()
+    except Exception as update_error:
+        logger.error(f"Failed to record cancellation: {update_error}")
+        return
+    worker_affinity.release(audio_id)
+    
+    if generation is None:
+        return
+    ProgressTracker(audio_id, generation.user_id).update(GenerationStage.CANCELLED)
+    if generation.streaming:
+        purge_stream_chunks.apply_async(args=[audio_id], countdown=settings.STREAM_CHUNK_RETENTION)
+    
+    ai_service = get_ai_service()
+    if generation.prediction_id and generation.provider in ai_service.registry:
+        # Submitted after the cancel request looked for it; stop the billing
+        try:
+            ai_service.provider(generation.provider).cancel_generation(generation.prediction_id)
+        except Exception as e:
+            logger.warning(f"Could not cancel prediction {generation.prediction_id}: {e}")
+
+
+def _handle_failure(task, db, audio_id: int, error: Exception) -> None:
+    """
+    Retry a transient failure with jittered backoff, or dead-letter the job
+    
+    Raises:
+        celery.exceptions.Retry: when the task has been scheduled to run again
+        celery.exceptions.Ignore: when a held job has been re-sent to the queue
+    """
+    kind, retry_after = classify_error(error)
+    retries = task.request.retries or 0
+    # The provider was never called (circuit open, bulkhead full): hold the
+    # job in the queue without spending its retry budget
+    held = isinstance(error, ProviderUnavailableError)
+    will_retry = held or (kind == ErrorKind.TRANSIENT and retries < settings.GENERATION_TASK_MAX_RETRIES)
+    delay = backoff_delay(retries, retry_after) if will_retry else None
+    
+    try:
+        db.rollback()
+        generation = db.query(GeneratedAudio).filter(GeneratedAudio.audio_id == audio_id).first()
+        queue_item = db.query(GenerationQueue).filter(GenerationQueue.audio_id == audio_id).first()
+        
+        if will_retry:
+            if generation:
+                generation.status = GenerationStatus.PENDING
+            if queue_item:
+                queue_item.status = QueueStatus.QUEUED
+                queue_item.last_error = f"{type(error).__name__}: {error}"[:2000]
+                queue_item.error_kind = kind.value
+                GenerationLease.release(queue_item)
+        else:
+            if generation:
+                generation.status = GenerationStatus.FAILED
+            if queue_item:
+                queue_item.retry_count += 1
+                GenerationLease.release(queue_item)
+                DeadLetterService.dead_letter(queue_item, error, kind)
         
         db.commit()
+    except Exception as update_error:
+        logger.error(f"Failed to update error status: {update_error}")
+    
+    if held:
+        logger.warning(f"⏸️ Provider unavailable, holding audio_id={audio_id} for {delay:.1f}s: {error}")
+        record_retry_event("held")
+        ProgressTracker(audio_id).update(
+            GenerationStage.QUEUED,
+            message="The voice provider is temporarily unavailable; your request will resume shortly"
+        )
+        # Same task id and retry count, and the rest of the chain comes along
+        task.signature_from_request(countdown=delay).apply_async()
+        raise Ignore()
+    
+    if will_retry:
+        logger.warning(f"🔁 Transient failure for audio_id={audio_id}, retry {retries + 1} in {delay:.1f}s")
+        record_retry_event("retried", kind, error)
+        ProgressTracker(audio_id).update(
+            GenerationStage.QUEUED,
+            message=f"The voice provider is busy; retrying in {int(delay) + 1} seconds"
+        )
+        raise task.retry(exc=error, countdown=delay, max_retries=settings.GENERATION_TASK_MAX_RETRIES)
+    
+    logger.error(f"☠️ Dead-lettered audio_id={audio_id} ({kind.value} error)")
+    ProgressTracker(audio_id).update(GenerationStage.FAILED)
+
+
+@celery_app.task(bind=True, name='app.tasks.generation_tasks.finalize_generation')
+def finalize_generation(self, audio_id: int, prediction_status: str, output=None, error: str = None):
+    """
+    Finalize a generation whose prediction completed via webhook (or
+    deferred synthetic completion)
+    
+    Args:
+        audio_id: ID of the GeneratedAudio record to finalize
+        prediction_status: Terminal prediction status (succeeded, failed, canceled)
+        output: Prediction output (audio URL) when it succeeded
+        error: Prediction error message when it failed
+    """
+    db = SessionLocal()
+    
+    try:
+        generation = db.query(GeneratedAudio).filter(GeneratedAudio.audio_id == audio_id).first()
+        if not generation:
+            logger.error(f"❌ Generation not found: audio_id={audio_id}")
+            return
+        
+        # Webhooks may be delivered more than once; cancelled jobs are dropped
+        if generation.status in FINISHED_STATUSES:
+            logger.info(f"Generation {audio_id} already finalized ({generation.status.value})")
+            return
         
-        logger.info(f"🎉 Voice generation completed for audio_id={audio_id}")
-        return {
-            'audio_id': audio_id,
-            'status': 'completed',
-            'output_path': output_path,
-            'duration': duration,
-            'file_size': file_size
-        }
+        queue_item = db.query(GenerationQueue).filter(GenerationQueue.audio_id == audio_id).first()
+        tracker = ProgressTracker(audio_id, generation.user_id)
         
-    except Exception as e:
-        logger.error(f"❌ Voice generation failed for audio_id={audio_id}: {str(e)}")
-        logger.exception(e)
+        if prediction_status == "failed" and generation_pipeline.retry_expired_reference(db, generation, error):
+            return {'audio_id': audio_id, 'status': 'requeued'}
         
-        try:
-            # Update to FAILED status
-            generation = db.query(GeneratedAudio).filter(GeneratedAudio.audio_id == audio_id).first()
-            if generation:
-                generation.status = GenerationStatus.FAILED
-            
-            queue_item = db.query(GenerationQueue).filter(GenerationQueue.audio_id == audio_id).first()
+        if prediction_status != "succeeded" or not output:
+            logger.error(f"❌ Prediction for audio_id={audio_id} ended as {prediction_status}: {error}")
+            generation.status = GenerationStatus.FAILED
             if queue_item:
-                queue_item.status = QueueStatus.FAILED
                 queue_item.retry_count += 1
-            
+                GenerationLease.release(queue_item)
+                DeadLetterService.dead_letter(
+                    queue_item,
+                    PermanentGenerationError(f"Prediction {prediction_status}: {error}"),
+                    ErrorKind.PERMANENT
+                )
             db.commit()
-        except Exception as update_error:
-            logger.error(f"Failed to update error status: {update_error}")
+            tracker(GenerationStage.FAILED)
+            return {'audio_id': audio_id, 'status': 'failed'}
         
+        job = generation_pipeline.new_job(generation, queue_item, output=output)
+    
+    except Exception as e:
+        logger.error(f"❌ Finalizing generation failed for audio_id={audio_id}: {str(e)}")
+        logger.exception(e)
+        _handle_failure(self, db, audio_id, e)
         raise
+    
+    finally:
+        db.close()
+    
+    # The rest of the pipeline picks the job up from the provider's output
+    return _run_stages(self, audio_id, fetch_generation_output.s(job) | postprocess_generation.s())
+
+
+@celery_app.task(bind=True, name='app.tasks.generation_tasks.complete_synthetic_prediction', max_retries=5)
+def complete_synthetic_prediction(self, prediction_id: str, error: str = None):
+    """
+    Finish a deferred synthetic prediction once its simulated latency has passed
+    
+    Plays the part of the provider webhook: renders the audio and enqueues
+    finalize_generation for the generation waiting on this prediction.
+    """
+    db = SessionLocal()
+    try:
+        generation = db.query(GeneratedAudio).filter(GeneratedAudio.prediction_id == prediction_id).first()
+        if not generation:
+            # The submitting worker may not have committed the prediction id yet
+            raise self.retry(countdown=1)
+        
+        if generation.status in FINISHED_STATUSES:
+            return
         
+        if error:
+            finalize_generation.delay(generation.audio_id, "failed", error=error)
+            return
+        
+        engine = get_ai_service().provider(generation.provider or "synthetic").engine
+        try:
+            output_path, _, _ = engine.write(engine.render(generation.script_text))
+        except Exception as e:
+            finalize_generation.delay(generation.audio_id, "failed", error=str(e))
+            return
+        
+        finalize_generation.delay(generation.audio_id, "succeeded", output_path)
     finally:
         db.close()
+
+
+@celery_app.task(name='app.tasks.generation_tasks.reap_stale_generations')
+def reap_stale_generations():
+    """
+    Re-queue or fail generations whose worker stopped heartbeating, and move
+    queued ones off nodes that left the ring (run by celery beat)
+    """
+    db = SessionLocal()
+    try:
+        result = reap_expired_leases(db)
+        result["redispatched"] = redispatch_stranded(db)
+        if result["requeued"] or result["failed"] or result["redispatched"]:
+            logger.info(
+                f"🧹 Reaper: {result['requeued']} re-queued, {result['failed']} failed, "
+                f"{result['redispatched']} re-dispatched"
+            )
+        return result
+    finally:
+        db.close()
+
+
+@celery_app.task(name='app.tasks.generation_tasks.purge_stream_chunks')
+def purge_stream_chunks(audio_id: int):
+    """Delete the chunk files of a finished streaming generation"""
+    StreamChunks(audio_id).clear()
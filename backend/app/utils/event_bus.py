@@ -0,0 +1,88 @@
+"""
+Cross-process event bus over Redis pub/sub.
+
+Celery workers publish generation events; every API process runs an
+EventSubscriber that hands them to its local WebSocket ConnectionManager.
+With REDIS_URL=memory:// the same code runs against the in-process stand-in.
+"""
+import json
+import threading
+import time
+import logging
+from typing import Callable, Optional
+from app.utils.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+GENERATION_EVENTS_CHANNEL = "events:generation"
+
+
+def publish_event(event: dict, channel: str = GENERATION_EVENTS_CHANNEL) -> None:
+    """Publish an event; failures are logged, never raised"""
+    try:
+        get_redis().publish(channel, json.dumps(event, default=str))
+    except Exception as e:
+        logger.warning(f"Could not publish event to {channel}: {e}")
+
+
+class EventSubscriber:
+    """Background thread delivering events from a channel to a handler"""
+
+    def __init__(
+        self,
+        handler: Callable[[dict], None],
+        channel: str = GENERATION_EVENTS_CHANNEL,
+        reconnect_delay: float = 2.0
+    ):
+        self.handler = handler
+        self.channel = channel
+        self.reconnect_delay = reconnect_delay
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"event-subscriber:{self.channel}", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            pubsub = None
+            try:
+                pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                logger.info(f"Subscribed to {self.channel}")
+
+                while not self._stop.is_set():
+                    message = pubsub.get_message(ignore_subscribe_messages=True, timeout=0.25)
+                    if message and message.get("type") == "message":
+                        self._dispatch(message["data"])
+            except Exception as e:
+                logger.error(f"Event subscription to {self.channel} failed, reconnecting: {e}")
+                self._stop.wait(self.reconnect_delay)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+
+    def _dispatch(self, data: str) -> None:
+        try:
+            event = json.loads(data)
+        except ValueError:
+            logger.warning(f"Ignoring malformed event on {self.channel}")
+            return
+
+        try:
+            self.handler(event)
+        except Exception as e:
+            logger.error(f"Event handler failed: {e}")
@@ -1,5 +1,7 @@
 import os
 import uuid
+import hashlib
+import functools
 import aiofiles
 from fastapi import UploadFile, HTTPException
 from app.config import settings
@@ -69,3 +71,19 @@ def get_file_info(file_path: str) -> dict:
         "size": stat.st_size,
         "exists": True
     }
+
+@functools.lru_cache(maxsize=512)
+def _hash_file(file_path: str, size: int, mtime_ns: int) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def compute_file_hash(file_path: str) -> str:
+    """
+    SHA-256 of a file's content
+    Memoized per (path, size, mtime) so repeated lookups don't reread the file
+    """
+    stat = os.stat(file_path)
+    return _hash_file(file_path, stat.st_size, stat.st_mtime_ns)
@@ -0,0 +1,178 @@
+"""
+Shared HTTP client for provider downloads.
+
+Each process keeps one connection-pooled ``requests.Session`` so repeated
+downloads reuse TCP/TLS connections. Downloads are streamed to a temporary
+file next to the destination, checked against Content-Length, resumed with
+Range requests when truncated, and atomically renamed into place.
+"""
+import os
+import threading
+import uuid
+import logging
+from typing import Iterable, Optional
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class DownloadError(IOError):
+    """Raised when a download cannot be completed"""
+
+
+_session: Optional[requests.Session] = None
+_session_pid: Optional[int] = None
+_session_lock = threading.Lock()
+
+
+def _build_session() -> requests.Session:
+    session = requests.Session()
+    # Retry connection setup only; interrupted bodies are resumed by download_to_file
+    retry = Retry(total=3, connect=3, read=0, status=0, backoff_factor=0.5)
+    adapter = HTTPAdapter(
+        pool_connections=settings.HTTP_POOL_SIZE,
+        pool_maxsize=settings.HTTP_POOL_SIZE,
+        max_retries=retry
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_http_session() -> requests.Session:
+    """Get the connection-pooled session for this process"""
+    global _session, _session_pid
+
+    pid = os.getpid()
+    if _session is not None and _session_pid == pid:
+        return _session
+
+    with _session_lock:
+        if _session is None or _session_pid != pid:
+            _session = _build_session()
+            _session_pid = pid
+        return _session
+
+
+def reset_http_session() -> None:
+    """Drop the shared session (pooled sockets must not be shared across fork)"""
+    global _session, _session_pid, _session_lock
+    _session = None
+    _session_pid = None
+    _session_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=reset_http_session)
+
+
+def _temp_path_for(dest_path: str) -> str:
+    """Temporary path in the destination directory so the final rename is atomic"""
+    directory = os.path.dirname(os.path.abspath(dest_path))
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f".{os.path.basename(dest_path)}.{uuid.uuid4().hex}.part")
+
+
+def _total_from_content_range(header: Optional[str]) -> Optional[int]:
+    """Parse the total size from a ``bytes start-end/total`` header"""
+    if not header or "/" not in header:
+        return None
+    total = header.rsplit("/", 1)[1].strip()
+    return int(total) if total.isdigit() else None
+
+
+def download_to_file(
+    url: str,
+    dest_path: str,
+    chunk_size: Optional[int] = None,
+    max_attempts: Optional[int] = None,
+    timeout: tuple = (10, 60)
+) -> int:
+    """
+    Stream a URL into dest_path
+
+    Args:
+        url: URL to download
+        dest_path: Final file path
+        chunk_size: Bytes per read
+        max_attempts: Requests to make before giving up on a truncated body
+        timeout: (connect, read) timeouts in seconds
+
+    Returns:
+        Number of bytes written
+    """
+    chunk_size = chunk_size or settings.DOWNLOAD_CHUNK_SIZE
+    max_attempts = max_attempts or settings.DOWNLOAD_MAX_ATTEMPTS
+    session = get_http_session()
+    temp_path = _temp_path_for(dest_path)
+
+    written = 0
+    expected = None
+
+    try:
+        with open(temp_path, "wb") as file:
+            for attempt in range(1, max_attempts + 1):
+                # Audio is already compressed; keep byte counts comparable to Content-Length
+                headers = {"Accept-Encoding": "identity"}
+                if written:
+                    headers["Range"] = f"bytes={written}-"
+
+                try:
+                    with session.get(url, stream=True, timeout=timeout, headers=headers) as response:
+                        if written and response.status_code == 206:
+                            expected = _total_from_content_range(response.headers.get("Content-Range")) or expected
+                        else:
+                            response.raise_for_status()
+                            if written:
+                                # Server ignored the Range header, start over
+                                logger.info(f"Range not honoured for {url}, restarting download")
+                                file.seek(0)
+                                file.truncate()
+                                written = 0
+                            length = response.headers.get("Content-Length")
+                            expected = int(length) if length and length.isdigit() else None
+
+                        for chunk in response.iter_content(chunk_size=chunk_size):
+                            if chunk:
+                                file.write(chunk)
+                                written += len(chunk)
+                except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                    logger.warning(f"Download interrupted at {written} bytes (attempt {attempt}/{max_attempts}): {e}")
+                    continue
+
+                if expected is None or written == expected:
+                    break
+
+                logger.warning(
+                    f"Download truncated at {written}/{expected} bytes (attempt {attempt}/{max_attempts})"
+                )
+            else:
+                raise DownloadError(f"Incomplete download from {url}: {written}/{expected} bytes")
+
+        os.replace(temp_path, dest_path)
+        return written
+    except Exception:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+
+def write_chunks_to_file(chunks: Iterable[bytes], dest_path: str) -> int:
+    """Write an iterable of byte chunks to dest_path atomically"""
+    temp_path = _temp_path_for(dest_path)
+    written = 0
+
+    try:
+        with open(temp_path, "wb") as file:
+            for chunk in chunks:
+                if chunk:
+                    file.write(chunk)
+                    written += len(chunk)
+        os.replace(temp_path, dest_path)
+        return written
+    except Exception:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
@@ -0,0 +1,298 @@
+"""
+Shared Redis client for cross-process coordination state.
+
+Set REDIS_URL to ``memory://`` to use an in-process stand-in instead of a
+Redis server (tests and single-process development). The stand-in only
+implements the commands this application uses, with Redis semantics and
+``decode_responses=True`` behaviour (strings in, strings out).
+"""
+import queue
+import threading
+import time
+import logging
+from typing import Dict, Optional, Tuple
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class InMemoryRedis:
+    """Thread-safe, single-process stand-in for the Redis commands we use"""
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[object, Optional[float]]] = {}
+        self._lock = threading.RLock()
+        self._pubsubs = set()
+
+    # -- internals -------------------------------------------------------
+
+    def _get_entry(self, key: str):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.time():
+            del self._data[key]
+            return None
+        return value
+
+    # -- keys ------------------------------------------------------------
+
+    def ping(self) -> bool:
+        return True
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            return self._get_entry(key)
+
+    def set(self, key: str, value, ex: Optional[int] = None, px: Optional[int] = None, nx: bool = False):
+        with self._lock:
+            if nx and self._get_entry(key) is not None:
+                return None
+            expires_at = None
+            if ex is not None:
+                expires_at = time.time() + ex
+            elif px is not None:
+                expires_at = time.time() + px / 1000.0
+            self._data[key] = (str(value), expires_at)
+            return True
+
+    def delete(self, *keys: str) -> int:
+        with self._lock:
+            removed = 0
+            for key in keys:
+                if self._get_entry(key) is not None:
+                    del self._data[key]
+                    removed += 1
+            return removed
+
+    def exists(self, *keys: str) -> int:
+        with self._lock:
+            return sum(1 for key in keys if self._get_entry(key) is not None)
+
+    def expire(self, key: str, seconds: int) -> bool:
+        with self._lock:
+            value = self._get_entry(key)
+            if value is None:
+                return False
+            self._data[key] = (value, time.time() + seconds)
+            return True
+
+    def ttl(self, key: str) -> int:
+        with self._lock:
+            if self._get_entry(key) is None:
+                return -2
+            expires_at = self._data[key][1]
+            if expires_at is None:
+                return -1
+            return max(0, int(round(expires_at - time.time())))
+
+    # -- hashes ----------------------------------------------------------
+
+    def _hash(self, key: str, create: bool = False) -> Optional[dict]:
+        value = self._get_entry(key)
+        if value is None and create:
+            value = {}
+            self._data[key] = (value, None)
+        return value
+
+    def hset(self, key: str, field: Optional[str] = None, value=None, mapping: Optional[dict] = None) -> int:
+        with self._lock:
+            items = dict(mapping or {})
+            if field is not None:
+                items[field] = value
+            hash_value = self._hash(key, create=True)
+            added = sum(1 for name in items if name not in hash_value)
+            hash_value.update({name: str(item) for name, item in items.items()})
+            return added
+
+    def hget(self, key: str, field: str) -> Optional[str]:
+        with self._lock:
+            return (self._hash(key) or {}).get(field)
+
+    def hgetall(self, key: str) -> dict:
+        with self._lock:
+            return dict(self._hash(key) or {})
+
+    def hincrby(self, key: str, field: str, amount: int = 1) -> int:
+        with self._lock:
+            hash_value = self._hash(key, create=True)
+            value = int(hash_value.get(field, 0)) + amount
+            hash_value[field] = str(value)
+            return value
+
+    # -- sets ------------------------------------------------------------
+
+    def sadd(self, key: str, *members) -> int:
+        with self._lock:
+            members_set = self._get_entry(key)
+            if members_set is None:
+                members_set = set()
+                self._data[key] = (members_set, None)
+            added = len({str(m) for m in members} - members_set)
+            members_set.update(str(m) for m in members)
+            return added
+
+    def srem(self, key: str, *members) -> int:
+        with self._lock:
+            members_set = self._get_entry(key) or set()
+            removed = len({str(m) for m in members} & members_set)
+            members_set.difference_update(str(m) for m in members)
+            return removed
+
+    def smembers(self, key: str) -> set:
+        with self._lock:
+            return set(self._get_entry(key) or set())
+
+    # -- sorted sets -----------------------------------------------------
+
+    def _zset(self, key: str, create: bool = False) -> Optional[dict]:
+        value = self._get_entry(key)
+        if value is None and create:
+            value = {}
+            self._data[key] = (value, None)
+        return value
+
+    def _zsorted(self, key: str):
+        return sorted((self._zset(key) or {}).items(), key=lambda item: (item[1], item[0]))
+
+    def zadd(self, key: str, mapping: dict, nx: bool = False) -> int:
+        with self._lock:
+            zset = self._zset(key, create=True)
+            added = 0
+            for member, score in mapping.items():
+                member = str(member)
+                if member not in zset:
+                    added += 1
+                elif nx:
+                    continue
+                zset[member] = float(score)
+            return added
+
+    def zrem(self, key: str, *members) -> int:
+        with self._lock:
+            zset = self._zset(key) or {}
+            removed = 0
+            for member in members:
+                if zset.pop(str(member), None) is not None:
+                    removed += 1
+            return removed
+
+    def zcard(self, key: str) -> int:
+        with self._lock:
+            return len(self._zset(key) or {})
+
+    def zscore(self, key: str, member) -> Optional[float]:
+        with self._lock:
+            return (self._zset(key) or {}).get(str(member))
+
+    def zrank(self, key: str, member) -> Optional[int]:
+        with self._lock:
+            for rank, (name, _) in enumerate(self._zsorted(key)):
+                if name == str(member):
+                    return rank
+            return None
+
+    def zrange(self, key: str, start: int, end: int, withscores: bool = False) -> list:
+        with self._lock:
+            items = self._zsorted(key)
+            end = len(items) - 1 if end == -1 else end
+            selected = items[start:end + 1]
+            return [(name, score) for name, score in selected] if withscores else [name for name, _ in selected]
+
+    def zremrangebyscore(self, key: str, min_score, max_score) -> int:
+        with self._lock:
+            zset = self._zset(key) or {}
+            low = float("-inf") if min_score == "-inf" else float(min_score)
+            high = float("inf") if max_score == "+inf" else float(max_score)
+            doomed = [name for name, score in zset.items() if low <= score <= high]
+            for name in doomed:
+                del zset[name]
+            return len(doomed)
+
+    # -- pub/sub ---------------------------------------------------------
+
+    def publish(self, channel: str, message) -> int:
+        with self._lock:
+            receivers = [pubsub for pubsub in self._pubsubs if channel in pubsub.channels]
+        for pubsub in receivers:
+            pubsub._deliver({"type": "message", "pattern": None, "channel": channel, "data": str(message)})
+        return len(receivers)
+
+    def pubsub(self, ignore_subscribe_messages: bool = False) -> "InMemoryPubSub":
+        return InMemoryPubSub(self, ignore_subscribe_messages)
+
+    def flushdb(self) -> bool:
+        with self._lock:
+            self._data.clear()
+            return True
+
+
+class InMemoryPubSub:
+    """Subscription handle returned by InMemoryRedis.pubsub()"""
+
+    def __init__(self, server: InMemoryRedis, ignore_subscribe_messages: bool = False):
+        self._server = server
+        self._messages = queue.Queue()
+        self.ignore_subscribe_messages = ignore_subscribe_messages
+        self.channels = set()
+
+    def _deliver(self, message: dict):
+        self._messages.put(message)
+
+    def subscribe(self, *channels: str):
+        with self._server._lock:
+            self.channels.update(channels)
+            self._server._pubsubs.add(self)
+        for channel in channels:
+            self._deliver({"type": "subscribe", "pattern": None, "channel": channel, "data": len(self.channels)})
+
+    def unsubscribe(self, *channels: str):
+        with self._server._lock:
+            self.channels.difference_update(channels or set(self.channels))
+            if not self.channels:
+                self._server._pubsubs.discard(self)
+
+    def get_message(self, ignore_subscribe_messages: bool = False, timeout: float = 0.0) -> Optional[dict]:
+        try:
+            message = self._messages.get(timeout=timeout) if timeout else self._messages.get_nowait()
+        except queue.Empty:
+            return None
+        if message["type"] != "message" and (ignore_subscribe_messages or self.ignore_subscribe_messages):
+            return None
+        return message
+
+    def close(self):
+        self.unsubscribe()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_redis():
+    """
+    Get the shared Redis client
+
+    redis-py's connection pool detects forks and reconnects in the child,
+    so one client per process can be created at import time or lazily.
+    """
+    global _client
+
+    if _client is not None:
+        return _client
+
+    with _client_lock:
+        if _client is None:
+            if settings.REDIS_URL.startswith("memory://"):
+                _client = InMemoryRedis()
+            else:
+                import redis
+                _client = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+        return _client
+
+
+def reset_redis() -> None:
+    """Drop the shared client so the next call reconnects (used in tests)"""
+    global _client
+    _client = None
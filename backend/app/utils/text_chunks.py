@@ -0,0 +1,65 @@
+"""
+Split scripts into sentence-sized chunks for incremental synthesis.
+"""
+import re
+from typing import List
+
+# Sentence end: terminal punctuation (plus closing quotes/brackets) then whitespace
+_SENTENCE_END = re.compile(r'(?<=[.!?…])["\'”’)\]]*\s+')
+# Clause boundaries used to break up over-long sentences
+_CLAUSE_END = re.compile(r'(?<=[,;:—])\s+')
+
+
+def _split_long(sentence: str, max_chars: int) -> List[str]:
+    """Break a sentence longer than max_chars at clause, then word, boundaries"""
+    parts: List[str] = []
+    current = ""
+    for piece in _CLAUSE_END.split(sentence):
+        for word in (piece.split() if len(piece) > max_chars else [piece]):
+            candidate = f"{current} {word}".strip()
+            if current and len(candidate) > max_chars:
+                parts.append(current)
+                current = word
+            else:
+                current = candidate
+    if current:
+        parts.append(current)
+    return parts
+
+
+def split_sentences(text: str, max_chars: int = 300, min_chars: int = 20) -> List[str]:
+    """
+    Split text into sentences suitable for synthesizing one at a time
+
+    Args:
+        text: Script text
+        max_chars: Sentences longer than this are split at commas, then words
+        min_chars: Fragments shorter than this are merged into the previous
+            chunk ("Hi." on its own makes an awkward, clipped clip)
+
+    Returns:
+        Non-empty chunks, in order; joining them gives back the words of text
+    """
+    chunks: List[str] = []
+    for sentence in _SENTENCE_END.split(" ".join(text.split())):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        for part in (_split_long(sentence, max_chars) if len(sentence) > max_chars else [sentence]):
+            if chunks and (len(chunks[-1]) < min_chars or len(part) < min_chars) \
+                    and len(chunks[-1]) + len(part) + 1 <= max_chars:
+                chunks[-1] = f"{chunks[-1]} {part}"
+            else:
+                chunks.append(part)
+    return chunks
+
+
+def leading_text(text: str, max_words: int, max_chars: int = 300) -> str:
+    """The first chunk split_sentences would make of text, cut to max_words"""
+    sentences = split_sentences(text, max_chars=max_chars)
+    if not sentences:
+        return ""
+    words = sentences[0].split()
+    if len(words) <= max_words:
+        return sentences[0]
+    return " ".join(words[:max_words])
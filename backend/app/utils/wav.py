@@ -0,0 +1,154 @@
+"""
+Minimal PCM WAV helpers for streaming and stitching generated audio.
+"""
+import io
+import os
+import struct
+import wave
+import contextlib
+from typing import Iterable, NamedTuple, Tuple
+import numpy as np
+
+# Size field value for a stream whose length is not known yet
+UNKNOWN_SIZE = 0xFFFFFFFF
+
+# Sample widths that can be mixed as integers
+SAMPLE_DTYPES = {2: "<i2", 4: "<i4"}
+
+
+class WavFormat(NamedTuple):
+    channels: int
+    sample_width: int  # bytes per sample
+    frame_rate: int
+
+
+def read_wav(path: str) -> Tuple[WavFormat, bytes]:
+    """Format and raw PCM frames of a WAV file"""
+    with contextlib.closing(wave.open(path, "rb")) as f:
+        fmt = WavFormat(f.getnchannels(), f.getsampwidth(), f.getframerate())
+        return fmt, f.readframes(f.getnframes())
+
+
+def wav_bytes(fmt: WavFormat, frames: bytes) -> bytes:
+    """A complete WAV file holding frames"""
+    buffer = io.BytesIO()
+    with contextlib.closing(wave.open(buffer, "wb")) as f:
+        f.setnchannels(fmt.channels)
+        f.setsampwidth(fmt.sample_width)
+        f.setframerate(fmt.frame_rate)
+        f.writeframes(frames)
+    return buffer.getvalue()
+
+
+def streaming_header(fmt: WavFormat) -> bytes:
+    """
+    WAV header for a stream of unknown length
+
+    Players treat the maximal RIFF and data sizes as "read until EOF", so PCM
+    frames can follow as they are produced.
+    """
+    block_align = fmt.channels * fmt.sample_width
+    return (
+        b"RIFF" + struct.pack("<I", UNKNOWN_SIZE) + b"WAVE"
+        + b"fmt " + struct.pack(
+            "<IHHIIHH", 16, 1, fmt.channels, fmt.frame_rate,
+            fmt.frame_rate * block_align, block_align, fmt.sample_width * 8
+        )
+        + b"data" + struct.pack("<I", UNKNOWN_SIZE)
+    )
+
+
+def duration_of(fmt: WavFormat, frames: bytes) -> float:
+    return len(frames) / float(fmt.channels * fmt.sample_width * fmt.frame_rate)
+
+
+def concatenate_wavs(paths: Iterable[str], output_path: str) -> Tuple[float, int]:
+    """
+    Join WAV files with the same format into one
+
+    Returns:
+        Tuple of (duration_seconds, file_size_bytes)
+
+    Raises:
+        ValueError: the files have different formats
+    """
+    paths = list(paths)
+    if not paths:
+        raise ValueError("No audio to join")
+
+    fmt = None
+    total_frames = 0
+    with contextlib.closing(wave.open(output_path, "wb")) as out:
+        for path in paths:
+            chunk_fmt, frames = read_wav(path)
+            if fmt is None:
+                fmt = chunk_fmt
+                out.setnchannels(fmt.channels)
+                out.setsampwidth(fmt.sample_width)
+                out.setframerate(fmt.frame_rate)
+            elif chunk_fmt != fmt:
+                raise ValueError(f"Cannot join {path}: {chunk_fmt} differs from {fmt}")
+            out.writeframes(frames)
+            total_frames += len(frames)
+
+    duration = total_frames / float(fmt.channels * fmt.sample_width * fmt.frame_rate)
+    return round(duration, 2), os.path.getsize(output_path)
+
+
+def crossfade_wavs(paths: Iterable[str], output_path: str, crossfade_seconds: float) -> Tuple[float, int]:
+    """
+    Join WAV files with the same format, overlapping each boundary with a
+    linear crossfade so separately synthesized pieces do not click
+
+    Files in formats that cannot be mixed (8 and 24 bit) are joined end to end.
+
+    Returns:
+        Tuple of (duration_seconds, file_size_bytes)
+
+    Raises:
+        ValueError: the files have different formats
+    """
+    paths = list(paths)
+    if not paths:
+        raise ValueError("No audio to join")
+
+    fmt = read_wav(paths[0])[0]
+    overlap = int(crossfade_seconds * fmt.frame_rate)
+    if overlap <= 0 or fmt.sample_width not in SAMPLE_DTYPES:
+        return concatenate_wavs(paths, output_path)
+    dtype = np.dtype(SAMPLE_DTYPES[fmt.sample_width])
+
+    total_frames = 0
+    with contextlib.closing(wave.open(output_path, "wb")) as out:
+        out.setnchannels(fmt.channels)
+        out.setsampwidth(fmt.sample_width)
+        out.setframerate(fmt.frame_rate)
+
+        def write(samples: np.ndarray) -> None:
+            nonlocal total_frames
+            out.writeframes(samples.astype(dtype).tobytes())
+            total_frames += len(samples)
+
+        tail = None  # end of the previous file, held back to mix into the next
+        for path in paths:
+            chunk_fmt, frames = read_wav(path)
+            if chunk_fmt != fmt:
+                raise ValueError(f"Cannot join {path}: {chunk_fmt} differs from {fmt}")
+            samples = np.frombuffer(frames, dtype=dtype).reshape(-1, fmt.channels)
+
+            if tail is not None:
+                n = min(len(tail), len(samples))
+                write(tail[:len(tail) - n])
+                fade_in = np.linspace(0.0, 1.0, n, endpoint=False)[:, None]
+                mixed = tail[len(tail) - n:] * (1.0 - fade_in) + samples[:n] * fade_in
+                write(np.round(mixed))
+                samples = samples[n:]
+
+            keep = min(overlap, len(samples))
+            write(samples[:len(samples) - keep])
+            tail = samples[len(samples) - keep:]
+
+        write(tail)
+
+    duration = total_frames / float(fmt.frame_rate)
+    return round(duration, 2), os.path.getsize(output_path)
@@ -0,0 +1,66 @@
+"""
+Webhook signature verification.
+
+Replicate signs webhook deliveries following the Standard Webhooks scheme:
+the signed content is ``"{webhook-id}.{webhook-timestamp}.{body}"`` and the
+``webhook-signature`` header carries one or more ``v1,<base64 hmac>`` entries.
+"""
+import base64
+import hashlib
+import hmac
+import time
+from typing import Optional
+
+
+def _decode_secret(secret: str) -> bytes:
+    """Decode a ``whsec_``-prefixed signing secret into raw key bytes"""
+    if secret.startswith("whsec_"):
+        secret = secret[len("whsec_"):]
+    return base64.b64decode(secret)
+
+
+def compute_webhook_signature(secret: str, webhook_id: str, timestamp: str, body: bytes) -> str:
+    """Compute the base64 HMAC-SHA256 signature for a webhook delivery"""
+    signed_content = f"{webhook_id}.{timestamp}.".encode() + body
+    digest = hmac.new(_decode_secret(secret), signed_content, hashlib.sha256).digest()
+    return base64.b64encode(digest).decode()
+
+
+def verify_webhook_signature(
+    secret: str,
+    webhook_id: Optional[str],
+    timestamp: Optional[str],
+    signature_header: Optional[str],
+    body: bytes,
+    tolerance_seconds: int = 300,
+    now: Optional[float] = None
+) -> bool:
+    """
+    Verify a signed webhook delivery
+
+    Returns False if any header is missing, the timestamp is outside the
+    tolerance window (replay protection) or no signature matches.
+    """
+    if not (secret and webhook_id and timestamp and signature_header):
+        return False
+
+    try:
+        sent_at = int(timestamp)
+    except ValueError:
+        return False
+
+    current = time.time() if now is None else now
+    if abs(current - sent_at) > tolerance_seconds:
+        return False
+
+    try:
+        expected = compute_webhook_signature(secret, webhook_id, timestamp, body)
+    except (ValueError, TypeError):
+        return False
+
+    for entry in signature_header.split():
+        version, _, signature = entry.partition(",")
+        if version == "v1" and hmac.compare_digest(signature, expected):
+            return True
+
+    return False
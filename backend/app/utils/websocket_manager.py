@@ -1,5 +1,8 @@
-from typing import Dict, Set
+from typing import Dict, Optional, Set
 from fastapi import WebSocket
+from datetime import datetime
+from app.utils.event_bus import EventSubscriber
+import asyncio
 import json
 import logging
 
@@ -11,6 +14,18 @@ class ConnectionManager:
     def __init__(self):
         # user_id -> Set of WebSocket connections
         self.active_connections: Dict[int, Set[WebSocket]] = {}
+        # Serializes the frames sent on each connection, so a message spanning
+        # two frames (chunk metadata, then its audio) is never split by another
+        self.send_locks: Dict[WebSocket, asyncio.Lock] = {}
+    
+    def send_lock(self, websocket: WebSocket) -> asyncio.Lock:
+        """The lock to hold while sending on a connection"""
+        return self.send_locks.setdefault(websocket, asyncio.Lock())
+    
+    async def send_json(self, websocket: WebSocket, message: dict):
+        """Send one JSON frame between other senders' messages"""
+        async with self.send_lock(websocket):
+            await websocket.send_json(message)
     
     async def connect(self, websocket: WebSocket, user_id: int):
         """Accept and store a new WebSocket connection"""
@@ -24,6 +39,7 @@ class ConnectionManager:
     
     def disconnect(self, websocket: WebSocket, user_id: int):
         """Remove a WebSocket connection"""
+        self.send_locks.pop(websocket, None)
         if user_id in self.active_connections:
             self.active_connections[user_id].discard(websocket)
             
@@ -40,7 +56,7 @@ class ConnectionManager:
             
             for connection in self.active_connections[user_id]:
                 try:
-                    await connection.send_json(message)
+                    await self.send_json(connection, message)
                 except Exception as e:
                     logger.error(f"Error sending message: {e}")
                     dead_connections.add(connection)
@@ -49,17 +65,63 @@ class ConnectionManager:
             for connection in dead_connections:
                 self.disconnect(connection, user_id)
     
-    async def broadcast_status_update(self, audio_id: int, user_id: int, status: str, progress: int):
+    async def broadcast_status_update(
+        self,
+        audio_id: int,
+        user_id: int,
+        status: str,
+        progress: int,
+        **details
+    ):
         """Broadcast generation status update to user"""
         message = {
             "type": "generation_status",
             "audio_id": audio_id,
             "status": status,
             "progress": progress,
-            "timestamp": str(datetime.utcnow())
+            "timestamp": str(datetime.utcnow()),
+            **details
         }
         
         await self.send_personal_message(message, user_id)
+    
+    async def handle_event(self, event: dict):
+        """Forward an event from the event bus to the owning user's sockets"""
+        user_id = event.get("user_id")
+        if user_id not in self.active_connections:
+            # Not connected to this API process
+            return
+        
+        if event.get("type") == "generation_status":
+            await self.broadcast_status_update(
+                event["audio_id"],
+                user_id,
+                event.get("status"),
+                event.get("progress"),
+                stage=event.get("stage"),
+                message=event.get("message")
+            )
+        else:
+            await self.send_personal_message(event, user_id)
 
 # Global connection manager instance
 manager = ConnectionManager()
+
+_event_subscriber: Optional[EventSubscriber] = None
+
+def start_event_bridge(loop: asyncio.AbstractEventLoop):
+    """Subscribe to worker events and forward them to this process's sockets"""
+    global _event_subscriber
+    
+    def forward(event: dict):
+        asyncio.run_coroutine_threadsafe(manager.handle_event(event), loop)
+    
+    _event_subscriber = EventSubscriber(forward)
+    _event_subscriber.start()
+
+def stop_event_bridge():
+    """Stop forwarding worker events"""
+    global _event_subscriber
+    if _event_subscriber:
+        _event_subscriber.stop()
+        _event_subscriber = None
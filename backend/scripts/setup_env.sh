@@ -89,6 +89,9 @@ echo "   1. Update DATABASE_URL in .env if needed"
 echo "   2. (Optional) Add REPLICATE_API_TOKEN in .env for real AI"
 echo "   3. Run: python -m alembic upgrade head"
 echo "   4. Start API: uvicorn app.main:app --reload --host 0.0.0.0 --port 8000"
-echo "   5. Start Celery: celery -A app.celery_app.celery_app worker -l info"
+echo "   5. Start Celery (CPU stages on prefork, I/O stages on gevent):"
+echo "      celery -A app.celery_app.celery_app worker -l info -P prefork -Q generation.prepare,generation.postprocess,celery -n cpu@%h"
+echo "      celery -A app.celery_app.celery_app worker -l info -P gevent -c 100 -Q generation.synthesize,generation.fetch -n io@%h"
+echo "      celery -A app.celery_app.celery_app worker -l info -P gevent -c 8 -Q generation.preview -n preview@%h"
 echo ""
 
@@ -43,17 +43,27 @@ fi
 
 echo ""
 
-# Start Celery Worker
-echo "🔧 Starting Celery Worker..."
-celery -A app.celery_app worker --loglevel=info --logfile=logs/celery.log &
+# Start Celery Workers: CPU stages on prefork, I/O stages (synthesis, download) on gevent
+echo "🔧 Starting Celery Workers..."
+celery -A app.celery_app worker --loglevel=info --logfile=logs/celery.log -P prefork -Q generation.prepare,generation.postprocess,celery -n cpu@%h &
 CELERY_PID=$!
-echo "Celery Worker PID: $CELERY_PID"
+celery -A app.celery_app worker --loglevel=info --logfile=logs/celery_io.log -P gevent -c 100 -Q generation.synthesize,generation.fetch -n io@%h &
+CELERY_IO_PID=$!
+celery -A app.celery_app worker --loglevel=info --logfile=logs/celery_preview.log -P gevent -c 8 -Q generation.preview -n preview@%h &
+CELERY_PREVIEW_PID=$!
+echo "Celery Worker PIDs: $CELERY_PID (cpu), $CELERY_IO_PID (io), $CELERY_PREVIEW_PID (preview)"
 sleep 3
 
-# Start Celery Beat (optional - for periodic tasks)
-# echo "⏰ Starting Celery Beat..."
-# celery -A app.celery_app beat --loglevel=info &
-# CELERY_BEAT_PID=$!
+# Start Outbox Relay (publishes queued generation tasks to Celery)
+echo "📮 Starting Outbox Relay..."
+python -m app.outbox_relay >> logs/outbox_relay.log 2>&1 &
+RELAY_PID=$!
+echo "Outbox Relay PID: $RELAY_PID"
+
+# Start Celery Beat (periodic tasks, e.g. re-queuing jobs from dead workers)
+echo "⏰ Starting Celery Beat..."
+celery -A app.celery_app beat --loglevel=info --logfile=logs/celery_beat.log &
+CELERY_BEAT_PID=$!
 
 echo ""
 
@@ -67,6 +77,6 @@ echo "Press Ctrl+C to stop all services"
 echo ""
 
 # Trap to cleanup on exit
-trap 'echo ""; echo "🛑 Stopping services..."; kill $CELERY_PID 2>/dev/null; exit' INT TERM
+trap 'echo ""; echo "🛑 Stopping services..."; kill $CELERY_PID $CELERY_IO_PID $CELERY_PREVIEW_PID $RELAY_PID $CELERY_BEAT_PID 2>/dev/null; exit' INT TERM
 
 uvicorn app.main:app --reload --host 0.0.0.0 --port 8000
@@ -1,7 +1,7 @@
 #!/bin/bash
 
 # Complete system startup script
-# This script starts the FastAPI server and Celery worker
+# This script starts the FastAPI server and Celery workers
 
 set -e  # Exit on error
 
@@ -100,6 +100,14 @@ export PATH="/opt/homebrew/opt/postgresql@15/bin:$PATH"
 uvicorn app.main:app --reload --host 0.0.0.0 --port 8000 > /tmp/fastapi.log 2>&1 &
 FASTAPI_PID=$!
 
+# Start the outbox relay (publishes queued generation tasks to Celery)
+python -m app.outbox_relay > /tmp/outbox_relay.log 2>&1 &
+RELAY_PID=$!
+
+# Start Celery beat (schedules the stale generation reaper)
+celery -A app.celery_app.celery_app beat -l info > /tmp/celery_beat.log 2>&1 &
+BEAT_PID=$!
+
 # Wait for FastAPI to start
 echo "⏳ Waiting for FastAPI to start..."
 sleep 3
@@ -115,23 +123,33 @@ fi
 
 echo ""
 echo "════════════════════════════════════════════════════════"
-echo "  Starting Celery Worker"
+echo "  Starting Celery Workers"
 echo "════════════════════════════════════════════════════════"
 echo ""
 echo "📝 Celery will process audio generation tasks"
 echo "   Mode: ${REPLICATE_API_TOKEN:-MOCK AI (no Replicate token)}"
 echo ""
 
-# Start Celery in foreground (so we can see logs)
-celery -A app.celery_app.celery_app worker -l info
+# Start the I/O stage workers (synthesis, download, previews) on gevent in background
+celery -A app.celery_app.celery_app worker -l info -P gevent -c 100 -Q generation.synthesize,generation.fetch -n io@%h > /tmp/celery_io.log 2>&1 &
+IO_WORKER_PID=$!
+celery -A app.celery_app.celery_app worker -l info -P gevent -c 8 -Q generation.preview -n preview@%h > /tmp/celery_preview.log 2>&1 &
+PREVIEW_WORKER_PID=$!
+
+# Start the CPU stage worker on prefork in foreground (so we can see logs)
+celery -A app.celery_app.celery_app worker -l info -P prefork -Q generation.prepare,generation.postprocess,celery -n cpu@%h
 
 # If we get here, Celery was stopped
 echo ""
-echo -e "${YELLOW}🛑 Celery worker stopped${NC}"
+echo -e "${YELLOW}🛑 Celery CPU worker stopped${NC}"
 echo "Cleaning up..."
 
-# Kill FastAPI
+# Kill FastAPI, the outbox relay, beat and the I/O workers
 kill $FASTAPI_PID 2>/dev/null || true
+kill $IO_WORKER_PID 2>/dev/null || true
+kill $PREVIEW_WORKER_PID 2>/dev/null || true
+kill $RELAY_PID 2>/dev/null || true
+kill $BEAT_PID 2>/dev/null || true
 
 echo -e "${GREEN}✅ System shutdown complete${NC}"
 
@@ -0,0 +1,326 @@
+import pytest
+from app.models.task_outbox import TaskOutbox
+from app.services.progress_tracker import GenerationStage, ProgressTracker
+from app.tasks.generation_tasks import process_voice_generation
+
+def queued_tasks(db):
+    """Arguments of the generation tasks written to the outbox"""
+    records = db.query(TaskOutbox).order_by(TaskOutbox.outbox_id).all()
+    return [tuple(r.args) for r in records if r.task_name == process_voice_generation.name]
+
+@pytest.fixture
+def generation(client, auth_headers, test_sample):
+    response = client.post(
+        "/api/generation/create",
+        headers=auth_headers,
+        json={
+            "sample_id": test_sample.sample_id,
+            "model_name": "Test Model",
+            "script_text": "Hello world. This is a test."
+        }
+    )
+    assert response.status_code == 201
+    return response.json()
+
+def test_create_generation_queues_task(generation, db):
+    """Test creating a generation writes its task to the outbox"""
+    assert generation["status"] == "pending"
+    assert queued_tasks(db) == [(generation["audio_id"],)]
+
+def test_status_reports_worker_stage(client, auth_headers, generation):
+    """Test status comes from the staged progress store"""
+    audio_id = generation["audio_id"]
+    
+    response = client.get(f"/api/generation/status/{audio_id}", headers=auth_headers)
+    data = response.json()
+    assert data["stage"] == "queued"
+    assert data["poll_after"] >= 1
+    
+    ProgressTracker(audio_id).update(GenerationStage.INFERRING, 0.5)
+    
+    response = client.get(f"/api/generation/status/{audio_id}", headers=auth_headers)
+    data = response.json()
+    assert data["stage"] == "inferring"
+    assert 20 < data["progress"] < 85
+    assert data["message"] == "Generating your audio with AI..."
+
+def _create(client, auth_headers, sample_id, text="Hello world. This is a test.", key=None):
+    headers = dict(auth_headers)
+    if key:
+        headers["Idempotency-Key"] = key
+    return client.post(
+        "/api/generation/create",
+        headers=headers,
+        json={"sample_id": sample_id, "model_name": "Test Model", "script_text": text}
+    )
+
+def test_idempotency_key_replays_original(client, auth_headers, test_sample, db):
+    """Test retrying with the same Idempotency-Key returns the same generation"""
+    first = _create(client, auth_headers, test_sample.sample_id, key="abc-123")
+    second = _create(client, auth_headers, test_sample.sample_id, key="abc-123")
+    
+    assert first.status_code == second.status_code == 201
+    assert first.json()["audio_id"] == second.json()["audio_id"]
+    assert len(queued_tasks(db)) == 1
+    
+    # Same key, different body is a client error
+    response = _create(client, auth_headers, test_sample.sample_id, text="Something else", key="abc-123")
+    assert response.status_code == 422
+
+def test_idempotency_key_of_deleted_generation_starts_over(client, auth_headers, test_sample, db, monkeypatch):
+    """Test a key whose generation was deleted is reserved again, unless a concurrent retry took it"""
+    from app.services.idempotency import idempotency_store, request_fingerprint
+    
+    first = _create(client, auth_headers, test_sample.sample_id, key="abc-123").json()
+    client.post(f"/api/generation/{first['audio_id']}/cancel", headers=auth_headers)
+    assert client.delete(f"/api/generation/{first['audio_id']}", headers=auth_headers).status_code == 204
+    
+    # Another retry reserves the key between our release and our begin
+    release = idempotency_store.release
+    fingerprint = request_fingerprint(test_sample.sample_id, "Test Model", "Hello world. This is a test.")
+    def release_then_race(user_id, key):
+        release(user_id, key)
+        idempotency_store.begin(user_id, key, fingerprint)
+    monkeypatch.setattr(idempotency_store, "release", release_then_race)
+    
+    response = _create(client, auth_headers, test_sample.sample_id, key="abc-123")
+    assert response.status_code == 409
+    assert queued_tasks(db) == []
+    
+    monkeypatch.undo()
+    release(test_sample.user_id, "abc-123")
+    idempotency_store.complete(test_sample.user_id, "abc-123", fingerprint, first["audio_id"])
+    second = _create(client, auth_headers, test_sample.sample_id, key="abc-123")
+    assert second.status_code == 201
+    assert queued_tasks(db) == [(second.json()["audio_id"],)]
+
+def test_identical_requests_coalesce_while_in_flight(client, auth_headers, test_sample, db):
+    """Test duplicate requests attach to the in-flight generation"""
+    from app.models.generated_audio import GeneratedAudio, GenerationStatus
+    
+    first = _create(client, auth_headers, test_sample.sample_id).json()
+    second = _create(client, auth_headers, test_sample.sample_id, text="Hello   world. This is a test.").json()
+    assert second["audio_id"] == first["audio_id"]
+    assert len(queued_tasks(db)) == 1
+    
+    # Once the first one finishes, the same request creates a new generation
+    db.query(GeneratedAudio).filter(GeneratedAudio.audio_id == first["audio_id"]).update(
+        {"status": GenerationStatus.COMPLETED}
+    )
+    db.commit()
+    third = _create(client, auth_headers, test_sample.sample_id).json()
+    assert third["audio_id"] != first["audio_id"]
+    assert len(queued_tasks(db)) == 2
+
+def test_duplicate_of_request_being_created_is_told_to_retry(client, auth_headers, test_sample, db):
+    """Test a duplicate gets 409 with Retry-After instead of waiting for the first request"""
+    from app.services.idempotency import PENDING, request_fingerprint, single_flight
+    from app.utils.redis_client import get_redis
+    
+    fingerprint = request_fingerprint(test_sample.sample_id, "Test Model", "Hello world. This is a test.")
+    get_redis().set(single_flight._key(test_sample.user_id, fingerprint), PENDING)
+    
+    response = _create(client, auth_headers, test_sample.sample_id)
+    assert response.status_code == 409
+    assert response.headers["Retry-After"] == "1"
+    assert queued_tasks(db) == []
+
+def test_only_one_duplicate_replaces_a_finished_generation(client, auth_headers, test_sample, db, monkeypatch):
+    """Test two identical requests seeing the same finished generation do not both create one"""
+    from app.models.generated_audio import GeneratedAudio, GenerationStatus
+    from app.services.idempotency import request_fingerprint, single_flight
+    
+    first = _create(client, auth_headers, test_sample.sample_id).json()
+    db.query(GeneratedAudio).filter(GeneratedAudio.audio_id == first["audio_id"]).update(
+        {"status": GenerationStatus.COMPLETED}
+    )
+    db.commit()
+    fingerprint = request_fingerprint(test_sample.sample_id, "Test Model", "Hello world. This is a test.")
+    
+    # The other request reads the same finished id and takes over just before this one
+    claim = single_flight.claim
+    def claim_then_lose_race(user_id, fingerprint):
+        stale_id = claim(user_id, fingerprint)
+        assert single_flight.take_over(user_id, fingerprint, stale_id)
+        return stale_id
+    monkeypatch.setattr(single_flight, "claim", claim_then_lose_race)
+    
+    response = _create(client, auth_headers, test_sample.sample_id)
+    assert response.status_code == 409
+    assert response.headers["Retry-After"] == "1"
+    assert len(queued_tasks(db)) == 1
+    assert not single_flight.take_over(test_sample.user_id, fingerprint, first["audio_id"])
+
+def test_dead_letter_inspection_and_requeue(client, auth_headers, generation, db):
+    """Test dead-lettered generations can be listed and re-queued in bulk"""
+    from app.models.generated_audio import GeneratedAudio, GenerationStatus
+    from app.models.generation_queue import GenerationQueue
+    from app.services.dead_letter import DeadLetterService
+    from app.services.retry_policy import ErrorKind
+    
+    audio_id = generation["audio_id"]
+    queue_item = db.query(GenerationQueue).filter(GenerationQueue.audio_id == audio_id).first()
+    db.query(GeneratedAudio).filter(GeneratedAudio.audio_id == audio_id).update(
+        {"status": GenerationStatus.FAILED, "prediction_id": "pred-1"}
+    )
+    DeadLetterService.dead_letter(queue_item, ValueError("bad sample"), ErrorKind.PERMANENT)
+    db.commit()
+    
+    response = client.get("/api/monitoring/dead-letter", headers=auth_headers)
+    items = response.json()["items"]
+    assert [item["audio_id"] for item in items] == [audio_id]
+    assert items[0]["error_kind"] == "permanent"
+    assert "bad sample" in items[0]["last_error"]
+    
+    page = client.get("/api/monitoring/dead-letter?skip=1", headers=auth_headers).json()
+    assert page == {"total": 1, "items": []}
+    
+    response = client.post("/api/monitoring/dead-letter/requeue", headers=auth_headers)
+    assert response.json()["audio_ids"] == [audio_id]
+    assert queued_tasks(db) == [(audio_id,), (audio_id,)]
+    db.expire_all()
+    assert db.query(GeneratedAudio).filter(GeneratedAudio.audio_id == audio_id).one().prediction_id == "pred-1"
+    assert client.get("/api/monitoring/dead-letter", headers=auth_headers).json()["total"] == 0
+    
+    metrics = client.get("/api/monitoring/retries", headers=auth_headers).json()["metrics"]
+    assert metrics["dead_lettered"] == 1
+    assert metrics["requeued"] == 1
+
+def test_retry_failed_generation_requeues(client, auth_headers, generation, db):
+    """Test the retry endpoint re-queues a failed generation"""
+    from app.models.generated_audio import GeneratedAudio, GenerationStatus
+    
+    audio_id = generation["audio_id"]
+    db.query(GeneratedAudio).filter(GeneratedAudio.audio_id == audio_id).update(
+        {"status": GenerationStatus.FAILED, "prediction_id": "pred-1"}
+    )
+    db.commit()
+    
+    response = client.post(f"/api/generation/{audio_id}/retry", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json()["status"] == "pending"
+    assert queued_tasks(db) == [(audio_id,), (audio_id,)]
+    db.expire_all()
+    assert db.query(GeneratedAudio).filter(GeneratedAudio.audio_id == audio_id).one().prediction_id == "pred-1"
+
+def test_cancel_pending_generation(client, auth_headers, generation, db):
+    """Test cancelling drops the queued task and the job can be retried later"""
+    from app.services.cancellation import is_cancelled
+    from app.services.progress_tracker import get_progress
+    
+    audio_id = generation["audio_id"]
+    response = client.post(f"/api/generation/{audio_id}/cancel", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json()["status"] == "cancelled"
+    assert queued_tasks(db) == []
+    assert is_cancelled(audio_id)
+    assert get_progress(audio_id)["stage"] == "cancelled"
+    
+    response = client.post(f"/api/generation/{audio_id}/cancel", headers=auth_headers)
+    assert response.status_code == 400
+    
+    response = client.post(f"/api/generation/{audio_id}/retry", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json()["status"] == "pending"
+    assert queued_tasks(db) == [(audio_id,)]
+    assert not is_cancelled(audio_id)
+
+def test_stream_serves_chunks_as_wav(client, auth_headers, test_sample, db, tmp_path, monkeypatch):
+    """Test a streaming generation can be listened to chunk by chunk"""
+    from tests.services.test_streaming import FakeSynth
+    from app.config import settings
+    from app.services.streaming import synthesize_streaming
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path))
+    
+    response = client.post(
+        "/api/generation/create",
+        headers=auth_headers,
+        json={
+            "sample_id": test_sample.sample_id,
+            "model_name": "Test Model",
+            "script_text": "The first sentence is here. The second sentence follows.",
+            "stream": True
+        }
+    )
+    assert response.status_code == 201
+    assert response.json()["streaming"] is True
+    audio_id = response.json()["audio_id"]
+    
+    # What the worker does
+    synthesize_streaming(FakeSynth(str(tmp_path)), audio_id, test_sample.user_id,
+                         "The first sentence is here. The second sentence follows.", str(tmp_path))
+    
+    response = client.get(f"/api/generation/{audio_id}/stream", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "audio/wav"
+    assert response.content[:4] == b"RIFF"
+    assert len(response.content) == 44 + 2 * 16000
+    
+    response = client.get(f"/api/generation/{audio_id}/chunks/1", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.content[:4] == b"RIFF"
+
+def test_stream_requires_streaming_generation(client, auth_headers, generation):
+    """Test regular generations cannot be streamed"""
+    response = client.get(f"/api/generation/{generation['audio_id']}/stream", headers=auth_headers)
+    assert response.status_code == 400
+
+def test_admission_sheds_load_with_retry_after(client, auth_headers, test_sample, db, monkeypatch):
+    """Test requests over the user cap or queue depth get 429, except for priority tiers"""
+    from app.config import settings
+    from app.models.user import User
+    from app.services import admission
+    
+    monkeypatch.setattr(settings, "ADMISSION_MAX_USER_OUTSTANDING", 2)
+    monkeypatch.setattr(settings, "ADMISSION_DEPTH_CACHE_SECONDS", 0)
+    monkeypatch.setitem(admission._depth_cache, "expires", 0.0)
+    
+    def create(text):
+        return client.post(
+            "/api/generation/create",
+            headers=auth_headers,
+            json={"sample_id": test_sample.sample_id, "model_name": "Test Model", "script_text": text}
+        )
+    
+    assert create("First script.").status_code == 201
+    assert create("Second script.").status_code == 201
+    response = create("Third script.")
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    
+    # Two jobs queued against a limit of one: the overflow must drain first
+    monkeypatch.setattr(settings, "ADMISSION_MAX_USER_OUTSTANDING", 10)
+    monkeypatch.setattr(settings, "ADMISSION_MAX_QUEUE_DEPTH", 1)
+    response = create("Third script.")
+    assert response.status_code == 429
+    assert "queue is full" in response.json()["detail"]
+    
+    user = db.query(User).filter(User.user_id == test_sample.user_id).first()
+    user.priority_tier = 1
+    db.commit()
+    assert create("Third script.").status_code == 201
+    assert admission.snapshot(db)["rejections"] == {"user_outstanding": 1, "queue_depth": 1}
+
+def test_preview_runs_first_sentence_on_its_lane(client, auth_headers, test_sample, db):
+    """Test a preview keeps only the first sentence, is queued on the preview lane and can be promoted"""
+    script = "This is the opening line of the script. Everything after it is left for the full generation."
+    response = client.post(
+        "/api/generation/create",
+        headers=auth_headers,
+        json={"sample_id": test_sample.sample_id, "model_name": "Test Model", "script_text": script, "preview": True}
+    )
+    assert response.status_code == 201
+    preview = response.json()
+    assert preview["preview"] is True
+    assert preview["script_text"] == "This is the opening line of the script."
+    record = db.query(TaskOutbox).filter(TaskOutbox.task_name == process_voice_generation.name).one()
+    assert record.options == {"queue": "generation.preview"}
+    
+    response = client.post(f"/api/generation/{preview['audio_id']}/promote", headers=auth_headers)
+    assert response.status_code == 201
+    full = response.json()
+    assert full["script_text"] == script
+    assert full["incremental"] is True and full["preview"] is False
+    
+    response = client.post(f"/api/generation/{full['audio_id']}/promote", headers=auth_headers)
+    assert response.status_code == 400
@@ -0,0 +1,77 @@
+import base64
+import json
+import time
+import pytest
+from app.config import settings
+from app.models.generated_audio import GeneratedAudio, GenerationStatus
+from app.tasks.generation_tasks import finalize_generation
+from app.utils.webhooks import compute_webhook_signature
+
+SECRET = "whsec_" + base64.b64encode(b"test-webhook-secret").decode()
+
+@pytest.fixture
+def webhook_secret(monkeypatch):
+    monkeypatch.setattr(settings, "REPLICATE_WEBHOOK_SECRET", SECRET)
+    return SECRET
+
+@pytest.fixture
+def queued_finalizes(monkeypatch):
+    calls = []
+    monkeypatch.setattr(finalize_generation, "delay", lambda *args: calls.append(args))
+    return calls
+
+@pytest.fixture
+def submitted_generation(db, test_user, test_sample):
+    generation = GeneratedAudio(
+        user_id=test_user["user_id"],
+        sample_id=test_sample.sample_id,
+        model_name="Test Model",
+        script_text="Hello there",
+        status=GenerationStatus.PROCESSING,
+        prediction_id="pred-123"
+    )
+    db.add(generation)
+    db.commit()
+    db.refresh(generation)
+    return generation
+
+def _signed_post(client, payload, secret=SECRET):
+    body = json.dumps(payload).encode()
+    timestamp = str(int(time.time()))
+    signature = compute_webhook_signature(secret, "msg-1", timestamp, body)
+    return client.post(
+        "/api/webhooks/replicate",
+        content=body,
+        headers={
+            "webhook-id": "msg-1",
+            "webhook-timestamp": timestamp,
+            "webhook-signature": f"v1,{signature}",
+            "content-type": "application/json"
+        }
+    )
+
+def test_webhook_enqueues_finalize(client, webhook_secret, queued_finalizes, submitted_generation):
+    """Test a signed completion webhook enqueues the finalize task"""
+    response = _signed_post(client, {
+        "id": "pred-123",
+        "status": "succeeded",
+        "output": "https://replicate.delivery/out.wav"
+    })
+    assert response.status_code == 202
+    assert response.json()["audio_id"] == submitted_generation.audio_id
+    assert queued_finalizes == [
+        (submitted_generation.audio_id, "succeeded", "https://replicate.delivery/out.wav", None)
+    ]
+
+def test_webhook_rejects_bad_signature(client, webhook_secret, queued_finalizes, submitted_generation):
+    """Test webhooks signed with another secret are rejected"""
+    other_secret = "whsec_" + base64.b64encode(b"someone-else").decode()
+    response = _signed_post(client, {"id": "pred-123", "status": "succeeded"}, secret=other_secret)
+    assert response.status_code == 401
+    assert queued_finalizes == []
+
+def test_webhook_unknown_prediction(client, webhook_secret, queued_finalizes):
+    """Test webhooks for unknown predictions ask Replicate to redeliver"""
+    response = _signed_post(client, {"id": "missing", "status": "succeeded"})
+    assert response.status_code == 404
+    assert queued_finalizes == []
@@ -0,0 +1,74 @@
+import time
+from app.services.progress_tracker import GenerationStage, ProgressTracker
+from app.utils.redis_client import get_redis
+
+def _wait_for_subscriber(timeout=5.0):
+    deadline = time.time() + timeout
+    while not get_redis()._pubsubs and time.time() < deadline:
+        time.sleep(0.01)
+
+def test_worker_progress_pushed_to_socket(client, test_user, auth_headers):
+    """Test progress published by a worker reaches the user's WebSocket"""
+    user_id = test_user["user_id"]
+    token = auth_headers["Authorization"].split()[1]
+    _wait_for_subscriber()
+    
+    with client.websocket_connect(f"/api/ws/{user_id}?token={token}") as websocket:
+        assert websocket.receive_json()["type"] == "connection"
+        
+        ProgressTracker(42, user_id).update(GenerationStage.INFERRING, 0.5)
+        
+        message = websocket.receive_json()
+        assert message["type"] == "generation_status"
+        assert message["audio_id"] == 42
+        assert message["status"] == "processing"
+        assert message["stage"] == "inferring"
+
+def test_status_request_over_socket(client, test_user, auth_headers):
+    """Test clients can ask for a progress snapshot over the socket"""
+    user_id = test_user["user_id"]
+    token = auth_headers["Authorization"].split()[1]
+    ProgressTracker(7, user_id).update(GenerationStage.DOWNLOADING)
+    
+    with client.websocket_connect(f"/api/ws/{user_id}?token={token}") as websocket:
+        websocket.receive_json()
+        websocket.send_json({"type": "status", "audio_id": 7})
+        
+        message = websocket.receive_json()
+        assert message["type"] == "generation_status"
+        assert message["stage"] == "downloading"
+
+def test_stream_request_sends_binary_chunks(client, test_user, auth_headers, test_sample, db, tmp_path, monkeypatch):
+    """Test a streaming generation's chunks arrive as binary frames"""
+    from tests.services.test_streaming import FakeSynth
+    from app.models.generated_audio import GeneratedAudio
+    from app.config import settings
+    from app.services.streaming import synthesize_streaming
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path))
+    
+    user_id = test_user["user_id"]
+    token = auth_headers["Authorization"].split()[1]
+    text = "The first sentence is here. The second sentence follows."
+    generation = GeneratedAudio(
+        user_id=user_id,
+        sample_id=test_sample.sample_id,
+        model_name="Test Model",
+        script_text=text,
+        streaming=True
+    )
+    db.add(generation)
+    db.commit()
+    synthesize_streaming(FakeSynth(str(tmp_path)), generation.audio_id, user_id, text, str(tmp_path))
+    
+    with client.websocket_connect(f"/api/ws/{user_id}?token={token}") as websocket:
+        websocket.receive_json()
+        websocket.send_json({"type": "stream", "audio_id": generation.audio_id})
+        
+        assert websocket.receive_json()["type"] == "stream_start"
+        for index in range(2):
+            header = websocket.receive_json()
+            assert header["type"] == "stream_chunk"
+            assert header["index"] == index
+            data = websocket.receive_bytes()
+            assert data[:4] == b"RIFF" and len(data) == header["bytes"]
+        assert websocket.receive_json() == {"type": "stream_end", "audio_id": generation.audio_id, "chunks": 2}
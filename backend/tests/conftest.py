@@ -1,3 +1,8 @@
+import os
+
+# Coordination state (caches, progress, locks) stays in-process during tests
+os.environ["REDIS_URL"] = "memory://"
+
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
@@ -11,6 +16,13 @@ SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
 engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+@pytest.fixture(autouse=True)
+def clean_redis():
+    """Start every test with empty coordination state"""
+    from app.utils.redis_client import get_redis
+    get_redis().flushdb()
+    yield
+
 @pytest.fixture(scope="function")
 def db():
     """Create test database"""
@@ -59,3 +71,24 @@ def auth_headers(client, test_user):
     )
     token = response.json()["access_token"]
     return {"Authorization": f"Bearer {token}"}
+
+@pytest.fixture
+def test_sample(db, test_user, tmp_path):
+    """Create an audio sample for the test user"""
+    from app.models.audio_sample import AudioSample, UploadType
+    
+    sample_path = tmp_path / "sample.wav"
+    sample_path.write_bytes(b"RIFF" + b"\x00" * 1000)
+    
+    sample = AudioSample(
+        user_id=test_user["user_id"],
+        sample_name="Test Voice",
+        file_name="sample.wav",
+        file_path=str(sample_path),
+        file_size=1004,
+        upload_type=UploadType.UPLOADED
+    )
+    db.add(sample)
+    db.commit()
+    db.refresh(sample)
+    return sample
@@ -0,0 +1,53 @@
+import pytest
+from app.config import settings
+from app.services import ai_service as ai_service_module
+from app.services.ai_service import get_ai_service, reset_ai_service
+
+@pytest.fixture(autouse=True)
+def isolated_service(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "REPLICATE_API_TOKEN", None)
+    reset_ai_service()
+    yield
+    reset_ai_service()
+
+def test_service_is_shared():
+    """Test the service is built once per process"""
+    assert get_ai_service() is get_ai_service()
+
+def test_service_rebuilt_on_config_change(monkeypatch, tmp_path):
+    """Test a settings change rebuilds the service"""
+    first = get_ai_service()
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path / "other"))
+    second = get_ai_service()
+    assert second is not first
+    assert second.output_dir.startswith(str(tmp_path / "other"))
+
+def test_service_rebuilt_after_fork(monkeypatch):
+    """Test a child process does not reuse the parent's service"""
+    first = get_ai_service()
+    monkeypatch.setattr(ai_service_module.os, "getpid", lambda: -1)
+    assert get_ai_service() is not first
+
+def test_provider_built_lazily(monkeypatch):
+    """Test the Replicate provider is only built when first used"""
+    monkeypatch.setattr(settings, "REPLICATE_API_TOKEN", "r8_test")
+    monkeypatch.setenv("REPLICATE_API_TOKEN", "r8_test")
+    service = get_ai_service()
+    assert service.use_real_ai
+    replicate = service.provider("replicate")
+    assert replicate._service is None
+    assert replicate.service is replicate.service
+
+def test_mock_mode_synthesizes_real_audio(monkeypatch):
+    """Test generations without a provider get real audio of the right length"""
+    monkeypatch.setattr(settings, "SYNTHETIC_LATENCY_MODEL", "fixed")
+    monkeypatch.setattr(settings, "SYNTHETIC_LATENCY_BASE", 0.0)
+    service = get_ai_service()
+    
+    output_path, duration, file_size = service.generate_speech("missing.wav", "Hello there. How are you today?", "Test")
+    
+    assert duration == pytest.approx(service.provider("synthetic").engine.expected_duration("Hello there. How are you today?"), abs=0.01)
+    assert file_size > 44
+    with open(output_path, "rb") as f:
+        assert f.read(4) == b"RIFF"
@@ -0,0 +1,74 @@
+import hashlib
+import wave
+import numpy as np
+import pytest
+from app.config import settings
+from app.services.audio_postprocess import analyze, gated_loudness, map_pcm, postprocess_audio
+from app.utils.wav import read_wav
+
+RATE = 24000
+
+def write_wav(path, samples, rate=RATE):
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(np.round(np.clip(samples, -1, 1) * 32767).astype("<i2").tobytes())
+    return str(path)
+
+def sine(amplitude, seconds, frequency=1000.0, rate=RATE):
+    t = np.arange(int(seconds * rate)) / rate
+    return amplitude * np.sin(2 * np.pi * frequency * t)
+
+def test_loudness_matches_reference_tone(tmp_path):
+    """Test a 1 kHz tone reads about 3 dB under its peak level, as BS.1770 specifies"""
+    path = write_wav(tmp_path / "tone.wav", sine(0.1, 3.0))
+    fmt, samples = map_pcm(path)
+    assert fmt.frame_rate == RATE and samples.shape == (3 * RATE, 1)
+    assert gated_loudness(analyze(samples, RATE).frame_energy) == pytest.approx(-23.01, abs=0.2)
+
+def test_normalizes_trims_and_checksums(tmp_path, monkeypatch):
+    """Test output is brought to the target loudness with the silence around it cut"""
+    monkeypatch.setattr(settings, "AUDIO_DELIVERY_FORMAT", "wav")
+    audio = np.concatenate([np.zeros(RATE), sine(0.05, 2.0), np.zeros(RATE)])
+    path = write_wav(tmp_path / "speech.wav", audio)
+    
+    result = postprocess_audio(path)
+    assert result.path == path
+    assert result.loudness_lufs == pytest.approx(settings.AUDIO_TARGET_LUFS, abs=0.2)
+    # 2 s of tone plus the padding kept either side
+    assert result.duration == pytest.approx(2.0 + 2 * settings.AUDIO_SILENCE_PAD_MS / 1000, abs=0.02)
+    
+    fmt, frames = read_wav(path)
+    assert result.checksum == hashlib.sha256(frames).hexdigest()
+    fmt, samples = map_pcm(path)
+    assert gated_loudness(analyze(samples, RATE).frame_energy) == pytest.approx(settings.AUDIO_TARGET_LUFS, abs=0.2)
+
+def test_limiter_holds_peak_ceiling(tmp_path, monkeypatch):
+    """Test a gain that would clip is limited to the ceiling instead"""
+    monkeypatch.setattr(settings, "AUDIO_TARGET_LUFS", 0.0)
+    audio = sine(0.5, 2.0)
+    audio[RATE:RATE + 240] *= 1.9  # a short transient
+    path = write_wav(tmp_path / "loud.wav", audio)
+    
+    result = postprocess_audio(path)
+    assert result.peak_dbfs <= settings.AUDIO_PEAK_CEILING_DBFS + 0.05
+    fmt, samples = map_pcm(path)
+    assert np.abs(samples).max() / 32768 <= 10 ** (settings.AUDIO_PEAK_CEILING_DBFS / 20) + 1e-3
+
+def test_opus_delivery(tmp_path, monkeypatch):
+    """Test Opus delivery writes a much smaller Ogg file, the same one again on a retry"""
+    soundfile = pytest.importorskip("soundfile")
+    if "OPUS" not in soundfile.available_subtypes("OGG"):
+        pytest.skip("libsndfile was built without Opus")
+    monkeypatch.setattr(settings, "AUDIO_DELIVERY_FORMAT", "opus")
+    path = write_wav(tmp_path / "speech.wav", sine(0.2, 3.0, frequency=220.0))
+    
+    result = postprocess_audio(path)
+    assert result.path == str(tmp_path / "speech.ogg")
+    # The source stays until the caller has recorded the new path
+    assert postprocess_audio(path).path == result.path
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["speech.ogg", "speech.wav"]
+    assert result.file_size < 3 * RATE * 2 / 4
+    info = soundfile.info(result.path)
+    assert info.samplerate == RATE and info.duration == pytest.approx(3.0, abs=0.05)
@@ -0,0 +1,79 @@
+import pytest
+from app.config import settings
+from app.models.generated_audio import GeneratedAudio, GenerationStatus
+from app.models.generation_queue import GenerationQueue, QueueStatus
+from app.services.ai_service import get_ai_service, reset_ai_service
+from app.services.cancellation import GenerationCancelled, cancellable, request_cancel
+from app.services.progress_tracker import GenerationStage, get_progress
+from app.tasks import generation_tasks
+
+@pytest.fixture
+def queued_generation(db, test_sample, monkeypatch, tmp_path):
+    from tests.conftest import TestingSessionLocal
+    
+    monkeypatch.setattr(generation_tasks, "SessionLocal", TestingSessionLocal)
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "REPLICATE_API_TOKEN", None)
+    monkeypatch.setattr(settings, "SYNTHETIC_DEFERRED_COMPLETION", False)
+    reset_ai_service()
+    
+    generation = GeneratedAudio(
+        user_id=test_sample.user_id,
+        sample_id=test_sample.sample_id,
+        model_name="Test Model",
+        script_text="Hello world. This is a test.",
+        status=GenerationStatus.PENDING
+    )
+    db.add(generation)
+    db.flush()
+    db.add(GenerationQueue(audio_id=generation.audio_id, user_id=test_sample.user_id, status=QueueStatus.QUEUED))
+    db.commit()
+    yield generation
+    reset_ai_service()
+
+def test_cancellable_progress_raises_once_flagged():
+    """Test a stage change after cancellation stops the worker"""
+    stages = []
+    report = cancellable(1, lambda stage, fraction=None: stages.append(stage))
+    report(GenerationStage.CONVERTING)
+    request_cancel(1)
+    with pytest.raises(GenerationCancelled):
+        report(GenerationStage.INFERRING)
+    assert stages == [GenerationStage.CONVERTING]
+
+def test_worker_skips_cancelled_generation(db, queued_generation, monkeypatch):
+    """Test a task picked up after cancellation never calls the provider"""
+    calls = []
+    engine = get_ai_service().provider("synthetic").engine
+    monkeypatch.setattr(engine, "synthesize", lambda text, on_progress=None: calls.append(text))
+    request_cancel(queued_generation.audio_id)
+    
+    result = generation_tasks.process_voice_generation.apply(args=[queued_generation.audio_id]).get()
+    
+    db.refresh(queued_generation)
+    assert result["status"] == "cancelled"
+    assert queued_generation.status == GenerationStatus.CANCELLED
+    assert calls == []
+
+def test_worker_stops_at_next_stage(db, queued_generation, monkeypatch, tmp_path):
+    """Test a job cancelled mid-generation ends cancelled without keeping output"""
+    engine = get_ai_service().provider("synthetic").engine
+    audio_id = queued_generation.audio_id
+    
+    def synthesize(text, on_progress=None):
+        request_cancel(audio_id)  # the user cancels while the provider works
+        on_progress(GenerationStage.INFERRING)
+        return engine.write(engine.render(text))
+    
+    monkeypatch.setattr(engine, "synthesize", synthesize)
+    
+    result = generation_tasks.process_voice_generation.apply(args=[audio_id]).get()
+    
+    db.refresh(queued_generation)
+    queue_item = db.query(GenerationQueue).filter(GenerationQueue.audio_id == audio_id).first()
+    assert result["status"] == "cancelled"
+    assert queued_generation.status == GenerationStatus.CANCELLED
+    assert queued_generation.output_file_path is None
+    assert queue_item.status == QueueStatus.CANCELLED
+    assert queue_item.leased_by is None
+    assert get_progress(audio_id)["stage"] == "cancelled"
@@ -0,0 +1,62 @@
+import pytest
+from app.config import settings
+from app.services.circuit_breaker import (
+    Bulkhead,
+    BulkheadFullError,
+    CircuitBreaker,
+    CircuitOpenError,
+    CircuitState,
+)
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+    
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+def test_breaker_opens_on_errors_and_probes_when_half_open(clock):
+    """Test the circuit opens at the error threshold and a good probe closes it"""
+    breaker = CircuitBreaker("test", clock=clock)
+    for _ in range(settings.CIRCUIT_MIN_CALLS):
+        assert breaker.before_call() is False
+        breaker.record(1.0, failed=True)
+    
+    assert breaker.state() == CircuitState.OPEN
+    with pytest.raises(CircuitOpenError) as exc_info:
+        breaker.before_call()
+    assert exc_info.value.retry_after > 0
+    
+    clock.now += settings.CIRCUIT_OPEN_SECONDS
+    assert breaker.state() == CircuitState.HALF_OPEN
+    assert breaker.before_call() is True
+    # Only one probe at a time
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    
+    breaker.record(1.0, failed=False, probe=True)
+    assert breaker.state() == CircuitState.CLOSED
+    # Failures from before it closed no longer count
+    assert breaker.window_stats()["calls"] == 0
+
+def test_breaker_opens_on_slow_calls(clock):
+    """Test sustained slow calls open the circuit too"""
+    breaker = CircuitBreaker("slow", clock=clock)
+    for _ in range(settings.CIRCUIT_MIN_CALLS):
+        breaker.record(settings.CIRCUIT_SLOW_CALL_SECONDS + 1, failed=False)
+    assert breaker.state() == CircuitState.OPEN
+
+def test_bulkhead_caps_concurrent_calls():
+    """Test the bulkhead hands out at most `limit` slots"""
+    bulkhead = Bulkhead("test", limit=2)
+    with bulkhead.slot():
+        with bulkhead.slot():
+            assert bulkhead.in_use() == 2
+            with pytest.raises(BulkheadFullError):
+                with bulkhead.slot(timeout=0):
+                    pass
+    assert bulkhead.in_use() == 0
@@ -0,0 +1,62 @@
+import pytest
+from app.services.eta_estimator import EtaEstimator, length_bucket
+from app.utils.redis_client import get_redis
+
+@pytest.fixture
+def estimator():
+    get_redis().flushdb()
+    return EtaEstimator(alpha=0.5)
+
+def test_length_buckets():
+    """Test scripts are bucketed by word count"""
+    assert length_bucket(10) == "le25"
+    assert length_bucket(26) == "le50"
+    assert length_bucket(5000) == "gt800"
+
+def test_estimate_needs_samples(estimator):
+    """Test no calibrated estimate until enough generations completed"""
+    estimator.record("replicate", 40, 20.0)
+    assert estimator.estimate_processing("replicate", 40) is None
+
+def test_estimate_tracks_observations(estimator):
+    """Test estimates follow observed timings per provider and length"""
+    for seconds in (20.0, 22.0, 21.0, 20.0):
+        estimator.record("replicate", 40, seconds, queue_wait_seconds=5.0)
+    
+    estimate = estimator.estimate_processing("replicate", 40)
+    assert 20.0 <= estimate < 25.0
+    assert estimator.estimate_processing("replicate", 300) is None
+    assert estimator.queue_delay() == pytest.approx(5.0)
+    assert estimator.queue_delay(queued_ahead=8, processing_seconds=20.0) > 0
+
+def test_seed_measures_from_processing_start(estimator, db, test_sample):
+    """Test history seeds processing time from when a worker claimed the job, apart from queue wait"""
+    from datetime import datetime, timedelta
+    from app.models.generated_audio import GeneratedAudio, GenerationStatus
+    from app.models.generation_queue import GenerationQueue, QueueStatus
+    
+    queued = datetime(2026, 1, 1, 12, 0, 0)
+    for i in range(4):
+        generation = GeneratedAudio(
+            user_id=test_sample.user_id, sample_id=test_sample.sample_id, model_name="Test Model",
+            script_text="word " * 40, status=GenerationStatus.COMPLETED, provider="synthetic" if i == 3 else None,
+            generated_at=queued, completed_at=queued + timedelta(seconds=100)
+        )
+        db.add(generation)
+        db.flush()
+        db.add(GenerationQueue(
+            audio_id=generation.audio_id, user_id=test_sample.user_id, status=QueueStatus.COMPLETED,
+            queued_at=queued, started_at=queued + timedelta(seconds=80)
+        ))
+    db.commit()
+    
+    assert estimator.seed_from_history(db, "replicate") == 4
+    assert estimator.estimate_processing("replicate", 40) == pytest.approx(20.0)
+    # The fallback's row does not count towards the primary
+    assert estimator._read(estimator._key("replicate", "le50"))["count"] == 3
+    assert estimator._read(estimator._key("synthetic", "le50"))["count"] == 1
+    assert estimator.queue_delay() == pytest.approx(80.0)
+    
+    # Only the first worker to start replays the history
+    get_redis().delete("eta:keys")
+    assert estimator.seed_from_history(db, "replicate") == 0
@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+from app.config import settings
+from app.models.generated_audio import GeneratedAudio, GenerationStatus
+from app.models.generation_queue import GenerationQueue, QueueStatus
+from app.models.task_outbox import TaskOutbox
+from app.services.generation_lease import GenerationLease, reap_expired_leases, redispatch_stranded
+
+@pytest.fixture
+def processing_job(db, test_sample):
+    generation = GeneratedAudio(
+        user_id=test_sample.user_id,
+        sample_id=test_sample.sample_id,
+        model_name="Test Model",
+        script_text="Hello world",
+        status=GenerationStatus.PROCESSING
+    )
+    db.add(generation)
+    db.flush()
+    queue_item = GenerationQueue(
+        audio_id=generation.audio_id,
+        user_id=test_sample.user_id,
+        status=QueueStatus.PROCESSING,
+        retry_count=0
+    )
+    db.add(queue_item)
+    db.commit()
+    return generation, queue_item
+
+def _expire(db, queue_item):
+    queue_item.leased_by = "dead-worker"
+    queue_item.lease_expires_at = datetime.now(timezone.utc) - timedelta(seconds=1)
+    db.commit()
+
+def test_live_lease_is_not_reaped(db, processing_job):
+    """Test a heartbeating job is left alone"""
+    _, queue_item = processing_job
+    lease = GenerationLease(queue_item.audio_id, "worker-1", session_factory=lambda: db)
+    lease.acquire(queue_item)
+    db.commit()
+    
+    assert reap_expired_leases(db) == {"requeued": 0, "failed": 0}
+
+def test_expired_lease_is_requeued_then_failed(db, processing_job, monkeypatch):
+    """Test a dead worker's job is re-queued up to the retry cap"""
+    monkeypatch.setattr(settings, "GENERATION_MAX_RETRIES", 1)
+    generation, queue_item = processing_job
+    
+    _expire(db, queue_item)
+    assert reap_expired_leases(db) == {"requeued": 1, "failed": 0}
+    db.refresh(generation)
+    db.refresh(queue_item)
+    assert generation.status == GenerationStatus.PENDING
+    assert queue_item.status == QueueStatus.QUEUED
+    assert queue_item.retry_count == 1
+    assert [r.args for r in db.query(TaskOutbox).all()] == [[generation.audio_id]]
+    
+    # Picked up again, and that worker dies too
+    queue_item.status = QueueStatus.PROCESSING
+    generation.status = GenerationStatus.PROCESSING
+    _expire(db, queue_item)
+    assert reap_expired_leases(db) == {"requeued": 0, "failed": 1}
+    db.refresh(generation)
+    assert generation.status == GenerationStatus.FAILED
+
+def test_queued_job_of_departed_node_is_redispatched(db, processing_job, monkeypatch):
+    """Test jobs waiting in the queue of a node that left the ring go to a live node"""
+    from app.services.worker_affinity import NodeHeartbeat, assigned_node, dispatch_options
+    
+    monkeypatch.setattr(settings, "AFFINITY_ROUTING", True)
+    generation, queue_item = processing_job
+    generation.status = GenerationStatus.PENDING
+    queue_item.status = QueueStatus.QUEUED
+    db.commit()
+    NodeHeartbeat("node-a").beat()
+    assert dispatch_options(generation.sample_id, generation.audio_id) == {"queue": "generation.prepare.node-a"}
+    assert redispatch_stranded(db) == 0
+    
+    NodeHeartbeat("node-b").beat()
+    NodeHeartbeat("node-a").stop()
+    assert redispatch_stranded(db) == 1
+    assert assigned_node(generation.audio_id) == "node-b"
+    assert db.query(TaskOutbox).one().options == {"queue": "generation.prepare.node-b"}
+    db.refresh(queue_item)
+    assert queue_item.retry_count == 0
+    assert redispatch_stranded(db) == 0
@@ -0,0 +1,249 @@
+import pytest
+from app.celery_app import celery_app
+from app.config import settings
+from app.models.generated_audio import GeneratedAudio, GenerationStatus
+from app.models.generation_queue import GenerationQueue, QueueStatus
+from app.services.ai_service import get_ai_service, reset_ai_service
+from app.tasks import generation_tasks
+
+@pytest.fixture
+def generation(db, test_sample, monkeypatch, tmp_path):
+    from tests.conftest import TestingSessionLocal
+    
+    monkeypatch.setattr(generation_tasks, "SessionLocal", TestingSessionLocal)
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "REPLICATE_API_TOKEN", None)
+    monkeypatch.setattr(settings, "SYNTHETIC_DEFERRED_COMPLETION", False)
+    monkeypatch.setattr(settings, "SYNTHETIC_LATENCY_MODEL", "fixed")
+    monkeypatch.setattr(settings, "SYNTHETIC_LATENCY_BASE", 0.0)
+    reset_ai_service()
+    
+    generation = GeneratedAudio(
+        user_id=test_sample.user_id,
+        sample_id=test_sample.sample_id,
+        model_name="Test Model",
+        script_text="Hello world. This is a test.",
+        status=GenerationStatus.PENDING
+    )
+    db.add(generation)
+    db.flush()
+    db.add(GenerationQueue(audio_id=generation.audio_id, user_id=test_sample.user_id, status=QueueStatus.QUEUED))
+    db.commit()
+    yield generation
+    reset_ai_service()
+
+def test_stages_routed_to_their_own_queues():
+    """Test each stage task goes to the queue of its worker pool"""
+    router = celery_app.amqp.router
+    queues = {
+        name: router.route({}, name)["queue"].name
+        for name in (
+            generation_tasks.process_voice_generation.name,
+            generation_tasks.synthesize_generation.name,
+            generation_tasks.fetch_generation_output.name,
+            generation_tasks.postprocess_generation.name,
+        )
+    }
+    assert list(queues.values()) == [
+        "generation.prepare", "generation.synthesize", "generation.fetch", "generation.postprocess"
+    ]
+
+@pytest.mark.parametrize("script", ["start_all.sh", "start_complete_system.sh", "setup_env.sh"])
+def test_start_scripts_consume_every_stage_queue(script):
+    """Test the workers the repo's scripts start pick up every stage, and previews, on the right pool"""
+    import os
+    import re
+    from app.services.generation_pipeline import STAGE_QUEUES
+    from app.services.worker_affinity import PREVIEW_QUEUE
+    
+    path = os.path.join(os.path.dirname(__file__), "..", "..", "scripts", script)
+    with open(path) as f:
+        consumed = set()
+        on_gevent = set()
+        for line in re.findall(r"celery_app(?:\.celery_app)? worker .*", f.read()):
+            queues = re.search(r"-Q (\S+)", line).group(1).split(",")
+            consumed.update(queues)
+            if "-P gevent" in line:
+                on_gevent.update(queues)
+    assert set(STAGE_QUEUES.values()) | {PREVIEW_QUEUE} <= consumed
+    # I/O stages run on gevent, CPU stages on prefork
+    assert {"generation.synthesize", "generation.fetch"} <= on_gevent
+    assert not {"generation.prepare", "generation.postprocess"} & on_gevent
+
+def test_chain_runs_every_stage(db, generation):
+    """Test a generation passes through all stages and releases its lease"""
+    result = generation_tasks.process_voice_generation.apply(args=[generation.audio_id]).get()
+    
+    db.refresh(generation)
+    queue_item = db.query(GenerationQueue).filter(GenerationQueue.audio_id == generation.audio_id).first()
+    assert result["status"] == "completed"
+    assert result["provider"] == "synthetic"
+    assert generation.status == GenerationStatus.COMPLETED
+    assert generation.duration_seconds > 0
+    assert queue_item.status == QueueStatus.COMPLETED
+    assert queue_item.leased_by is None
+
+def test_webhook_completion_runs_fetch_and_postprocess(db, generation):
+    """Test a provider's completion picks the job up at the fetch stage"""
+    engine = get_ai_service().provider("synthetic").engine
+    output_path, duration, _ = engine.write(engine.render(generation.script_text))
+    generation.status = GenerationStatus.PROCESSING
+    generation.provider = "synthetic"
+    generation.prediction_id = "synthetic-test"
+    db.commit()
+    
+    result = generation_tasks.finalize_generation.apply(args=[generation.audio_id, "succeeded", output_path]).get()
+    
+    db.refresh(generation)
+    assert result["status"] == "completed"
+    assert generation.output_file_path == output_path
+    # Postprocessing trims the silence the engine leaves around the speech
+    assert 0 < generation.duration_seconds <= duration
+    assert generation.loudness_lufs == pytest.approx(settings.AUDIO_TARGET_LUFS, abs=0.5)
+    assert len(generation.checksum) == 64
+
+def test_prediction_failing_on_expired_reference_reruns_once(db, generation, monkeypatch):
+    """Test a webhook reporting an unfetchable reference re-queues the job once with a fresh upload"""
+    from app.services.voice_providers import SyntheticProvider
+    
+    invalidated = []
+    monkeypatch.setattr(SyntheticProvider, "reference_expired", lambda self, error: "download" in error)
+    monkeypatch.setattr(SyntheticProvider, "invalidate_reference", lambda self, path: invalidated.append(path))
+    generation.provider = "synthetic"
+    generation.prediction_id = "synthetic-test"
+    generation.status = GenerationStatus.PROCESSING
+    db.commit()
+    error = "failed to download file https://api.replicate.com/v1/files/file-1"
+    
+    result = generation_tasks.finalize_generation.apply(args=[generation.audio_id, "failed", None, error]).get()
+    db.refresh(generation)
+    assert result["status"] == "requeued"
+    assert generation.status == GenerationStatus.PENDING
+    assert generation.prediction_id is None
+    assert len(invalidated) == 1
+    
+    generation.status = GenerationStatus.PROCESSING
+    db.commit()
+    result = generation_tasks.finalize_generation.apply(args=[generation.audio_id, "failed", None, error]).get()
+    db.refresh(generation)
+    assert result["status"] == "failed"
+    assert len(invalidated) == 1
+
+def test_stage_of_superseded_run_is_dropped(db, generation):
+    """Test a stage queued before the job was re-queued does nothing"""
+    queue_item = db.query(GenerationQueue).filter(GenerationQueue.audio_id == generation.audio_id).first()
+    queue_item.retry_count = 1
+    db.commit()
+    job = {
+        "audio_id": generation.audio_id,
+        "provider": "synthetic",
+        "streaming": False,
+        "attempt": 0,
+        "pinned": False,
+        "sample_path": "unused.wav",
+        "reference": "unused.wav",
+    }
+    
+    assert generation_tasks.synthesize_generation.apply(args=[job]).get() is None
+    db.refresh(generation)
+    assert generation.status == GenerationStatus.PENDING
+
+def test_draining_worker_hands_job_back(db, generation, monkeypatch):
+    """Test a job waiting on its provider during a warm shutdown goes back to the queue"""
+    from app.models.task_outbox import TaskOutbox
+    from app.services.worker_drain import check_draining, start_draining, stop_draining
+    
+    provider = get_ai_service().provider("synthetic")
+    
+    def poll_until_shutdown(*args, on_submitted=None, **kwargs):
+        on_submitted("synthetic-123")
+        check_draining()
+    
+    monkeypatch.setattr(provider, "synthesize", poll_until_shutdown)
+    start_draining()
+    try:
+        result = generation_tasks.process_voice_generation.apply(args=[generation.audio_id]).get()
+    finally:
+        stop_draining()
+    
+    db.refresh(generation)
+    queue_item = db.query(GenerationQueue).filter(GenerationQueue.audio_id == generation.audio_id).first()
+    assert result == {"audio_id": generation.audio_id, "status": "requeued"}
+    assert generation.status == GenerationStatus.PENDING
+    assert generation.prediction_id == "synthetic-123"
+    assert queue_item.status == QueueStatus.QUEUED
+    assert queue_item.leased_by is None
+    assert (queue_item.retry_count or 0) == 0
+    assert db.query(TaskOutbox).filter(TaskOutbox.task_name == generation_tasks.process_voice_generation.name).count() == 1
+
+class ResumableProvider:
+    name = "resumable"
+    supports_resume = True
+    supports_webhooks = False
+    
+    def __init__(self, error):
+        self.error = error
+        self.started = 0
+    
+    def await_prediction(self, prediction_id, on_progress=None):
+        raise self.error
+    
+    def synthesize(self, *args, **kwargs):
+        self.started += 1
+        return "new-output"
+
+@pytest.mark.parametrize("error, starts_over", [
+    (ConnectionError("connection reset"), False),
+    (Exception("Prediction p-1 failed: CUDA out of memory"), True),
+])
+def test_resume_starts_over_only_when_prediction_is_gone(db, generation, error, starts_over):
+    """Test a transient error while reattaching retries instead of paying for a new prediction"""
+    from app.services.generation_lease import GenerationLease
+    from app.services.generation_pipeline import _synthesize_on
+    
+    generation.prediction_id = "p-1"
+    generation.provider = "resumable"
+    db.commit()
+    provider = ResumableProvider(error)
+    args = (provider, db, generation, None, GenerationLease(generation.audio_id, "test"), "s.wav", "s.wav", lambda *a: None)
+    
+    if starts_over:
+        assert _synthesize_on(*args) == ("new-output", None)
+        assert generation.prediction_id is None
+    else:
+        with pytest.raises(ConnectionError):
+            _synthesize_on(*args)
+        assert generation.prediction_id == "p-1"
+    assert provider.started == int(starts_over)
+
+def test_promoted_preview_reuses_its_sentence(db, generation, monkeypatch):
+    """Test a preview speaks only its first sentence, and its promotion only speaks the rest"""
+    from app.models.user import User
+    from app.schemas.generation import GenerationCreate
+    from app.services.generation_service import GenerationService
+    
+    engine = get_ai_service().provider("synthetic").engine
+    synthesize = engine.synthesize
+    spoken = []
+    monkeypatch.setattr(engine, "synthesize", lambda text, on_progress=None: spoken.append(text) or synthesize(text, on_progress))
+    
+    user = db.query(User).filter(User.user_id == generation.user_id).first()
+    preview = GenerationService.create_generation(db, user, GenerationCreate(
+        sample_id=generation.sample_id,
+        model_name="Test Model",
+        script_text="The first sentence is right here. The second one follows after it. And a third closes the script.",
+        preview=True
+    ))
+    result = generation_tasks.process_voice_generation.apply(args=[preview.audio_id]).get()
+    assert result["status"] == "completed"
+    assert spoken == ["The first sentence is right here."]
+    
+    db.refresh(preview)
+    full = GenerationService.promote_preview(db, preview.audio_id, user)
+    result = generation_tasks.process_voice_generation.apply(args=[full.audio_id]).get()
+    
+    db.refresh(full)
+    assert result["status"] == "completed"
+    assert full.provider == preview.provider == "synthetic"
+    assert spoken[1:] == ["The second one follows after it.", "And a third closes the script."]
+    assert full.duration_seconds > preview.duration_seconds
@@ -0,0 +1,106 @@
+from types import SimpleNamespace
+from contextlib import contextmanager
+from app.models.task_outbox import TaskOutbox
+from app.services.outbox import OutboxRelay, enqueue_task
+
+class FakeCelery:
+    def __init__(self, fail_after=None):
+        self.sent = []
+        self.fail_after = fail_after
+    
+    @contextmanager
+    def producer_or_acquire(self):
+        yield object()
+    
+    def send_task(self, name, args=None, producer=None, **options):
+        if self.fail_after is not None and len(self.sent) >= self.fail_after:
+            raise ConnectionError("broker unavailable")
+        self.sent.append((name, args))
+        return SimpleNamespace(id=f"task-{len(self.sent)}")
+
+def test_relay_publishes_committed_records_once(db):
+    """Test records are published in order and marked sent"""
+    for audio_id in (1, 2, 3):
+        enqueue_task(db, "generate", [audio_id])
+    db.commit()
+    
+    celery = FakeCelery()
+    relay = OutboxRelay(celery, batch_size=2)
+    assert relay.relay_batch(db) == 2
+    assert relay.relay_batch(db) == 1
+    assert relay.relay_batch(db) == 0
+    
+    assert celery.sent == [("generate", [1]), ("generate", [2]), ("generate", [3])]
+    assert db.query(TaskOutbox).filter(TaskOutbox.sent_at.is_(None)).count() == 0
+
+def test_relay_keeps_unsent_records_on_broker_error(db):
+    """Test a broker failure leaves the rest of the batch for the next run"""
+    for audio_id in (1, 2, 3):
+        enqueue_task(db, "generate", [audio_id])
+    db.commit()
+    
+    assert OutboxRelay(FakeCelery(fail_after=1)).relay_batch(db) == 1
+    
+    pending = db.query(TaskOutbox).filter(TaskOutbox.sent_at.is_(None)).order_by(TaskOutbox.outbox_id).all()
+    assert [r.args for r in pending] == [[2], [3]]
+    assert pending[0].attempts == 1
+    assert "broker unavailable" in pending[0].last_error
+
+def test_relay_commits_a_full_batch_when_the_producer_fails_on_release(db):
+    """Test an error after the last record was sent still marks the batch sent"""
+    for audio_id in (1, 2):
+        enqueue_task(db, "generate", [audio_id])
+    db.commit()
+    
+    class ReleaseFailsCelery(FakeCelery):
+        @contextmanager
+        def producer_or_acquire(self):
+            yield object()
+            raise ConnectionError("connection reset on release")
+    
+    celery = ReleaseFailsCelery()
+    assert OutboxRelay(celery).relay_batch(db) == 2
+    
+    assert celery.sent == [("generate", [1]), ("generate", [2])]
+    assert db.query(TaskOutbox).filter(TaskOutbox.sent_at.is_(None)).count() == 0
+    assert db.query(TaskOutbox).filter(TaskOutbox.attempts > 0).count() == 0
+
+def test_failed_record_backs_off_then_dead_letters_its_generation(db, test_sample, monkeypatch):
+    """Test a refused record waits before its next attempt, and failing its generation once out of attempts"""
+    from datetime import datetime, timedelta, timezone
+    from app.config import settings
+    from app.models.generated_audio import GeneratedAudio, GenerationStatus
+    from app.models.generation_queue import GenerationQueue, QueueStatus
+    from app.tasks.generation_tasks import process_voice_generation
+    
+    generation = GeneratedAudio(
+        user_id=test_sample.user_id,
+        sample_id=test_sample.sample_id,
+        model_name="Test Model",
+        script_text="Hello world.",
+        status=GenerationStatus.PENDING
+    )
+    db.add(generation)
+    db.flush()
+    db.add(GenerationQueue(audio_id=generation.audio_id, user_id=test_sample.user_id, status=QueueStatus.QUEUED))
+    record = enqueue_task(db, process_voice_generation.name, [generation.audio_id], audio_id=generation.audio_id)
+    db.commit()
+    
+    broken = FakeCelery(fail_after=0)
+    assert OutboxRelay(broken).relay_batch(db) == 0
+    assert record.attempts == 1
+    # Polling again right away does not spend another attempt
+    assert OutboxRelay(broken).relay_batch(db) == 0
+    assert record.attempts == 1
+    
+    monkeypatch.setattr(settings, "OUTBOX_MAX_ATTEMPTS", 2)
+    record.next_attempt_at = datetime.now(timezone.utc) - timedelta(seconds=1)
+    db.commit()
+    assert OutboxRelay(broken).relay_batch(db) == 0
+    
+    queue_item = db.query(GenerationQueue).filter(GenerationQueue.audio_id == generation.audio_id).one()
+    db.refresh(generation)
+    assert record.attempts == 2
+    assert generation.status == GenerationStatus.FAILED
+    assert queue_item.status == QueueStatus.FAILED
+    assert queue_item.dead_lettered_at is not None
@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+from app.config import settings
+from app.models.generated_audio import GeneratedAudio, GenerationStatus
+from app.models.generation_queue import GenerationQueue, QueueStatus
+from app.models.user import User
+from app.services.queue_view import active_queue, drain_rate, record_drained
+
+@pytest.fixture
+def queue(db, test_sample):
+    """Six jobs a minute apart: the other user's and ours interleaved, plus finished history"""
+    other = User(username="other", email="other@example.com", password_hash="x")
+    db.add(other)
+    db.flush()
+    user = db.query(User).filter(User.user_id == test_sample.user_id).first()
+    
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    layout = [
+        (other, QueueStatus.PROCESSING),
+        (user, QueueStatus.PROCESSING),
+        (other, QueueStatus.QUEUED),
+        (user, QueueStatus.QUEUED),
+        (other, QueueStatus.QUEUED),
+        (user, QueueStatus.QUEUED),
+        (user, QueueStatus.COMPLETED),
+    ]
+    for minute, (owner, status) in enumerate(layout):
+        generation = GeneratedAudio(
+            user_id=owner.user_id,
+            sample_id=test_sample.sample_id,
+            model_name="Test Model",
+            script_text="One two three four five.",
+            status=GenerationStatus.PROCESSING if status == QueueStatus.PROCESSING else GenerationStatus.PENDING
+        )
+        db.add(generation)
+        db.flush()
+        db.add(GenerationQueue(
+            audio_id=generation.audio_id,
+            user_id=owner.user_id,
+            status=status,
+            queued_at=start + timedelta(minutes=minute)
+        ))
+    db.commit()
+    return user
+
+def test_active_queue_shows_global_positions(db, queue):
+    """Test only active jobs are listed, ranked among every user's queued jobs"""
+    view = active_queue(db, queue)
+    
+    assert view["total_queued"] == 4
+    assert view["active"] == 3
+    assert [item["status"] for item in view["queue_items"]] == ["processing", "queued", "queued"]
+    assert [item["position"] for item in view["queue_items"]] == [None, 1, 3]
+    
+    etas = [item["eta_seconds"] for item in view["queue_items"]]
+    assert etas[0] < etas[1] < etas[2]
+    assert view["queue_items"][0]["starts_in_seconds"] == 0
+
+def test_priority_tier_moves_jobs_ahead(db, queue):
+    """Test a job on a higher priority tier is ranked (and dispatched) before earlier ones"""
+    from app.services.worker_affinity import DEFAULT_TASK_PRIORITY, dispatch_options
+    
+    latest = db.query(GenerationQueue).filter(
+        GenerationQueue.user_id == queue.user_id, GenerationQueue.status == QueueStatus.QUEUED
+    ).order_by(GenerationQueue.queued_at.desc()).first()
+    latest.priority = 1
+    db.commit()
+    
+    view = active_queue(db, queue)
+    assert [item["position"] for item in view["queue_items"]] == [None, 2, 0]
+    assert dispatch_options(None, latest.audio_id, priority=latest.priority) == {"priority": DEFAULT_TASK_PRIORITY - 1}
+    assert dispatch_options(None, latest.audio_id) is None
+
+def test_drain_rate_measured_from_recent_completions(monkeypatch):
+    """Test the rate falls back to concurrency until enough jobs have completed"""
+    monkeypatch.setattr(settings, "WORKER_CONCURRENCY", 4)
+    monkeypatch.setattr(settings, "QUEUE_DRAIN_WINDOW", 600)
+    monkeypatch.setattr(settings, "QUEUE_DRAIN_MIN_SAMPLES", 5)
+    assert drain_rate(per_job_seconds=20) == pytest.approx(0.2)
+    
+    for audio_id in range(60):
+        record_drained(audio_id)
+    assert drain_rate(per_job_seconds=20) == pytest.approx(0.1)
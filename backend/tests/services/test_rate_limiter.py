@@ -0,0 +1,66 @@
+import pytest
+from app.config import settings
+from app.services.rate_limiter import AdaptiveConcurrency, RateLimitedError, TokenBucket
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+    
+    def __call__(self):
+        return self.now
+
+def test_token_bucket_refills_at_rate():
+    """Test bursts are capped and tokens come back at the configured rate"""
+    clock = FakeClock()
+    bucket = TokenBucket("test", rate=2, burst=3, clock=clock)
+    
+    assert [bucket.try_acquire() for _ in range(3)] == [0, 0, 0]
+    assert bucket.try_acquire() == pytest.approx(0.5)
+    
+    clock.now += 1.0
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() == 0
+    with pytest.raises(RateLimitedError):
+        bucket.acquire(timeout=0)
+
+def test_window_grows_when_healthy_and_halves_on_overload():
+    """Test additive increase, multiplicative decrease and the decrease cooldown"""
+    clock = FakeClock()
+    limiter = AdaptiveConcurrency("test", clock=clock)
+    start = limiter.window()
+    
+    for _ in range(20):
+        limiter.record(latency_per_unit=0.1)
+    grown = limiter.window()
+    assert start < grown <= settings.PROVIDER_MAX_CONCURRENCY
+    
+    limiter.record(overloaded=True)
+    assert limiter.window() == pytest.approx(grown * settings.AIMD_DECREASE_FACTOR)
+    # A burst of 429s within the cooldown only counts once
+    limiter.record(overloaded=True)
+    assert limiter.window() == pytest.approx(grown * settings.AIMD_DECREASE_FACTOR)
+    
+    clock.now += settings.AIMD_DECREASE_COOLDOWN
+    # A latency spike is treated as overload
+    limiter.record(latency_per_unit=10.0)
+    assert limiter.window() == pytest.approx(max(
+        settings.AIMD_MIN_CONCURRENCY, grown * settings.AIMD_DECREASE_FACTOR ** 2
+    ))
+    assert limiter.snapshot()["limit"] >= settings.AIMD_MIN_CONCURRENCY
+
+def test_window_recovers_after_lasting_latency_shift():
+    """Test a provider that got permanently slower is re-learned instead of pinning the window"""
+    clock = FakeClock()
+    limiter = AdaptiveConcurrency("test", clock=clock)
+    for _ in range(20):
+        limiter.record(latency_per_unit=0.1)
+    
+    # Three times slower from now on: spikes at first, until the baseline catches up
+    windows = []
+    for _ in range(150):
+        clock.now += settings.AIMD_DECREASE_COOLDOWN
+        windows.append(limiter.record(latency_per_unit=0.3))
+    
+    assert min(windows) == settings.AIMD_MIN_CONCURRENCY
+    assert windows[-1] > 2 * settings.AIMD_MIN_CONCURRENCY
+    assert limiter.snapshot()["latency_baseline"] > 0.3 / settings.AIMD_LATENCY_SPIKE_FACTOR
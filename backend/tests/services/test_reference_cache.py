@@ -0,0 +1,127 @@
+import pytest
+from app.config import settings
+from app.services.replicate_integration import ReplicateVoiceService
+from app.utils.redis_client import get_redis
+
+class MissingFileError(Exception):
+    status = 404
+
+@pytest.fixture
+def replicate_service(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "REPLICATE_API_TOKEN", "r8_test")
+    monkeypatch.setenv("REPLICATE_API_TOKEN", "r8_test")
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path))
+    get_redis().flushdb()
+    
+    service = ReplicateVoiceService()
+    uploads = []
+    
+    def fake_upload(file_handle):
+        uploads.append(file_handle.read())
+        return f"https://api.replicate.com/v1/files/file-{len(uploads)}", f"file-{len(uploads)}", None
+    
+    monkeypatch.setattr(service, "upload_file", fake_upload)
+    service.uploads = uploads
+    return service
+
+@pytest.fixture
+def sample_path(tmp_path):
+    path = tmp_path / "voice.wav"
+    path.write_bytes(b"RIFF" + b"\x01" * 2048)
+    return str(path)
+
+def test_reference_uploaded_once(replicate_service, sample_path):
+    """Test repeated predictions reuse the uploaded reference URL"""
+    prompts = [
+        replicate_service._with_audio_prompt(sample_path, lambda prompt: prompt)
+        for _ in range(3)
+    ]
+    assert prompts == ["https://api.replicate.com/v1/files/file-1"] * 3
+    assert len(replicate_service.uploads) == 1
+
+def test_missing_upload_reuploaded(replicate_service, sample_path):
+    """Test a cached upload Replicate cannot download is re-uploaded and retried once"""
+    replicate_service._with_audio_prompt(sample_path, lambda prompt: prompt)
+    
+    attempts = []
+    def call(prompt):
+        attempts.append(prompt)
+        if len(attempts) == 1:
+            raise MissingFileError("Prediction input failed: could not download file")
+        return prompt
+    
+    result = replicate_service._with_audio_prompt(sample_path, call)
+    assert result == "https://api.replicate.com/v1/files/file-2"
+    assert len(replicate_service.uploads) == 2
+
+def test_only_missing_input_files_trigger_a_reupload(replicate_service, sample_path):
+    """Test a 404 or "not found" for anything but the input file is raised instead of re-uploading"""
+    replicate_service._with_audio_prompt(sample_path, lambda prompt: prompt)
+    
+    def call(prompt):
+        raise MissingFileError("Model version not found")
+    
+    with pytest.raises(MissingFileError, match="not found"):
+        replicate_service._with_audio_prompt(sample_path, call)
+    assert len(replicate_service.uploads) == 1
+    
+    attempts = []
+    def call(prompt):
+        attempts.append(prompt)
+        if len(attempts) == 1:
+            raise Exception("Prediction failed: Failed to download file from https://api.replicate.com/v1/files/file-1")
+        return prompt
+    
+    assert replicate_service._with_audio_prompt(sample_path, call) == "https://api.replicate.com/v1/files/file-2"
+
+def test_prediction_failing_to_fetch_reference_is_rerun(replicate_service, sample_path, monkeypatch):
+    """Test an upload that expires before Replicate fetches it fails the prediction, which is re-run once"""
+    from types import SimpleNamespace
+    from app.services.retry_policy import PermanentGenerationError
+    
+    reference = replicate_service.prepare_reference(sample_path)
+    submitted = []
+    def submit(text, audio_prompt):
+        submitted.append(audio_prompt)
+        return SimpleNamespace(id=f"pred-{len(submitted)}")
+    def wait(prediction, on_progress=None):
+        if prediction.id == "pred-1":
+            raise PermanentGenerationError(f"Prediction {prediction.id} failed: Failed to download file {reference}")
+        return "https://replicate.delivery/out.wav"
+    monkeypatch.setattr(replicate_service, "_submit", submit)
+    monkeypatch.setattr(replicate_service, "wait_for_prediction", wait)
+    
+    ids = []
+    output = replicate_service.predict(sample_path, reference, "Hello", on_submitted=ids.append)
+    assert output == "https://replicate.delivery/out.wav"
+    assert submitted == [reference, "https://api.replicate.com/v1/files/file-2"]
+    assert ids == ["pred-1", "pred-2"]
+    assert replicate_service.prepare_reference(sample_path) == "https://api.replicate.com/v1/files/file-2"
+
+def test_expired_upload_not_reused(replicate_service):
+    """Test entries about to expire are treated as missing"""
+    cache = replicate_service.reference_cache
+    cache.put("abc", "https://example.com/old", "old", "2000-01-01T00:00:00Z")
+    assert cache.get("abc") is None
+    
+    cache.put("abc", "https://example.com/new", "new", None)
+    assert cache.get("abc")["url"] == "https://example.com/new"
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    """Test the disk cache stays under budget by dropping the coldest references"""
+    import os
+    from app.services.reference_cache import ReferenceDiskCache
+    
+    get_redis().flushdb()
+    cache = ReferenceDiskCache(str(tmp_path / "refs"), max_bytes=2500, node="node-a")
+    for i, name in enumerate(["a", "b", "c"]):
+        converted = tmp_path / f"{name}.tmp"
+        converted.write_bytes(b"\0" * 1000)
+        path = cache.put(name, str(converted))
+        os.utime(path, (1000 + i, 1000 + i))
+        if name == "b":
+            os.utime(cache.get("a"), (1001.5, 1001.5))  # "a" was used after "b"
+    
+    assert cache.get("b") is None
+    assert cache.get("a") and cache.get("c")
+    assert cache.stats() == {"node": "node-a", "hits": 3, "misses": 1, "hit_rate": 0.75}
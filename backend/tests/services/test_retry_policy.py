@@ -0,0 +1,43 @@
+import requests
+from types import SimpleNamespace
+from app.config import settings
+from app.services.retry_policy import (
+    ErrorKind,
+    PermanentGenerationError,
+    backoff_delay,
+    classify_error,
+)
+
+class FakeApiError(Exception):
+    def __init__(self, status, headers=None):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+        self.response = SimpleNamespace(status_code=status, headers=headers or {})
+
+def test_rate_limits_and_network_errors_are_transient():
+    """Test 429/5xx and connection problems are retried, honouring Retry-After"""
+    assert classify_error(FakeApiError(429, {"Retry-After": "12"})) == (ErrorKind.TRANSIENT, 12.0)
+    assert classify_error(FakeApiError(503))[0] == ErrorKind.TRANSIENT
+    assert classify_error(requests.ConnectionError("reset"))[0] == ErrorKind.TRANSIENT
+    
+    # Still recognised when wrapped in a generic error
+    try:
+        try:
+            raise FakeApiError(429)
+        except FakeApiError as e:
+            raise Exception("Replicate AI generation failed") from e
+    except Exception as wrapped:
+        assert classify_error(wrapped)[0] == ErrorKind.TRANSIENT
+
+def test_bad_input_is_permanent():
+    """Test client errors and failed predictions are not retried"""
+    assert classify_error(FakeApiError(422))[0] == ErrorKind.PERMANENT
+    assert classify_error(PermanentGenerationError("Prediction failed"))[0] == ErrorKind.PERMANENT
+    assert classify_error(ValueError("bad sample"))[0] == ErrorKind.PERMANENT
+
+def test_backoff_is_jittered_and_capped():
+    """Test delays stay under the exponential ceiling and respect Retry-After"""
+    for attempt in range(10):
+        delay = backoff_delay(attempt)
+        assert 0 <= delay <= min(settings.GENERATION_RETRY_MAX_DELAY, settings.GENERATION_RETRY_BASE_DELAY * 2 ** attempt)
+    assert backoff_delay(0, retry_after=30) >= 30
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+from app.config import settings
+from app.services.segment_cache import SegmentCache, synthesize_incremental
+from app.utils.wav import WavFormat, crossfade_wavs, read_wav, wav_bytes
+
+FORMAT = WavFormat(1, 2, 1000)
+
+def write_tone(path, value, frames):
+    path.write_bytes(wav_bytes(FORMAT, np.full(frames, value, dtype="<i2").tobytes()))
+    return str(path)
+
+@pytest.fixture
+def segments(tmp_path):
+    return SegmentCache(str(tmp_path / "segments"), 10 * 1024 ** 2, "voice-hash", {"provider": "synthetic"})
+
+@pytest.fixture
+def speak(tmp_path):
+    spoken = []
+
+    def synthesize(sentence):
+        spoken.append(sentence)
+        path = write_tone(tmp_path / f"out-{len(spoken)}.wav", 1000, 200)
+        return path, 0.2, 0
+
+    synthesize.spoken = spoken
+    return synthesize
+
+def test_crossfade_overlaps_boundaries(tmp_path):
+    """Test pieces overlap by the crossfade and ramp from one to the next"""
+    first = write_tone(tmp_path / "a.wav", 1000, 100)
+    second = write_tone(tmp_path / "b.wav", 3000, 100)
+
+    duration, _ = crossfade_wavs([first, second], str(tmp_path / "out.wav"), 0.02)
+
+    fmt, frames = read_wav(str(tmp_path / "out.wav"))
+    samples = np.frombuffer(frames, dtype="<i2")
+    assert fmt == FORMAT
+    assert len(samples) == 180
+    assert duration == 0.18
+    assert samples[79] == 1000 and samples[100] == 3000
+    assert np.all(np.diff(samples[80:100]) > 0)
+
+def test_edit_resynthesizes_only_changed_sentences(tmp_path, segments, speak, monkeypatch):
+    """Test regenerating an edited script only sends the new sentence to the provider"""
+    monkeypatch.setattr(settings, "SEGMENT_CROSSFADE_MS", 10)
+    script = "The first sentence is here. The second one follows it. And a third closes the script."
+
+    output, _, _ = synthesize_incremental(speak, segments, script, str(tmp_path))
+    assert len(speak.spoken) == 3
+
+    edited = script.replace("second one follows it", "second one was rewritten")
+    output, duration, _ = synthesize_incremental(speak, segments, "  " + edited, str(tmp_path))
+
+    assert speak.spoken[3:] == ["The second one was rewritten."]
+    assert duration == pytest.approx(0.58)
+    assert segments.stats()["hits"] == 2
+
+def test_keys_depend_on_voice_and_params(segments):
+    """Test the same sentence in another voice or model is not reused"""
+    other_voice = SegmentCache(segments.directory, segments.max_bytes, "other-hash", segments.params)
+    other_model = SegmentCache(segments.directory, segments.max_bytes, "voice-hash", {"provider": "replicate"})
+
+    assert segments.key("Hello  there.") == segments.key("Hello there.")
+    assert segments.key("Hello there.") != other_voice.key("Hello there.")
+    assert segments.key("Hello there.") != other_model.key("Hello there.")
@@ -0,0 +1,74 @@
+import os
+import pytest
+from app.config import settings
+from app.services.progress_tracker import GenerationStage, ProgressTracker
+from app.services.streaming import StreamChunks, iter_wav_stream, synthesize_streaming
+from app.utils.wav import WavFormat, read_wav, wav_bytes
+
+FORMAT = WavFormat(channels=1, sample_width=2, frame_rate=8000)
+
+@pytest.fixture(autouse=True)
+def storage(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path))
+    return tmp_path
+
+class FakeSynth:
+    """Writes one second of a distinct byte pattern per sentence"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.sentences = []
+
+    def __call__(self, sentence):
+        self.sentences.append(sentence)
+        path = os.path.join(self.directory, f"out-{len(self.sentences)}.wav")
+        frames = bytes([len(self.sentences)]) * (FORMAT.frame_rate * FORMAT.sample_width)
+        with open(path, "wb") as f:
+            f.write(wav_bytes(FORMAT, frames))
+        return path, 1.0, os.path.getsize(path)
+
+TEXT = "The first sentence is here. The second sentence follows. And this is the third."
+
+def test_chunks_published_then_stitched(tmp_path):
+    """Test each sentence is registered as a chunk and the output joins them all"""
+    synth = FakeSynth(str(tmp_path))
+    output_path, duration, size = synthesize_streaming(synth, 1, 9, TEXT, str(tmp_path))
+
+    assert len(synth.sentences) == 3
+    state = StreamChunks(1).state()
+    assert state["total"] == 3
+    assert sorted(state["chunks"]) == [0, 1, 2]
+    assert state["output"] == output_path
+    assert duration == 3.0
+    assert size == os.path.getsize(output_path)
+
+    fmt, frames = read_wav(output_path)
+    assert fmt == FORMAT
+    assert frames[0] == 1 and frames[-1] == 3
+
+def test_requeued_job_reuses_finished_chunks(tmp_path):
+    """Test a re-run only synthesizes the chunks that are missing"""
+    synth = FakeSynth(str(tmp_path))
+    synthesize_streaming(synth, 2, 9, TEXT, str(tmp_path))
+    chunks = StreamChunks(2)
+    os.remove(chunks.chunk_path(2))
+
+    rerun = FakeSynth(str(tmp_path))
+    synthesize_streaming(rerun, 2, 9, TEXT, str(tmp_path))
+    assert rerun.sentences == ["And this is the third."]
+
+def test_wav_stream_is_header_then_frames(tmp_path):
+    """Test the stream is one playable WAV of all chunks in order"""
+    synthesize_streaming(FakeSynth(str(tmp_path)), 3, 9, TEXT, str(tmp_path))
+
+    stream = b"".join(iter_wav_stream(3, poll_interval=0.01, timeout=1))
+    assert stream[:4] == b"RIFF" and stream[8:12] == b"WAVE"
+    pcm = stream[44:]
+    assert len(pcm) == 3 * FORMAT.frame_rate * FORMAT.sample_width
+    assert pcm[0] == 1 and pcm[-1] == 3
+
+def test_stream_stops_when_generation_fails():
+    """Test a listener is not left waiting on a failed generation"""
+    StreamChunks(4).start(3)
+    ProgressTracker(4, 9).update(GenerationStage.FAILED)
+    assert list(iter_wav_stream(4, poll_interval=0.01, timeout=5)) == []
@@ -0,0 +1,65 @@
+import pytest
+from app.celery_app import celery_app
+from app.services.retry_policy import PermanentGenerationError, TransientGenerationError
+from app.services.synthetic_engine import LatencyModel, SyntheticVoiceEngine
+from app.utils.wav import read_wav
+
+TEXT = "The quick brown fox jumps over the lazy dog. It lands safely!"
+
+@pytest.fixture
+def engine(tmp_path):
+    return SyntheticVoiceEngine(str(tmp_path), latency=LatencyModel("fixed", base=0.0), seed=1)
+
+def test_render_matches_expected_duration(engine):
+    """Test the audio is as long as the text takes to say"""
+    samples = engine.render(TEXT)
+    assert samples.dtype.name == "int16"
+    assert len(samples) / engine.format.frame_rate == pytest.approx(engine.expected_duration(TEXT), abs=0.01)
+    assert samples.any()
+    assert (engine.render(TEXT) == samples).all()
+
+def test_synthesize_writes_playable_wav(engine):
+    """Test the output is a real WAV whose reported duration and size are true"""
+    path, duration, size = engine.synthesize(TEXT)
+    fmt, frames = read_wav(path)
+    assert fmt.frame_rate == engine.format.frame_rate
+    assert duration == pytest.approx(engine.expected_duration(TEXT), abs=0.01)
+    assert engine.describe(path) == (path, duration, size)
+
+def test_latency_models():
+    """Test fixed, per-word and log-normal latencies"""
+    import numpy as np
+    rng = np.random.default_rng(0)
+    assert LatencyModel("fixed", base=2.0).sample(100, rng) == 2.0
+    assert LatencyModel("per_word", base=1.0, per_word=0.1).sample(20, rng) == pytest.approx(3.0)
+    
+    lognormal = LatencyModel("lognormal", base=1.0, per_word=0.0, sigma=0.5)
+    draws = [lognormal.sample(10, rng) for _ in range(4000)]
+    assert np.mean(draws) == pytest.approx(lognormal.expected(10), rel=0.05)
+    assert max(draws) > 2 * np.median(draws)
+    
+    with pytest.raises(ValueError):
+        LatencyModel("instant")
+
+def test_failure_injection(tmp_path):
+    """Test failures are injected as transient or permanent errors"""
+    flaky = SyntheticVoiceEngine(str(tmp_path), latency=LatencyModel("fixed", base=0.0), transient_failure_rate=1.0)
+    with pytest.raises(TransientGenerationError):
+        flaky.synthesize(TEXT)
+    
+    broken = SyntheticVoiceEngine(str(tmp_path), latency=LatencyModel("fixed", base=0.0), permanent_failure_rate=1.0)
+    with pytest.raises(PermanentGenerationError):
+        broken.synthesize(TEXT)
+
+def test_submit_defers_completion(tmp_path, monkeypatch):
+    """Test a submitted job completes later, carrying any injected failure"""
+    sent = []
+    monkeypatch.setattr(celery_app, "send_task", lambda name, args, countdown: sent.append((name, args, countdown)))
+    engine = SyntheticVoiceEngine(str(tmp_path), latency=LatencyModel("fixed", base=3.0), permanent_failure_rate=1.0)
+    
+    prediction_id = engine.submit(TEXT)
+    
+    name, args, countdown = sent[0]
+    assert name == "app.tasks.generation_tasks.complete_synthetic_prediction"
+    assert args == [prediction_id, "Injected permanent failure"]
+    assert countdown == 3.0
@@ -0,0 +1,134 @@
+import pytest
+from app.config import settings
+from app.services.ai_service import get_ai_service, reset_ai_service
+from app.services.circuit_breaker import BulkheadFullError
+from app.services.voice_providers import ProviderRegistry, ProviderRouter, SyntheticProvider, VoiceProvider
+
+class FakeProvider(VoiceProvider):
+    def __init__(self, name, latency, cost_per_word=0.0, unavailable=False):
+        super().__init__(name, "/tmp")
+        self.latency = latency
+        self.cost_per_word = cost_per_word
+        self.unavailable = unavailable
+        self.calls = 0
+
+    def expected_latency(self, word_count):
+        return self.latency
+
+    def generate_speech(self, sample_path, text, model_name, on_progress=None, on_submitted=None):
+        self.calls += 1
+        if self.unavailable:
+            raise BulkheadFullError(f"{self.name} is full")
+        return f"{self.name}.wav", 1.0, 100
+
+def _router(*providers):
+    return ProviderRouter(ProviderRegistry(list(providers)))
+
+def test_faster_provider_ranked_first():
+    """Test the provider expected to finish soonest is preferred"""
+    slow, fast = FakeProvider("slow", 30), FakeProvider("fast", 10)
+    assert [p.name for p in _router(slow, fast).rank(50)] == ["fast", "slow"]
+
+def test_cost_is_weighed_against_latency(monkeypatch):
+    """Test an expensive provider loses to a slightly slower cheap one"""
+    monkeypatch.setattr(settings, "PROVIDER_COST_WEIGHT", 600.0)
+    pricey, cheap = FakeProvider("pricey", 10, cost_per_word=0.001), FakeProvider("cheap", 20)
+    assert _router(pricey, cheap).rank(50)[0].name == "cheap"  # $0.05 = 30s
+
+def test_errors_and_load_push_a_provider_down():
+    """Test error rate and a full concurrency window count against a provider"""
+    flaky, steady = FakeProvider("flaky", 10), FakeProvider("steady", 12)
+    for failed in (True, True, False, False):
+        flaky.circuit_breaker.record(1.0, failed=failed)
+    assert _router(flaky, steady).rank(50)[0].name == "steady"
+    
+    busy, idle = FakeProvider("busy", 10), FakeProvider("idle", 15)
+    for _ in range(busy.bulkhead.limit):
+        busy.bulkhead.try_acquire()
+    assert _router(busy, idle).rank(50)[0].name == "idle"
+
+def test_open_circuit_goes_last():
+    """Test providers failing fast are only tried when nothing else is left"""
+    down, up = FakeProvider("down", 1), FakeProvider("up", 100)
+    down.circuit_breaker._open("test")
+    assert [p.name for p in _router(down, up).rank(50)] == ["up", "down"]
+
+def test_unavailable_provider_falls_back():
+    """Test a job moves to the next provider when one cannot take it"""
+    full, spare = FakeProvider("full", 1, unavailable=True), FakeProvider("spare", 5)
+    provider, result = _router(full, spare).run(50, lambda p: p.generate_speech("s.wav", "text", "m"))
+    assert provider is spare
+    assert result[0] == "spare.wav"
+    assert full.calls == 1
+
+def test_pinned_provider_does_not_fall_back():
+    """Test a job holding a prediction stays on its provider"""
+    full, spare = FakeProvider("full", 1, unavailable=True), FakeProvider("spare", 5)
+    with pytest.raises(BulkheadFullError):
+        _router(full, spare).run(50, lambda p: p.generate_speech("s.wav", "text", "m"), pinned="full")
+    assert spare.calls == 0
+
+def test_probe_released_when_turned_away_by_bulkhead(monkeypatch):
+    """Test a half-open probe that never reaches the provider lets the next call probe"""
+    from app.services.circuit_breaker import CircuitState
+    from app.utils.redis_client import get_redis
+    
+    monkeypatch.setattr(settings, "BULKHEAD_ACQUIRE_TIMEOUT", 0)
+    provider = FakeProvider("flaky", 1)
+    provider.circuit_breaker._open("test")
+    monkeypatch.setattr(settings, "CIRCUIT_OPEN_SECONDS", 0)
+    assert provider.circuit_breaker.state() == CircuitState.HALF_OPEN
+    
+    for _ in range(provider.bulkhead.limit):
+        provider.bulkhead.try_acquire()
+    with pytest.raises(BulkheadFullError):
+        provider._call_provider(lambda: "never called")
+    
+    # Once a slot frees up the next call probes instead of waiting out the probe timeout
+    get_redis().delete(provider.bulkhead.key)
+    assert provider._call_provider(lambda: "probed") == "probed"
+    assert provider.circuit_breaker.state() == CircuitState.CLOSED
+
+def test_registry_from_settings(monkeypatch, tmp_path):
+    """Test providers are built in the configured order, skipping unusable ones"""
+    monkeypatch.setattr(settings, "REPLICATE_API_TOKEN", None)
+    monkeypatch.setattr(settings, "PROVIDERS", "replicate, synthetic, nonsense")
+    registry = ProviderRegistry.from_settings(str(tmp_path))
+    assert [p.name for p in registry.all()] == ["synthetic"]
+    assert isinstance(registry.primary, SyntheticProvider)
+
+def test_generation_routed_and_completed(db, test_sample, monkeypatch, tmp_path):
+    """Test a generation task runs on the routed provider and records it"""
+    from tests.conftest import TestingSessionLocal
+    from app.models.generated_audio import GeneratedAudio, GenerationStatus
+    from app.models.generation_queue import GenerationQueue, QueueStatus
+    from app.tasks import generation_tasks
+    
+    monkeypatch.setattr(generation_tasks, "SessionLocal", TestingSessionLocal)
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "REPLICATE_API_TOKEN", None)
+    monkeypatch.setattr(settings, "SYNTHETIC_DEFERRED_COMPLETION", False)
+    monkeypatch.setattr(settings, "SYNTHETIC_LATENCY_MODEL", "fixed")
+    monkeypatch.setattr(settings, "SYNTHETIC_LATENCY_BASE", 0.0)
+    reset_ai_service()
+    
+    generation = GeneratedAudio(
+        user_id=test_sample.user_id,
+        sample_id=test_sample.sample_id,
+        model_name="Test Model",
+        script_text="Hello world. This is a test.",
+        status=GenerationStatus.PENDING
+    )
+    db.add(generation)
+    db.flush()
+    db.add(GenerationQueue(audio_id=generation.audio_id, user_id=test_sample.user_id, status=QueueStatus.QUEUED))
+    db.commit()
+    
+    result = generation_tasks.process_voice_generation.apply(args=[generation.audio_id]).get()
+    
+    db.refresh(generation)
+    assert result["status"] == "completed"
+    assert generation.status == GenerationStatus.COMPLETED
+    assert generation.provider == "synthetic"
+    assert generation.duration_seconds > 0
+    reset_ai_service()
@@ -0,0 +1,68 @@
+import time
+import pytest
+from app.config import settings
+from app.services import worker_affinity
+from app.services.worker_affinity import HashRing, NodeHeartbeat, assign, dispatch_options, release
+from app.utils.redis_client import get_redis
+
+@pytest.fixture
+def nodes(monkeypatch):
+    monkeypatch.setattr(settings, "AFFINITY_ROUTING", True)
+    monkeypatch.setattr(settings, "AFFINITY_NODE_CAPACITY", 2)
+    for node in ("node-a", "node-b", "node-c"):
+        NodeHeartbeat(node).beat()
+    return ["node-a", "node-b", "node-c"]
+
+def test_ring_moves_few_keys_when_a_node_joins():
+    """Test only the keys next to a new node change owner"""
+    keys = [f"sample:{i}" for i in range(2000)]
+    before = HashRing(["a", "b", "c"])
+    after = HashRing(["a", "b", "c", "d"])
+    owners = [(next(before.nodes_for(key)), next(after.nodes_for(key))) for key in keys]
+    
+    moved = [(old, new) for old, new in owners if old != new]
+    assert all(new == "d" for _, new in moved)
+    assert 0.15 < len(moved) / len(keys) < 0.35
+    assert sorted(before.nodes_for("sample:1")) == ["a", "b", "c"]
+
+def test_voice_sticks_to_its_node_and_spills_over_when_saturated(nodes):
+    """Test jobs for a voice share a node until it is full, then move along the ring"""
+    owner = assign(7, 1)
+    assert owner in nodes
+    assert assign(7, 2) == owner
+    
+    spilled = assign(7, 3)
+    assert spilled not in (None, owner)
+    release(1)
+    assert assign(7, 4) == owner
+    assert dispatch_options(7, 5) == {"queue": f"generation.prepare.{spilled}"}
+
+def test_load_is_released_from_the_assigned_node(nodes, monkeypatch):
+    """Test a job frees the node it was sent to, not the one that ran it, and only once"""
+    owner = assign(7, 1)
+    assert worker_affinity.assigned_node(1) == owner
+    
+    # Re-dispatching moves the job's load instead of counting it twice
+    assign(7, 1)
+    assert worker_affinity.node_load(owner) == 1
+    
+    monkeypatch.setattr(settings, "WORKER_NODE", next(node for node in nodes if node != owner))
+    release(1)
+    assert worker_affinity.node_load(owner) == 0
+    assert worker_affinity.assigned_node(1) is None
+    
+    # A stale run releasing its old node keeps the newer assignment
+    newer = assign(7, 2)
+    release(2, "node-x")
+    assert worker_affinity.assigned_node(2) == newer
+
+def test_dead_nodes_leave_the_ring(nodes, monkeypatch):
+    """Test jobs go to the shared queue once no node has a fresh heartbeat"""
+    get_redis().zadd(worker_affinity.NODES_KEY, {node: time.time() - 2 * settings.AFFINITY_NODE_TTL for node in nodes})
+    assert assign(7, 1) is None
+    assert dispatch_options(7, 1) is None
+    
+    NodeHeartbeat("node-b").beat()
+    assert assign(7, 2) == "node-b"
+    monkeypatch.setattr(settings, "AFFINITY_ROUTING", False)
+    assert assign(7, 3) is None
@@ -0,0 +1,67 @@
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from app.utils.http_client import DownloadError, download_to_file
+
+PAYLOAD = bytes(range(256)) * 400  # 100KB
+
+class FlakyAudioHandler(BaseHTTPRequestHandler):
+    """Serves PAYLOAD, cutting the first response short"""
+    truncate_first = True
+    requests_seen = []
+
+    def do_GET(self):
+        range_header = self.headers.get("Range")
+        self.requests_seen.append(range_header)
+
+        if range_header:
+            start = int(range_header.split("=")[1].rstrip("-"))
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(PAYLOAD) - 1}/{len(PAYLOAD)}")
+            self.send_header("Content-Length", str(len(PAYLOAD) - start))
+            self.end_headers()
+            self.wfile.write(PAYLOAD[start:])
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(PAYLOAD)))
+        self.end_headers()
+        if self.truncate_first:
+            self.wfile.write(PAYLOAD[:30000])
+            self.close_connection = True
+        else:
+            self.wfile.write(PAYLOAD)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def audio_server():
+    FlakyAudioHandler.requests_seen = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FlakyAudioHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/out.wav"
+    server.shutdown()
+    server.server_close()
+
+def test_download_resumes_truncated_body(audio_server, tmp_path):
+    """Test a truncated body is resumed with a Range request"""
+    dest = tmp_path / "generated" / "out.wav"
+    written = download_to_file(audio_server, str(dest), chunk_size=4096)
+
+    assert written == len(PAYLOAD)
+    assert dest.read_bytes() == PAYLOAD
+    first, resumed = FlakyAudioHandler.requests_seen
+    assert first is None
+    assert resumed.startswith("bytes=") and resumed != "bytes=0-"
+    assert os.listdir(dest.parent) == ["out.wav"]
+
+def test_download_gives_up_without_partial_file(audio_server, tmp_path):
+    """Test an incomplete download raises and leaves nothing behind"""
+    dest = tmp_path / "out.wav"
+    with pytest.raises(DownloadError):
+        download_to_file(audio_server, str(dest), max_attempts=1)
+
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,24 @@
+from app.utils.text_chunks import split_sentences
+
+def test_splits_on_sentence_ends():
+    """Test each sentence becomes its own chunk"""
+    text = "The quick brown fox jumps. Does it land safely?  It does!"
+    assert split_sentences(text, min_chars=5) == [
+        "The quick brown fox jumps.",
+        "Does it land safely?",
+        "It does!",
+    ]
+
+def test_short_fragments_are_merged():
+    """Test very short sentences are not synthesized on their own"""
+    assert split_sentences("Hi. My name is Ada and I build engines.") == [
+        "Hi. My name is Ada and I build engines."
+    ]
+
+def test_long_sentences_split_at_clauses():
+    """Test sentences over the limit are broken up without losing words"""
+    text = "First clause goes here, second clause follows it, and a third one closes the sentence."
+    chunks = split_sentences(text, max_chars=40, min_chars=5)
+    assert all(len(chunk) <= 40 for chunk in chunks)
+    assert " ".join(chunks).split() == text.split()
+    assert len(chunks) > 1
@@ -0,0 +1,45 @@
+import asyncio
+
+from app.utils.websocket_manager import ConnectionManager
+
+
+class FakeSocket:
+    """Records frames, yielding to the event loop on every send"""
+    
+    def __init__(self):
+        self.frames = []
+    
+    async def accept(self):
+        pass
+    
+    async def send_json(self, message):
+        await asyncio.sleep(0)
+        self.frames.append(message)
+    
+    async def send_bytes(self, data):
+        await asyncio.sleep(0)
+        self.frames.append(data)
+
+
+def test_status_push_waits_for_a_chunk_header_and_its_audio():
+    """Test a status event can't land between a chunk's metadata and bytes"""
+    manager = ConnectionManager()
+    websocket = FakeSocket()
+    
+    async def send_chunk():
+        async with manager.send_lock(websocket):
+            await websocket.send_json({"type": "stream_chunk", "index": 0})
+            await websocket.send_bytes(b"RIFF")
+    
+    async def run():
+        await manager.connect(websocket, 1)
+        await asyncio.gather(
+            send_chunk(),
+            manager.send_personal_message({"type": "status_update"}, 1)
+        )
+    
+    asyncio.run(run())
+    
+    header = websocket.frames.index({"type": "stream_chunk", "index": 0})
+    assert websocket.frames[header + 1] == b"RIFF"
+    assert {"type": "status_update"} in websocket.frames
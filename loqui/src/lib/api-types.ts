@@ -30,7 +30,10 @@ export interface GeneratedAudio {
   output_file_path?: string | null;
   file_size?: number | null;
   duration_seconds?: number | null;
-  status: 'pending' | 'processing' | 'completed' | 'failed';
+  checksum?: string | null;
+  loudness_lufs?: number | null;
+  peak_dbfs?: number | null;
+  status: 'pending' | 'processing' | 'completed' | 'failed' | 'cancelled';
   generated_at: string;
   completed_at?: string | null;
 }
@@ -80,7 +83,7 @@ export interface ApiError {
 
 export interface GenerationStatus {
   audio_id: number;
-  status: 'pending' | 'processing' | 'completed' | 'failed';
+  status: 'pending' | 'processing' | 'completed' | 'failed' | 'cancelled';
   progress?: number;
   message?: string;
 }